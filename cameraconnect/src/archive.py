@@ -0,0 +1,452 @@
+"""
+Asynchronous archive for the encoded images.
+
+Writing the images to disk on the acquisition path stalls the
+triggers as soon as the storage is slow (e.g. SD cards or NFS
+mounts). The ImageArchiveWriter takes the encoded images from a
+bounded queue and writes them in a background thread into a
+storage backend. Old images are deleted as soon as the archive
+exceeds its size or age limit.
+
+Provided storage backends:
+- FileStorage: one file per image in one directory per day
+
+    <storage_path>/<YYYY-MM-DD>/<iso timestamp><extension>
+
+  Images of the same millisecond get a sequence number, e.g.
+  "<iso timestamp>-1.jpg". Images that earlier versions wrote
+  directly into <storage_path> are still counted and deleted by the
+  retention.
+
+- SegmentStorage (see segment_store.py): images appended to rolling
+            segment files with a timestamp index
+"""
+
+# Import python in-built libraries
+import collections
+import datetime
+import logging
+import os
+import threading
+import time
+
+# Import self-written modules
+from pipeline import QUEUE_POLICY_DROP_OLDEST, StageQueue
+
+# File extensions of the codecs (see image_codecs.py), archives of
+#   earlier runs may have used another codec
+ARCHIVE_EXTENSIONS = (".jpg", ".png", ".webp", ".raw")
+
+
+def image_file_name(timestamp_ms, extension, sequence=0) -> str:
+    """
+    File name of an archived image, e.g.
+    "2022-06-15T10_00_00_123000_00_00.jpg".
+
+    Args:
+        timestamp_ms[int]:      Timestamp of the image in ms since
+                                epoch
+        extension[string]:      File extension including the dot
+        (opt.) sequence[int]:   Number of the image within the same
+                                millisecond, appended if not 0
+                                Default value: 0
+
+    Returns:
+        File name
+    """
+    timestamp = datetime.datetime.fromtimestamp(timestamp_ms / 1000, tz=datetime.timezone.utc).isoformat()
+    stem = timestamp.replace(":", "_").replace(".", "_").replace("+", "_")
+    if sequence:
+        stem += "-{}".format(sequence)
+    return stem + extension
+
+
+def parse_image_file_name(file_name):
+    """
+    Timestamp of an archived image from its file name, the inverse
+    of image_file_name().
+
+    Args:
+        file_name[string]:      File name with or without directory
+
+    Returns:
+        Timestamp in ms since epoch or None if the name was not
+        created by image_file_name()
+    """
+    stem = os.path.splitext(os.path.basename(file_name))[0]
+    parts = stem.split("_")
+    # Date and hour, minute, second, (microsecond,) offset hours and
+    #   minutes, e.g. "2022-06-15T10_00_00_123000_00_00"
+    if len(parts) not in (5, 6):
+        return None
+    # Sequence number of images of the same millisecond
+    parts[-1], _, sequence = parts[-1].partition("-")
+    if sequence and not sequence.isdigit():
+        return None
+    microsecond = parts[3] if len(parts) == 6 else "0"
+    try:
+        point = datetime.datetime.strptime("_".join(parts[:3]), "%Y-%m-%dT%H_%M_%S")
+        microsecond = int(microsecond)
+    except ValueError:
+        return None
+    point = point.replace(microsecond=microsecond, tzinfo=datetime.timezone.utc)
+    return int(round(point.timestamp() * 1000))
+
+
+def is_day_directory_name(name) -> bool:
+    """
+    Checks if a directory name is a day of the archive, e.g.
+    "2022-06-15".
+
+    Args:
+        name[string]:           Name of the directory
+
+    Returns:
+        True if the name is a day
+    """
+    try:
+        datetime.datetime.strptime(name, "%Y-%m-%d")
+    except ValueError:
+        return False
+    return len(name) == 10
+
+
+def sync_directory(directory) -> None:
+    """
+    Syncs the entries of a directory to disk, required so that new
+    files survive a power loss.
+
+    Args:
+        directory[string]:      Path of the directory
+
+    Returns:
+        None
+    """
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    except OSError:
+        pass
+
+
+class FileStorage:
+    """
+    Storage backend that writes one file per image into one
+    directory per day.
+
+    A storage backend provides:
+        scan():     the retention units of earlier runs as list of
+                    (key, timestamp of newest image in s, size),
+                    oldest first
+        write():    writes an image and returns (key, size) of the
+                    retention unit it was written to
+        sync():     syncs all written images to disk
+        remove():   deletes a retention unit, returns False if the
+                    unit is still in use
+        close():    syncs and closes all open files
+
+    For this backend every image is its own retention unit and the
+    key is the path of the file. Only files in the layout of the
+    archive are retained, all other files in storage_path (e.g.
+    profiles, a spool or files of the operator) are never counted
+    or deleted. Images directly in storage_path, as written by
+    earlier versions, are retained as well.
+
+    Args of constructor:
+        storage_path[string]:   Directory of the archive
+        (opt.) extension[string]:
+                                File extension of the images
+                                Default value: ".jpg"
+    """
+
+    def __init__(self, storage_path, extension=".jpg") -> None:
+        self.storage_path = storage_path
+        self.extension = extension
+        self._unsynced = []
+        self._unsynced_dirs = set()
+
+    def scan(self) -> list:
+        units = []
+        try:
+            names = os.listdir(self.storage_path)
+        except OSError:
+            return units
+        # Flat layout of earlier versions
+        self._scan_directory(self.storage_path, names, units)
+        for day in names:
+            directory = os.path.join(self.storage_path, day)
+            if not is_day_directory_name(day) or not os.path.isdir(directory):
+                continue
+            self._scan_directory(directory, os.listdir(directory), units)
+        units.sort(key=lambda unit: unit[1])
+        return units
+
+    def _scan_directory(self, directory, file_names, units) -> None:
+        for file_name in file_names:
+            if not self._is_archived_image(file_name):
+                continue
+            path = os.path.join(directory, file_name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            units.append((path, stat.st_mtime, stat.st_size))
+
+    def _is_archived_image(self, file_name) -> bool:
+        extension = os.path.splitext(file_name)[1]
+        if extension != self.extension and extension not in ARCHIVE_EXTENSIONS:
+            return False
+        return parse_image_file_name(file_name) is not None
+
+    def write(self, timestamp_ms, image_id, encoded) -> tuple:
+        day = datetime.datetime.fromtimestamp(timestamp_ms / 1000, tz=datetime.timezone.utc).strftime("%Y-%m-%d")
+        directory = os.path.join(self.storage_path, day)
+        if not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+            self._unsynced_dirs.add(self.storage_path)
+
+        sequence = 0
+        while True:
+            path = os.path.join(directory, image_file_name(timestamp_ms, self.extension, sequence))
+            try:
+                f = open(path, "xb")
+                break
+            except FileExistsError:
+                # Another image of the same millisecond
+                sequence += 1
+        try:
+            size = f.write(encoded)
+        except OSError:
+            f.close()
+            raise
+        # Kept open until the next sync
+        self._unsynced.append(f)
+        self._unsynced_dirs.add(directory)
+        return path, size
+
+    def sync(self) -> None:
+        for f in self._unsynced:
+            try:
+                f.flush()
+                os.fsync(f.fileno())
+            finally:
+                f.close()
+        self._unsynced = []
+
+        for directory in self._unsynced_dirs:
+            sync_directory(directory)
+        self._unsynced_dirs = set()
+
+    def remove(self, key) -> bool:
+        os.remove(key)
+        # Remove the directory of a day once it is empty
+        directory = os.path.dirname(key)
+        if directory != self.storage_path:
+            try:
+                os.rmdir(directory)
+            except OSError:
+                pass
+        return True
+
+    def close(self) -> None:
+        self.sync()
+
+
+class ImageArchiveWriter:
+    """
+    Writes encoded images in a background thread.
+
+    The writer never blocks the caller. If the queue is full, the
+    oldest queued image is dropped. Images are synced to disk in
+    batches of fsync_batch images or as soon as the queue runs
+    empty. The total size of the archive is tracked incrementally,
+    the storage is only scanned once at startup.
+
+    Args of constructor:
+        storage_path[string]:   Directory of the archive
+        (opt.) extension[string]:
+                                File extension of the images
+                                Default value: ".jpg"
+        (opt.) queue_depth[int]:
+                                Maximum number of images waiting to
+                                be written
+                                Default value: 64
+        (opt.) max_bytes[int]:  Maximum total size of the archive,
+                                None for no limit
+                                Default value: None
+        (opt.) max_age[float]:  Maximum age of archived images in
+                                seconds, None for no limit
+                                Default value: None
+        (opt.) fsync_batch[int]:
+                                Number of images after which the
+                                written images are synced to disk
+                                Default value: 16
+        (opt.) storage[FileStorage/SegmentStorage]:
+                                Storage backend, None for a
+                                FileStorage in storage_path
+                                Default value: None
+
+    Returns of constructor:
+        A running archive writer
+    """
+
+    def __init__(self, storage_path, extension=".jpg", queue_depth=64, max_bytes=None, max_age=None,
+                 fsync_batch=16, storage=None) -> None:
+        self.storage_path = storage_path
+        self.extension = extension
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.fsync_batch = max(1, fsync_batch)
+        self.storage = storage if storage is not None else FileStorage(storage_path, extension)
+
+        # Counters
+        self.written = 0
+        self.bytes_written = 0
+        self.deleted = 0
+        self.write_errors = 0
+        self.write_latency_ms = 0.0
+        self.write_latency_ms_max = 0.0
+        self._write_latency_ms_sum = 0.0
+
+        # key -> [timestamp of newest image in s, size] of all
+        #   retention units, oldest first
+        self._units = collections.OrderedDict()
+        self.total_bytes = 0
+        self._scan()
+        self._enforce_retention()
+
+        self._queue = StageQueue(queue_depth, QUEUE_POLICY_DROP_OLDEST)
+        self._unsynced = 0
+        self._thread = threading.Thread(target=self._run, name="archive", daemon=True)
+        self._thread.start()
+
+    def submit(self, timestamp_ms, image_id, encoded) -> None:
+        """
+        Queues an encoded image for writing. Never blocks.
+
+        Args:
+            timestamp_ms[int]:      Timestamp of the image in ms since
+                                    epoch
+            image_id[string]:       Unique id of the image
+            encoded[buffer]:        Encoded image
+
+        Returns:
+            None
+        """
+        self._queue.put((timestamp_ms, image_id, encoded))
+
+    def stats(self) -> dict:
+        """
+        Current counters of the writer.
+
+        Args:
+            None
+
+        Returns:
+            Dictionary with the counters
+        """
+        return {
+            'queue_depth': len(self._queue),
+            'dropped_writes': self._queue.dropped,
+            'written': self.written,
+            'write_errors': self.write_errors,
+            'bytes_written': self.bytes_written,
+            'deleted': self.deleted,
+            'total_bytes': self.total_bytes,
+            'write_latency_ms': self.write_latency_ms,
+            'write_latency_ms_max': self.write_latency_ms_max,
+            'write_latency_ms_mean': self._write_latency_ms_sum / self.written if self.written else 0.0,
+        }
+
+    def stop(self) -> None:
+        """
+        Writes all queued images, syncs them to disk and stops the
+        background thread.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        self._queue.close()
+        self._thread.join()
+
+    def _scan(self) -> None:
+        # Register the images of earlier runs for the retention
+        for key, timestamp, size in self.storage.scan():
+            self._units[key] = [timestamp, size]
+            self.total_bytes += size
+        logging.debug("Image archive contains {} bytes.".format(self.total_bytes))
+
+    def _run(self) -> None:
+        while True:
+            # Sync as soon as there is nothing else to do
+            if self._unsynced and len(self._queue) == 0:
+                self._sync()
+            item = self._queue.get()
+            if item is None:
+                break
+            self._write(*item)
+            if self._unsynced >= self.fsync_batch:
+                self._sync()
+        try:
+            self.storage.close()
+        except OSError:
+            logging.exception("Image archive could not be closed.")
+
+    def _write(self, timestamp_ms, image_id, encoded) -> None:
+        start = time.perf_counter()
+        try:
+            key, size = self.storage.write(timestamp_ms, image_id, encoded)
+        except OSError:
+            self.write_errors += 1
+            logging.exception("Image {} could not be saved.".format(image_id))
+            return
+        self._unsynced += 1
+
+        unit = self._units.get(key)
+        if unit is None:
+            self._units[key] = [timestamp_ms / 1000, size]
+        else:
+            unit[0] = timestamp_ms / 1000
+            unit[1] += size
+        self.total_bytes += size
+        self.bytes_written += size
+        self.written += 1
+        self._enforce_retention()
+
+        self.write_latency_ms = (time.perf_counter() - start) * 1000
+        self.write_latency_ms_max = max(self.write_latency_ms_max, self.write_latency_ms)
+        self._write_latency_ms_sum += self.write_latency_ms
+        logging.debug("Image saved to {}".format(key))
+
+    def _sync(self) -> None:
+        try:
+            self.storage.sync()
+        except OSError:
+            self.write_errors += 1
+            logging.exception("Images could not be synced to disk.")
+        self._unsynced = 0
+
+    def _enforce_retention(self) -> None:
+        oldest_allowed = time.time() - self.max_age if self.max_age is not None else None
+        while self._units:
+            key = next(iter(self._units))
+            timestamp, size = self._units[key]
+            too_big = self.max_bytes is not None and self.total_bytes > self.max_bytes
+            too_old = oldest_allowed is not None and timestamp < oldest_allowed
+            if not too_big and not too_old:
+                break
+            try:
+                if not self.storage.remove(key):
+                    # Unit is still in use, e.g. the open segment
+                    break
+                self.deleted += 1
+            except OSError:
+                logging.warning("Archived images {} could not be deleted.".format(key))
+            del self._units[key]
+            self.total_bytes -= size
@@ -0,0 +1,519 @@
+"""
+Benchmark of the hot path of cameraconnect on synthetic frames.
+
+Two kinds of scenarios are measured for every resolution and pixel
+format:
+
+    publish     encode_frame() and publish_frame() of a camera, which
+                send the message with a real MQTT client over TCP to
+                a broker
+    convert     the conversion of a GenTL buffer into the BGR or Mono
+                array with the PixelConverter (see pixel_formats.py),
+                i.e. the part of GenICam.get_image() that runs after
+                the buffer was fetched
+
+Unless --broker is given, the messages are sent to a minimal MQTT
+broker that runs in-process. It acknowledges and counts the messages
+but does not forward them, so the results do not depend on the load
+of a shared broker.
+
+Reported per scenario:
+    fps                 frames per second, for publish including the
+                        time until the broker received all messages
+    cpu_ms_per_frame    CPU time of the process per frame, which
+                        includes the network thread of the MQTT
+                        client and the in-process broker
+    bytes_per_frame     size of the MQTT message (publish) or of the
+                        converted image (convert)
+    allocated_peak_bytes, allocated_blocks_per_frame
+                        peak of the memory allocated while processing
+                        frames and the growth of the allocated memory
+                        blocks per frame, measured with tracemalloc
+                        in a separate pass
+    p50_ms, p95_ms, p99_ms
+                        percentiles of the time per frame, for
+                        publish also per stage
+
+Print the results as JSON and compare two versions, e.g.:
+
+    python3 benchmark.py --frames 200 --output before.json
+    python3 benchmark.py --frames 200 --compare before.json
+"""
+
+# Import python in-built libraries
+import argparse
+import gc
+import json
+import platform
+import socket
+import struct
+import sys
+import threading
+import time
+import tracemalloc
+
+# Import libraries that had been installed with pip install
+import cv2
+import numpy as np
+
+# Import self-written modules
+from benchmark_codecs import synthetic_frame
+from buffer_pool import FrameBufferPool
+from cameras import CamGeneral
+from image_codecs import CODEC_JPG, CODECS, create_codec
+from payload import PAYLOAD_FORMATS
+from pixel_formats import PixelConverter
+
+# (name, height, width)
+RESOLUTIONS = [
+    ("640x480", 480, 640),
+    ("1280x1024", 1024, 1280),
+    ("1920x1200", 1200, 1920),
+    ("2448x2048", 2048, 2448),
+]
+# Pixel formats of the publish scenarios -> channels
+PUBLISH_PIXEL_FORMATS = {"Mono8": 1, "BGR8": 3}
+# GenTL pixel formats of the convert scenarios -> bytes per pixel
+#   in the buffer
+CONVERT_PIXEL_FORMATS = {
+    "Mono8": 1,
+    "RGB8": 3,
+    "BGR8": 3,
+    "BayerRG8": 1,
+    "YUV422_8": 2,
+    "Mono12": 2,
+    "Mono12Packed": 1.5,
+    "Mono12p": 1.5,
+    "Mono10p": 1.25,
+}
+
+WARMUP_FRAMES = 5
+# Relative change of fps that is marked in the comparison
+COMPARE_THRESHOLD = 0.05
+
+
+def percentiles(timings) -> dict:
+    """
+    p50, p95 and p99 of a list of timings.
+
+    Args:
+        timings[list]:          Timings in ms
+
+    Returns:
+        Dictionary like {'p50_ms': ..., 'p95_ms': ..., 'p99_ms': ...}
+    """
+    values = np.percentile(timings, (50, 95, 99))
+    return {'p{}_ms'.format(p): round(float(v), 3) for p, v in zip((50, 95, 99), values)}
+
+
+def measure_allocations(step, frames) -> dict:
+    """
+    Runs a step several times with tracemalloc.
+
+    Args:
+        step[callable]:         Processes one frame
+        frames[int]:            Number of frames
+
+    Returns:
+        Dictionary with allocated_peak_bytes and
+        allocated_blocks_per_frame
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        start_size = tracemalloc.get_traced_memory()[0]
+        for i in range(frames):
+            step()
+        # tracemalloc.reset_peak() is only available since Python
+        #   3.9, so this is the peak of the whole pass
+        peak = tracemalloc.get_traced_memory()[1] - start_size
+        gc.collect()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, "filename"))
+    return {
+        'allocated_peak_bytes': int(peak),
+        'allocated_blocks_per_frame': round(blocks / frames, 2),
+    }
+
+
+class StandInBroker:
+    """
+    Minimal MQTT 3.1.1 broker in background threads. It accepts
+    connections, acknowledges published messages with QoS 1, answers
+    pings and counts the messages, nothing is forwarded.
+
+    Args of constructor:
+        (opt.) host[string]:    Address to listen on
+                                Default value: "127.0.0.1"
+
+    Returns of constructor:
+        A running broker listening on a free port (see self.port)
+    """
+
+    def __init__(self, host="127.0.0.1") -> None:
+        self.host = host
+        self.messages = 0
+        self.bytes = 0
+        self._condition = threading.Condition()
+        self._connections = []
+        self._socket = socket.socket()
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((host, 0))
+        self._socket.listen(8)
+        self.port = self._socket.getsockname()[1]
+        threading.Thread(target=self._accept, name="broker", daemon=True).start()
+
+    def wait_for(self, messages, timeout=60.0) -> bool:
+        """
+        Waits until the broker received a number of messages.
+
+        Args:
+            messages[int]:          Total number of messages
+            (opt.) timeout[float]:  Maximum time to wait in seconds
+                                    Default value: 60.0
+
+        Returns:
+            True if the messages were received in time
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while self.messages < messages:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def stop(self) -> None:
+        """
+        Closes the listening socket and all connections.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        for sock in [self._socket] + self._connections:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+
+    def _accept(self) -> None:
+        while True:
+            try:
+                connection, address = self._socket.accept()
+            except OSError:
+                return
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._connections.append(connection)
+            threading.Thread(target=self._serve, args=(connection,), daemon=True).start()
+
+    def _serve(self, connection) -> None:
+        stream = connection.makefile("rb")
+        try:
+            while True:
+                header = stream.read(1)
+                if not header:
+                    break
+                packet_type = header[0] >> 4
+                length = self._read_length(stream)
+                body = stream.read(length)
+                if packet_type == 1:
+                    # CONNECT -> CONNACK
+                    connection.sendall(b"\x20\x02\x00\x00")
+                elif packet_type == 3:
+                    qos = (header[0] >> 1) & 3
+                    topic_length = struct.unpack_from("!H", body)[0]
+                    payload_start = 2 + topic_length
+                    if qos:
+                        # PUBACK with the packet id
+                        connection.sendall(b"\x40\x02" + body[payload_start:payload_start + 2])
+                        payload_start += 2
+                    with self._condition:
+                        self.messages += 1
+                        self.bytes += length - payload_start
+                        self._condition.notify_all()
+                elif packet_type == 8:
+                    # SUBSCRIBE -> SUBACK granting QoS 0
+                    connection.sendall(b"\x90\x03" + body[:2] + b"\x00")
+                elif packet_type == 12:
+                    # PINGREQ -> PINGRESP
+                    connection.sendall(b"\xd0\x00")
+                elif packet_type == 14:
+                    break
+        except (OSError, ValueError, struct.error):
+            pass
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _read_length(stream) -> int:
+        length = 0
+        multiplier = 1
+        while True:
+            byte = stream.read(1)
+            if not byte:
+                raise ValueError("Connection closed.")
+            length += (byte[0] & 127) * multiplier
+            multiplier *= 128
+            if not byte[0] & 128:
+                return length
+
+
+class SyntheticCamera(CamGeneral):
+    """
+    Camera that returns the same synthetic frame for every
+    acquisition.
+
+    Args of constructor:
+        mqtt_host, mqtt_port, mqtt_topic, mac_address and the
+        optional arguments of CamGeneral, see there
+        image[np.ndarray]:      Frame that is returned
+
+    Returns of constructor:
+        A camera ready to get an image
+    """
+
+    def __init__(self, mqtt_host, mqtt_port, mqtt_topic, mac_address, image, **kwargs) -> None:
+        super().__init__(mqtt_host, mqtt_port, mqtt_topic, mac_address, **kwargs)
+        self.image = image
+
+    def _acquire_image(self):
+        return self.image
+
+
+def benchmark_publish(broker, host, port, frame, codec, payload_format, qos, frames) -> dict:
+    """
+    Encodes and publishes a frame several times.
+
+    Args:
+        broker[StandInBroker]:  In-process broker or None for an
+                                external one
+        host[string]:           Host of the MQTT broker
+        port[int]:              Port of the MQTT broker
+        frame[np.ndarray]:      Frame to publish
+        codec[ImageCodec]:      Codec of the camera
+        payload_format[string]: Payload format of the camera
+        qos[int]:               QoS of the published messages
+        frames[int]:            Number of measured frames
+
+    Returns:
+        Dictionary with the results
+    """
+    cam = SyntheticCamera(host, port, "benchmark/cameraconnect", "benchmark", frame, codec=codec,
+                          payload_format=payload_format, mqtt_qos=qos)
+    deadline = time.monotonic() + 10
+    while not cam.mqtt_connected and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    def step():
+        acquired = cam.acquire_frame()
+        cam.encode_frame(acquired)
+        cam.publish_frame(acquired)
+
+    try:
+        for i in range(WARMUP_FRAMES):
+            step()
+        received = broker.messages if broker is not None else 0
+
+        timings = {'encode': [], 'publish': [], 'total': []}
+        message_bytes = 0
+        cpu_start = time.process_time()
+        start = time.perf_counter()
+        for i in range(frames):
+            frame_start = time.perf_counter()
+            acquired = cam.acquire_frame()
+            cam.encode_frame(acquired)
+            encoded = time.perf_counter()
+            cam.publish_frame(acquired)
+            published = time.perf_counter()
+            timings['encode'].append((encoded - frame_start) * 1000)
+            timings['publish'].append((published - encoded) * 1000)
+            timings['total'].append((published - frame_start) * 1000)
+            message_bytes += len(acquired.message)
+        # Only frames that arrived at the broker count
+        complete = broker.wait_for(received + frames) if broker is not None else True
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - cpu_start
+
+        result = {
+            'fps': round(frames / elapsed, 2),
+            'cpu_ms_per_frame': round(cpu * 1000 / frames, 3),
+            'bytes_per_frame': int(message_bytes / frames),
+            'complete': complete,
+        }
+        result.update(percentiles(timings['total']))
+        for stage in ('encode', 'publish'):
+            for key, value in percentiles(timings[stage]).items():
+                result[stage + '_' + key] = value
+        result.update(measure_allocations(step, min(frames, 20)))
+        return result
+    finally:
+        cam.disconnect()
+
+
+def benchmark_convert(data_format, height, width, frames) -> dict:
+    """
+    Converts a synthetic GenTL buffer several times into arrays of a
+    buffer pool, like GenICam._convert_component().
+
+    Args:
+        data_format[string]:    GenICam pixel format of the buffer
+        height[int]:            Height of the image in pixels
+        width[int]:             Width of the image in pixels
+        frames[int]:            Number of measured frames
+
+    Returns:
+        Dictionary with the results
+    """
+    # The conversions do not depend on the content of the pixels
+    size = int(height * width * CONVERT_PIXEL_FORMATS[data_format])
+    data = np.random.RandomState(0).randint(0, 256, size).astype(np.uint8)
+    converter = PixelConverter(data_format)
+    shape = converter.output_shape(height, width)
+    buffer_pool = FrameBufferPool(shape, dtype=converter.dtype)
+
+    def step():
+        image = converter.convert(data, height, width, out=buffer_pool.acquire())
+        buffer_pool.release(image)
+
+    for i in range(WARMUP_FRAMES):
+        step()
+    timings = []
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    for i in range(frames):
+        frame_start = time.perf_counter()
+        step()
+        timings.append((time.perf_counter() - frame_start) * 1000)
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+
+    result = {
+        'fps': round(frames / elapsed, 2),
+        'cpu_ms_per_frame': round(cpu * 1000 / frames, 3),
+        'bytes_per_frame': int(np.prod(shape)) * converter.dtype.itemsize,
+    }
+    result.update(percentiles(timings))
+    result.update(measure_allocations(step, min(frames, 20)))
+    return result
+
+
+def environment() -> dict:
+    """
+    Versions of the environment, to tell apart results of different
+    machines.
+
+    Args:
+        None
+
+    Returns:
+        Dictionary with the versions
+    """
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpus': cv2.getNumberOfCPUs(),
+    }
+
+
+def compare(results, baseline_path) -> None:
+    """
+    Prints the change of fps and cpu_ms_per_frame against an earlier
+    run.
+
+    Args:
+        results[list]:          Results of this run
+        baseline_path[string]:  JSON output of an earlier run
+
+    Returns:
+        None
+    """
+    with open(baseline_path) as f:
+        baseline = {result['scenario']: result for result in json.load(f)['results']}
+
+    print("{:<48} {:>10} {:>10} {:>8} {:>12}".format("scenario", "fps", "baseline", "change", "cpu [ms]"))
+    for result in results:
+        before = baseline.get(result['scenario'])
+        if before is None:
+            print("{:<48} {:>10} {:>10}".format(result['scenario'], result['fps'], "new"))
+            continue
+        change = result['fps'] / before['fps'] - 1 if before['fps'] else 0.0
+        mark = " <-- slower" if change < -COMPARE_THRESHOLD else ""
+        print("{:<48} {:>10} {:>10} {:>+7.1%} {:>5} -> {:<5}{}".format(
+            result['scenario'], result['fps'], before['fps'], change, before['cpu_ms_per_frame'],
+            result['cpu_ms_per_frame'], mark))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the hot path of cameraconnect.")
+    parser.add_argument("--frames", type=int, default=100, help="measured frames per scenario")
+    parser.add_argument("--resolutions", nargs="+", default=[name for name, h, w in RESOLUTIONS],
+                        choices=[name for name, h, w in RESOLUTIONS])
+    parser.add_argument("--codecs", nargs="+", default=[CODEC_JPG], choices=CODECS)
+    parser.add_argument("--payload-formats", nargs="+", default=list(PAYLOAD_FORMATS), choices=PAYLOAD_FORMATS)
+    parser.add_argument("--qos", type=int, default=0, choices=(0, 1), help="QoS of the published messages")
+    parser.add_argument("--broker", default=None, help="host:port of an MQTT broker instead of the in-process one")
+    parser.add_argument("--scenarios", nargs="+", default=["publish", "convert"], choices=["publish", "convert"])
+    parser.add_argument("--output", default=None, help="write the JSON results into this file")
+    parser.add_argument("--compare", default=None, help="compare with the JSON results of an earlier run")
+    args = parser.parse_args()
+
+    broker = None
+    if args.broker:
+        host, port = args.broker.rsplit(":", 1)
+        port = int(port)
+    else:
+        broker = StandInBroker()
+        host, port = broker.host, broker.port
+
+    results = []
+    for name, height, width in RESOLUTIONS:
+        if name not in args.resolutions:
+            continue
+        if "publish" in args.scenarios:
+            for pixel_format, channels in PUBLISH_PIXEL_FORMATS.items():
+                frame = synthetic_frame(height, width, channels)
+                for codec_name in args.codecs:
+                    for payload_format in args.payload_formats:
+                        result = {'scenario': "publish {} {} {} {}".format(name, pixel_format, codec_name,
+                                                                          payload_format)}
+                        result.update(benchmark_publish(broker, host, port, frame, create_codec(codec_name),
+                                                        payload_format, args.qos, args.frames))
+                        results.append(result)
+                        print("{scenario:<48} {fps:>9} fps".format(**result), file=sys.stderr)
+        if "convert" in args.scenarios:
+            for pixel_format in CONVERT_PIXEL_FORMATS:
+                result = {'scenario': "convert {} {}".format(name, pixel_format)}
+                result.update(benchmark_convert(pixel_format, height, width, args.frames))
+                results.append(result)
+                print("{scenario:<48} {fps:>9} fps".format(**result), file=sys.stderr)
+
+    if broker is not None:
+        broker.stop()
+
+    report = {
+        'environment': environment(),
+        'settings': {'frames': args.frames, 'qos': args.qos, 'broker': args.broker or "in-process"},
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+    elif not args.output:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Benchmark of the image codecs on the frame sizes used in production.
+
+For every codec, preset and frame size the script reports the mean
+and 95th percentile encoding time and the size of the encoded
+image. Run it inside the container to pick the cheapest codec for a
+line, e.g.:
+
+    python3 benchmark_codecs.py --iterations 20
+    python3 benchmark_codecs.py --image /app/assets/dummy_image.jpg --json
+
+Without --image synthetic frames (gradients, edges and sensor noise)
+are used, which compress similar to real images of parts.
+"""
+
+# Import python in-built libraries
+import argparse
+import json
+import time
+
+# Import libraries that had been installed with pip install
+import cv2
+import numpy as np
+
+# Import self-written modules
+from image_codecs import CODEC_RAW, CODECS, PRESETS, create_codec
+
+# (name, height, width, channels)
+FRAME_SIZES = [
+    ("800x800 Mono8", 800, 800, 1),
+    ("1280x1024 Mono8", 1024, 1280, 1),
+    ("1920x1200 BGR8", 1200, 1920, 3),
+    ("2448x2048 Mono8", 2048, 2448, 1),
+    ("2448x2048 BGR8", 2048, 2448, 3),
+]
+
+
+def synthetic_frame(height, width, channels, seed=0) -> np.ndarray:
+    """
+    Creates a frame with smooth gradients, a few sharp edges and
+    sensor noise.
+
+    Args:
+        height[int]:            Height of the frame in pixels
+        width[int]:             Width of the frame in pixels
+        channels[int]:          1 for Mono8, 3 for BGR8
+        (opt.) seed[int]:       Seed of the noise
+
+    Returns:
+        Frame as np.ndarray of shape (height, width, channels)
+    """
+    rng = np.random.RandomState(seed)
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, np.newaxis]
+    x = np.linspace(0, 1, width, dtype=np.float32)[np.newaxis, :]
+    base = 60 + 120 * (0.5 * x + 0.5 * y)
+
+    frame = np.empty((height, width, channels), dtype=np.uint8)
+    for channel in range(channels):
+        layer = base * (0.8 + 0.2 * channel) + rng.normal(0, 4, (height, width))
+        frame[:, :, channel] = np.clip(layer, 0, 255)
+
+    # Some parts with sharp edges
+    for i in range(8):
+        top = rng.randint(0, height - height // 6)
+        left = rng.randint(0, width - width // 6)
+        color = tuple(int(c) for c in rng.randint(0, 255, channels))
+        cv2.rectangle(frame, (left, top), (left + width // 8, top + height // 8), color, -1)
+    return frame
+
+
+def load_frame(path, height, width, channels) -> np.ndarray:
+    """
+    Loads an image and resizes it to the frame size.
+
+    Args:
+        path[string]:           Path to the image
+        height[int]:            Height of the frame in pixels
+        width[int]:             Width of the frame in pixels
+        channels[int]:          1 for Mono8, 3 for BGR8
+
+    Returns:
+        Frame as np.ndarray of shape (height, width, channels)
+    """
+    flag = cv2.IMREAD_GRAYSCALE if channels == 1 else cv2.IMREAD_COLOR
+    image = cv2.resize(cv2.imread(path, flag), (width, height))
+    return image.reshape(height, width, channels)
+
+
+def benchmark_codec(codec, frame, iterations) -> dict:
+    """
+    Encodes a frame several times with a codec.
+
+    Args:
+        codec[ImageCodec]:      Codec to benchmark
+        frame[np.ndarray]:      Frame to encode
+        iterations[int]:        Number of measured encodings
+
+    Returns:
+        Dictionary with the timings in ms and the encoded size
+    """
+    # Warm up, e.g. allocation of internal buffers
+    encoded = codec.encode(frame)
+
+    timings = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        encoded = codec.encode(frame)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    size = memoryview(encoded).nbytes
+    return {
+        'mean_ms': round(float(np.mean(timings)), 3),
+        'p95_ms': round(float(np.percentile(timings, 95)), 3),
+        'bytes': size,
+        'ratio': round(frame.nbytes / size, 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the image codecs of cameraconnect.")
+    parser.add_argument("--iterations", type=int, default=10, help="measured encodings per codec and frame")
+    parser.add_argument("--codecs", nargs="+", default=list(CODECS), choices=CODECS)
+    parser.add_argument("--presets", nargs="+", default=list(PRESETS), choices=list(PRESETS))
+    parser.add_argument("--image", default=None, help="use this image instead of synthetic frames")
+    parser.add_argument("--json", action="store_true", help="print the results as json")
+    args = parser.parse_args()
+
+    results = []
+    for frame_name, height, width, channels in FRAME_SIZES:
+        if args.image:
+            frame = load_frame(args.image, height, width, channels)
+        else:
+            frame = synthetic_frame(height, width, channels)
+
+        for codec_name in args.codecs:
+            # The raw codec has no settings
+            presets = ["Default"] if codec_name == CODEC_RAW else args.presets
+            for preset in presets:
+                codec = create_codec(codec_name, preset=preset)
+                result = benchmark_codec(codec, frame, args.iterations)
+                result.update({'frame': frame_name, 'codec': codec_name, 'implementation': type(codec).__name__,
+                               'preset': preset})
+                results.append(result)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print("{:<17} {:<10} {:<9} {:>10} {:>10} {:>11} {:>7}".format(
+        "frame", "codec", "preset", "mean [ms]", "p95 [ms]", "bytes", "ratio"))
+    for result in results:
+        print("{frame:<17} {codec:<10} {preset:<9} {mean_ms:>10} {p95_ms:>10} {bytes:>11} {ratio:>7}".format(**result))
+
+
+if __name__ == "__main__":
+    main()
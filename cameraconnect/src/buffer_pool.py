@@ -0,0 +1,119 @@
+"""
+Pool of reusable image arrays.
+
+Allocating a new array for every frame churns hundreds of MB/s
+through the allocator at high frame rates. The FrameBufferPool
+preallocates arrays of the negotiated image size, the conversion
+writes into them and they are released back to the pool as soon as
+the frame is encoded.
+"""
+
+# Import python in-built libraries
+import collections
+import resource
+import threading
+
+# Import libraries that had been installed with pip install
+import numpy as np
+
+
+def peak_rss_mb() -> float:
+    """
+    Peak resident set size of the process.
+
+    Args:
+        None
+
+    Returns:
+        Peak RSS in MB
+    """
+    # ru_maxrss is given in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class FrameBufferPool:
+    """
+    Thread safe pool of arrays with the same shape and data type.
+    If all arrays are in use, a new one is allocated, so the pool
+    grows to the number of frames that are in flight at the same
+    time.
+
+    Args of constructor:
+        shape[tuple]:           Shape of the arrays, e.g.
+                                (height, width, channels)
+        (opt.) dtype[np.dtype]: Data type of the arrays
+                                Default value: np.uint8
+        (opt.) preallocate[int]:
+                                Number of arrays allocated upfront
+                                Default value: 3
+
+    Returns of constructor:
+        A pool with preallocated arrays
+    """
+
+    def __init__(self, shape, dtype=np.uint8, preallocate=3) -> None:
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+
+        self.allocations = 0
+        self.reuses = 0
+        self.in_use = 0
+        self._free = collections.deque()
+        self._lock = threading.Lock()
+        for i in range(preallocate):
+            self._free.append(self._allocate())
+
+    def acquire(self) -> np.ndarray:
+        """
+        Takes an array out of the pool. The content is undefined.
+
+        Args:
+            None
+
+        Returns:
+            Array of the shape and data type of the pool
+        """
+        with self._lock:
+            self.in_use += 1
+            if self._free:
+                self.reuses += 1
+                return self._free.pop()
+            return self._allocate()
+
+    def release(self, array) -> None:
+        """
+        Puts an array back into the pool. Arrays of another shape
+        (e.g. after the region of interest changed) are dropped.
+
+        Args:
+            array[np.ndarray]:      Array taken out with acquire()
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self.in_use = max(0, self.in_use - 1)
+            if array.shape == self.shape and array.dtype == self.dtype:
+                self._free.append(array)
+
+    def stats(self) -> dict:
+        """
+        Current counters of the pool.
+
+        Args:
+            None
+
+        Returns:
+            Dictionary with the counters
+        """
+        return {
+            'allocations': self.allocations,
+            'reuses': self.reuses,
+            'in_use': self.in_use,
+            'free': len(self._free),
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+        }
+
+    def _allocate(self) -> np.ndarray:
+        self.allocations += 1
+        return np.empty(self.shape, dtype=self.dtype)
@@ -0,0 +1,170 @@
+"""
+Several cameras served by one process.
+
+Running one container per camera loads the GenTL producers and
+enumerates all devices once per camera. With a list of MAC
+addresses one process drives all cameras with a shared Harvester
+(see create_harvester() in genicam_camera.py) and one image acquirer per
+device. The CameraGroup fans a capture request out to all cameras,
+so they acquire in parallel and every camera publishes to its own
+topic.
+"""
+
+# Import python in-built libraries
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+
+def camera_name(cam) -> str:
+    """
+    Name of a camera in the logs, its MAC address.
+
+    Args:
+        cam[CamGeneral/FramePipeline]:
+                                Camera or pipeline of a camera
+
+    Returns:
+        Name of the camera
+    """
+    cam = getattr(cam, "cam", cam)
+    return str(getattr(cam, "mac_address", cam))
+
+
+def disconnect_camera(cam) -> None:
+    """
+    Finishes the queued frames of a FramePipeline and disconnects
+    the camera.
+
+    Args:
+        cam[CamGeneral/FramePipeline]:
+                                Camera or pipeline of a camera
+
+    Returns:
+        None
+    """
+    if hasattr(cam, "stop"):
+        cam.stop()
+        cam = cam.cam
+    cam.disconnect()
+
+
+class CameraGroup:
+    """
+    Captures an image with all cameras of the group in parallel.
+    Provides get_image() like a single camera, so the triggers can
+    be used without changes.
+
+    Args of constructor:
+        cams[list]:             Cameras or FramePipelines, each one
+                                must provide get_image()
+
+    Returns of constructor:
+        A group ready to capture images
+    """
+
+    def __init__(self, cams) -> None:
+        self.cams = list(cams)
+        # Failed captures of every camera
+        self.failures = [0] * len(self.cams)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, len(self.cams)))
+
+    def get_image(self, request=None) -> None:
+        """
+        Gets an image of every camera and waits until all of them
+        are done. A failing camera does not stop the others.
+
+        Args:
+            (opt.) request[CaptureRequest]:
+                                    Request that caused the
+                                    acquisition, every camera gets
+                                    its own copy
+                                    Default value: None
+
+        Returns:
+            None
+        """
+        futures = [self._executor.submit(cam.get_image, request.copy() if request is not None else None)
+                   for cam in self.cams]
+        for index, future in enumerate(futures):
+            try:
+                future.result()
+            except Exception:
+                self.failures[index] += 1
+                logging.exception("Getting an image of camera {} failed.".format(camera_name(self.cams[index])))
+
+    @property
+    def paced_ns(self) -> int:
+        # Time the cameras waited on purpose, see ContinuousTrigger.
+        #   The cameras wait in parallel, the trigger limits it to
+        #   the time of the capture.
+        return sum(getattr(cam, "paced_ns", 0) for cam in self.cams)
+
+    def is_finished(self) -> bool:
+        """
+        Checks if all cameras are finished, see
+        CamGeneral.is_finished().
+
+        Args:
+            None
+
+        Returns:
+            True if no camera can deliver any more images
+        """
+        return all(cam.is_finished() for cam in self.cams)
+
+    def is_ready(self) -> bool:
+        """
+        Readiness of all cameras of the group, see
+        CamGeneral.is_ready().
+
+        Args:
+            None
+
+        Returns:
+            True if every camera is ready
+        """
+        return all(cam.is_ready() for cam in self.cams)
+
+    def stats(self) -> dict:
+        """
+        Counters and readiness of every camera of the group.
+
+        Args:
+            None
+
+        Returns:
+            Dictionary with the name of every camera as key and a
+            dictionary of its counters, its readiness and its failed
+            captures in the group as value
+        """
+        stats = {}
+        for cam, failures in zip(self.cams, self.failures):
+            stats[camera_name(cam)] = dict(cam.stats(), ready=int(cam.is_ready()), group_failures=failures)
+        return stats
+
+    def close(self) -> None:
+        """
+        Waits for the running captures and ends the threads of the
+        group. The cameras stay connected.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        self._executor.shutdown(wait=True)
+
+    def disconnect(self) -> None:
+        """
+        Stops the pipelines and disconnects all cameras.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        self.close()
+        for cam in self.cams:
+            disconnect_camera(cam)
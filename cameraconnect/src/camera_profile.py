@@ -0,0 +1,194 @@
+"""
+Cached configuration profile of a GenICam camera.
+
+Listing all features of the node map of a camera and writing every
+setting costs many GenApi round-trips, which are repeated on every
+start and every recovery of the camera. The CameraProfile keeps the
+feature names of the node map and the last applied settings, so the
+features are only discovered once per device and only settings that
+differ from the camera are written. Settings that this process
+already wrote or read back are not read from the camera again, e.g.
+during a recovery. The profile can be persisted as JSON file, so a
+restarted container skips the discovery as well:
+
+    {
+        "device_id": "devicemodul00_30_53_2B_87_9C",
+        "features": ["AcquisitionMode", ...],
+        "applied": {"Width": 800, "PixelFormat": "Mono8", ...}
+    }
+
+The applied settings of the file are read back from the camera once,
+because the camera may have been power cycled since they were
+written. Delete the file after a firmware update of the camera to
+discover the features again.
+"""
+
+# Import python in-built libraries
+import json
+import logging
+import os
+
+
+class CameraProfile:
+    """
+    Feature names of the node map and last applied settings of one
+    camera.
+
+    Args of constructor:
+        (opt.) path[string]:    JSON file of the profile, None to
+                                keep the profile only in memory
+                                Default value: None
+
+    Returns of constructor:
+        A profile, loaded from path if the file exists
+    """
+
+    def __init__(self, path=None) -> None:
+        self.path = path
+        self.device_id = None
+        # Feature names of the node map, None if not discovered yet
+        self.features = None
+        # Feature name -> last value written to the camera
+        self.applied = {}
+        # Feature names whose applied value was written or read back
+        #   by this process, see is_applied()
+        self._verified = set()
+        # Settings of the loaded profile to detect changes
+        self._saved = None
+        self._load()
+
+    def features_of(self, device_id):
+        """
+        Cached feature names of a device.
+
+        Args:
+            device_id[string]:      Id of the device
+
+        Returns:
+            Set of feature names or None if the features of this
+            device are not known
+        """
+        if self.features is None or self.device_id != device_id:
+            return None
+        return self.features
+
+    def is_applied(self, name, value) -> bool:
+        """
+        Checks if the camera has a setting without reading it.
+
+        Args:
+            name[string]:           Name of the feature
+            value:                  Value of the setting
+
+        Returns:
+            True if this process already wrote or read back the
+            same value
+        """
+        return name in self._verified and self.applied.get(name) == value
+
+    def mark_applied(self, name, value) -> None:
+        """
+        Records a setting that was written to or read back from the
+        camera.
+
+        Args:
+            name[string]:           Name of the feature
+            value:                  Value of the setting
+
+        Returns:
+            None
+        """
+        self.applied[name] = value
+        self._verified.add(name)
+
+    def invalidate(self) -> None:
+        """
+        Forgets which settings the camera has, e.g. after a user set
+        was loaded or the camera was rediscovered. The next
+        configuration reads every setting back once.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        self._verified = set()
+
+    def set_features(self, device_id, features) -> None:
+        """
+        Stores the discovered feature names of a device. The applied
+        settings of another device are discarded.
+
+        Args:
+            device_id[string]:      Id of the device
+            features[iterable]:     Feature names of the node map
+
+        Returns:
+            None
+        """
+        if self.device_id != device_id:
+            self.applied = {}
+            self._verified = set()
+        self.device_id = device_id
+        self.features = frozenset(features)
+
+    def save(self) -> None:
+        """
+        Writes the profile to its file if anything changed since it
+        was loaded or saved. The file is replaced atomically.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        if self.path is None or self.features is None:
+            return
+        content = {
+            'device_id': self.device_id,
+            'features': sorted(self.features),
+            'applied': self.applied,
+        }
+        if content == self._saved:
+            return
+        temporary_path = self.path + ".tmp"
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(temporary_path, "w") as f:
+                json.dump(content, f)
+            os.replace(temporary_path, self.path)
+        except OSError:
+            logging.exception("Camera profile could not be saved to {}.".format(self.path))
+            return
+        self._saved = {
+            'device_id': self.device_id,
+            'features': content['features'],
+            'applied': dict(self.applied),
+        }
+        logging.debug("Camera profile saved to {}.".format(self.path))
+
+    def _load(self) -> None:
+        if self.path is None or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                content = json.load(f)
+            self.device_id = content['device_id']
+            self.features = frozenset(content['features'])
+            self.applied = dict(content['applied'])
+        except (OSError, ValueError, KeyError, TypeError):
+            logging.warning("Camera profile {} is invalid and ignored.".format(self.path))
+            self.device_id = None
+            self.features = None
+            self.applied = {}
+            return
+        self._saved = {
+            'device_id': self.device_id,
+            'features': sorted(self.features),
+            'applied': dict(self.applied),
+        }
+        logging.debug("Camera profile loaded from {}.".format(self.path))
@@ -2,23 +2,20 @@
 Classes to connect, configurate and get image data from cameras.
 
 The module provides two classes:
-- GenICam: for all GenICam compatible cameras. Cameras with GigE
-            Vision or USB3 Vision transport layer always support
-            GenICam.
-- DummyCam: for simulating a camera
+- CamGeneral: base class of all cameras
+- DummyCamera: for simulating a camera, e.g. for load tests
+
+The GenICam class for all GenICam compatible cameras is provided by
+genicam_camera.py. It is only imported if a GenICam camera is used,
+so the harvesters and genicam modules are not loaded otherwise.
 
 """
 
 # Import python in-built libraries
 import logging
 from abc import ABC, abstractmethod
+import random
 import time
-import base64
-import json
-
-import datetime
-
-import os
 import sys
 
 # Import libraries that had been installed with pip install
@@ -26,33 +23,91 @@ import paho.mqtt.client as mqtt
 import cv2
 import numpy as np
 
-# Import libraries that are only needed for GenICam
-from genicam.gentl import TimeoutException
-from genicam.genapi import OutOfRangeException
-from harvesters.core import Harvester
+# Import self-written modules
+from archive import ImageArchiveWriter
+from buffer_pool import FrameBufferPool
+from frame import CaptureRequest, Frame
+from image_codecs import JpegCodec
+from latency import MESSAGE_STAGES, STAGE_CONVERT, STAGE_ENCODE, STAGE_FETCH, STAGE_PUBLISH, LatencyTracker, now_ms
+from payload import PAYLOAD_FORMAT_BINARY, PAYLOAD_FORMATS, encode_binary_payload, encode_json_payload
+from spool import ReliablePublisher
 
 #Console Style elements for outpu
 HORIZONTAL_CONSOLE_LINE = "\n"+"_"*80+"\n"
 
+# Settings of the DummyCamera
+DUMMY_SOURCE_PATH = "/app/assets/dummy_image.jpg"
+DUMMY_PIXEL_FORMAT_BGR8 = "BGR8"
+DUMMY_PIXEL_FORMAT_MONO8 = "Mono8"
+DUMMY_PIXEL_FORMATS = (DUMMY_PIXEL_FORMAT_BGR8, DUMMY_PIXEL_FORMAT_MONO8)
+DUMMY_VARIATION_NONE = "None"
+DUMMY_VARIATION_PATTERN = "Pattern"
+DUMMY_VARIATION_NOISE = "Noise"
+DUMMY_VARIATIONS = (DUMMY_VARIATION_NONE, DUMMY_VARIATION_PATTERN, DUMMY_VARIATION_NOISE)
+DUMMY_NOISE_AMPLITUDE = 24
+# Number of different noise frames
+DUMMY_NOISE_OFFSETS = 4096
+
+
 class CamGeneral(ABC):
     """
     Abstract base clase for the different cameras.
-    This class defines only the basic constructor, the
-    method _publish_mqtt() to publish the results to the MQTT
-    broker, the method disconnect() and the abstract method
-    get_image(). Children must define the get_image() method.
+    This class defines the basic constructor, the method
+    get_image() which runs the stages acquire_frame(),
+    encode_frame() and publish_frame() to send an image to the
+    MQTT broker, the method disconnect() and the abstract method
+    _acquire_image(). Children must define the _acquire_image()
+    method.
 
     Args of constructor:
         mqtt_host[string]:      Hostname or IP address of the MQTT broker
         mqtt_port[int]:         Network port of the server host to connect to
         mqtt_topic[string]:     Topic on MQTT Broker where trigger signal is send to
                                 (e.g. "test/trigger/")
+        (opt.) payload_format[string]:
+                                Wire format of the image messages.
+                                Possible values: "JSON" (legacy,
+                                base64 encoded image in a json
+                                message), "Binary" (fixed header
+                                followed by the raw encoded image,
+                                see payload.py)
+                                Default value: "JSON"
+        (opt.) codec[ImageCodec]:
+                                Codec that encodes the images, see
+                                image_codecs.py
+                                Default value: None (JpegCodec with
+                                the OpenCV defaults)
+        (opt.) archive[ImageArchiveWriter]:
+                                Archive for the encoded images, see
+                                archive.py. If None and an
+                                image_storage_path is given, an
+                                archive without limits is created.
+                                Default value: None
+        (opt.) mqtt_qos[int]:
+                                QoS level of the image messages.
+                                With QoS 1 the messages are
+                                published by a ReliablePublisher,
+                                see spool.py
+                                Possible values: 0, 1
+                                Default value: 0
+        (opt.) max_inflight[int]:
+                                Maximum number of unacknowledged
+                                messages with QoS 1
+                                Default value: 20
+        (opt.) spool[PublishSpool]:
+                                Spool for the messages that can
+                                not be published with QoS 1
+                                while the broker is unreachable,
+                                None to drop them
+                                Default value: None
 
     Returns of constructor:
         See inheritors
     """
 
-    def __init__(self, mqtt_host, mqtt_port, mqtt_topic, mac_address, image_storage_path=None) -> None:
+    def __init__(self, mqtt_host, mqtt_port, mqtt_topic, mac_address, image_storage_path=None,
+                 payload_format="JSON", codec=None, archive=None, mqtt_qos=0, max_inflight=20,
+                 spool=None) -> None:
         """
         Base class constructor configures the object with the
         MQTT host settings.
@@ -70,590 +125,355 @@ class CamGeneral(ABC):
         self.mac_address = mac_address
         self.image_storage_path = image_storage_path
 
+        if payload_format not in PAYLOAD_FORMATS:
+            sys.exit("Unsupported payload format: %s" % payload_format)
+        self.payload_format = payload_format
+        self.codec = codec if codec is not None else JpegCodec()
+
+        if archive is None and image_storage_path:
+            archive = ImageArchiveWriter(image_storage_path, extension=self.codec.extension)
+        self.archive = archive
+
+        # Pool of image arrays, set by children that convert into
+        #   preallocated arrays
+        self.buffer_pool = None
+
+        # Rolling latencies between the stages of the published
+        #   frames, see latency.py
+        self.latency = LatencyTracker()
+        # Set by children in _acquire_image() via _mark_fetched()
+        self._fetch_ms = None
+        self._exposure_ns = None
+
+        # Counters of the metrics, see stats()
+        self.frames_captured = 0
+        self.frames_published = 0
+        self.bytes_sent = 0
+        self.mqtt_connected = False
+        self.mqtt_connects = 0
+
         # Connect to the Broker, default port for MQTT 1883
         self.client = mqtt.Client()
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.publisher = None
+        if mqtt_qos > 0:
+            self.publisher = ReliablePublisher(self.client, self.mqtt_topic, qos=mqtt_qos,
+                                               max_inflight=max_inflight, spool=spool)
         self.client.connect(self.mqtt_host, self.mqtt_port)
         logging.debug("Connected to MQTT broker.")
+        # Not on the event loop of the runtime like the triggers,
+        #   the images are published from other threads (see
+        #   runtime.py)
         self.client.loop_start()
 
-    def _publish_mqtt(self, image) -> None:
+    def get_image(self, request=None) -> None:
         """
-        Sends the timestamp of the time at at which the image was
-        taken, and the image itself to the MQTT broker.
-        Therefore, the image is first
-        converted from a numpy array into a byte array and from
-        a byte array into a string.
-
-        The MQTT message contains in one json:
-            - timestamp of the acquisition time in ms since epoch
-            - image information:
-                - string containing the image data (image_bytes)
-                - image height, width and channels
-
-        Json format:
-            {
-            'timestamp_ms': timestamp_ms,
-            'image':
-                    {'image_id':"<mac_address>_<timestamp>"
-                    'image_bytes': encoded_image,
-                    'image_height': image.shape[0],
-                    'image_width': image.shape[1],
-                    'image_channels':image.shape[2]},
-            }
-
+        Gets an image from the camera and publishes it to the MQTT
+        broker. All stages (acquisition, encoding, publishing) are
+        executed one after another in the calling thread. Use a
+        FramePipeline (see pipeline.py) to run them concurrently.
 
         Args:
-            image[np.ndarray]:      Array of image in BGR color
-                                    format with array size
-                                    N x M x image_channels
-                                    where N is height, M is width
-                                    and image channels the number
-                                    of bytes per pixel
+            (opt.) request[CaptureRequest]:
+                                    Request that triggered the
+                                    acquisition
 
         Returns:
             None
         """
-        # Get timestamp of time  when trigger was received.
-        #   Measured in ms since epoch. Epoch is defined as
-        #   January 1, 1970, 00:00:00 (UTC)
-        timestamp_ms = int(round(time.time() * 1000))
-
-        # Encode numpy array in byte array
-        # Use decode() to convert the bytes to a string to send them in a json message
-        irrelevant, im_arr = cv2.imencode('.jpg', image)
-        im_bytes = im_arr.tobytes()
-        encoded_image = base64.b64encode(im_bytes).decode()
-        # Preparation of the message that will be published
-        prepared_message = {
-            'timestamp_ms': timestamp_ms,
-            'image':
-                {'image_id':(str(self.mac_address)+"_"+str(timestamp_ms)),
-                'image_bytes': encoded_image,
-                'image_height': image.shape[0],
-                'image_width': image.shape[1],
-                'image_channels': image.shape[2]},
-        }
-
-        # Get json formatted string, convert python object into
-        #   json object
+        frame = self.acquire_frame(request)
+        if frame is None:
+            return
+        self.encode_frame(frame)
+        self.publish_frame(frame)
 
-        message = json.dumps(prepared_message)
-        # Publish the message
-        ret = self.client.publish(self.mqtt_topic, message, qos=0)
-        logging.debug("Image No.: " + str(ret[1]))
+    def acquire_frame(self, request=None):
+        """
+        Acquisition stage: gets an image from the camera.
 
-        logging.debug("Image sent to MQTT broker under topic: " + str(self.mqtt_topic))
+        Args:
+            (opt.) request[CaptureRequest]:
+                                    Request that triggered the
+                                    acquisition
 
-    @abstractmethod
-    def get_image(self) -> None:
+        Returns:
+            Frame or None if no image could be acquired
         """
-        Must be defined by children.
-
-        Function to get an image from the camera and uses
-        _publish_mqtt to send it to MQTT broker.
+        if request is None:
+            request = CaptureRequest()
+        self._fetch_ms = None
+        self._exposure_ns = None
+        image = self._acquire_image()
+        if image is None:
+            return None
+        convert_ms = now_ms()
+        self.frames_captured += 1
+        release = self.buffer_pool.release if self.buffer_pool is not None else None
+        frame = Frame(image, request, release=release)
+        # Cameras that do not report the fetch deliver the image
+        #   without a separate conversion
+        frame.stages[STAGE_FETCH] = self._fetch_ms if self._fetch_ms is not None else convert_ms
+        frame.stages[STAGE_CONVERT] = convert_ms
+        frame.exposure_ns = self._exposure_ns
+        return frame
+
+    def _mark_fetched(self, exposure_ns=None) -> None:
+        """
+        Records that the image buffer was fetched from the camera,
+        to be called by children in _acquire_image() before the
+        image is converted.
 
         Args:
-            None
+            (opt.) exposure_ns[int]:
+                                    Hardware timestamp of the
+                                    exposure in ns of the camera
+                                    clock
+                                    Default value: None
 
         Returns:
             None
         """
-        pass
+        self._fetch_ms = now_ms()
+        self._exposure_ns = exposure_ns
 
-    def disconnect(self) -> None:
+    def stats(self) -> dict:
         """
-        Disconnects from MQTT broker.
+        Frame and MQTT counters and rolling latencies between the
+        stages of the published frames.
 
         Args:
             None
 
         Returns:
-            None
+            Dictionary with the counters and the p50, p95 and p99
+            of each latency
         """
-        self.client.loop_stop()
-        self.client.disconnect()
-        logging.debug("Disconnected from MQTT broker.")
-
+        stats = {
+            'frames_captured': self.frames_captured,
+            'frames_published': self.frames_published,
+            'bytes_sent': self.bytes_sent,
+            'mqtt_connected': int(self.mqtt_connected),
+            'mqtt_reconnects': max(0, self.mqtt_connects - 1),
+        }
+        if self.publisher is not None:
+            stats.update(self.publisher.stats())
+        stats.update(self.latency.stats())
+        return stats
 
-class GenICam(CamGeneral):
-    """
-    This class is for all GenICam compatible cameras. Cameras
-    with GigE Vision or USB3 Vision transport layer always
-    support GenICam. Each instance of this class will be
-    automatically connected to the device.
-
-    The class inherits all methods from the base class CamGeneral.
-    (see description of CamGeneral) Because of that this class has
-    to define the abstract method get_image(). In this class
-    get_image() fetchs an image out of the buffer/image stream and
-    makes sure that data format is BGR8 to send it to MQTT broker
-    with _publish_mqtt().
-
-    Additional methods of the GenICam class:
-    The first method _connect() establishs a connection to the
-    GenICam camera. Afterwards, _apply_settings() applies either
-    a configurated user set of configurations or the entered
-    settings in the arguments for the class instance. The user
-    set of configurations can be created in the matrix vision
-    wxPropView or in most SDK which is provided by the camera
-    manufacturer. If no user set of configurations is used
-    and no settings are provided in the arguments, the default
-    settings of the camera will be used.
-    The method start _start_acquisition() starts the image stream
-    of the camera.
-    The last method deactivate() disconnects from camera.
-
-    Some of the comments in this class are copied from:
-    https://github.com/genicam/harvesters/blob/master/README.rst
+    def is_ready(self) -> bool:
+        """
+        Readiness of the camera to publish images.
 
-    Args of constructor:
-        mqtt_host[string]:          Hostname or IP address of the
-                                    MQTT broker
-        mqtt_port[int]:             Network port of the server
-                                    host to connect to
-        mqtt_topic[string]:         Topic on MQTT Broker where
-                                    trigger signal is send to
-                                    (e.g. "test/trigger/")
-        genTL_producer_path[string]:
-                                    Path to the *.cti file that
-                                    is used to connect to camera
-        (opt.) user_set_selector[string]:
-                                    Use an already pre-configu-
-                                    rated user set.
-                                    Possible values: "Default",
-                                        "UserSet1", "UserSet2",
-                                        "UserSet3", "UserSet4",
-                                        "UserSet5" (The number of
-                                        user sets is camera
-                                        dependent.)
-                                    Default value: "Default"
-        (opt.) image_width[int]:    Determine in pixels the region
-                                    of interest (ROI). ROI will be
-                                    always centered in camera
-                                    sensor.
-                                    A value higher than maximum
-                                    resolution of the camera will
-                                    set maximum values instead of
-                                    the values entered here.
-                                    To find out the highest value,
-                                    search for the resolution in
-                                    the specifications of the
-                                    camera.
-                                    Specifications are available
-                                    in the manual or on the
-                                    website where you bought the
-                                    camera.
-                                    Default: None
-        (opt.) image_height[int]:   see image_width
-                                    Default: None
-        (opt.) pixel_format[string]:
-                                    Set the pixel format you want
-                                    to use. This program allows
-                                    you to take pictures in
-                                    monochrome pixel formats
-                                    (use: "Mono8") and RGB/BRG
-                                    color pixel formats (use:
-                                    "RGB8Packed" or "BGR8Packed")
-                                    If you only have a camera with
-                                    only one image sensor, you can
-                                    only take monochrome images.
-                                    Possible values: "Mono8",
-                                        "RGB8Packed", "BGR8Packed"
-                                    Default value: None
-        (opt.) image_channels[int]: Number of channels (bytes per
-                                    pixel) that are used in the
-                                    array (third dimension of the
-                                    image data array).You do not
-                                    have to set this value.
-                                    If None, the best number of
-                                    channels for your set pixel
-                                    format will be used
-                                    Possible Values: 1, 3
-                                    Default value: None
-        (opt.) exposure_time[float]:
-                                    Set the exposure time manually.
-                                    Default value: None
-        (opt.) exposure_auto[string]:
-                                    Determine if camera should
-                                    automatically adjust the
-                                    exposure time.
-                                    Your settings will only be
-                                    executed if the camera supports
-                                    this. You do not have to check
-                                    if the camera supports this.
-                                    Possible values are:
-                                        - "Off":  No automatic
-                                            adjustment
-                                        - "Once": Adjusted once
-                                        - "Continuous": Continuous
-                                            adjustment (not
-                                            recommended,
-                                            Attention: This could
-                                            have a big impact on
-                                            the frame rate of your
-                                            camera)
-                                    Default value: None
-        (opt.) gain_auto[string]:   Determine if camera should
-                                    automatically adjust the gain.
-                                    Your settings will only be
-                                    executed if the camera supports
-                                    this. You do not have to check
-                                    if the camera supports this.
-                                    Possible values are:
-                                        see exposure_auto
-                                    Default value: None
-        (opt.) balance_white_auto[string]:
-                                    Determine if camera should
-                                    automatically adjust the
-                                    white balance.
-                                    Your settings will only be
-                                    executed if the camera supports
-                                    this. You do not have to check
-                                    if the camera supports this.
-                                    Possible values are:
-                                        see exposure_auto
-                                    Default value: None
+        Args:
+            None
 
-    Returns of constructor:
-        A configured and connected instance of GenICam ready to
-        fetch an image.
-    """
+        Returns:
+            True if the camera is connected to the MQTT broker
+        """
+        return self.mqtt_connected
 
-    def __init__(self, mqtt_host, mqtt_port, mqtt_topic, mac_address, gen_tl_producer_path_list,
-                 user_set_selector="Default", image_width=None, image_height=None, pixel_format=None,
-                 image_channels=None, exposure_time=None, exposure_auto=None, gain_auto=None, balance_white_auto=None,
-                 image_storage_path=None) -> None:
+    def is_finished(self) -> bool:
         """
-        Defines the settings for the camera configuration and
-        establish a connection to the GenICam camera.
+        Checks if the camera can not deliver any more images, e.g.
+        a replay that reached the end of its archive.
 
         Args:
-            see class description
+            None
 
         Returns:
-            see class description
+            True if the camera is finished, always False for live
+            cameras
         """
-        super().__init__(mqtt_host=mqtt_host,
-                         mqtt_port=mqtt_port,
-                         mqtt_topic=mqtt_topic,
-                         mac_address=mac_address)
-
-        self.gen_tl_producer_path_list = gen_tl_producer_path_list
-        self.user_set_selector = user_set_selector
-        self.image_width = image_width
-        self.image_height = image_height
-        self.pixel_format = pixel_format
-        self.image_channels = image_channels
-        self.exposure_time = exposure_time
-        self.exposure_auto = exposure_auto
-        self.gain_auto = gain_auto
-        self.balance_white_auto = balance_white_auto
-
-        self.image_storage_path = image_storage_path
-
-        # Connect to camera
-        self._connect()
+        return False
+
+    def _on_connect(self, client, userdata, flags, rc) -> None:
+        if rc == 0:
+            self.mqtt_connected = True
+            self.mqtt_connects += 1
+            if self.publisher is not None:
+                self.publisher.set_connected(True)
+
+    def _on_disconnect(self, client, userdata, rc) -> None:
+        self.mqtt_connected = False
+        if self.publisher is not None:
+            self.publisher.set_connected(False)
+        if rc != 0:
+            logging.warning("Connection to the MQTT broker lost, reconnecting.")
+
+    def encode_frame(self, frame) -> None:
+        """
+        Encoding stage: encodes the image with the configured codec
+        and serializes the MQTT message according to the configured
+        payload format.
+        Safe to be called from several threads at the same time.
 
-        # Apply configurations
-        self._apply_settings()
+        The MQTT message contains:
+            - timestamp of the acquisition time in ms since epoch
+            - image information:
+                - the encoded image (image_bytes)
+                - image height, width and channels
 
-        # Start acquisition
-        self._start_acquisition()
+        Json format (payload_format "JSON"):
+            {
+            'timestamp_ms': timestamp_ms,
+            'image':
+                    {'image_id':"<mac_address>_<timestamp>"
+                    'image_bytes': base64 encoded image,
+                    'image_height': image.shape[0],
+                    'image_width': image.shape[1],
+                    'image_channels':image.shape[2]},
+                    ('image_encoding': codec name, only if not jpg)
+            ('late': True, only if the trigger could not be served
+                in time)
+            'correlation_id': id of the trigger,
+            'stages':
+                    {'trigger_ms', 'fetch_ms', 'convert_ms',
+                     'encode_ms': time in ms since epoch,
+                     ('exposure_ns': hardware timestamp, only if
+                        the camera provides it)}
+            }
 
-    def _connect(self) -> None:
-        """
-        Establishes with the set GenTL Producer a connection to
-        the GenICam camera. Also some default settings are done.
+        Binary format (payload_format "Binary"):
+            fixed header with the same meta data, followed by the
+            encoded image bytes (see payload.py)
 
         Args:
-            None
+            frame[Frame]:           Acquired frame, frame.image is
+                                    an array of the image in BGR
+                                    color format with array size
+                                    N x M x image_channels
+                                    where N is height, M is width
+                                    and image channels the number
+                                    of bytes per pixel. Frames
+                                    that are already encoded
+                                    (frame.encoded set, e.g. by the
+                                    ReplayCamera) are passed
+                                    through without encoding.
+
         Returns:
             None
         """
+        # Get timestamp of time  when trigger was received.
+        #   Measured in ms since epoch. Epoch is defined as
+        #   January 1, 1970, 00:00:00 (UTC)
+        frame.timestamp_ms = int(round(time.time() * 1000))
+        frame.image_id = str(self.mac_address) + "_" + str(frame.timestamp_ms)
 
-        # Instantiate a Harvester object to use harvesters core
-        self.h = Harvester()
+        # Encode numpy array in byte array. The encoder's buffer
+        #   is handed to the serializers without copying it first
+        encoded_here = frame.encoded is None
+        if encoded_here:
+            frame.encoded = self.codec.encode(frame.image)
+        frame.stages[STAGE_ENCODE] = now_ms()
 
-        # Add path of GenTL Producer
-        #self.h.add_file(self.gen_tl_producer_path)
+        # Preparation of the message that will be published
+        late = frame.request is not None and frame.request.late
+        correlation_id = frame.request.correlation_id if frame.request is not None else ""
+        if self.payload_format == PAYLOAD_FORMAT_BINARY:
+            frame.message = encode_binary_payload(frame.timestamp_ms, frame.image_id, frame.encoded,
+                                                  frame.shape, encoding=self.codec.name, late=late,
+                                                  correlation_id=correlation_id, stages=frame.stages,
+                                                  exposure_ns=frame.exposure_ns)
+        else:
+            stages = {stage + '_ms': round(frame.stages[stage], 3)
+                      for stage in MESSAGE_STAGES if stage in frame.stages}
+            if frame.exposure_ns is not None:
+                stages['exposure_ns'] = frame.exposure_ns
+            fields = {'correlation_id': correlation_id, 'stages': stages}
+            if late:
+                fields['late'] = True
+            frame.message = encode_json_payload(frame.timestamp_ms, frame.image_id, frame.encoded,
+                                                frame.shape, encoding=self.codec.name, fields=fields)
+
+        # The serialized message is independent of the image, so
+        #   the image can go back to the buffer pool. Only the raw
+        #   codec shares the memory of the image, which is then
+        #   copied for the archive.
+        if encoded_here and not self.codec.copies_image and self.archive is not None and frame.release is not None:
+            frame.encoded = frame.encoded.copy()
+        frame.release_image()
+
+    def publish_frame(self, frame) -> None:
+        """
+        Publishing stage: sends the serialized message of an
+        encoded frame to the MQTT broker and saves the encoded image
+        if an image storage path is set.
 
-        for path in self.gen_tl_producer_path_list:
-            self.h.add_file(path)
+        Args:
+            frame[Frame]:           Frame processed by encode_frame()
 
-        # Check if cti-file available, stop if none found
-        if len(self.h.files) == 0:
-            sys.exit("No valid cti file found")
-        logging.debug(HORIZONTAL_CONSOLE_LINE)
-        logging.debug("Currently available genTL Producer CTI files: ")
-        for file in self.h.files:
-            logging.debug(file)
-
-        # Update the list of remote devices; fills up your device
-        #   information list; multiple devices in list possible
-        self.h.update()
-        # If no remote devices in the list that you can control
-        if len(self.h.device_info_list) == 0:
-            sys.exit("No compatible devices detected.")
-        # Show remote devices in list
-        logging.debug("Available devices:")
-        for camera in self.h.device_info_list:
-            logging.debug(camera)
-        # Create an image acquirer object specifying a target
-        #   remote device
-        # As argument also user_defined_name,
-        #   vendor, model, etc. possible
-        # If multiple cameras in device list, choose the right
-        #   one by changing the list_index or by using another
-        #   argument
-
-        for camera in self.h.device_info_list:
-            #read cameras mac address
-            #ATTENTION: only works with BAUMER SDK
-            device_mac_address = str(camera.id_).replace("_","").replace("devicemodul","")
-            if device_mac_address.upper() == self.mac_address.upper().replace(":",""):
-                try:
-                    self.ia = self.h.create_image_acquirer(id_=camera.id_)
-                except:
-                    logging.error("Camera ist not reachable. Most likely another container already occupies the same camera. One camera can only be used by exactly one container at the time.")
-                    sys.exit("Camera not reachable.")
-                logging.debug("Using:" + str(camera))
-                logging.debug(HORIZONTAL_CONSOLE_LINE)
-
-        if not hasattr(self, "ia"):
-            logging.error("No camera with the specified MAC address available. Please specify MAC address in env file correctly.")
-            sys.exit("Invalid MAC address.")
-        ## Set some default settings
-        # This is required because of a bug in the harvesters
-        #   module. This should not affect our usage of image
-        #   acquirer. Only change if you know what you are doing
-        self.ia.remote_device.node_map.ChunkModeActive.value = False
-
-        # The number of buffers that is prepared for the image
-        #   acquisition process. The buffers will be announced
-        #   to the target GenTL Producer. Need this so that we
-        #   always get the correct actual image.
-        self.ia.num_buffers = 1
-
-    def _apply_settings(self) -> None:
+        Returns:
+            None
         """
-        Applies the settings for the camera.
+        # Publish the message
+        self._publish_mqtt(frame)
+        frame.stages[STAGE_PUBLISH] = now_ms()
+        self.latency.record(frame.stages)
+        self.frames_published += 1
+        self.bytes_sent += len(frame.message)
 
-        Either a configured user set of configurations or the
-        entered settings in the arguments for the class instance.
-        The user set of configurations can be created in the
-        matrix vision wxPropView or in most SDK which is provided
-        by the camera manufacturer.
-        If no user set of configurations is used and no settings
-        are provided in the arguments, the default settings of
-        the cameras will be used.
+        # Save image
+        if self.archive is not None:
+            self._store_frame(frame)
 
-        The automatic adjust settings are only applied if camera
-        supports these features.
+    def _publish_mqtt(self, frame) -> None:
+        """
+        Sends the serialized message of an encoded frame to the
+        MQTT broker.
 
         Args:
-            None
+            frame[Frame]:           Frame processed by encode_frame()
 
         Returns:
             None
         """
-
-        # Get list of all available features of the camera
-        node_map = dir(self.ia.remote_device.node_map)
-        logging.debug("Adjustable parameters for connected camera:")
-        for setting in node_map:
-            logging.debug(setting)
-
-        # If camera was already configured and configurations
-        #   has been saved in user set, then set and load user
-        #   set here and return
-        if self.user_set_selector != "Default":
-            self.ia.remote_device.node_map.UserSetSelector.value = self.user_set_selector
-            self.ia.remote_device.node_map.UserSetLoad.execute()
-            # Do not execute the code afterwards in this function
-            #   if user-set is used
+        if self.publisher is not None:
+            # QoS 1, spilled to the spool if the broker is not
+            #   reachable
+            self.publisher.publish(frame.message, frame.timestamp_ms, frame.image_id)
             return
 
-        # Set Width
-        if self.image_width is not None:
-            if self.image_width > self.ia.remote_device.node_map.WidthMax.value:
-                # Value given in settings higher than max
-                #   -> set max
-                self.ia.remote_device.node_map.Width.value = self.ia.remote_device.node_map.WidthMax.value
-            else:
-                # Set value given in settings
-                self.ia.remote_device.node_map.Width.value = self.image_width
-
-        # Set Height
-        if self.image_height is not None:
-            if self.image_height > self.ia.remote_device.node_map.HeightMax.value:
-                # Value given in settings higher than max
-                #   -> set max
-                self.ia.remote_device.node_map.Height.value = self.ia.remote_device.node_map.HeightMax.value
-            else:
-                # Set value given in settings
-                self.ia.remote_device.node_map.Height.value = self.image_height
-
-        # Set ROI always centered in camera sensor
-        # Therefore calculate Offset X and Offset Y where the
-        #   readout region should start and assign it to features
-        if self.user_set_selector != "Default":
-            self.ia.remote_device.node_map.OffsetX.value = int(
-                (self.ia.remote_device.node_map.WidthMax.value - self.ia.remote_device.node_map.Width.value) / 2)
-            self.ia.remote_device.node_map.OffsetY.value = int(
-                (self.ia.remote_device.node_map.HeightMax.value - self.ia.remote_device.node_map.Height.value) / 2)
-
-        # Set PixelFormat
-        if self.pixel_format is not None:
-            self.ia.remote_device.node_map.PixelFormat.value = self.pixel_format
-
-        # Set Exposure time
-        if self.exposure_auto is not None:
-            try:
-                self.ia.remote_device.node_map.ExposureTimeAbs.value = self.exposure_time
-            except OutOfRangeException:
-                logging.error("Specified Exposure time too high for selected camera. Please choose smaller value.")
-                sys.exit(1)
-
-        # Set ExposureAuto, GainAuto and BalanceWhiteAuto;
-        #   it always first checks if connected camera supports
-        #   this function
-        if self.exposure_auto is not None:
-            if "ExposureAuto" in node_map:
-                self.ia.remote_device.node_map.ExposureAuto.value = self.exposure_auto
-            else:
-                logging.warning("Camera does not support automatic adjustment of exposure time")
-        if self.gain_auto is not None:
-            if "GainAuto" in node_map:
-                self.ia.remote_device.node_map.GainAuto.value = self.gain_auto
-            else:
-                logging.warning("Camera does not support automatic adjustment of gain")
-        if self.balance_white_auto is not None:
-            if "BalanceWhiteAuto" in node_map:
-                self.ia.remote_device.node_map.BalanceWhiteAuto.value = self.balance_white_auto
-            else:
-                logging.warning("Camera does not support automatic adjustment of white balance")
-
-    def _start_acquisition(self) -> None:
+        ret = self.client.publish(self.mqtt_topic, frame.message, qos=0)
+        logging.debug("Image No.: " + str(ret[1]))
+
+        logging.debug("Image sent to MQTT broker under topic: " + str(self.mqtt_topic))
+
+    def _store_frame(self, frame) -> None:
         """
-        Activate an image stream from camera to be able to fetch
-        images out of stream.
+        Hands the encoded image of a frame to the image archive.
+        The bytes produced by the encode stage are written as they
+        are, so the image is not encoded a second time. Writing
+        happens in the background thread of the archive.
 
         Args:
-            None
+            frame[Frame]:           Published frame
 
         Returns:
             None
         """
-        # Starts image acquisition with harvesters
-        self.ia.start_acquisition()
-        logging.debug("Acquisition started.")
-
+        self.archive.submit(frame.timestamp_ms, frame.image_id, frame.encoded)
 
-    # Get image out of image stream
-    def get_image(self) -> None:
+    @abstractmethod
+    def _acquire_image(self):
         """
-        Fetch an image out of the image stream and make sure if
-        colored image that BGR pixel format is used.
+        Must be defined by children.
+
+        Function to get an image from the camera.
 
         Args:
             None
 
         Returns:
-            None
+            Image as np.ndarray in BGR color format with size
+            N x M x image_channels or None if no image could be
+            acquired
         """
-        # Try to fetch a buffer that has been filled up with an
-        #   image
-        try:
-            # Default value
-            retrieved_image = None
-
-            # To solve the problem that buffer is already filled
-            #   with an old image, but we want the newest image,
-            #   This here is probably not the best way to solve
-            #   the problem. It is a workaround.
-            with self.ia.fetch_buffer(timeout=20) as buffer:
-                # Do not use this buffer, use the next one
-                pass
-
-            # Due to with statement buffer will automatically be
-            #   queued
-            with self.ia.fetch_buffer(timeout=20) as buffer:
-                logging.debug(HORIZONTAL_CONSOLE_LINE)
-                logging.debug("Image fetched.")
-                # Create an alias of the 2D image component:
-                component = buffer.payload.components[0]
-                # Note that the number of components can be vary.
-                #   If your target remote device transmits a
-                #   multi-part information, then you'd get two or
-                #   more components in the payload. However, this
-                #   programs works with a remote device that
-                #   transmits only a 2D image. So we manipulate
-                #   only index 0 of the list object, components.
-
-                # As we record only two-dimensional pictures the
-                #   third position in shaps shows the number of
-                #   color values.
-                #  Mono8 is only black and white -> one color
-                #   value for each pixel (one byte per pixel)
-                #   -> image_channel = 1
-                # RGB/BGR is red, green and blue -> three color
-                #   values for each pixel to determine its
-                #   overall color (three bytes per pixel)
-                #   -> image_channel = 3
-
-                # Check if Mono or RGB/BGR to determine argument
-                #   for shape of the array of retrieved image
-                #   If number of channels is set in arguments,
-                #   do not change anything, only change if None
-                data_format = component.data_format
-                if self.image_channels is None:
-                    if data_format == "Mono8":
-                        self.image_channels = 1
-                    elif data_format == "RGB8" or data_format == "BGR8":
-                        self.image_channels = 3
-                    else:
-                        sys.exit("Unsupported pixel format: %s" % data_format)
-
-                # Generate out of buffer data, which is an
-                #   [1x(N+M+image_channels)x1] array, an
-                #   [N x M x image_channels] array where N is
-                #   height and M is width of image
-                retrieved_image = np.ndarray(buffer=component.data.copy(),
-                                             dtype=np.uint8,
-                                             shape=(component.height, component.width, self.image_channels))
-
-                # Adjust the order of red, blue and green color
-                #   to BGR which is default in opencv
-                if data_format == "RGB8":
-                    retrieved_image = cv2.cvtColor(retrieved_image, cv2.COLOR_RGB2BGR)
-
-            self._publish_mqtt(retrieved_image)
-            logging.debug("Image converted and published to MQTT.")
-
-            # Save image
-            if self.image_storage_path:
-                timestamp = datetime.datetime.now(tz=datetime.timezone.utc).isoformat().replace(":", "_").replace(".",
-                                                                                                                  "_").replace(
-                    "+", "_")
-                img_save_dir = os.path.join(self.image_storage_path, "{}.jpg".format(timestamp))
-                cv2.imwrite(img_save_dir, retrieved_image)
-
-                logging.debug("Image saved to {}".format(img_save_dir))
-
-        # If TimeoutException because no image was fetchable,
-        #   restart the acquisition process
-        except TimeoutException:
-            logging.error("Timeout ocurred during fetching an image. Camera reset and restart.")
-            self.ia.destroy()
-            self.h.reset()
-            self._connect()
-            self._apply_settings()
-            self._start_acquisition()
-            logging.debug("Camera restarted. Ready to fetch an image.")
+        pass
 
     def disconnect(self) -> None:
         """
-        Deactivate acquisition and disconnect from camera.
+        Disconnects from MQTT broker.
 
         Args:
             None
@@ -661,42 +481,182 @@ class GenICam(CamGeneral):
         Returns:
             None
         """
-        # Close the connection to ...
-        # ... MQTT (and stop loop)
-        CamGeneral.disconnect(self)
+        # Wait for the acknowledgments of the published images
+        if self.publisher is not None:
+            self.publisher.stop()
+        self.client.loop_stop()
+        self.client.disconnect()
+        logging.debug("Disconnected from MQTT broker.")
 
-        # ... GenICam (destroy image acquirer)
-        self.ia.destroy()
-        self.h.reset()
+        # Write the images that are still queued
+        if self.archive is not None:
+            self.archive.stop()
 
-        logging.debug("Disconnected from GenICam camera.")
 
 class DummyCamera(CamGeneral):
+    """
+    Simulates a camera, e.g. to load test the MQTT broker and the
+    consumers without a physical camera. The source image is read
+    and decoded once. Every acquisition returns the cached image or
+    a variation of it, which is generated with vectorized numpy
+    operations into arrays of a buffer pool.
+
+    Args of constructor:
+        mqtt_host, mqtt_port, mqtt_topic, mac_address and the
+        optional arguments of CamGeneral, see there
+        (opt.) source_path[string]:
+                                Image file that is simulated
+                                Default value:
+                                    "/app/assets/dummy_image.jpg"
+        (opt.) image_width[int]:
+                                Width of the images, None for the
+                                width of the source
+                                Default value: None
+        (opt.) image_height[int]:
+                                Height of the images, None for the
+                                height of the source
+                                Default value: None
+        (opt.) pixel_format[string]:
+                                "BGR8" (3 channels) or "Mono8"
+                                (1 channel)
+                                Default value: "BGR8"
+        (opt.) variation[string]:
+                                Change of the image from frame to
+                                frame.
+                                Possible values:
+                                    - "None": static image
+                                    - "Pattern": the image moves
+                                        horizontally
+                                    - "Noise": noise changes in
+                                        every frame
+                                Default value: "None"
+        (opt.) target_fps[float]:
+                                Maximum frame rate of the simulated
+                                sensor, None for no limit
+                                Default value: None
+        (opt.) latency_ms[float]:
+                                Additional latency of every
+                                acquisition in ms
+                                Default value: 0
+        (opt.) timeout_rate[float]:
+                                Share of the acquisitions that time
+                                out and return no image, 0 to 1
+                                Default value: 0
+        (opt.) timeout_ms[float]:
+                                Time in ms until an injected
+                                timeout is reported
+                                Default value: 1000
 
-    def get_image(self) -> None:
+    Returns of constructor:
+        A simulated camera ready to get an image
+    """
 
-        # Default value
-        retrieved_image = None
+    def __init__(self, mqtt_host, mqtt_port, mqtt_topic, mac_address, source_path=DUMMY_SOURCE_PATH,
+                 image_width=None, image_height=None, pixel_format=DUMMY_PIXEL_FORMAT_BGR8,
+                 variation=DUMMY_VARIATION_NONE, target_fps=None, latency_ms=0, timeout_rate=0,
+                 timeout_ms=1000, **kwargs) -> None:
+        if pixel_format not in DUMMY_PIXEL_FORMATS:
+            sys.exit("Unsupported pixel format of the dummy camera: %s" % pixel_format)
+        if variation not in DUMMY_VARIATIONS:
+            sys.exit("Unsupported variation of the dummy camera: %s" % variation)
+
+        super().__init__(mqtt_host, mqtt_port, mqtt_topic, mac_address, **kwargs)
+
+        self.variation = variation
+        self.frame_interval = 1 / target_fps if target_fps else None
+        self.latency_ms = latency_ms
+        self.timeout_rate = timeout_rate
+        self.timeout_ms = timeout_ms
+        self.timeouts = 0
+        self.frames = 0
+
+        # Decode the source once
+        source = cv2.imread(source_path)
+        if source is None:
+            sys.exit("Image of the dummy camera could not be read: %s" % source_path)
+        if image_width or image_height:
+            size = (image_width or source.shape[1], image_height or source.shape[0])
+            source = cv2.resize(source, size, interpolation=cv2.INTER_AREA)
+        if pixel_format == DUMMY_PIXEL_FORMAT_MONO8:
+            source = cv2.cvtColor(source, cv2.COLOR_BGR2GRAY)[:, :, np.newaxis]
+        self.image = np.ascontiguousarray(source)
+        height, width, channels = self.image.shape
+        logging.debug("Dummy camera simulates {}x{}x{} images ({}).".format(width, height, channels, variation))
+        self._next_frame = time.monotonic()
+
+        if variation == DUMMY_VARIATION_NONE:
+            return
+        # The variations are written into pooled arrays, the cached
+        #   image stays unchanged
+        self.buffer_pool = FrameBufferPool(self.image.shape)
+        self._shift = max(1, width // 100)
+        if variation == DUMMY_VARIATION_NOISE:
+            # Scale the image down, so adding the noise never
+            #   overflows. The noise is a random table that is read
+            #   at a different offset in every frame, so no random
+            #   numbers are drawn per frame.
+            self.image = (self.image.astype(np.uint16) * (255 - DUMMY_NOISE_AMPLITUDE) // 255).astype(np.uint8)
+            random_state = np.random.RandomState(0)
+            self._noise = random_state.randint(0, DUMMY_NOISE_AMPLITUDE + 1, self.image.size + DUMMY_NOISE_OFFSETS,
+                                               dtype=np.uint8)
+
+    def stats(self) -> dict:
+        """
+        Generated frames and injected timeouts together with the
+        counters of CamGeneral.
 
-        #reads a static image which is part of stack
-        img = cv2.imread("/app/assets/dummy_image.jpg")
-        logging.debug(HORIZONTAL_CONSOLE_LINE)
-        logging.debug("Image fetched.")
-        height, width, channels = img.shape
-        retrieved_image = np.ndarray(buffer=img,
-                                     dtype=np.uint8,
-                                     shape=(height, width, channels))
+        Args:
+            None
 
-        self._publish_mqtt(retrieved_image)
-        logging.debug("Image converted and published to MQTT.")
+        Returns:
+            Dictionary with the counters
+        """
+        stats = super().stats()
+        stats['frames_generated'] = self.frames
+        stats['timeouts'] = self.timeouts
+        return stats
 
-        # Save image
-        if self.image_storage_path:
-            timestamp = datetime.datetime.now(tz=datetime.timezone.utc).isoformat().replace(":", "_").replace(".",
-                                                                                                              "_").replace(
-                "+", "_")
-            img_save_dir = os.path.join(self.image_storage_path, "{}.jpg".format(timestamp))
-            cv2.imwrite(img_save_dir, retrieved_image)
+    def _acquire_image(self):
+        """
+        Returns the next simulated image. Waits for the next frame
+        of the simulated sensor and the injected latency.
 
-            logging.debug("Image saved to {}".format(img_save_dir))
+        Args:
+            None
 
+        Returns:
+            Image as np.ndarray or None if a timeout was injected
+        """
+        if self.frame_interval is not None:
+            now = time.monotonic()
+            if now < self._next_frame:
+                time.sleep(self._next_frame - now)
+                now = self._next_frame
+            self._next_frame = now + self.frame_interval
+        if self.latency_ms > 0:
+            time.sleep(self.latency_ms / 1000)
+        if self.timeout_rate > 0 and random.random() < self.timeout_rate:
+            time.sleep(self.timeout_ms / 1000)
+            self.timeouts += 1
+            logging.debug("Injected timeout of the dummy camera.")
+            return None
+
+        self._mark_fetched()
+        self.frames += 1
+        logging.debug(HORIZONTAL_CONSOLE_LINE)
+        logging.debug("Image fetched.")
+        if self.variation == DUMMY_VARIATION_NONE:
+            return self.image
+
+        retrieved_image = self.buffer_pool.acquire()
+        if self.variation == DUMMY_VARIATION_PATTERN:
+            # Move the image to the right and wrap it around
+            width = self.image.shape[1]
+            shift = (self.frames * self._shift) % width
+            retrieved_image[:, shift:] = self.image[:, :width - shift]
+            retrieved_image[:, :shift] = self.image[:, width - shift:]
+        else:
+            offset = (self.frames * 7919) % DUMMY_NOISE_OFFSETS
+            noise = self._noise[offset:offset + self.image.size].reshape(self.image.shape)
+            np.add(self.image, noise, out=retrieved_image)
+        return retrieved_image
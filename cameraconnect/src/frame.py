@@ -0,0 +1,121 @@
+"""
+Data containers that are passed between the triggers, the cameras
+and the stages of the frame pipeline.
+
+Provided classes:
+- CaptureRequest: a trigger asking for one image
+- Frame: one acquired image on its way to the MQTT broker
+"""
+
+# Import self-written modules
+from latency import STAGE_TRIGGER, new_correlation_id, now_ms
+
+
+class CaptureRequest:
+    """
+    A request to capture one image. Created by the triggers and
+    handed to get_image() of a camera or a FramePipeline.
+
+    Args of constructor:
+        (opt.) source[string]:  Name of the trigger that created the
+                                request (e.g. "MQTT", "Continuous")
+                                Default value: None
+        (opt.) correlation_id[string]:
+                                Id of the trigger that is passed on
+                                into the image message, None to
+                                generate one
+                                Default value: None
+
+    Returns of constructor:
+        A capture request stamped with the time of its creation
+    """
+
+    __slots__ = ("source", "correlation_id", "received_ms", "late")
+
+    def __init__(self, source=None, correlation_id=None) -> None:
+        self.source = source
+        self.correlation_id = str(correlation_id) if correlation_id is not None else new_correlation_id()
+        # Time at which the trigger was received in ms since epoch
+        #   with sub-ms resolution
+        self.received_ms = now_ms()
+        # Set if the image could not be captured at the requested
+        #   time
+        self.late = False
+
+    def copy(self):
+        """
+        Copy of the request with the same correlation id and time of
+        reception, e.g. for every camera of a CameraGroup.
+
+        Args:
+            None
+
+        Returns:
+            New CaptureRequest
+        """
+        request = CaptureRequest.__new__(CaptureRequest)
+        for name in self.__slots__:
+            setattr(request, name, getattr(self, name))
+        return request
+
+
+class Frame:
+    """
+    One acquired image together with everything that is derived
+    from it on its way to the MQTT broker.
+
+    Args of constructor:
+        image[np.ndarray]:      Acquired image in BGR color format
+                                with size N x M x image_channels
+        (opt.) request[CaptureRequest]:
+                                Request that caused the acquisition
+                                Default value: None
+        (opt.) release[callable]:
+                                Gives the image back to its buffer
+                                pool, see release_image()
+                                Default value: None
+
+    A frame that is already encoded has no image, but frame.encoded
+    and frame.shape are set.
+
+    Returns of constructor:
+        A frame that still has to be encoded and published
+    """
+
+    __slots__ = ("image", "shape", "request", "release", "stages", "exposure_ns", "timestamp_ms", "image_id",
+                 "encoded", "message")
+
+    def __init__(self, image, request=None, release=None) -> None:
+        self.image = image
+        # (height, width, channels) of the image, kept after the
+        #   image is released
+        self.shape = image.shape if image is not None else None
+        self.request = request
+        self.release = release
+        # Stage name -> time in ms since epoch, see latency.py
+        self.stages = {}
+        if request is not None:
+            self.stages[STAGE_TRIGGER] = request.received_ms
+        # Hardware timestamp of the exposure in ns of the camera
+        #   clock, None if the camera does not provide it
+        self.exposure_ns = None
+        # Filled by the encode stage
+        self.timestamp_ms = None
+        self.image_id = None
+        self.encoded = None
+        self.message = None
+
+    def release_image(self) -> None:
+        """
+        Gives the image back to its buffer pool. The image must not
+        be used anymore afterwards.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        if self.release is not None and self.image is not None:
+            self.release(self.image)
+        self.image = None
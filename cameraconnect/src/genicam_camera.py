@@ -0,0 +1,1057 @@
+"""
+Class to connect, configurate and get image data from GenICam
+compatible cameras. Cameras with GigE Vision or USB3 Vision
+transport layer always support GenICam.
+
+This module is only imported if CAMERA_INTERFACE is GenICam, because
+loading harvesters and genicam takes a noticeable part of the
+startup time.
+"""
+
+# Import python in-built libraries
+import logging
+import time
+import sys
+import threading
+
+# Import libraries that are only needed for GenICam
+from genicam.gentl import TimeoutException
+from genicam.genapi import OutOfRangeException
+from harvesters.core import Harvester
+
+# Import self-written modules
+from buffer_pool import FrameBufferPool
+from camera_profile import CameraProfile
+from cameras import HORIZONTAL_CONSOLE_LINE, CamGeneral
+from grabber import LatestFrameGrabber
+from image_codecs import CODEC_PNG
+from pixel_formats import BIT_DEPTHS, PIXEL_FORMATS, PixelConverter
+
+
+# Acquisition modes of the GenICam class
+ACQUISITION_MODE_FLUSH = "Flush"
+ACQUISITION_MODE_NEWEST_ONLY = "NewestOnly"
+ACQUISITION_MODE_LATEST_FRAME = "LatestFrame"
+ACQUISITION_MODE_SOFTWARE_TRIGGER = "SoftwareTrigger"
+ACQUISITION_MODES = (ACQUISITION_MODE_FLUSH, ACQUISITION_MODE_NEWEST_ONLY, ACQUISITION_MODE_LATEST_FRAME,
+                     ACQUISITION_MODE_SOFTWARE_TRIGGER)
+
+# Tiers of the recovery after a TimeoutException, from the cheapest
+#   to the most expensive one
+RECOVERY_STREAM = "stream"
+RECOVERY_DEVICE = "device"
+RECOVERY_HARVESTER = "harvester"
+RECOVERY_TIERS = (RECOVERY_STREAM, RECOVERY_DEVICE, RECOVERY_HARVESTER)
+# Backoff between failed recovery attempts in seconds, doubled
+#   after every failed attempt
+RECOVERY_BACKOFF_BASE = 0.1
+RECOVERY_BACKOFF_MAX = 10.0
+
+# Serializes the creation of image acquirers of a shared Harvester
+_HARVESTER_LOCK = threading.Lock()
+
+
+def create_harvester(gen_tl_producer_path_list):
+    """
+    Loads the GenTL producers and discovers all available devices.
+    The returned Harvester can be shared by several GenICam
+    instances, so the producer libraries are loaded and the devices
+    are enumerated only once per process.
+
+    Args:
+        gen_tl_producer_path_list[list]:
+                                Paths to the *.cti files
+
+    Returns:
+        Harvester with an updated device information list
+    """
+    # Instantiate a Harvester object to use harvesters core
+    h = Harvester()
+
+    for path in gen_tl_producer_path_list:
+        h.add_file(path)
+
+    # Check if cti-file available, stop if none found
+    if len(h.files) == 0:
+        sys.exit("No valid cti file found")
+    logging.debug(HORIZONTAL_CONSOLE_LINE)
+    logging.debug("Currently available genTL Producer CTI files: ")
+    for file in h.files:
+        logging.debug(file)
+
+    # Update the list of remote devices; fills up your device
+    #   information list; multiple devices in list possible
+    h.update()
+    # If no remote devices in the list that you can control
+    if len(h.device_info_list) == 0:
+        sys.exit("No compatible devices detected.")
+    # Show remote devices in list
+    logging.debug("Available devices:")
+    for camera in h.device_info_list:
+        logging.debug(camera)
+    return h
+
+
+class GenICam(CamGeneral):
+    """
+    This class is for all GenICam compatible cameras. Cameras
+    with GigE Vision or USB3 Vision transport layer always
+    support GenICam. Each instance of this class will be
+    automatically connected to the device.
+
+    The class inherits all methods from the base class CamGeneral.
+    (see description of CamGeneral) Because of that this class has
+    to define the abstract method _acquire_image(). In this class
+    _acquire_image() fetchs an image out of the buffer/image stream
+    and makes sure that data format is BGR8 so that get_image() can
+    send it to MQTT broker.
+
+    Additional methods of the GenICam class:
+    The first method _connect() establishs a connection to the
+    GenICam camera. Afterwards, _apply_settings() applies either
+    a configurated user set of configurations or the entered
+    settings in the arguments for the class instance. The user
+    set of configurations can be created in the matrix vision
+    wxPropView or in most SDK which is provided by the camera
+    manufacturer. If no user set of configurations is used
+    and no settings are provided in the arguments, the default
+    settings of the camera will be used.
+    The method start _start_acquisition() starts the image stream
+    of the camera.
+    The last method deactivate() disconnects from camera.
+
+    Some of the comments in this class are copied from:
+    https://github.com/genicam/harvesters/blob/master/README.rst
+
+    Args of constructor:
+        mqtt_host[string]:          Hostname or IP address of the
+                                    MQTT broker
+        mqtt_port[int]:             Network port of the server
+                                    host to connect to
+        mqtt_topic[string]:         Topic on MQTT Broker where
+                                    trigger signal is send to
+                                    (e.g. "test/trigger/")
+        genTL_producer_path[string]:
+                                    Path to the *.cti file that
+                                    is used to connect to camera
+        (opt.) user_set_selector[string]:
+                                    Use an already pre-configu-
+                                    rated user set.
+                                    Possible values: "Default",
+                                        "UserSet1", "UserSet2",
+                                        "UserSet3", "UserSet4",
+                                        "UserSet5" (The number of
+                                        user sets is camera
+                                        dependent.)
+                                    Default value: "Default"
+        (opt.) image_width[int]:    Determine in pixels the region
+                                    of interest (ROI). ROI will be
+                                    always centered in camera
+                                    sensor.
+                                    A value higher than maximum
+                                    resolution of the camera will
+                                    set maximum values instead of
+                                    the values entered here.
+                                    To find out the highest value,
+                                    search for the resolution in
+                                    the specifications of the
+                                    camera.
+                                    Specifications are available
+                                    in the manual or on the
+                                    website where you bought the
+                                    camera.
+                                    Default: None
+        (opt.) image_height[int]:   see image_width
+                                    Default: None
+        (opt.) pixel_format[string]:
+                                    Set the pixel format you want
+                                    to use. Monochrome formats are
+                                    published as Mono8 (or 16 bit,
+                                    see bit_depth), all color
+                                    formats as BGR8. Bayer and
+                                    YUV422 formats are converted on
+                                    the host, which saves two
+                                    thirds resp. one third of the
+                                    bandwidth compared to "RGB8".
+                                    If you only have a camera with
+                                    only one image sensor, you can
+                                    only take monochrome images.
+                                    Possible values: see
+                                        PIXEL_FORMATS in
+                                        pixel_formats.py, e.g.
+                                        "Mono8", "Mono12p",
+                                        "BayerRG8", "RGB8Packed"
+                                    Default value: None
+        (opt.) bit_depth[int]:      Bits per pixel of the published
+                                    Mono10 and Mono12 images, 8 or
+                                    16. 16 requires the png codec.
+                                    Default value: 8
+        (opt.) bit_shift[int]:      Number of least significant
+                                    bits that are dropped to reduce
+                                    Mono10 and Mono12 to 8 bits,
+                                    None to keep the 8 most
+                                    significant bits
+                                    Default value: None
+        (opt.) image_channels[int]: Number of channels (bytes per
+                                    pixel) that are used in the
+                                    array (third dimension of the
+                                    image data array).You do not
+                                    have to set this value.
+                                    If None, the best number of
+                                    channels for your set pixel
+                                    format will be used
+                                    Possible Values: 1, 3
+                                    Default value: None
+        (opt.) exposure_time[float]:
+                                    Set the exposure time manually.
+                                    Default value: None
+        (opt.) exposure_auto[string]:
+                                    Determine if camera should
+                                    automatically adjust the
+                                    exposure time.
+                                    Your settings will only be
+                                    executed if the camera supports
+                                    this. You do not have to check
+                                    if the camera supports this.
+                                    Possible values are:
+                                        - "Off":  No automatic
+                                            adjustment
+                                        - "Once": Adjusted once
+                                        - "Continuous": Continuous
+                                            adjustment (not
+                                            recommended,
+                                            Attention: This could
+                                            have a big impact on
+                                            the frame rate of your
+                                            camera)
+                                    Default value: None
+        (opt.) gain_auto[string]:   Determine if camera should
+                                    automatically adjust the gain.
+                                    Your settings will only be
+                                    executed if the camera supports
+                                    this. You do not have to check
+                                    if the camera supports this.
+                                    Possible values are:
+                                        see exposure_auto
+                                    Default value: None
+        (opt.) balance_white_auto[string]:
+                                    Determine if camera should
+                                    automatically adjust the
+                                    white balance.
+                                    Your settings will only be
+                                    executed if the camera supports
+                                    this. You do not have to check
+                                    if the camera supports this.
+                                    Possible values are:
+                                        see exposure_auto
+                                    Default value: None
+        (opt.) payload_format[string]:
+                                    Wire format of the image
+                                    messages, see CamGeneral.
+                                    Default value: "JSON"
+        (opt.) codec[ImageCodec]:   Codec that encodes the images,
+                                    see CamGeneral.
+                                    Default value: None
+        (opt.) archive[ImageArchiveWriter]:
+                                    Archive for the encoded images,
+                                    see CamGeneral.
+                                    Default value: None
+        (opt.) acquisition_mode[string]:
+                                    Determine how the newest image
+                                    is fetched out of the stream.
+                                    Possible values are:
+                                        - "Flush": one buffer is
+                                            discarded before the
+                                            image is fetched (doubles
+                                            the latency)
+                                        - "NewestOnly": the GenTL
+                                            producer only delivers
+                                            the newest buffer. Falls
+                                            back to "Flush" if not
+                                            supported by the producer
+                                        - "LatestFrame": a background
+                                            thread grabs every frame
+                                            and a trigger waits for
+                                            the next one
+                                        - "SoftwareTrigger": the
+                                            camera only exposes a
+                                            frame when get_image()
+                                            fires a software trigger.
+                                            Falls back to "Flush" if
+                                            not supported by the
+                                            camera
+                                    Default value: "Flush"
+        (opt.) harvester[Harvester]:
+                                    Harvester shared with other
+                                    GenICam instances, see
+                                    create_harvester(). The shared
+                                    Harvester is never reset by
+                                    this instance. None to create
+                                    an own Harvester
+                                    Default value: None
+        (opt.) profile_path[string]:
+                                    JSON file in which the feature
+                                    names of the node map and the
+                                    applied settings are cached
+                                    across restarts (see
+                                    camera_profile.py). None to
+                                    cache them only in memory
+                                    Default value: None
+        (opt.) mqtt_qos[int], max_inflight[int], spool[PublishSpool]:
+                                    Reliable publishing, see
+                                    CamGeneral
+                                    Default values: 0, 20, None
+
+    Returns of constructor:
+        A configured and connected instance of GenICam ready to
+        fetch an image.
+    """
+
+    def __init__(self, mqtt_host, mqtt_port, mqtt_topic, mac_address, gen_tl_producer_path_list,
+                 user_set_selector="Default", image_width=None, image_height=None, pixel_format=None,
+                 image_channels=None, exposure_time=None, exposure_auto=None, gain_auto=None, balance_white_auto=None,
+                 image_storage_path=None, payload_format="JSON", codec=None, archive=None,
+                 acquisition_mode="Flush", harvester=None, profile_path=None, mqtt_qos=0, max_inflight=20,
+                 spool=None, bit_depth=8, bit_shift=None) -> None:
+        """
+        Defines the settings for the camera configuration and
+        establish a connection to the GenICam camera.
+
+        Args:
+            see class description
+
+        Returns:
+            see class description
+        """
+        super().__init__(mqtt_host=mqtt_host,
+                         mqtt_port=mqtt_port,
+                         mqtt_topic=mqtt_topic,
+                         mac_address=mac_address,
+                         image_storage_path=image_storage_path,
+                         payload_format=payload_format,
+                         codec=codec,
+                         archive=archive,
+                         mqtt_qos=mqtt_qos,
+                         max_inflight=max_inflight,
+                         spool=spool)
+
+        self.gen_tl_producer_path_list = gen_tl_producer_path_list
+        self.user_set_selector = user_set_selector
+        self.image_width = image_width
+        self.image_height = image_height
+        self.pixel_format = pixel_format
+        self.image_channels = image_channels
+        self.exposure_time = exposure_time
+        self.exposure_auto = exposure_auto
+        self.gain_auto = gain_auto
+        self.balance_white_auto = balance_white_auto
+
+        if acquisition_mode not in ACQUISITION_MODES:
+            sys.exit("Unsupported acquisition mode: %s" % acquisition_mode)
+        if pixel_format is not None and pixel_format not in PIXEL_FORMATS:
+            sys.exit("Unsupported pixel format: %s" % pixel_format)
+        if bit_depth not in BIT_DEPTHS:
+            sys.exit("Unsupported bit depth: %s" % bit_depth)
+        if bit_depth == 16 and self.codec.name != CODEC_PNG:
+            sys.exit("Unsupported codec for a bit depth of 16: %s" % self.codec.name)
+        if image_channels not in (None, 1, 3):
+            sys.exit("Unsupported number of image channels: %s" % image_channels)
+        self.bit_depth = bit_depth
+        self.bit_shift = bit_shift
+        # Pixel format -> PixelConverter, see _converter()
+        self._converters = {}
+        self.acquisition_mode = acquisition_mode
+        self.grabber = None
+        self.h = harvester
+        self._owns_harvester = harvester is None
+        # Id of the device of the camera, cached to reopen it
+        #   without a new discovery
+        self.device_id = None
+        self.profile = CameraProfile(profile_path)
+
+        # Recovery counters
+        self.timeouts = 0
+        self.transport_errors = 0
+        self.conversion_errors = 0
+        self.recoveries = dict.fromkeys(RECOVERY_TIERS, 0)
+        self.recovery_failures = 0
+        self.recovery_ms_last = 0.0
+        self.recovery_ms_max = 0.0
+        self._failed_attempts = 0
+        # A failed recovery destroyed the image acquirer, the next
+        #   recovery has to open the device again
+        self._reacquire = False
+        # Set by disconnect(), interrupts the backoff of a recovery
+        self._stopped = threading.Event()
+
+        # Connect to camera
+        self._connect()
+
+        # Apply configurations
+        self._apply_settings()
+
+        # Start acquisition
+        self._start_acquisition()
+
+    def _connect(self) -> None:
+        """
+        Establishes with the set GenTL Producer a connection to
+        the GenICam camera. Also some default settings are done.
+
+        Args:
+            None
+        Returns:
+            None
+        """
+
+        # A shared Harvester already loaded the producers and
+        #   discovered the devices
+        if self._owns_harvester:
+            self.h = create_harvester(self.gen_tl_producer_path_list)
+
+        # Create an image acquirer object specifying a target
+        #   remote device
+        # As argument also user_defined_name,
+        #   vendor, model, etc. possible
+        # If multiple cameras in device list, choose the right
+        #   one by changing the list_index or by using another
+        #   argument
+
+        self.ia = None
+        for camera in self.h.device_info_list:
+            #read cameras mac address
+            #ATTENTION: only works with BAUMER SDK
+            device_mac_address = str(camera.id_).replace("_","").replace("devicemodul","")
+            if device_mac_address.upper() == self.mac_address.upper().replace(":",""):
+                try:
+                    self._open_device(camera.id_)
+                except:
+                    logging.error("Camera ist not reachable. Most likely another container already occupies the same camera. One camera can only be used by exactly one container at the time.")
+                    sys.exit("Camera not reachable.")
+                logging.debug("Using:" + str(camera))
+                logging.debug(HORIZONTAL_CONSOLE_LINE)
+
+        if self.ia is None:
+            logging.error("No camera with the specified MAC address available. Please specify MAC address in env file correctly.")
+            sys.exit("Invalid MAC address.")
+
+    def _open_device(self, device_id) -> None:
+        """
+        Creates the image acquirer of a discovered device and does
+        some default settings.
+
+        Args:
+            device_id[string]:      Id of the device in the device
+                                    information list of the Harvester
+
+        Returns:
+            None
+        """
+        with _HARVESTER_LOCK:
+            self.ia = self.h.create_image_acquirer(id_=device_id)
+        self.device_id = device_id
+
+        ## Set some default settings
+        # This is required because of a bug in the harvesters
+        #   module. This should not affect our usage of image
+        #   acquirer. Only change if you know what you are doing
+        self.ia.remote_device.node_map.ChunkModeActive.value = False
+
+        # The number of buffers that is prepared for the image
+        #   acquisition process. The buffers will be announced
+        #   to the target GenTL Producer. Need this so that we
+        #   always get the correct actual image.
+        self.ia.num_buffers = 1
+
+    def _apply_settings(self) -> None:
+        """
+        Applies the settings for the camera.
+
+        Either a configured user set of configurations or the
+        entered settings in the arguments for the class instance.
+        The user set of configurations can be created in the
+        matrix vision wxPropView or in most SDK which is provided
+        by the camera manufacturer.
+        If no user set of configurations is used and no settings
+        are provided in the arguments, the default settings of
+        the cameras will be used.
+
+        The automatic adjust settings are only applied if camera
+        supports these features.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+
+        # Get list of all available features of the camera
+        node_map = self._node_map_features()
+
+        # If camera was already configured and configurations
+        #   has been saved in user set, then set and load user
+        #   set here and return
+        if self.user_set_selector != "Default":
+            self._set_feature("UserSetSelector", self.user_set_selector)
+            self.ia.remote_device.node_map.UserSetLoad.execute()
+            # The user set overwrote the applied settings
+            self.profile.invalidate()
+            self._configure_trigger(node_map)
+            self.profile.save()
+            # Do not execute the code afterwards in this function
+            #   if user-set is used
+            return
+
+        # Set Width
+        if self.image_width is not None:
+            if self.image_width > self.ia.remote_device.node_map.WidthMax.value:
+                # Value given in settings higher than max
+                #   -> set max
+                self._set_feature("Width", self.ia.remote_device.node_map.WidthMax.value)
+            else:
+                # Set value given in settings
+                self._set_feature("Width", self.image_width)
+
+        # Set Height
+        if self.image_height is not None:
+            if self.image_height > self.ia.remote_device.node_map.HeightMax.value:
+                # Value given in settings higher than max
+                #   -> set max
+                self._set_feature("Height", self.ia.remote_device.node_map.HeightMax.value)
+            else:
+                # Set value given in settings
+                self._set_feature("Height", self.image_height)
+
+        # Set ROI always centered in camera sensor
+        # Therefore calculate Offset X and Offset Y where the
+        #   readout region should start and assign it to features
+        if self.user_set_selector != "Default":
+            self._set_feature("OffsetX", int(
+                (self.ia.remote_device.node_map.WidthMax.value - self.ia.remote_device.node_map.Width.value) / 2))
+            self._set_feature("OffsetY", int(
+                (self.ia.remote_device.node_map.HeightMax.value - self.ia.remote_device.node_map.Height.value) / 2))
+
+        # Set PixelFormat
+        if self.pixel_format is not None:
+            self._set_feature("PixelFormat", self.pixel_format)
+
+        # Set Exposure time; without a value the camera keeps its
+        #   own
+        if self.exposure_auto is not None and self.exposure_time is not None:
+            try:
+                self._set_feature("ExposureTimeAbs", self.exposure_time)
+            except OutOfRangeException:
+                logging.error("Specified Exposure time too high for selected camera. Please choose smaller value.")
+                sys.exit(1)
+
+        # Set ExposureAuto, GainAuto and BalanceWhiteAuto;
+        #   it always first checks if connected camera supports
+        #   this function
+        if self.exposure_auto is not None:
+            if "ExposureAuto" in node_map:
+                self._set_feature("ExposureAuto", self.exposure_auto)
+            else:
+                logging.warning("Camera does not support automatic adjustment of exposure time")
+        if self.gain_auto is not None:
+            if "GainAuto" in node_map:
+                self._set_feature("GainAuto", self.gain_auto)
+            else:
+                logging.warning("Camera does not support automatic adjustment of gain")
+        if self.balance_white_auto is not None:
+            if "BalanceWhiteAuto" in node_map:
+                self._set_feature("BalanceWhiteAuto", self.balance_white_auto)
+            else:
+                logging.warning("Camera does not support automatic adjustment of white balance")
+
+        self._configure_trigger(node_map)
+        self.profile.save()
+
+    def _node_map_features(self) -> frozenset:
+        """
+        Names of all available features of the camera. Listing the
+        node map is slow, so the names are taken from the profile
+        if the device is already known.
+
+        Args:
+            None
+
+        Returns:
+            Set of feature names
+        """
+        features = self.profile.features_of(self.device_id)
+        if features is not None:
+            return features
+
+        features = dir(self.ia.remote_device.node_map)
+        logging.debug("Adjustable parameters for connected camera:")
+        for setting in features:
+            logging.debug(setting)
+        self.profile.set_features(self.device_id, features)
+        return self.profile.features
+
+    def _set_feature(self, name, value) -> None:
+        """
+        Writes a feature of the node map only if the camera has
+        another value. Settings that this process already applied
+        (see CameraProfile.is_applied()) are skipped without any
+        node map access. Other settings are read first, e.g. after
+        a power cycle or a changed configuration, because writing
+        always costs a round-trip and may invalidate dependent
+        features.
+
+        Args:
+            name[string]:           Name of the feature
+            value:                  Value to set
+
+        Returns:
+            None
+        """
+        if self.profile.is_applied(name, value):
+            return
+        node = getattr(self.ia.remote_device.node_map, name)
+        if node.value != value:
+            node.value = value
+            logging.debug("{} set to {}".format(name, value))
+        previous = self.profile.applied.get(name)
+        if previous is not None and previous != value:
+            logging.info("{} changed from {} to {} since the last configuration.".format(name, previous, value))
+        self.profile.mark_applied(name, value)
+
+    def _configure_trigger(self, node_map) -> None:
+        """
+        Switches the camera from free running to software triggered
+        acquisition if the acquisition mode is "SoftwareTrigger".
+        Then the camera only exposes and transfers a frame when
+        TriggerSoftware is executed, which gives deterministic
+        exposure timing and no bus load while idle.
+
+        Args:
+            node_map[list]:         Names of all available features of
+                                    the camera
+
+        Returns:
+            None
+        """
+        if self.acquisition_mode != ACQUISITION_MODE_SOFTWARE_TRIGGER:
+            # Undo the software trigger of an earlier configuration,
+            #   otherwise the camera would never expose a frame
+            if self.profile.applied.get("TriggerMode") == "On":
+                self._set_feature("TriggerMode", "Off")
+            return
+        if "TriggerMode" not in node_map or "TriggerSoftware" not in node_map:
+            logging.warning("Camera does not support software triggers. Fall back to Flush.")
+            self.acquisition_mode = ACQUISITION_MODE_FLUSH
+            return
+
+        # Trigger the start of each frame
+        if "TriggerSelector" in node_map:
+            self._set_feature("TriggerSelector", "FrameStart")
+        self._set_feature("TriggerMode", "On")
+        self._set_feature("TriggerSource", "Software")
+        logging.debug("Software trigger configured.")
+
+    def _start_acquisition(self) -> None:
+        """
+        Activate an image stream from camera to be able to fetch
+        images out of stream. Depending on the acquisition mode the
+        buffer handling of the stream is configured or the grab
+        thread is started.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        if self.acquisition_mode == ACQUISITION_MODE_NEWEST_ONLY:
+            if not self._set_newest_only_buffer_handling():
+                logging.warning("GenTL producer does not support the buffer handling mode NewestOnly. Fall back to Flush.")
+                self.acquisition_mode = ACQUISITION_MODE_FLUSH
+        if self.acquisition_mode == ACQUISITION_MODE_LATEST_FRAME:
+            # More than one buffer so that the camera can keep
+            #   streaming while a frame is converted
+            self.ia.num_buffers = 3
+
+        self._create_buffer_pool()
+
+        # Starts image acquisition with harvesters
+        self.ia.start_acquisition()
+        logging.debug("Acquisition started.")
+
+        if self.acquisition_mode == ACQUISITION_MODE_LATEST_FRAME:
+            release = self.buffer_pool.release if self.buffer_pool is not None else None
+            self.grabber = LatestFrameGrabber(self.ia, self._convert_component, release=release)
+
+    def _create_buffer_pool(self) -> None:
+        """
+        Creates the pool of image arrays sized from the negotiated
+        Width, Height and PixelFormat of the camera. Without a
+        supported pixel format every frame gets a new array.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        node_map = self.ia.remote_device.node_map
+        try:
+            converter = self._converter(node_map.PixelFormat.value)
+        except ValueError:
+            self.buffer_pool = None
+            return
+        shape = converter.output_shape(node_map.Height.value, node_map.Width.value)
+        if self.buffer_pool is None or self.buffer_pool.shape != shape or self.buffer_pool.dtype != converter.dtype:
+            self.buffer_pool = FrameBufferPool(shape, dtype=converter.dtype)
+            logging.debug("Buffer pool created for images of shape {}.".format(shape))
+
+    def _stop_grabber(self) -> None:
+        """
+        Stop the grab thread if the acquisition mode uses one. Must
+        be called before the image acquirer is destroyed.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        if self.grabber is not None:
+            self.grabber.stop()
+            self.grabber = None
+
+    def _set_newest_only_buffer_handling(self) -> bool:
+        """
+        Sets the StreamBufferHandlingMode of the data stream to
+        NewestOnly, so that a fetch always returns the newest
+        buffer.
+
+        Args:
+            None
+
+        Returns:
+            True if the GenTL producer supports the mode
+        """
+        data_streams = getattr(self.ia, "data_streams", None) or getattr(self.ia, "_data_streams", None)
+        if not data_streams:
+            return False
+        node_map = data_streams[0].node_map
+        if "StreamBufferHandlingMode" not in dir(node_map):
+            return False
+        try:
+            node_map.StreamBufferHandlingMode.value = "NewestOnly"
+        except Exception:
+            return False
+        # Two buffers, so that one can be filled while the other
+        #   one is converted
+        self.ia.num_buffers = 2
+        return True
+
+    # Get image out of image stream
+    def _acquire_image(self):
+        """
+        Fetch the newest image out of the image stream. If no image
+        was fetchable, the camera is recovered and the image is
+        fetched again, so the trigger does not get lost. An image
+        whose pixel format can not be converted is dropped.
+
+        Args:
+            None
+
+        Returns:
+            Image as np.ndarray or None if the image could not be
+            converted or the camera could not be recovered
+        """
+        if self._reacquire:
+            # Without image acquirer there is nothing to fetch from
+            return self._recover()
+        try:
+            retrieved_image = self._fetch_image()
+            self._failed_attempts = 0
+            return retrieved_image
+        except TimeoutException:
+            self.timeouts += 1
+            logging.error("Timeout ocurred during fetching an image. Recover camera.")
+        except ValueError:
+            # Raised by the PixelConverter, a recovery does not
+            #   change the pixel format of the stream
+            self.conversion_errors += 1
+            logging.exception("Image could not be converted, image is dropped.")
+            return None
+        except Exception:
+            # Any other error of the GenTL producer or harvesters
+            self.transport_errors += 1
+            logging.exception("Fetching an image failed. Recover camera.")
+        return self._recover()
+
+    def _fetch_image(self):
+        """
+        Fetch the newest image out of the image stream and make sure
+        if colored image that BGR pixel format is used.
+
+        Args:
+            None
+
+        Returns:
+            Image as np.ndarray
+
+        Raises:
+            TimeoutException if no image was fetchable
+        """
+        # Try to fetch a buffer that has been filled up with an
+        #   image
+        if self.acquisition_mode == ACQUISITION_MODE_LATEST_FRAME:
+            # The grab thread already converted the frame
+            retrieved_image = self.grabber.wait_for_frame(timeout=20)
+            logging.debug(HORIZONTAL_CONSOLE_LINE)
+            logging.debug("Image fetched.")
+            return retrieved_image
+
+        if self.acquisition_mode == ACQUISITION_MODE_SOFTWARE_TRIGGER:
+            # Expose exactly one frame, which is the next buffer
+            #   of the stream
+            self.ia.remote_device.node_map.TriggerSoftware.execute()
+        elif self.acquisition_mode == ACQUISITION_MODE_FLUSH:
+            # To solve the problem that buffer is already filled
+            #   with an old image, but we want the newest image,
+            #   This here is probably not the best way to solve
+            #   the problem. It is a workaround.
+            with self.ia.fetch_buffer(timeout=20) as buffer:
+                # Do not use this buffer, use the next one
+                pass
+
+        # Due to with statement buffer will automatically be
+        #   queued
+        with self.ia.fetch_buffer(timeout=20) as buffer:
+            self._mark_fetched(exposure_ns=self._exposure_timestamp(buffer))
+            logging.debug(HORIZONTAL_CONSOLE_LINE)
+            logging.debug("Image fetched.")
+            # Create an alias of the 2D image component:
+            # Note that the number of components can be vary.
+            #   If your target remote device transmits a
+            #   multi-part information, then you'd get two or
+            #   more components in the payload. However, this
+            #   programs works with a remote device that
+            #   transmits only a 2D image. So we manipulate
+            #   only index 0 of the list object, components.
+            retrieved_image = self._convert_component(buffer.payload.components[0])
+
+        logging.debug("Image converted.")
+        return retrieved_image
+
+    @staticmethod
+    def _exposure_timestamp(buffer):
+        """
+        Hardware timestamp of the exposure of a buffer.
+
+        Args:
+            buffer[Buffer]:         Fetched buffer
+
+        Returns:
+            Timestamp in ns of the camera clock or None if the
+            producer does not provide it
+        """
+        try:
+            timestamp_ns = buffer.timestamp_ns
+        except Exception:
+            return None
+        return int(timestamp_ns) if timestamp_ns else None
+
+    def _recover(self):
+        """
+        Recovers the camera in tiers from the cheapest to the most
+        expensive one until an image can be fetched again:
+            1. restart the image stream
+            2. reopen the cached device id and apply the settings
+            3. rebuild the Harvester, reload the producers and
+               rediscover the device (not done with a shared
+               Harvester, which keeps serving the other cameras)
+        Failed attempts are retried with exponential backoff, which
+        is interrupted by disconnect(). After the image acquirer was
+        destroyed, the recovery starts with the device tier.
+
+        Args:
+            None
+
+        Returns:
+            Image as np.ndarray or None if all tiers failed or the
+            camera was disconnected
+        """
+        start = time.perf_counter()
+        for tier in RECOVERY_TIERS:
+            if tier == RECOVERY_HARVESTER and not self._owns_harvester:
+                continue
+            if tier == RECOVERY_STREAM and self._reacquire:
+                continue
+            if self._failed_attempts > 0:
+                backoff = min(RECOVERY_BACKOFF_MAX, RECOVERY_BACKOFF_BASE * 2 ** (self._failed_attempts - 1))
+                if self._stopped.wait(backoff):
+                    return None
+            elif self._stopped.is_set():
+                return None
+            try:
+                self._run_recovery_tier(tier)
+                retrieved_image = self._fetch_image()
+            except Exception:
+                self._failed_attempts += 1
+                logging.warning("Recovery of the camera by {} restart failed.".format(tier), exc_info=True)
+                continue
+
+            self._failed_attempts = 0
+            self.recoveries[tier] += 1
+            self.recovery_ms_last = (time.perf_counter() - start) * 1000
+            self.recovery_ms_max = max(self.recovery_ms_max, self.recovery_ms_last)
+            logging.info("Camera recovered by {} restart in {:.0f} ms.".format(tier, self.recovery_ms_last))
+            return retrieved_image
+
+        self.recovery_failures += 1
+        logging.error("Camera could not be recovered. Trying again with the next trigger.")
+        return None
+
+    def _run_recovery_tier(self, tier) -> None:
+        """
+        Restarts the camera in the given recovery tier.
+
+        Args:
+            tier[string]:           One of RECOVERY_TIERS
+
+        Returns:
+            None
+        """
+        self._stop_grabber()
+        if tier == RECOVERY_STREAM:
+            self.ia.stop_acquisition()
+            self._start_acquisition()
+            return
+
+        # Until the tier succeeded, every following recovery has to
+        #   open the device again
+        self._reacquire = True
+        if self.ia is not None:
+            self.ia.destroy()
+            self.ia = None
+        if tier == RECOVERY_DEVICE:
+            self._open_device(self.device_id)
+        else:
+            self.h.reset()
+            self._connect()
+            # The camera was rediscovered, e.g. after a power cycle,
+            #   and may have lost its settings
+            self.profile.invalidate()
+        self._apply_settings()
+        self._start_acquisition()
+        self._reacquire = False
+
+    def stats(self) -> dict:
+        """
+        Current recovery counters and latencies of the camera.
+
+        Args:
+            None
+
+        Returns:
+            Dictionary with the counters
+        """
+        stats = super().stats()
+        stats.update({
+            'timeouts': self.timeouts,
+            'transport_errors': self.transport_errors,
+            'conversion_errors': self.conversion_errors,
+            'recovery_failures': self.recovery_failures,
+            'recovery_ms_last': self.recovery_ms_last,
+            'recovery_ms_max': self.recovery_ms_max,
+        })
+        for tier in RECOVERY_TIERS:
+            stats['recoveries_' + tier] = self.recoveries[tier]
+        return stats
+
+    def is_ready(self) -> bool:
+        """
+        Readiness of the camera to publish images.
+
+        Args:
+            None
+
+        Returns:
+            True if the camera is connected to the MQTT broker and
+            the last recovery did not fail
+        """
+        return super().is_ready() and self._failed_attempts == 0 and not self._reacquire
+
+    def _converter(self, pixel_format) -> PixelConverter:
+        """
+        Converter of a pixel format, created once per format.
+
+        Args:
+            pixel_format[string]:   GenICam pixel format
+
+        Returns:
+            PixelConverter
+
+        Raises:
+            ValueError if the pixel format is not supported
+        """
+        converter = self._converters.get(pixel_format)
+        if converter is None:
+            converter = PixelConverter(pixel_format, bit_depth=self.bit_depth, bit_shift=self.bit_shift,
+                                       channels=self.image_channels)
+            self._converters[pixel_format] = converter
+        return converter
+
+    def _convert_component(self, component):
+        """
+        Converts the image data of a buffer component into an array
+        in Mono8 or BGR8 (see pixel_formats.py) in a single pass.
+
+        Args:
+            component[Component2DImage]:
+                                    Component of a fetched buffer
+
+        Returns:
+            Image as np.ndarray
+
+        Raises:
+            ValueError if the pixel format of the buffer is not
+            supported
+        """
+        converter = self._converter(component.data_format)
+
+        # Convert into an array of the pool. The data still points
+        #   into the buffer of the GenTL producer.
+        shape = converter.output_shape(component.height, component.width)
+        out = None
+        if self.buffer_pool is not None and self.buffer_pool.shape == shape \
+                and self.buffer_pool.dtype == converter.dtype:
+            out = self.buffer_pool.acquire()
+        return converter.convert(component.data, component.height, component.width, out=out)
+
+    def disconnect(self) -> None:
+        """
+        Deactivate acquisition and disconnect from camera.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        self._stopped.set()
+
+        # Close the connection to ...
+        # ... MQTT (and stop loop)
+        CamGeneral.disconnect(self)
+
+        # ... GenICam (destroy image acquirer, unless a failed
+        #   recovery already did)
+        self._stop_grabber()
+        if self.ia is not None:
+            self.ia.destroy()
+        if self._owns_harvester:
+            self.h.reset()
+
+        if self.buffer_pool is not None:
+            logging.debug("Buffer pool statistics: {}".format(self.buffer_pool.stats()))
+        logging.debug("Camera statistics: {}".format(self.stats()))
+
+        logging.debug("Disconnected from GenICam camera.")
@@ -0,0 +1,132 @@
+"""
+Background grabbing of the newest frame of a free running camera.
+
+The LatestFrameGrabber fetches every buffer of the image stream as
+soon as it is delivered, converts it and requeues the buffer right
+away, so the GenTL producer never runs out of buffers and no stale
+frames pile up. Only the newest converted frame is kept in a single
+slot. A trigger waits once for the next frame that completes after
+the trigger instead of flushing a stale buffer first.
+"""
+
+# Import python in-built libraries
+import logging
+import threading
+import time
+
+# Import libraries that are only needed for GenICam
+from genicam.gentl import TimeoutException
+
+
+class LatestFrameGrabber:
+    """
+    Keeps the newest frame of an image acquirer in a single slot.
+
+    Args of constructor:
+        ia[ImageAcquirer]:      Image acquirer of harvesters with
+                                started acquisition
+        convert[callable]:      Converts a buffer component into an
+                                image, called in the grab thread
+        (opt.) release[callable]:
+                                Gives an image back to its buffer
+                                pool. Called for frames that were
+                                replaced by a newer one before a
+                                trigger took them.
+                                Default value: None
+        (opt.) fetch_timeout[float]:
+                                Timeout of a single fetch in seconds.
+                                The grab thread keeps trying after a
+                                timeout.
+                                Default value: 1.0
+
+    Returns of constructor:
+        A running grabber
+    """
+
+    def __init__(self, ia, convert, release=None, fetch_timeout=1.0) -> None:
+        self.ia = ia
+        self.convert = convert
+        self.release = release
+        self.fetch_timeout = fetch_timeout
+
+        self.grabbed = 0
+        self._image = None
+        self._taken = False
+        self._sequence = 0
+        self._error = None
+        self._running = True
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="grabber", daemon=True)
+        self._thread.start()
+
+    def wait_for_frame(self, timeout):
+        """
+        Waits for the next frame that is completed after this call.
+
+        Args:
+            timeout[float]:         Maximum waiting time in seconds
+
+        Returns:
+            Image as np.ndarray
+
+        Raises:
+            TimeoutException if no frame was completed in time
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            sequence = self._sequence
+            while self._sequence == sequence:
+                if self._error is not None:
+                    error, self._error = self._error, None
+                    raise error
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._running:
+                    raise TimeoutException("No frame grabbed within {} s".format(timeout))
+                self._condition.wait(remaining)
+            # The caller owns the image from now on
+            self._taken = True
+            return self._image
+
+    def stop(self) -> None:
+        """
+        Stops the grab thread. Must be called before the acquisition
+        is stopped or the image acquirer is destroyed.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        self._running = False
+        self._thread.join()
+        with self._condition:
+            self._condition.notify_all()
+
+    def _run(self) -> None:
+        while self._running:
+            try:
+                with self.ia.fetch_buffer(timeout=self.fetch_timeout) as buffer:
+                    image = self.convert(buffer.payload.components[0])
+            except TimeoutException:
+                continue
+            except Exception as e:
+                # Hand the error to the next trigger
+                logging.exception("Grabbing a frame failed.")
+                with self._condition:
+                    self._error = e
+                    self._condition.notify_all()
+                time.sleep(self.fetch_timeout)
+                continue
+
+            with self._condition:
+                # A frame nobody took goes back to the pool, so only
+                #   three arrays are in use: the one being filled,
+                #   the newest one and the one of the trigger
+                if self._image is not None and not self._taken and self.release is not None:
+                    self.release(self._image)
+                self._image = image
+                self._taken = False
+                self._sequence += 1
+                self.grabbed += 1
+                self._condition.notify_all()
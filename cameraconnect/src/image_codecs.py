@@ -0,0 +1,364 @@
+"""
+Image codecs that are used to encode the acquired images before
+they are published and stored.
+
+Provided codecs:
+- JpegCodec: JPEG via OpenCV with quality and optimize flags
+- TurboJpegCodec: JPEG via libjpeg-turbo (optional dependency
+            PyTurboJPEG, falls back to JpegCodec if not installed)
+- PngCodec: lossless PNG with a compression level
+- WebpCodec: WebP with a quality setting
+- RawCodec: uncompressed pixel data, meant for Mono8 images
+
+Use create_codec() to get a codec by its name and preset. The
+benchmark in benchmark_codecs.py compares the codecs on synthetic
+frames. detect_encoding() and encoded_image_shape() inspect already
+encoded images without decoding them.
+"""
+
+# Import python in-built libraries
+import logging
+import struct
+import sys
+from abc import ABC, abstractmethod
+
+# Import libraries that had been installed with pip install
+import cv2
+import numpy as np
+
+CODEC_JPG = "jpg"
+CODEC_TURBOJPEG = "turbojpeg"
+CODEC_PNG = "png"
+CODEC_WEBP = "webp"
+CODEC_RAW = "raw"
+CODECS = (CODEC_JPG, CODEC_TURBOJPEG, CODEC_PNG, CODEC_WEBP, CODEC_RAW)
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# PNG color type -> channels after decoding with IMREAD_UNCHANGED
+PNG_CHANNELS = {0: 1, 2: 3, 3: 3, 4: 2, 6: 4}
+
+# Codec settings per preset. "Default" keeps the defaults of the
+#   libraries, "Fast" trades size for encoding speed and "Small"
+#   trades encoding speed for size.
+PRESETS = {
+    "Default": {},
+    "Fast": {
+        CODEC_JPG: {'quality': 80},
+        CODEC_TURBOJPEG: {'quality': 80},
+        # Without a compression level OpenCV uses its fastest
+        #   setting (level 1 with run-length encoding)
+        CODEC_PNG: {},
+        CODEC_WEBP: {'quality': 75},
+    },
+    "Balanced": {
+        CODEC_JPG: {'quality': 90},
+        CODEC_TURBOJPEG: {'quality': 90},
+        CODEC_PNG: {'compression': 3},
+        CODEC_WEBP: {'quality': 85},
+    },
+    "Small": {
+        CODEC_JPG: {'quality': 85, 'optimize': True},
+        CODEC_TURBOJPEG: {'quality': 85},
+        CODEC_PNG: {'compression': 9},
+        CODEC_WEBP: {'quality': 80},
+    },
+}
+
+
+class ImageCodec(ABC):
+    """
+    Abstract base class for the codecs.
+
+    Attributes:
+        name[string]:           Name of the encoding, used in the
+                                binary payload header
+        extension[string]:      File extension for stored images
+        copies_image[bool]:     False if the encoded image shares
+                                the memory of the image
+    """
+
+    name = None
+    extension = None
+    copies_image = True
+
+    @abstractmethod
+    def encode(self, image):
+        """
+        Must be defined by children.
+
+        Encodes an image.
+
+        Args:
+            image[np.ndarray]:      Image in BGR color format with
+                                    size N x M x image_channels
+
+        Returns:
+            Encoded image as an object supporting the buffer
+            protocol (np.ndarray of uint8 or bytes)
+        """
+        pass
+
+
+class JpegCodec(ImageCodec):
+    """
+    JPEG encoding with OpenCV.
+
+    Args of constructor:
+        (opt.) quality[int]:    JPEG quality from 0 to 100,
+                                None for the OpenCV default (95)
+                                Default value: None
+        (opt.) optimize[bool]:  Optimize the Huffman tables, smaller
+                                files but slower encoding
+                                Default value: False
+    """
+
+    name = CODEC_JPG
+    extension = ".jpg"
+
+    def __init__(self, quality=None, optimize=False) -> None:
+        self.params = []
+        if quality is not None:
+            self.params += [cv2.IMWRITE_JPEG_QUALITY, int(quality)]
+        if optimize:
+            self.params += [cv2.IMWRITE_JPEG_OPTIMIZE, 1]
+
+    def encode(self, image):
+        irrelevant, encoded = cv2.imencode(self.extension, image, self.params)
+        return encoded
+
+
+class TurboJpegCodec(ImageCodec):
+    """
+    JPEG encoding with libjpeg-turbo through the optional PyTurboJPEG
+    binding.
+
+    Args of constructor:
+        (opt.) quality[int]:    JPEG quality from 0 to 100
+                                Default value: 95
+        (opt.) library_path[string]:
+                                Path to libturbojpeg, None to let
+                                PyTurboJPEG search for it
+                                Default value: None
+
+    Raises:
+        ImportError if PyTurboJPEG or libturbojpeg is not available
+    """
+
+    name = CODEC_JPG
+    extension = ".jpg"
+
+    def __init__(self, quality=None, library_path=None) -> None:
+        try:
+            import turbojpeg
+            self._turbojpeg = turbojpeg
+            self._encoder = turbojpeg.TurboJPEG(library_path)
+        except (ImportError, OSError, RuntimeError) as e:
+            raise ImportError("libjpeg-turbo is not available: {}".format(e))
+        self.quality = 95 if quality is None else int(quality)
+
+    def encode(self, image):
+        if image.ndim == 3 and image.shape[2] == 3:
+            pixel_format = self._turbojpeg.TJPF_BGR
+            subsample = self._turbojpeg.TJSAMP_420
+        else:
+            pixel_format = self._turbojpeg.TJPF_GRAY
+            subsample = self._turbojpeg.TJSAMP_GRAY
+            if image.ndim == 2:
+                image = image[:, :, np.newaxis]
+        return self._encoder.encode(image, quality=self.quality, pixel_format=pixel_format,
+                                    jpeg_subsample=subsample)
+
+
+class PngCodec(ImageCodec):
+    """
+    Lossless PNG encoding with OpenCV.
+
+    Args of constructor:
+        (opt.) compression[int]:
+                                Compression level from 0 (fastest)
+                                to 9 (smallest), None for the
+                                OpenCV default
+                                Default value: None
+    """
+
+    name = CODEC_PNG
+    extension = ".png"
+
+    def __init__(self, compression=None) -> None:
+        self.params = []
+        if compression is not None:
+            self.params += [cv2.IMWRITE_PNG_COMPRESSION, int(compression)]
+
+    def encode(self, image):
+        irrelevant, encoded = cv2.imencode(self.extension, image, self.params)
+        return encoded
+
+
+class WebpCodec(ImageCodec):
+    """
+    WebP encoding with OpenCV. A quality above 100 selects the
+    lossless mode.
+
+    Args of constructor:
+        (opt.) quality[int]:    WebP quality from 1 to 100,
+                                None for the OpenCV default
+                                Default value: None
+    """
+
+    name = CODEC_WEBP
+    extension = ".webp"
+
+    def __init__(self, quality=None) -> None:
+        self.params = []
+        if quality is not None:
+            self.params += [cv2.IMWRITE_WEBP_QUALITY, int(quality)]
+
+    def encode(self, image):
+        irrelevant, encoded = cv2.imencode(self.extension, image, self.params)
+        return encoded
+
+
+class RawCodec(ImageCodec):
+    """
+    No compression, the pixel data is passed on as it is. Meant for
+    Mono8 images on lines where bandwidth is cheaper than CPU. The
+    shape of the image is part of every message, so consumers can
+    restore the array.
+    """
+
+    name = CODEC_RAW
+    extension = ".raw"
+    copies_image = False
+
+    def encode(self, image):
+        # Only copies if the image is not contiguous in memory
+        return np.ascontiguousarray(image).reshape(-1)
+
+
+def create_codec(name=CODEC_JPG, preset="Default", quality=None, optimize=None, compression=None) -> ImageCodec:
+    """
+    Creates a codec by its name. Explicitly given settings override
+    the settings of the preset.
+
+    Args:
+        (opt.) name[string]:    Possible values: "jpg", "turbojpeg",
+                                "png", "webp", "raw"
+                                Default value: "jpg"
+        (opt.) preset[string]:  Possible values: "Default", "Fast",
+                                "Balanced", "Small"
+                                Default value: "Default"
+        (opt.) quality[int]:    Quality of jpg, turbojpeg and webp
+        (opt.) optimize[bool]:  Optimize flag of jpg
+        (opt.) compression[int]:
+                                Compression level of png
+
+    Returns:
+        ImageCodec
+    """
+    if name not in CODECS:
+        sys.exit("Unsupported image codec: %s" % name)
+    if preset not in PRESETS:
+        sys.exit("Unsupported codec preset: %s" % preset)
+
+    settings = dict(PRESETS[preset].get(name, {}))
+    if quality is not None:
+        settings['quality'] = quality
+    if optimize is not None:
+        settings['optimize'] = optimize
+    if compression is not None:
+        settings['compression'] = compression
+
+    if name == CODEC_TURBOJPEG:
+        try:
+            return TurboJpegCodec(quality=settings.get('quality'))
+        except ImportError as e:
+            logging.warning("{}. Falling back to OpenCV JPEG encoding.".format(e))
+            return JpegCodec(quality=settings.get('quality'))
+    if name == CODEC_JPG:
+        return JpegCodec(quality=settings.get('quality'), optimize=settings.get('optimize', False))
+    if name == CODEC_PNG:
+        return PngCodec(compression=settings.get('compression'))
+    if name == CODEC_WEBP:
+        return WebpCodec(quality=settings.get('quality'))
+    return RawCodec()
+
+
+def detect_encoding(data):
+    """
+    Encoding of an encoded image by its magic bytes.
+
+    Args:
+        data[buffer]:           Encoded image
+
+    Returns:
+        Codec name ("jpg", "png" or "webp") or None if unknown
+    """
+    head = bytes(data[:12])
+    if head[:3] == b"\xff\xd8\xff":
+        return CODEC_JPG
+    if head[:8] == PNG_SIGNATURE:
+        return CODEC_PNG
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return CODEC_WEBP
+    return None
+
+
+def encoded_image_shape(data):
+    """
+    (height, width, channels) of an encoded JPEG, PNG or WebP image,
+    read from its header without decoding it.
+
+    Args:
+        data[buffer]:           Encoded image
+
+    Returns:
+        Shape as tuple or None if the header can not be read
+    """
+    view = memoryview(data).cast("B")
+    encoding = detect_encoding(view)
+    if encoding == CODEC_PNG and len(view) >= 26:
+        # IHDR is always the first chunk
+        width, height = struct.unpack_from("!II", view, 16)
+        channels = PNG_CHANNELS.get(view[25])
+        return (height, width, channels) if channels else None
+    if encoding == CODEC_WEBP and len(view) >= 30:
+        # The first chunk is the lossy, the lossless or the extended
+        #   format, WebP is decoded with 3 channels or 4 with alpha
+        chunk = bytes(view[12:16])
+        if chunk == b"VP8 " and bytes(view[23:26]) == b"\x9d\x01\x2a":
+            width, height = struct.unpack_from("<HH", view, 26)
+            return height & 0x3FFF, width & 0x3FFF, 3
+        if chunk == b"VP8L" and view[20] == 0x2F:
+            bits = struct.unpack_from("<I", view, 21)[0]
+            return (bits >> 14 & 0x3FFF) + 1, (bits & 0x3FFF) + 1, 4 if bits >> 28 & 1 else 3
+        if chunk == b"VP8X":
+            width = int.from_bytes(bytes(view[24:27]), "little") + 1
+            height = int.from_bytes(bytes(view[27:30]), "little") + 1
+            return height, width, 4 if view[20] & 0x10 else 3
+        return None
+    if encoding != CODEC_JPG:
+        return None
+
+    position = 2
+    while position + 4 <= len(view):
+        if view[position] != 0xFF:
+            return None
+        marker = view[position + 1]
+        if marker == 0xFF:
+            # Fill byte
+            position += 1
+            continue
+        if 0xD0 <= marker <= 0xD9 or marker == 0x01:
+            # Markers without a length
+            position += 2
+            continue
+        length = (view[position + 2] << 8) | view[position + 3]
+        # Start of frame markers, except DHT, JPG and DAC
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            if position + 10 > len(view):
+                return None
+            height = (view[position + 5] << 8) | view[position + 6]
+            width = (view[position + 7] << 8) | view[position + 8]
+            return height, width, view[position + 9]
+        position += 2 + length
+    return None
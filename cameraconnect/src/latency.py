@@ -0,0 +1,133 @@
+"""
+End-to-end latency tracing of the frames.
+
+Every capture request carries a correlation id, which is taken from
+the trigger message (key 'correlation_id') or generated, and is
+passed on into the image message. On its way to the MQTT broker a
+frame records the point in time at which it passed each stage in ms
+since epoch:
+
+    trigger     trigger received
+    fetch       image buffer fetched from the camera
+    convert     image converted into the BGR array
+    encode      image encoded
+    publish     message handed to the MQTT client
+
+The hardware timestamp of the exposure is recorded as well. It is
+given in ns of the camera clock and only comparable with the other
+stages if the camera clock is synchronized (e.g. PTP), so it is
+passed on in the image message but not used for the latencies.
+
+The stages up to encode are part of the image message. The publish
+stage happens after the message is serialized, so it is only known
+locally. The LatencyTracker keeps rolling percentiles of the time
+spent between the stages and histograms of them for the metrics.
+"""
+
+# Import python in-built libraries
+import time
+import uuid
+
+# Import self-written modules
+from metrics import Histogram
+from rolling_stats import RollingWindow
+
+STAGE_TRIGGER = "trigger"
+STAGE_FETCH = "fetch"
+STAGE_CONVERT = "convert"
+STAGE_ENCODE = "encode"
+STAGE_PUBLISH = "publish"
+# Latency from the trigger to the publishing. Not named "total",
+#   the Prometheus names ending with _total are reserved for
+#   counters.
+LATENCY_END_TO_END = "end_to_end"
+# Stages that are part of the image message, in this order
+MESSAGE_STAGES = (STAGE_TRIGGER, STAGE_FETCH, STAGE_CONVERT, STAGE_ENCODE)
+
+# Reported latencies: (name, from stage, to stage)
+LATENCIES = (
+    (STAGE_FETCH, STAGE_TRIGGER, STAGE_FETCH),
+    (STAGE_CONVERT, STAGE_FETCH, STAGE_CONVERT),
+    (STAGE_ENCODE, STAGE_CONVERT, STAGE_ENCODE),
+    (STAGE_PUBLISH, STAGE_ENCODE, STAGE_PUBLISH),
+    (LATENCY_END_TO_END, STAGE_TRIGGER, STAGE_PUBLISH),
+)
+
+
+def now_ms() -> float:
+    """
+    Current time with sub-ms resolution.
+
+    Args:
+        None
+
+    Returns:
+        Time in ms since epoch
+    """
+    return time.time() * 1000
+
+
+def new_correlation_id() -> str:
+    """
+    Generates a correlation id for a trigger that did not bring one.
+
+    Args:
+        None
+
+    Returns:
+        Random id as 32 hex characters
+    """
+    return uuid.uuid4().hex
+
+
+class LatencyTracker:
+    """
+    Rolling percentiles and histograms of the latencies between the
+    stages of the published frames. Thread safe.
+
+    Args of constructor:
+        (opt.) size[int]:       Number of frames kept per latency
+                                Default value: 1000
+
+    Returns of constructor:
+        A tracker without measurements
+    """
+
+    def __init__(self, size=1000) -> None:
+        self._windows = {name: RollingWindow(size) for name, start, end in LATENCIES}
+        # Latency name -> Histogram in ms
+        self.histograms = {name: Histogram() for name, start, end in LATENCIES}
+
+    def record(self, stages) -> None:
+        """
+        Adds the latencies of one frame. Latencies whose stages are
+        missing are skipped.
+
+        Args:
+            stages[dict]:           Stage name -> time in ms since
+                                    epoch
+
+        Returns:
+            None
+        """
+        for name, start, end in LATENCIES:
+            if start in stages and end in stages:
+                latency_ms = stages[end] - stages[start]
+                self._windows[name].add(latency_ms)
+                self.histograms[name].observe(latency_ms)
+
+    def stats(self) -> dict:
+        """
+        p50, p95 and p99 of every latency.
+
+        Args:
+            None
+
+        Returns:
+            Dictionary like {'latency_ms_end_to_end_p50': ..., ...}
+        """
+        stats = {}
+        for name, window in self._windows.items():
+            for percentile, value in window.percentiles().items():
+                stats['latency_ms_{}_{}'.format(name, percentile)] = value
+        return stats
@@ -14,36 +14,98 @@ running until the user stops the container.
 """
 
 # Import python in-built libraries
-import glob
 import time
+# Measure the startup time including all imports
+STARTUP_START = time.perf_counter()
+import glob
 import os
 import sys
 import logging
 
-# Import self-written modules
-from cameras import GenICam
+# Import self-written modules. The GenICam camera and the optional
+#   subsystems (archive, spool, pipeline, profiling, camera group)
+#   are imported only if they are used, see below.
+from startup_timer import StartupTimer
 from cameras import DummyCamera
+from runtime import AsyncRuntime
 from trigger import MqttTrigger,ContinuousTrigger
+from image_codecs import create_codec
+
+startup_timer = StartupTimer(STARTUP_START)
+startup_timer.phase("imports")
 
 IMAGE_PATH = os.environ.get('IMAGE_PATH', None)
+IMAGE_ARCHIVE_MAX_MB = os.environ.get('IMAGE_ARCHIVE_MAX_MB', 'None')
+IMAGE_ARCHIVE_MAX_AGE_HOURS = os.environ.get('IMAGE_ARCHIVE_MAX_AGE_HOURS', 'None')
+IMAGE_ARCHIVE_QUEUE_DEPTH = int(os.environ.get('IMAGE_ARCHIVE_QUEUE_DEPTH', 64))
+IMAGE_ARCHIVE_FSYNC_BATCH = int(os.environ.get('IMAGE_ARCHIVE_FSYNC_BATCH', 16))
+IMAGE_ARCHIVE_BACKEND = os.environ.get('IMAGE_ARCHIVE_BACKEND', 'Files')
+IMAGE_ARCHIVE_SEGMENT_MB = float(os.environ.get('IMAGE_ARCHIVE_SEGMENT_MB', 256))
 
 ### LOAD OVERALL SETTINGS
 ## MQTT SETTINGS
 MQTT_HOST = os.environ.get('MQTT_HOST')
 MQTT_PORT = int(os.environ.get('MQTT_PORT', 1883))
+PAYLOAD_FORMAT = os.environ.get('PAYLOAD_FORMAT', 'JSON')
+MQTT_QOS = int(os.environ.get('MQTT_QOS', 0))
+MQTT_MAX_INFLIGHT = int(os.environ.get('MQTT_MAX_INFLIGHT', 20))
+MQTT_SPOOL_PATH = os.environ.get('MQTT_SPOOL_PATH', None)
+MQTT_SPOOL_MAX_MB = float(os.environ.get('MQTT_SPOOL_MAX_MB', 1024))
+
+## IMAGE CODEC SETTINGS
+IMAGE_CODEC = os.environ.get('IMAGE_CODEC', 'jpg')
+CODEC_PRESET = os.environ.get('CODEC_PRESET', 'Default')
+IMAGE_QUALITY = os.environ.get('IMAGE_QUALITY', 'None')
+JPEG_OPTIMIZE = os.environ.get('JPEG_OPTIMIZE', 'None')
+PNG_COMPRESSION = os.environ.get('PNG_COMPRESSION', 'None')
 
 ## TRIGGER & PROCESS SETTINGS
 TRIGGER = os.environ.get('TRIGGER')
 ACQUISITION_DELAY = float(os.environ.get('ACQUISITION_DELAY', 0.0))
 CYCLE_TIME = float(os.environ.get('CYCLE_TIME', 10.0))
+TRIGGER_QUEUE_DEPTH = int(os.environ.get('TRIGGER_QUEUE_DEPTH', 8))
+TRIGGER_QUEUE_POLICY = os.environ.get('TRIGGER_QUEUE_POLICY', 'DropNewest')
+TRIGGER_COALESCE_MS = float(os.environ.get('TRIGGER_COALESCE_MS', 100))
+
+## PIPELINE SETTINGS
+PIPELINE_ENCODE_WORKERS = int(os.environ.get('PIPELINE_ENCODE_WORKERS', 0))
+PIPELINE_QUEUE_DEPTH = int(os.environ.get('PIPELINE_QUEUE_DEPTH', 4))
+PIPELINE_QUEUE_POLICY = os.environ.get('PIPELINE_QUEUE_POLICY', 'Block')
+
+## MONITORING SETTINGS
+METRICS_PORT = os.environ.get('METRICS_PORT', 'None')
+PROFILE_MODE = os.environ.get('PROFILE_MODE', 'Off')
+PROFILE_FRAMES = int(os.environ.get('PROFILE_FRAMES', 100))
+PROFILE_PATH = os.environ.get('PROFILE_PATH', None)
+PROFILE_MEMORY = os.environ.get('PROFILE_MEMORY', 'True') == 'True'
 
 ## CAMERA SETTINGS
 CAMERA_INTERFACE = os.environ.get('CAMERA_INTERFACE')
 MAC_ADDRESS = os.environ.get('MAC_ADDRESS','')
 TRANSMITTER_ID = os.environ.get('CUBE_TRANSMITTERID','')
 
-MQTT_TOPIC_TRIGGER = "ia/trigger/"+TRANSMITTER_ID+"/"+MAC_ADDRESS
-MQTT_TOPIC_IMAGE = "ia/rawImage/"+TRANSMITTER_ID+"/"+MAC_ADDRESS
+# Several cameras are separated by commas, each one gets its own
+#   topics
+MAC_ADDRESSES = [mac.strip() for mac in MAC_ADDRESS.split(',') if mac.strip()] or ['']
+MQTT_TOPIC_TRIGGER = "ia/trigger/"+TRANSMITTER_ID+"/"
+MQTT_TOPIC_IMAGE = "ia/rawImage/"+TRANSMITTER_ID+"/"
+
+# DummyCamera settings
+DUMMY_SOURCE_PATH = os.environ.get('DUMMY_SOURCE_PATH', '/app/assets/dummy_image.jpg')
+DUMMY_IMAGE_WIDTH = os.environ.get('DUMMY_IMAGE_WIDTH', 'None')
+DUMMY_IMAGE_HEIGHT = os.environ.get('DUMMY_IMAGE_HEIGHT', 'None')
+DUMMY_PIXEL_FORMAT = os.environ.get('DUMMY_PIXEL_FORMAT', 'BGR8')
+DUMMY_VARIATION = os.environ.get('DUMMY_VARIATION', 'None')
+DUMMY_TARGET_FPS = os.environ.get('DUMMY_TARGET_FPS', 'None')
+DUMMY_LATENCY_MS = float(os.environ.get('DUMMY_LATENCY_MS', 0))
+DUMMY_TIMEOUT_RATE = float(os.environ.get('DUMMY_TIMEOUT_RATE', 0))
+DUMMY_TIMEOUT_MS = float(os.environ.get('DUMMY_TIMEOUT_MS', 1000))
+
+# ReplayCamera settings
+REPLAY_PATH = os.environ.get('REPLAY_PATH', '/app/replay')
+REPLAY_SPEED = float(os.environ.get('REPLAY_SPEED', 1.0))
+REPLAY_LOOP = os.environ.get('REPLAY_LOOP', 'False') == 'True'
+REPLAY_PREFETCH = int(os.environ.get('REPLAY_PREFETCH', 8))
 
 # GenICam settings
 DEFAULT_GENTL_PRODUCER_PATH = os.environ.get('DEFAULT_GENTL_PRODUCER_PATH', '/app/assets/producer_files')
@@ -51,6 +113,8 @@ USER_SET_SELECTOR = os.environ.get('USER_SET_SELECTOR', 'Default')
 IMAGE_WIDTH = int(os.environ.get('IMAGE_WIDTH', 800))
 IMAGE_HEIGHT = int(os.environ.get('IMAGE_HEIGHT', 800))
 PIXEL_FORMAT = os.environ.get('PIXEL_FORMAT', 'Mono8')
+PIXEL_BIT_DEPTH = int(os.environ.get('PIXEL_BIT_DEPTH', 8))
+PIXEL_BIT_SHIFT = os.environ.get('PIXEL_BIT_SHIFT', 'None')
 IMAGE_CHANNELS = os.environ.get('IMAGE_CHANNELS', 'None')
 EXPOSURE_TIME = os.environ.get('EXPOSURE_TIME', 'None')
 
@@ -58,11 +122,21 @@ EXPOSURE_AUTO = os.environ.get('EXPOSURE_AUTO', 'Off')
 GAIN_AUTO = os.environ.get('GAIN_AUTO', 'Off')
 BALANCE_WHITE_AUTO = os.environ.get('BALANCE_WHITE_AUTO', 'Off')
 LOGGING_LEVEL = os.environ.get('LOGGING_LEVEL', 'INFO')
+ACQUISITION_MODE = os.environ.get('ACQUISITION_MODE', 'Flush')
+CAMERA_PROFILE_PATH = os.environ.get('CAMERA_PROFILE_PATH', None)
 
-if IMAGE_CHANNELS != 'None':
-    IMAGE_CHANNELS = int(IMAGE_CHANNELS)
-if EXPOSURE_TIME != 'None':
-    EXPOSURE_TIME = float(EXPOSURE_TIME)
+IMAGE_CHANNELS = int(IMAGE_CHANNELS) if IMAGE_CHANNELS != 'None' else None
+EXPOSURE_TIME = float(EXPOSURE_TIME) if EXPOSURE_TIME != 'None' else None
+IMAGE_QUALITY = int(IMAGE_QUALITY) if IMAGE_QUALITY != 'None' else None
+JPEG_OPTIMIZE = (JPEG_OPTIMIZE == 'True') if JPEG_OPTIMIZE != 'None' else None
+PNG_COMPRESSION = int(PNG_COMPRESSION) if PNG_COMPRESSION != 'None' else None
+IMAGE_ARCHIVE_MAX_BYTES = int(float(IMAGE_ARCHIVE_MAX_MB) * 1024 * 1024) if IMAGE_ARCHIVE_MAX_MB != 'None' else None
+METRICS_PORT = int(METRICS_PORT) if METRICS_PORT != 'None' else None
+PIXEL_BIT_SHIFT = int(PIXEL_BIT_SHIFT) if PIXEL_BIT_SHIFT != 'None' else None
+DUMMY_IMAGE_WIDTH = int(DUMMY_IMAGE_WIDTH) if DUMMY_IMAGE_WIDTH != 'None' else None
+DUMMY_IMAGE_HEIGHT = int(DUMMY_IMAGE_HEIGHT) if DUMMY_IMAGE_HEIGHT != 'None' else None
+DUMMY_TARGET_FPS = float(DUMMY_TARGET_FPS) if DUMMY_TARGET_FPS != 'None' else None
+IMAGE_ARCHIVE_MAX_AGE = float(IMAGE_ARCHIVE_MAX_AGE_HOURS) * 3600 if IMAGE_ARCHIVE_MAX_AGE_HOURS != 'None' else None
 
 ### End of loading settings ###
 
@@ -84,41 +158,130 @@ if __name__ == "__main__":
     logging.debug("Set image width: " + str(IMAGE_WIDTH))
     logging.debug("Set image height: " + str(IMAGE_HEIGHT))
 
-    #detect available cti files as camera producers
-    cti_file_list = []
-    for name in glob.glob(str(DEFAULT_GENTL_PRODUCER_PATH)+'/**/*.cti', recursive=True):
+    startup_timer.phase("settings")
+
+    codec = create_codec(IMAGE_CODEC, preset=CODEC_PRESET, quality=IMAGE_QUALITY, optimize=JPEG_OPTIMIZE, compression=PNG_COMPRESSION)
+    logging.debug("Image codec: " + type(codec).__name__)
+    startup_timer.phase("codec")
+
+    harvester = None
+    if CAMERA_INTERFACE == "GenICam":
+        # Only needed for GenICam, loading harvesters and genicam
+        #   is slow
+        from genicam_camera import GenICam, create_harvester
+        startup_timer.phase("genicam imports")
+
+        #detect available cti files as camera producers
+        cti_file_list = []
+        for name in glob.glob(str(DEFAULT_GENTL_PRODUCER_PATH)+'/**/*.cti', recursive=True):
+
+            cti_file_list.append(str(name))
+
+        #if no cti files are found, log error and exit program
+        if len(cti_file_list)==0:
+            logging.error("No producer file discovered")
+            exit(1)
+
+        # All cameras share the loaded producers and the discovered
+        #   devices
+        harvester = create_harvester(cti_file_list)
+        startup_timer.phase("producer discovery")
+
+    cams = []
+    for mac_address in MAC_ADDRESSES:
+        # Images are written in the background, old images are
+        #   deleted once the archive exceeds its limits. Several
+        #   cameras get one archive each.
+        archive = None
+        image_path = IMAGE_PATH
+        if IMAGE_PATH:
+            from archive import FileStorage, ImageArchiveWriter
+            if len(MAC_ADDRESSES) > 1:
+                image_path = os.path.join(IMAGE_PATH, mac_address)
+            if IMAGE_ARCHIVE_BACKEND == "Segments":
+                from segment_store import SegmentStorage
+                storage = SegmentStorage(image_path, segment_bytes=int(IMAGE_ARCHIVE_SEGMENT_MB * 1024 * 1024))
+            elif IMAGE_ARCHIVE_BACKEND == "Files":
+                storage = FileStorage(image_path, extension=codec.extension)
+            else:
+                sys.exit("Environment Error: IMAGE_ARCHIVE_BACKEND not supported ||| Make sure to set a value that is allowed according to the specified possible values for this environment variable and make sure the spelling is correct.")
+            archive = ImageArchiveWriter(image_path, extension=codec.extension, queue_depth=IMAGE_ARCHIVE_QUEUE_DEPTH, max_bytes=IMAGE_ARCHIVE_MAX_BYTES, max_age=IMAGE_ARCHIVE_MAX_AGE, fsync_batch=IMAGE_ARCHIVE_FSYNC_BATCH, storage=storage)
+
+        # Images that can not be published with QoS 1 are spooled
+        #   on disk, several cameras get one spool each
+        spool = None
+        if MQTT_QOS > 0 and MQTT_SPOOL_PATH:
+            from spool import PublishSpool
+            spool_path = os.path.join(MQTT_SPOOL_PATH, mac_address) if len(MAC_ADDRESSES) > 1 else MQTT_SPOOL_PATH
+            spool = PublishSpool(spool_path, max_bytes=int(MQTT_SPOOL_MAX_MB * 1024 * 1024))
+
+        # Check selected camera interface
+        if CAMERA_INTERFACE == "DummyCamera":
+            cam = DummyCamera(MQTT_HOST, MQTT_PORT, MQTT_TOPIC_IMAGE+mac_address, 0, image_storage_path=image_path, payload_format=PAYLOAD_FORMAT, codec=codec, archive=archive, mqtt_qos=MQTT_QOS, max_inflight=MQTT_MAX_INFLIGHT, spool=spool, source_path=DUMMY_SOURCE_PATH, image_width=DUMMY_IMAGE_WIDTH, image_height=DUMMY_IMAGE_HEIGHT, pixel_format=DUMMY_PIXEL_FORMAT, variation=DUMMY_VARIATION, target_fps=DUMMY_TARGET_FPS, latency_ms=DUMMY_LATENCY_MS, timeout_rate=DUMMY_TIMEOUT_RATE, timeout_ms=DUMMY_TIMEOUT_MS)
+        elif CAMERA_INTERFACE == "ReplayCamera":
+            from replay_camera import ReplayCamera
+            # Several cameras replay one subdirectory each, like
+            #   the archive is written
+            replay_path = os.path.join(REPLAY_PATH, mac_address) if len(MAC_ADDRESSES) > 1 else REPLAY_PATH
+            cam = ReplayCamera(MQTT_HOST, MQTT_PORT, MQTT_TOPIC_IMAGE+mac_address, 0, replay_path, speed=REPLAY_SPEED, loop=REPLAY_LOOP, prefetch=REPLAY_PREFETCH, image_storage_path=image_path, payload_format=PAYLOAD_FORMAT, codec=codec, archive=archive, mqtt_qos=MQTT_QOS, max_inflight=MQTT_MAX_INFLIGHT, spool=spool)
+        elif CAMERA_INTERFACE == "GenICam":
+            # Cached node map features and applied settings
+            profile_path = os.path.join(CAMERA_PROFILE_PATH, (mac_address or "camera") + ".json") if CAMERA_PROFILE_PATH else None
+            cam = GenICam(MQTT_HOST,MQTT_PORT,MQTT_TOPIC_IMAGE+mac_address, mac_address, cti_file_list, image_width=IMAGE_WIDTH, image_height=IMAGE_HEIGHT, pixel_format=PIXEL_FORMAT, image_channels=IMAGE_CHANNELS, bit_depth=PIXEL_BIT_DEPTH, bit_shift=PIXEL_BIT_SHIFT, image_storage_path=image_path, exposure_time=EXPOSURE_TIME, exposure_auto=EXPOSURE_AUTO, payload_format=PAYLOAD_FORMAT, codec=codec, archive=archive, acquisition_mode=ACQUISITION_MODE, harvester=harvester, profile_path=profile_path, mqtt_qos=MQTT_QOS, max_inflight=MQTT_MAX_INFLIGHT, spool=spool)
+        else: 
+            # Stop system, not possible to run with this settings
+            sys.exit("Environment Error: CAMERA_INTERFACE not supported ||| Make sure to set a value that is allowed according to the specified possible values for this environment variable and make sure the spelling is correct.")
 
-        cti_file_list.append(str(name))
+        # Run acquisition, encoding and publishing in separate
+        #   stages, the triggers then only enqueue capture requests
+        if PIPELINE_ENCODE_WORKERS > 0:
+            from pipeline import FramePipeline
+            cam = FramePipeline(cam, encode_workers=PIPELINE_ENCODE_WORKERS, queue_depth=PIPELINE_QUEUE_DEPTH, queue_policy=PIPELINE_QUEUE_POLICY)
+        cams.append(cam)
+    startup_timer.phase("cameras")
 
-    #if no cti files are found, log error and exit program
-    if len(cti_file_list)==0:
-        logging.error("No producer file discovered")
-        exit(1)
+    # Profiling sessions over the next frames, started at startup
+    #   or with SIGUSR1
+    profiler = None
+    if PROFILE_MODE in ("Signal", "Startup"):
+        # No default inside IMAGE_PATH, the retention of the archive
+        #   must not count or delete the profiles
+        if not PROFILE_PATH:
+            sys.exit("Environment Error: PROFILE_MODE requires PROFILE_PATH ||| Set a directory outside of IMAGE_PATH in which the profiles are written.")
+        from profiling import Profiler
+        profiler = Profiler(cams, PROFILE_PATH, frames=PROFILE_FRAMES, memory=PROFILE_MEMORY)
+    elif PROFILE_MODE != "Off":
+        sys.exit("Environment Error: PROFILE_MODE not supported ||| Make sure to set a value that is allowed according to the specified possible values for this environment variable and make sure the spelling is correct.")
 
-    # Check selected camera interface
-    if CAMERA_INTERFACE == "DummyCamera":
-        cam = DummyCamera(MQTT_HOST, MQTT_PORT, MQTT_TOPIC_IMAGE, 0, image_storage_path=IMAGE_PATH)
-    elif CAMERA_INTERFACE == "GenICam":
-        cam = GenICam(MQTT_HOST,MQTT_PORT,MQTT_TOPIC_IMAGE, MAC_ADDRESS, cti_file_list, image_width=IMAGE_WIDTH, image_height=IMAGE_HEIGHT, pixel_format=PIXEL_FORMAT, image_storage_path=IMAGE_PATH, exposure_time=EXPOSURE_TIME, exposure_auto=EXPOSURE_AUTO)
-    else: 
-        # Stop system, not possible to run with this settings
-        sys.exit("Environment Error: CAMERA_INTERFACE not supported ||| Make sure to set a value that is allowed according to the specified possible values for this environment variable and make sure the spelling is correct.")
+    # The event loop of the runtime owns the trigger intake and
+    #   drains all in-flight frames on SIGTERM
+    runtime = AsyncRuntime(cams, metrics_port=METRICS_PORT, profiler=profiler)
+    if PROFILE_MODE == "Startup":
+        profiler.start()
 
     # Check trigger type and use appropriate instance of the
     #   trigger classes
     if TRIGGER == "Continuous":
-        # Never jumps out of the processes of the instance
-        ContinuousTrigger(cam,CAMERA_INTERFACE,CYCLE_TIME)
+        # All cameras capture in parallel in every cycle
+        if len(cams) == 1:
+            cam = cams[0]
+        else:
+            from camera_group import CameraGroup
+            cam = CameraGroup(cams)
+        trigger = ContinuousTrigger(cam,CAMERA_INTERFACE,CYCLE_TIME,start=False)
+        startup_timer.phase("triggers")
+        logging.info(startup_timer.report())
+        # Runs until SIGTERM
+        runtime.run(continuous=trigger)
     elif TRIGGER == "MQTT":
-        # Starts an asynchroneous process for working with 
-        #   the received mqtt data
-        trigger = MqttTrigger(cam,CAMERA_INTERFACE,ACQUISITION_DELAY,MQTT_HOST,MQTT_PORT,MQTT_TOPIC_TRIGGER)
-
-        # Run forever to stay connected 
-        while True:
-            # Avoid overloading the CPU
-            time.sleep(10)
-            logging.debug("Still running.")
+        # Every camera listens to its own trigger topic, the
+        #   network I/O runs on the event loop of the runtime
+        for mac_address, cam in zip(MAC_ADDRESSES, cams):
+            runtime.add_trigger(MqttTrigger(cam,CAMERA_INTERFACE,ACQUISITION_DELAY,MQTT_HOST,MQTT_PORT,MQTT_TOPIC_TRIGGER+mac_address,queue_depth=TRIGGER_QUEUE_DEPTH,queue_policy=TRIGGER_QUEUE_POLICY,coalesce_ms=TRIGGER_COALESCE_MS,loop=runtime.loop))
+        startup_timer.phase("triggers")
+        logging.info(startup_timer.report())
+        # Runs until SIGTERM
+        runtime.run()
     else:
         # Stop system, not possible to run with this setting
         sys.exit("Environment Error: TRIGGER not supported ||| Make sure to set a value that is allowed according to the specified possible values for this environment variable and make sure the spelling is correct.")
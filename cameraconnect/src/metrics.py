@@ -0,0 +1,315 @@
+"""
+Prometheus metrics and health checks of cameraconnect.
+
+The MetricsServer serves three endpoints over HTTP:
+
+    /metrics    all metrics in the Prometheus text format
+    /healthz    liveness, 200 if the process is working, else 503
+    /readyz     readiness, 200 if cameras and MQTT broker are
+                connected, else 503
+
+The components keep plain counters in their stats() dictionaries.
+The MetricsRegistry only reads them at scrape time, so the hot path
+of the frames is not changed by the metrics. The only metrics that
+are updated per frame are the latency histograms (see latency.py),
+which cost one bisect per latency.
+"""
+
+# Import python in-built libraries
+import bisect
+import logging
+import os
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+# Import self-written modules
+from buffer_pool import peak_rss_mb
+
+METRIC_COUNTER = "counter"
+METRIC_GAUGE = "gauge"
+METRIC_HISTOGRAM = "histogram"
+
+# Upper bounds of the latency histograms in ms
+LATENCY_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def rss_bytes() -> int:
+    """
+    Current resident set size of the process.
+
+    Args:
+        None
+
+    Returns:
+        RSS in bytes, the peak RSS if /proc is not available
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return int(peak_rss_mb() * 1024 * 1024)
+
+
+class Histogram:
+    """
+    Cumulative histogram with fixed buckets. Thread safe.
+
+    Args of constructor:
+        (opt.) buckets[tuple]:  Sorted upper bounds of the buckets
+                                Default value: LATENCY_BUCKETS_MS
+
+    Returns of constructor:
+        An empty histogram
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS) -> None:
+        self.buckets = tuple(buckets)
+        # One more bucket for the values above the last bound
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value) -> None:
+        """
+        Adds a value.
+
+        Args:
+            value[float]:           Observed value
+
+        Returns:
+            None
+        """
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def snapshot(self) -> tuple:
+        """
+        Consistent copy of the histogram.
+
+        Args:
+            None
+
+        Returns:
+            (cumulative counts per bucket including +Inf, sum)
+        """
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        cumulative = []
+        running = 0
+        for count in counts:
+            running += count
+            cumulative.append(running)
+        return cumulative, total
+
+
+class MetricsRegistry:
+    """
+    Collects the metrics of all components at scrape time.
+
+    A collector is a callable without arguments that returns an
+    iterable of metrics (name, type, help, labels, value), where
+    type is "counter", "gauge" or "histogram", labels is a dict and
+    value is a number or, for histograms, a Histogram.
+
+    Args of constructor:
+        (opt.) prefix[string]:  Prefix of all metric names
+                                Default value: "cameraconnect_"
+
+    Returns of constructor:
+        A registry without collectors
+    """
+
+    def __init__(self, prefix="cameraconnect_") -> None:
+        self.prefix = prefix
+        self._collectors = []
+
+    def add_collector(self, collector) -> None:
+        """
+        Adds a collector, see class description.
+
+        Args:
+            collector[callable]:    Returns the metrics
+
+        Returns:
+            None
+        """
+        self._collectors.append(collector)
+
+    def add_stats(self, name, stats, labels=None, counters=()) -> None:
+        """
+        Exports all numeric values of a stats dictionary as metrics
+        named <prefix><name>_<key>.
+
+        Args:
+            name[string]:           Name of the component, e.g.
+                                    "camera"
+            stats[callable]:        Returns the stats dictionary,
+                                    e.g. stats() of a component
+            (opt.) labels[dict]:    Labels of all metrics
+                                    Default value: None
+            (opt.) counters[tuple]: Keys that only increase, they
+                                    are exported as counters with the
+                                    suffix _total, all other keys as
+                                    gauges
+                                    Default value: ()
+
+        Returns:
+            None
+        """
+        labels = labels or {}
+        counters = frozenset(counters)
+
+        def collect():
+            for key, value in stats().items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                help_text = "{} of the {}".format(key.replace("_", " "), name.replace("_", " "))
+                if key in counters:
+                    yield name + "_" + key + "_total", METRIC_COUNTER, help_text, labels, value
+                else:
+                    yield name + "_" + key, METRIC_GAUGE, help_text, labels, value
+
+        self.add_collector(collect)
+
+    def render(self) -> str:
+        """
+        All metrics in the Prometheus text exposition format. A
+        failing collector is logged and skipped.
+
+        Args:
+            None
+
+        Returns:
+            Metrics as text
+        """
+        # Metric name -> (type, help, list of lines)
+        families = {}
+        for collector in self._collectors:
+            try:
+                metrics = list(collector())
+            except Exception:
+                logging.exception("Collecting metrics failed.")
+                continue
+            for name, kind, help_text, labels, value in metrics:
+                name = self.prefix + name
+                family = families.setdefault(name, (kind, help_text, []))
+                if kind == METRIC_HISTOGRAM:
+                    family[2].extend(self._histogram_lines(name, labels, value))
+                else:
+                    family[2].append("{}{} {}".format(name, self._labels(labels), float(value)))
+
+        lines = []
+        for name, (kind, help_text, samples) in families.items():
+            lines.append("# HELP {} {}".format(name, help_text))
+            lines.append("# TYPE {} {}".format(name, kind))
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+    @classmethod
+    def _histogram_lines(cls, name, labels, histogram) -> list:
+        cumulative, total = histogram.snapshot()
+        bounds = [str(float(bound)) for bound in histogram.buckets] + ["+Inf"]
+        lines = ["{}_bucket{} {}".format(name, cls._labels(dict(labels, le=bound)), count)
+                 for bound, count in zip(bounds, cumulative)]
+        lines.append("{}_sum{} {}".format(name, cls._labels(labels), total))
+        lines.append("{}_count{} {}".format(name, cls._labels(labels), cumulative[-1]))
+        return lines
+
+    @staticmethod
+    def _labels(labels) -> str:
+        if not labels:
+            return ""
+        escaped = ('{}="{}"'.format(key, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+                   for key, value in sorted(labels.items()))
+        return "{" + ",".join(escaped) + "}"
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    # http.server.ThreadingHTTPServer is only available since
+    #   Python 3.7
+    daemon_threads = True
+
+
+class MetricsServer:
+    """
+    HTTP server of the metrics and health checks in a background
+    thread, see module description.
+
+    Args of constructor:
+        registry[MetricsRegistry]:
+                                Metrics served under /metrics
+        is_alive[callable]:     Returns True if the process works
+        is_ready[callable]:     Returns True if cameras and MQTT
+                                broker are connected
+        (opt.) port[int]:       TCP port
+                                Default value: 9100
+        (opt.) host[string]:    Address to listen on
+                                Default value: "0.0.0.0"
+
+    Returns of constructor:
+        A running server
+    """
+
+    def __init__(self, registry, is_alive, is_ready, port=9100, host="0.0.0.0") -> None:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                server._handle(self)
+
+            def log_message(self, format, *args):
+                # Scrapes and probes would flood the log
+                pass
+
+        self.registry = registry
+        self.is_alive = is_alive
+        self.is_ready = is_ready
+        self._httpd = _ThreadingHTTPServer((host, port), Handler)
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="metrics", daemon=True)
+        self._thread.start()
+        logging.info("Metrics served on port {}.".format(port))
+
+    def _handle(self, request) -> None:
+        path = request.path.split("?", 1)[0]
+        try:
+            if path == "/metrics":
+                status, body = 200, self.registry.render()
+                content_type = "text/plain; version=0.0.4; charset=utf-8"
+            elif path in ("/healthz", "/readyz"):
+                check = self.is_alive if path == "/healthz" else self.is_ready
+                ok = check()
+                status, body = (200, "ok\n") if ok else (503, "unavailable\n")
+                content_type = "text/plain; charset=utf-8"
+            else:
+                status, body, content_type = 404, "not found\n", "text/plain; charset=utf-8"
+        except Exception:
+            logging.exception("Serving {} failed.".format(path))
+            status, body, content_type = 500, "error\n", "text/plain; charset=utf-8"
+
+        payload = body.encode("utf-8")
+        request.send_response(status)
+        request.send_header("Content-Type", content_type)
+        request.send_header("Content-Length", str(len(payload)))
+        request.end_headers()
+        request.wfile.write(payload)
+
+    def stop(self) -> None:
+        """
+        Stops the server.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._thread.join()
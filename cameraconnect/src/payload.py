@@ -0,0 +1,206 @@
+"""
+Serialization of image messages that are published to the MQTT
+broker.
+
+Two wire formats are provided:
+- JSON (legacy): the encoded image is base64 encoded and wrapped
+            together with its meta data in one json message
+- Binary: a small fixed header carrying the meta data, directly
+            followed by the encoded image bytes
+
+Binary format (all integers in network byte order):
+
+    offset  size  field
+    0       4     magic, always b"UMHI"
+    4       1     format version
+    5       2     header length in bytes (offset of the image bytes)
+    7       8     timestamp_ms
+    15      4     image height
+    19      4     image width
+    23      1     image channels
+    24      8     encoding, ascii, zero padded (e.g. b"jpg")
+    32      2     length of image_id in bytes
+    34      n     image_id, utf-8
+
+Since version 2 the header is extended by the flags and the trace
+of the frame (see latency.py):
+
+    34+n    1     flags, bit 0: late
+    35+n    2     length of correlation_id in bytes
+    37+n    m     correlation_id, utf-8
+    37+n+m  32    trigger, fetch, convert and encode stage in us
+                  since epoch, 0 if unknown
+    69+n+m  8     exposure hardware timestamp in ns of the camera
+                  clock, 0 if unknown
+
+Consumers must use the header length to find the start of the
+image bytes, so that fields can be appended to the header in later
+versions without breaking them.
+"""
+
+# Import python in-built libraries
+import base64
+import json
+import struct
+
+# Import self-written modules
+from latency import MESSAGE_STAGES
+
+PAYLOAD_FORMAT_JSON = "JSON"
+PAYLOAD_FORMAT_BINARY = "Binary"
+PAYLOAD_FORMATS = (PAYLOAD_FORMAT_JSON, PAYLOAD_FORMAT_BINARY)
+
+BINARY_MAGIC = b"UMHI"
+BINARY_VERSION = 2
+BINARY_HEADER = struct.Struct("!4sBHQIIB8sH")
+BINARY_TRACE_HEADER = struct.Struct("!BH")
+BINARY_TRACE_STAMPS = struct.Struct("!{}QQ".format(len(MESSAGE_STAGES)))
+BINARY_FLAG_LATE = 0x01
+
+
+def encode_json_payload(timestamp_ms, image_id, encoded_image, shape, encoding="jpg", fields=None) -> str:
+    """
+    Builds the legacy json message. The key 'image_encoding' is only
+    added if the image is not encoded as jpg, so the default message
+    stays unchanged.
+
+    Args:
+        timestamp_ms[int]:      Acquisition time in ms since epoch
+        image_id[string]:       Unique id of the image
+        encoded_image[buffer]:  Encoded image (e.g. output of
+                                cv2.imencode)
+        shape[tuple]:           (height, width, channels) of the
+                                original image
+        (opt.) encoding[string]:
+                                Name of the image encoding
+                                Default value: "jpg"
+        (opt.) fields[dict]:    Additional top level fields of the
+                                message, e.g. {'late': True}
+                                Default value: None
+
+    Returns:
+        Json formatted string
+    """
+    prepared_message = {
+        'timestamp_ms': timestamp_ms,
+        'image':
+            {'image_id': image_id,
+             'image_bytes': base64.b64encode(encoded_image).decode(),
+             'image_height': shape[0],
+             'image_width': shape[1],
+             'image_channels': shape[2]},
+    }
+    if encoding != "jpg":
+        prepared_message['image']['image_encoding'] = encoding
+    if fields:
+        prepared_message.update(fields)
+    return json.dumps(prepared_message)
+
+
+def encode_binary_payload(timestamp_ms, image_id, encoded_image, shape, encoding="jpg", late=False,
+                          correlation_id="", stages=None, exposure_ns=None) -> bytearray:
+    """
+    Builds a binary message: fixed header, image_id, trace and the
+    encoded image bytes. The payload buffer is allocated once and
+    the image is copied straight from the encoder's buffer into it.
+
+    Args:
+        timestamp_ms[int]:      Acquisition time in ms since epoch
+        image_id[string]:       Unique id of the image
+        encoded_image[buffer]:  Encoded image, any object supporting
+                                the buffer protocol
+        shape[tuple]:           (height, width, channels) of the
+                                original image
+        encoding[string]:       Name of the image encoding,
+                                at most 8 ascii characters
+        (opt.) late[bool]:      Trigger could not be served in time
+                                Default value: False
+        (opt.) correlation_id[string]:
+                                Id of the trigger
+                                Default value: ""
+        (opt.) stages[dict]:    Stage name -> time in ms since epoch
+                                Default value: None
+        (opt.) exposure_ns[int]:
+                                Hardware timestamp of the exposure
+                                Default value: None
+
+    Returns:
+        Payload as bytearray
+    """
+    image_id_bytes = image_id.encode("utf-8")
+    correlation_id_bytes = correlation_id.encode("utf-8")
+    image_view = memoryview(encoded_image).cast("B")
+    trace_start = BINARY_HEADER.size + len(image_id_bytes)
+    stamps_start = trace_start + BINARY_TRACE_HEADER.size + len(correlation_id_bytes)
+    header_length = stamps_start + BINARY_TRACE_STAMPS.size
+
+    payload = bytearray(header_length + image_view.nbytes)
+    BINARY_HEADER.pack_into(payload, 0,
+                            BINARY_MAGIC,
+                            BINARY_VERSION,
+                            header_length,
+                            timestamp_ms,
+                            shape[0],
+                            shape[1],
+                            shape[2],
+                            encoding.encode("ascii"),
+                            len(image_id_bytes))
+    payload[BINARY_HEADER.size:trace_start] = image_id_bytes
+
+    stages = stages or {}
+    BINARY_TRACE_HEADER.pack_into(payload, trace_start,
+                                  BINARY_FLAG_LATE if late else 0,
+                                  len(correlation_id_bytes))
+    payload[trace_start + BINARY_TRACE_HEADER.size:stamps_start] = correlation_id_bytes
+    BINARY_TRACE_STAMPS.pack_into(payload, stamps_start,
+                                  *[int(round(stages.get(stage, 0) * 1000)) for stage in MESSAGE_STAGES],
+                                  exposure_ns or 0)
+    payload[header_length:] = image_view
+    return payload
+
+
+def decode_binary_payload(payload) -> dict:
+    """
+    Parses a binary message. Meant for consumers and debugging.
+
+    Args:
+        payload[bytes]:         Received message payload
+
+    Returns:
+        Dictionary with the meta data and a memoryview of the
+        encoded image under 'image_bytes'. Since version 2 it also
+        contains 'late', 'correlation_id', 'stages' (stage name ->
+        time in ms since epoch) and 'exposure_ns', unknown stamps
+        are None.
+    """
+    view = memoryview(payload)
+    (magic, version, header_length, timestamp_ms, height, width, channels,
+     encoding, image_id_length) = BINARY_HEADER.unpack_from(view, 0)
+    if magic != BINARY_MAGIC:
+        raise ValueError("Not a binary image payload")
+
+    image_id_start = BINARY_HEADER.size
+    image_id = bytes(view[image_id_start:image_id_start + image_id_length]).decode("utf-8")
+    decoded = {
+        'version': version,
+        'timestamp_ms': timestamp_ms,
+        'image_id': image_id,
+        'image_height': height,
+        'image_width': width,
+        'image_channels': channels,
+        'encoding': encoding.rstrip(b"\0").decode("ascii"),
+        'image_bytes': view[header_length:],
+    }
+    if version < 2:
+        return decoded
+
+    trace_start = image_id_start + image_id_length
+    flags, correlation_id_length = BINARY_TRACE_HEADER.unpack_from(view, trace_start)
+    correlation_id_start = trace_start + BINARY_TRACE_HEADER.size
+    stamps_start = correlation_id_start + correlation_id_length
+    stamps = BINARY_TRACE_STAMPS.unpack_from(view, stamps_start)
+    decoded['late'] = bool(flags & BINARY_FLAG_LATE)
+    decoded['correlation_id'] = bytes(view[correlation_id_start:stamps_start]).decode("utf-8")
+    decoded['stages'] = {stage: stamp / 1000 if stamp else None for stage, stamp in zip(MESSAGE_STAGES, stamps)}
+    decoded['exposure_ns'] = stamps[-1] or None
+    return decoded
@@ -0,0 +1,329 @@
+"""
+Staged frame pipeline for the cameras.
+
+Without a pipeline get_image() of a camera acquires, encodes and
+publishes one image after another in the thread of the trigger, so
+the achievable frame rate is limited by the sum of all stage
+latencies. The FramePipeline runs the stages concurrently:
+
+    trigger --> [capture queue] --> acquisition thread
+            --> encode worker pool --> [publish queue]
+            --> publish thread --> MQTT broker / image storage
+
+The acquisition keeps running while earlier frames are still being
+encoded. OpenCV releases the GIL while encoding, so the encode
+workers scale with threads. Frames are published in the order in
+which they were acquired.
+
+Provided classes:
+- StageQueue: bounded queue with a "Block" or "DropOldest" policy
+- FramePipeline: runs the stages of a camera in separate threads
+"""
+
+# Import python in-built libraries
+import collections
+import logging
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Import self-written modules
+from frame import CaptureRequest
+
+QUEUE_POLICY_BLOCK = "Block"
+QUEUE_POLICY_DROP_OLDEST = "DropOldest"
+QUEUE_POLICIES = (QUEUE_POLICY_BLOCK, QUEUE_POLICY_DROP_OLDEST)
+
+
+class StageQueue:
+    """
+    Bounded FIFO queue between two pipeline stages.
+
+    Args of constructor:
+        maxsize[int]:           Maximum number of items in the queue
+        policy[string]:         What happens if an item is put into
+                                a full queue.
+                                Possible values:
+                                    - "Block": wait until there is
+                                        space again
+                                    - "DropOldest": remove the
+                                        oldest item to make space
+        (opt.) on_drop[callable]:
+                                Called with every dropped item
+                                Default value: None
+
+    Returns of constructor:
+        An empty queue
+    """
+
+    def __init__(self, maxsize, policy, on_drop=None) -> None:
+        if policy not in QUEUE_POLICIES:
+            sys.exit("Unsupported queue policy: %s" % policy)
+
+        self.maxsize = max(1, maxsize)
+        self.policy = policy
+        self.on_drop = on_drop
+        self.dropped = 0
+
+        self._items = collections.deque()
+        self._closed = False
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+
+    def put(self, item) -> bool:
+        """
+        Appends an item according to the queue policy.
+
+        Args:
+            item:                   Item to append
+
+        Returns:
+            False if the queue is closed, otherwise True
+        """
+        dropped = None
+        with self._lock:
+            if self.policy == QUEUE_POLICY_BLOCK:
+                while len(self._items) >= self.maxsize and not self._closed:
+                    self._not_full.wait()
+            elif len(self._items) >= self.maxsize:
+                dropped = self._items.popleft()
+                self.dropped += 1
+            if self._closed:
+                return False
+            self._items.append(item)
+            self._not_empty.notify()
+
+        if dropped is not None:
+            logging.debug("Pipeline queue full, dropped oldest entry.")
+            if self.on_drop is not None:
+                self.on_drop(dropped)
+        return True
+
+    def get(self):
+        """
+        Removes and returns the oldest item. Blocks until an item
+        is available.
+
+        Args:
+            None
+
+        Returns:
+            Oldest item or None if the queue is closed and empty
+        """
+        with self._lock:
+            while not self._items:
+                if self._closed:
+                    return None
+                self._not_empty.wait()
+            item = self._items.popleft()
+            self._not_full.notify()
+            return item
+
+    def close(self) -> None:
+        """
+        Closes the queue. Items that are already queued can still
+        be taken out, new items are rejected.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class FramePipeline:
+    """
+    Runs acquisition, encoding and publishing of a camera in
+    separate stages that are connected by bounded queues.
+
+    The pipeline provides get_image() like a camera, so it can be
+    handed to the triggers in place of the camera. get_image() only
+    enqueues a capture request and returns immediately.
+
+    Args of constructor:
+        cam[CamGeneral]:        A configured camera ready to get an
+                                image
+        (opt.) encode_workers[int]:
+                                Number of threads that encode frames
+                                in parallel
+                                Default value: 2
+        (opt.) queue_depth[int]:
+                                Maximum number of capture requests
+                                and of frames waiting to be
+                                published
+                                Default value: 4
+        (opt.) queue_policy[string]:
+                                What happens if a queue is full.
+                                Possible values: "Block",
+                                    "DropOldest"
+                                Default value: "Block"
+
+    Returns of constructor:
+        A running pipeline
+    """
+
+    def __init__(self, cam, encode_workers=2, queue_depth=4, queue_policy=QUEUE_POLICY_BLOCK) -> None:
+        self.cam = cam
+        self.encode_workers = max(1, encode_workers)
+
+        self.capture_queue = StageQueue(queue_depth, queue_policy)
+        self.publish_queue = StageQueue(queue_depth, queue_policy, on_drop=self._cancel_encoding)
+
+        self._encoder = ThreadPoolExecutor(max_workers=self.encode_workers)
+        self._acquisition_thread = threading.Thread(target=self._run_acquisition, name="acquisition", daemon=True)
+        self._publish_thread = threading.Thread(target=self._run_publishing, name="publishing", daemon=True)
+        self._acquisition_thread.start()
+        self._publish_thread.start()
+        logging.debug("Frame pipeline started with {} encode workers.".format(self.encode_workers))
+
+    def get_image(self, request=None) -> None:
+        """
+        Enqueues a capture request. The image is acquired, encoded
+        and published asynchronously.
+
+        Args:
+            (opt.) request[CaptureRequest]:
+                                    Request of the trigger, a new one
+                                    is created if None
+
+        Returns:
+            None
+        """
+        if request is None:
+            request = CaptureRequest()
+        self.capture_queue.put(request)
+
+    def stats(self) -> dict:
+        """
+        Current queue depths, number of dropped entries and the
+        statistics of the camera.
+
+        Args:
+            None
+
+        Returns:
+            Dictionary with the statistics of the pipeline
+        """
+        stats = self.cam.stats()
+        stats.update({
+            'capture_queue_depth': len(self.capture_queue),
+            'publish_queue_depth': len(self.publish_queue),
+            'dropped_capture_requests': self.capture_queue.dropped,
+            'dropped_frames': self.publish_queue.dropped,
+        })
+        return stats
+
+    def is_ready(self) -> bool:
+        """
+        Readiness of the camera of the pipeline.
+
+        Args:
+            None
+
+        Returns:
+            True if the camera is ready
+        """
+        return self.cam.is_ready()
+
+    @property
+    def paced_ns(self) -> int:
+        # Time the camera waited on purpose, see ContinuousTrigger
+        return getattr(self.cam, "paced_ns", 0)
+
+    def is_finished(self) -> bool:
+        """
+        Checks if the camera of the pipeline is finished, see
+        CamGeneral.is_finished().
+
+        Args:
+            None
+
+        Returns:
+            True if the camera is finished
+        """
+        return self.cam.is_finished()
+
+    def is_alive(self) -> bool:
+        """
+        Liveness of the stage threads.
+
+        Args:
+            None
+
+        Returns:
+            True if the acquisition and publish threads run
+        """
+        return self._acquisition_thread.is_alive() and self._publish_thread.is_alive()
+
+    def _run_acquisition(self) -> None:
+        # Cameras are not thread safe, so only this thread
+        #   acquires images
+        while True:
+            request = self.capture_queue.get()
+            if request is None:
+                break
+            try:
+                frame = self.cam.acquire_frame(request)
+            except Exception:
+                logging.exception("Acquisition of an image failed.")
+                continue
+            if frame is None:
+                continue
+            future = self._encoder.submit(self.cam.encode_frame, frame)
+            # The publish queue holds the encoding futures in the
+            #   order of acquisition, which keeps the order of the
+            #   published frames and bounds the number of frames
+            #   in flight
+            if not self.publish_queue.put((frame, future)):
+                self._cancel_encoding((frame, future))
+
+        self.publish_queue.close()
+
+    def _run_publishing(self) -> None:
+        while True:
+            entry = self.publish_queue.get()
+            if entry is None:
+                break
+            frame, future = entry
+            try:
+                future.result()
+                self.cam.publish_frame(frame)
+            except Exception:
+                logging.exception("Encoding or publishing of an image failed.")
+            finally:
+                # A failed encoding did not give the image back to
+                #   the buffer pool, a released frame is not
+                #   released again
+                frame.release_image()
+
+    @staticmethod
+    def _cancel_encoding(entry) -> None:
+        frame, future = entry
+        if future.cancel():
+            frame.release_image()
+
+    def stop(self) -> None:
+        """
+        Stops accepting capture requests, finishes all queued
+        requests and frames and stops the threads.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        self.capture_queue.close()
+        self._acquisition_thread.join()
+        self._publish_thread.join()
+        self._encoder.shutdown(wait=True)
+        logging.debug("Frame pipeline stopped.")
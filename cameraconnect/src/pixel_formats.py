@@ -0,0 +1,328 @@
+"""
+Conversion of the pixel formats of GenICam cameras into the arrays
+that are encoded and published: BGR8 for color and Mono8 (or 16 bit
+Mono) for monochrome images.
+
+Supported pixel formats:
+- Mono8, RGB8, BGR8 (also "...Packed" of GigE Vision 1.x)
+- BayerRG8, BayerBG8, BayerGR8, BayerGB8: demosaiced on the host, so
+  the camera sends one byte per pixel instead of three
+- Mono10, Mono12: 16 bit little endian per pixel
+- Mono10Packed, Mono12Packed (GigE Vision) and Mono10p, Mono12p
+  (PFNC): bit packed, unpacked with vectorized numpy operations
+- YUV422: UYVY ("YUV422Packed", "YUV422_8_UYVY") and YUYV
+  ("YUV422_YUYV_Packed", "YUV422_8")
+
+Formats with more than 8 bits are reduced to 8 bits by dropping the
+least significant bits. bit_shift sets how many bits are dropped,
+fewer bits brighten dark images (the values are then rounded and
+saturate at 255). With bit_depth 16 all bits are kept and scaled to
+the full 16 bit range. Color images can be published in Mono8 and
+monochrome images in BGR8 by setting the channels, which costs an
+extra OpenCV pass.
+
+The PixelConverter picks the fastest conversion per format. If the
+8 most significant bits are kept, they are read out of the (packed)
+data without unpacking the full values first. Other reductions
+unpack the values and scale them with OpenCV in a single SIMD pass.
+"""
+
+# Import python in-built libraries
+import logging
+
+# Import libraries that had been installed with pip install
+import cv2
+import numpy as np
+
+# Output channels per pixel format
+PIXEL_FORMAT_CHANNELS = {
+    "Mono8": 1,
+    "RGB8": 3,
+    "BGR8": 3,
+    "RGB8Packed": 3,
+    "BGR8Packed": 3,
+    "BayerRG8": 3,
+    "BayerBG8": 3,
+    "BayerGR8": 3,
+    "BayerGB8": 3,
+    "Mono10": 1,
+    "Mono12": 1,
+    "Mono10Packed": 1,
+    "Mono12Packed": 1,
+    "Mono10p": 1,
+    "Mono12p": 1,
+    "YUV422Packed": 3,
+    "YUV422_8_UYVY": 3,
+    "YUV422_YUYV_Packed": 3,
+    "YUV422_8": 3,
+}
+PIXEL_FORMATS = tuple(PIXEL_FORMAT_CHANNELS)
+
+# The GenICam names give the color of the first two pixels of the
+#   first row, the OpenCV names those of the second and third pixel
+#   of the second row
+BAYER_CODES = {
+    "BayerRG8": cv2.COLOR_BayerBG2BGR,
+    "BayerBG8": cv2.COLOR_BayerRG2BGR,
+    "BayerGR8": cv2.COLOR_BayerGB2BGR,
+    "BayerGB8": cv2.COLOR_BayerGR2BGR,
+}
+YUV422_CODES = {
+    "YUV422Packed": cv2.COLOR_YUV2BGR_UYVY,
+    "YUV422_8_UYVY": cv2.COLOR_YUV2BGR_UYVY,
+    "YUV422_YUYV_Packed": cv2.COLOR_YUV2BGR_YUYV,
+    "YUV422_8": cv2.COLOR_YUV2BGR_YUYV,
+}
+# Monochrome formats with more than 8 bits -> (bits per pixel,
+#   packing), packing is None (16 bit per pixel), "GigE" (2 pixels
+#   in 3 bytes, most significant bits in bytes 0 and 2) or "PFNC"
+#   (little endian bit stream)
+MONO_HIGH_BIT_FORMATS = {
+    "Mono10": (10, None),
+    "Mono12": (12, None),
+    "Mono10Packed": (10, "GigE"),
+    "Mono12Packed": (12, "GigE"),
+    "Mono10p": (10, "PFNC"),
+    "Mono12p": (12, "PFNC"),
+}
+BIT_DEPTHS = (8, 16)
+
+
+def packing_group(bits, packing) -> tuple:
+    """
+    Smallest group of pixels that fills whole bytes.
+
+    Args:
+        bits[int]:              10 or 12
+        packing[string]:        None, "GigE" or "PFNC", see
+                                MONO_HIGH_BIT_FORMATS
+
+    Returns:
+        (pixels, bytes) per group
+    """
+    if packing is None:
+        return 1, 2
+    if packing == "PFNC" and bits == 10:
+        return 4, 5
+    return 2, 3
+
+
+def _words(data, byte, group_bytes, groups) -> np.ndarray:
+    # Little endian 16 bit word at the same byte offset of every
+    #   group, as view into the data without copying it
+    return np.ndarray((groups,), dtype="<u2", buffer=data, offset=byte, strides=(group_bytes,))
+
+
+def unpack_mono(data, bits, packing, pixels) -> np.ndarray:
+    """
+    Unpacks monochrome pixels with more than 8 bits. Every pixel of
+    a packing group is processed for all groups at once, so the
+    number of numpy operations does not depend on the image size.
+
+    Args:
+        data[np.ndarray]:       Buffer as 1D uint8 array
+        bits[int]:              10 or 12
+        packing[string]:        None, "GigE" or "PFNC", see
+                                MONO_HIGH_BIT_FORMATS
+        pixels[int]:            Number of pixels, a multiple of the
+                                pixels per packing group
+
+    Returns:
+        Pixel values as 1D uint16 array
+    """
+    if packing is None:
+        return data[:pixels * 2].view("<u2")
+
+    group_pixels, group_bytes = packing_group(bits, packing)
+    groups = pixels // group_pixels
+    values = np.empty(pixels, dtype=np.uint16)
+    if packing == "PFNC":
+        # The pixels follow each other in a little endian bit stream
+        mask = (1 << bits) - 1
+        for pixel in range(group_pixels):
+            byte, shift = divmod(bits * pixel, 8)
+            np.bitwise_and(_words(data, byte, group_bytes, groups) >> shift, mask, out=values[pixel::group_pixels])
+        return values
+
+    # GigE: the most significant bits of the two pixels are in
+    #   bytes 0 and 2, the remaining bits share byte 1
+    low_bits = bits - 8
+    middle = data[1:groups * 3:3]
+    np.left_shift(data[0:groups * 3:3], low_bits, out=values[0::2], dtype=np.uint16)
+    values[0::2] |= middle & ((1 << low_bits) - 1)
+    np.left_shift(data[2:groups * 3:3], low_bits, out=values[1::2], dtype=np.uint16)
+    values[1::2] |= (middle >> 4) & ((1 << low_bits) - 1)
+    return values
+
+
+def mono_most_significant_bytes(data, bits, packing, pixels, out) -> None:
+    """
+    Writes the 8 most significant bits of monochrome pixels with
+    more than 8 bits, without unpacking the full values first.
+
+    Args:
+        data[np.ndarray]:       Buffer as 1D uint8 array
+        bits[int]:              10 or 12
+        packing[string]:        None, "GigE" or "PFNC", see
+                                MONO_HIGH_BIT_FORMATS
+        pixels[int]:            Number of pixels, a multiple of the
+                                pixels per packing group
+        out[np.ndarray]:        1D uint8 array of the pixels
+
+    Returns:
+        None
+    """
+    group_pixels, group_bytes = packing_group(bits, packing)
+    groups = pixels // group_pixels
+    for pixel in range(group_pixels):
+        if packing == "GigE":
+            # The most significant bits are whole bytes
+            byte, shift = 2 * pixel, 0
+        else:
+            byte, shift = divmod(bits * pixel + bits - 8, 8)
+        target = out[pixel::group_pixels]
+        if shift == 0:
+            np.copyto(target, data[byte:byte + groups * group_bytes:group_bytes])
+        else:
+            # Casting keeps the lower 8 bits of the shifted word
+            np.copyto(target, _words(data, byte, group_bytes, groups) >> shift, casting="unsafe")
+
+
+class PixelConverter:
+    """
+    Converts the buffers of one pixel format, see module
+    description.
+
+    Args of constructor:
+        pixel_format[string]:   GenICam pixel format of the buffers
+        (opt.) bit_depth[int]:  Bits per pixel of converted Mono10
+                                and Mono12 images, 8 or 16. All other
+                                formats are converted to 8 bits.
+                                Default value: 8
+        (opt.) bit_shift[int]:  Number of least significant bits
+                                dropped to reduce Mono10 and Mono12
+                                to 8 bits, None to keep the 8 most
+                                significant bits
+                                Default value: None
+        (opt.) channels[int]:   Channels of the converted images,
+                                1 or 3, None for the channels of the
+                                pixel format. Other channels are
+                                converted in a second pass.
+                                Default value: None
+
+    Returns of constructor:
+        A converter
+
+    Raises:
+        ValueError if the pixel format or the bit depth is not
+        supported
+    """
+
+    def __init__(self, pixel_format, bit_depth=8, bit_shift=None, channels=None) -> None:
+        if pixel_format not in PIXEL_FORMAT_CHANNELS:
+            raise ValueError("Unsupported pixel format: %s" % pixel_format)
+        if bit_depth not in BIT_DEPTHS:
+            raise ValueError("Unsupported bit depth: %s" % bit_depth)
+        if channels not in (None, 1, 3):
+            raise ValueError("Unsupported number of channels: %s" % channels)
+
+        self.pixel_format = pixel_format
+        self.channels = PIXEL_FORMAT_CHANNELS[pixel_format]
+        self.dtype = np.dtype(np.uint8)
+        self.bits, self.packing = MONO_HIGH_BIT_FORMATS.get(pixel_format, (8, None))
+        self.bit_shift = None
+
+        if self.bits > 8:
+            if bit_depth == 16:
+                self.dtype = np.dtype(np.uint16)
+                self._convert = self._scale_to_16_bits
+            elif bit_shift is None or bit_shift == self.bits - 8:
+                self._convert = self._most_significant_bytes
+            else:
+                self.bit_shift = max(0, bit_shift)
+                self._convert = self._shift_to_8_bits
+        elif pixel_format in BAYER_CODES:
+            self._convert = self._color_conversion(BAYER_CODES[pixel_format], 1)
+        elif pixel_format in YUV422_CODES:
+            self._convert = self._color_conversion(YUV422_CODES[pixel_format], 2)
+        elif pixel_format.startswith("RGB8"):
+            self._convert = self._color_conversion(cv2.COLOR_RGB2BGR, 3)
+        else:
+            # Mono8 and BGR8 are already in the right format
+            self._convert = self._copy
+        if channels is not None and channels != self.channels:
+            self._format_convert = self._convert
+            self._channels_code = cv2.COLOR_GRAY2BGR if channels == 3 else cv2.COLOR_BGR2GRAY
+            self._convert = self._change_channels
+            self._source_channels = self.channels
+            self.channels = channels
+        logging.debug("Converter for pixel format {}: {}.".format(pixel_format, self._convert.__name__))
+
+    def output_shape(self, height, width) -> tuple:
+        """
+        Shape of the converted images.
+
+        Args:
+            height[int]:            Height of the image in pixels
+            width[int]:             Width of the image in pixels
+
+        Returns:
+            (height, width, channels)
+        """
+        return height, width, self.channels
+
+    def convert(self, data, height, width, out=None) -> np.ndarray:
+        """
+        Converts the data of a buffer in a single pass.
+
+        Args:
+            data[buffer]:           Image data of the buffer, it is
+                                    only read
+            height[int]:            Height of the image in pixels
+            width[int]:             Width of the image in pixels
+            (opt.) out[np.ndarray]: Array of output_shape() and
+                                    self.dtype that receives the
+                                    image, None for a new array
+                                    Default value: None
+
+        Returns:
+            Image as np.ndarray of output_shape()
+        """
+        if out is None:
+            out = np.empty(self.output_shape(height, width), dtype=self.dtype)
+        packing = self.packing
+        if isinstance(data, np.ndarray) and data.dtype.itemsize == 2:
+            # Already unpacked into 16 bit per pixel, e.g. by the
+            #   GenTL producer
+            packing = None
+        self._convert(np.frombuffer(data, dtype=np.uint8), height, width, out, packing)
+        return out
+
+    def _copy(self, data, height, width, out, packing) -> None:
+        np.copyto(out, data[:out.size].reshape(out.shape))
+
+    def _color_conversion(self, code, source_channels):
+        def color_conversion(data, height, width, out, packing):
+            source = data[:height * width * source_channels].reshape(height, width, source_channels)
+            if source_channels == 1:
+                source = source[:, :, 0]
+            cv2.cvtColor(source, code, dst=out)
+        return color_conversion
+
+    def _change_channels(self, data, height, width, out, packing) -> None:
+        source = np.empty((height, width, self._source_channels), dtype=self.dtype)
+        self._format_convert(data, height, width, source, packing)
+        cv2.cvtColor(source, self._channels_code, dst=out.reshape(height, width) if self.channels == 1 else out)
+
+    def _most_significant_bytes(self, data, height, width, out, packing) -> None:
+        mono_most_significant_bytes(data, self.bits, packing, height * width, out.reshape(-1))
+
+    def _shift_to_8_bits(self, data, height, width, out, packing) -> None:
+        values = unpack_mono(data, self.bits, packing, height * width).reshape(height, width)
+        # Scales, rounds and saturates in one SIMD pass, which is
+        #   several times faster than the same numpy operations
+        cv2.convertScaleAbs(values, dst=out.reshape(height, width), alpha=1.0 / (1 << self.bit_shift))
+
+    def _scale_to_16_bits(self, data, height, width, out, packing) -> None:
+        values = unpack_mono(data, self.bits, packing, height * width)
+        np.left_shift(values, 16 - self.bits, out=out.reshape(-1))
@@ -0,0 +1,253 @@
+"""
+Opt-in profiling of the frames in production.
+
+A profiling session covers the next N published frames. It is
+started at startup or with SIGUSR1 (see PROFILE_MODE in main.py) and
+records:
+
+    - cProfile statistics of the acquire, encode and publish stages
+      of all cameras, merged over all threads that run the stages
+    - the time and the change of the traced memory per stage
+    - the allocations by source line between the start and the end
+      of the session (tracemalloc)
+
+At the end of the session the results are written into the profile
+directory:
+
+    <time>_profile.pstats   cProfile statistics, e.g. for snakeviz
+                            or python3 -m pstats
+    <time>_profile.txt      the functions with the highest cumulative
+                            time
+    <time>_memory.txt       the source lines that allocated most
+    <time>_summary.json     time and memory per stage
+
+Nothing is installed in the hot path while no session runs: the
+stages of the cameras are only wrapped for the time of a session.
+tracemalloc slows down every allocation, so it is only started for
+the session and can be switched off.
+"""
+
+# Import python in-built libraries
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+
+# Import libraries that had been installed with pip install
+import numpy as np
+
+# Stage methods of the cameras that are profiled
+PROFILED_STAGES = ("acquire_frame", "encode_frame", "publish_frame")
+# Depth of the tracebacks stored by tracemalloc
+TRACEMALLOC_FRAMES = 10
+# Lines in the text reports
+REPORT_LINES = 40
+
+
+class _Session:
+    """
+    State of one profiling session.
+    """
+
+    def __init__(self, frames, memory) -> None:
+        self.frames = frames
+        self.memory = memory
+        self.published = 0
+        self.closed = False
+        self.in_flight = 0
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        # Thread ident -> cProfile.Profile, a profile must only be
+        #   enabled in one thread
+        self.profiles = {}
+        # Stage -> list of (time in ms, change of traced memory in
+        #   bytes)
+        self.samples = {stage: [] for stage in PROFILED_STAGES}
+        self.snapshot = None
+
+
+class Profiler:
+    """
+    Profiles the stages of cameras for a number of frames, see
+    module description. Thread safe.
+
+    Args of constructor:
+        cams[list]:             Cameras or FramePipelines
+        directory[string]:      Directory of the results
+        (opt.) frames[int]:     Number of published frames per
+                                session
+                                Default value: 100
+        (opt.) memory[bool]:    Trace the allocations with
+                                tracemalloc
+                                Default value: True
+
+    Returns of constructor:
+        A profiler without a running session
+    """
+
+    def __init__(self, cams, directory, frames=100, memory=True) -> None:
+        # FramePipelines wrap the camera
+        self.cams = [getattr(cam, "cam", cam) for cam in cams]
+        self.directory = directory
+        self.frames = max(1, frames)
+        self.memory = memory
+        self.sessions = 0
+        self._session = None
+        self._lock = threading.Lock()
+
+    def start(self) -> bool:
+        """
+        Starts a session. Safe to be called from a signal handler of
+        the event loop.
+
+        Args:
+            None
+
+        Returns:
+            False if a session is already running
+        """
+        with self._lock:
+            if self._session is not None:
+                logging.warning("Profiling already running.")
+                return False
+            session = _Session(self.frames, self.memory)
+            if session.memory:
+                if tracemalloc.is_tracing():
+                    # Started by someone else, e.g. PYTHONTRACEMALLOC
+                    session.memory = False
+                else:
+                    tracemalloc.start(TRACEMALLOC_FRAMES)
+                    session.snapshot = tracemalloc.take_snapshot()
+            for cam in self.cams:
+                for stage in PROFILED_STAGES:
+                    # The instance attribute hides the method of the
+                    #   class until the session ends
+                    setattr(cam, stage, self._wrap(session, stage, getattr(cam, stage)))
+            self._session = session
+        logging.info("Profiling the next {} frames.".format(self.frames))
+        return True
+
+    def stop(self) -> None:
+        """
+        Ends the running session and writes its results. Does
+        nothing if no session runs.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        with self._lock:
+            session = self._session
+            if session is None:
+                return
+            self._session = None
+            for cam in self.cams:
+                for stage in PROFILED_STAGES:
+                    cam.__dict__.pop(stage, None)
+
+        with session.lock:
+            session.closed = True
+            # Stages that are still running write into the profiles
+            session.idle.wait_for(lambda: session.in_flight == 0, timeout=10)
+
+        after = None
+        if session.memory:
+            after = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+        try:
+            self._write(session, after)
+        except Exception:
+            logging.exception("Writing the profile failed.")
+        self.sessions += 1
+
+    def _wrap(self, session, stage, method):
+        def profiled(*args, **kwargs):
+            with session.lock:
+                if session.closed:
+                    return method(*args, **kwargs)
+                session.in_flight += 1
+                profile = session.profiles.get(threading.get_ident())
+                if profile is None:
+                    profile = session.profiles[threading.get_ident()] = cProfile.Profile()
+
+            memory_before = tracemalloc.get_traced_memory()[0] if session.memory else 0
+            start = time.perf_counter()
+            profile.enable()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                profile.disable()
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                memory_change = tracemalloc.get_traced_memory()[0] - memory_before if session.memory else 0
+                with session.lock:
+                    session.samples[stage].append((elapsed_ms, memory_change))
+                    session.in_flight -= 1
+                    if stage == "publish_frame":
+                        session.published += 1
+                    finished = session.published == session.frames
+                    session.idle.notify_all()
+                if finished:
+                    # Writing the results takes a while, it must
+                    #   not delay the frames
+                    threading.Thread(target=self.stop, name="profiler", daemon=True).start()
+        return profiled
+
+    def _write(self, session, after) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        prefix = os.path.join(self.directory, time.strftime("%Y-%m-%dT%H_%M_%S", time.gmtime(session.started)))
+        written = []
+
+        profiles = list(session.profiles.values())
+        if profiles:
+            stats = pstats.Stats(profiles[0])
+            for profile in profiles[1:]:
+                stats.add(profile)
+            stats.dump_stats(prefix + "_profile.pstats")
+            report = io.StringIO()
+            stats.stream = report
+            stats.sort_stats("cumulative").print_stats(REPORT_LINES)
+            with open(prefix + "_profile.txt", "w") as f:
+                f.write(report.getvalue())
+            written += [prefix + "_profile.pstats", prefix + "_profile.txt"]
+
+        if after is not None:
+            with open(prefix + "_memory.txt", "w") as f:
+                f.write("Allocations between start and end of the profiling, by source line:\n")
+                for stat in after.compare_to(session.snapshot, "lineno")[:REPORT_LINES]:
+                    f.write(str(stat) + "\n")
+            written.append(prefix + "_memory.txt")
+
+        summary = {
+            'frames': session.published,
+            'threads': len(profiles),
+            'duration_s': round(time.time() - session.started, 3),
+            'stages': {},
+        }
+        for stage, samples in session.samples.items():
+            if not samples:
+                continue
+            timings = np.array([sample[0] for sample in samples])
+            memory = np.array([sample[1] for sample in samples])
+            summary['stages'][stage] = {
+                'calls': len(samples),
+                'mean_ms': round(float(timings.mean()), 3),
+                'p95_ms': round(float(np.percentile(timings, 95)), 3),
+                'max_ms': round(float(timings.max()), 3),
+            }
+            if session.memory:
+                # The traced memory is shared by all threads, so the
+                #   changes of concurrent stages are mixed
+                summary['stages'][stage]['mean_memory_change_bytes'] = int(memory.mean())
+                summary['stages'][stage]['max_memory_change_bytes'] = int(memory.max())
+        with open(prefix + "_summary.json", "w") as f:
+            json.dump(summary, f, indent=2)
+        written.append(prefix + "_summary.json")
+        logging.info("Profile of {} frames written: {}".format(session.published, ", ".join(written)))
@@ -0,0 +1,334 @@
+"""
+Camera that replays an image archive, e.g. to reproduce an incident
+in production or to benchmark the consumers with recorded images.
+
+Both backends of the image archive (see archive.py) can be replayed:
+- a directory of segments (*.seg with their *.idx), read with the
+  SegmentReader of segment_store.py
+- a directory tree of image files (.jpg, .png, .webp), ordered by
+  the timestamp in their file names or, for other names, by their
+  modification time
+
+The images are published with the original time between them,
+scaled by a speed factor, or as fast as possible. The time waited
+for the recorded timing is counted in paced_ns, so a continuous
+trigger does not count it as late. At the end of the archive the
+replay starts again (loop) or the camera is finished, which stops
+the continuous trigger (see CamGeneral.is_finished()). A background
+thread reads and, if necessary, decodes the images ahead of the
+acquisitions. Images that are already encoded like the configured
+codec are published as they are, without decoding and encoding them
+again.
+"""
+
+# Import python in-built libraries
+import logging
+import os
+import sys
+import threading
+import time
+
+# Import libraries that had been installed with pip install
+import cv2
+import numpy as np
+
+# Import self-written modules
+from archive import parse_image_file_name
+from cameras import HORIZONTAL_CONSOLE_LINE, CamGeneral
+from frame import CaptureRequest, Frame
+from image_codecs import detect_encoding, encoded_image_shape
+from latency import STAGE_CONVERT, STAGE_FETCH, now_ms
+from pipeline import QUEUE_POLICY_BLOCK, StageQueue
+from segment_store import SEGMENT_EXTENSION, SegmentReader
+
+REPLAY_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+class ReplayCamera(CamGeneral):
+    """
+    Replays the images of an image archive, see module description.
+
+    Args of constructor:
+        mqtt_host, mqtt_port, mqtt_topic, mac_address and the
+        optional arguments of CamGeneral, see there
+        replay_path[string]:    Directory of the archive
+        (opt.) speed[float]:    Replay speed relative to the
+                                recording, e.g. 2 for twice as fast,
+                                0 for as fast as possible
+                                Default value: 1.0
+        (opt.) loop[bool]:      Start again with the first image
+                                after the last one
+                                Default value: False
+        (opt.) prefetch[int]:   Number of images that are read and
+                                decoded ahead
+                                Default value: 8
+
+    Returns of constructor:
+        A camera ready to replay the first image
+    """
+
+    def __init__(self, mqtt_host, mqtt_port, mqtt_topic, mac_address, replay_path, speed=1.0, loop=False,
+                 prefetch=8, **kwargs) -> None:
+        if not os.path.isdir(replay_path):
+            sys.exit("Replay path is not a directory: %s" % replay_path)
+        if speed < 0:
+            sys.exit("Unsupported replay speed: %s" % speed)
+
+        super().__init__(mqtt_host, mqtt_port, mqtt_topic, mac_address, **kwargs)
+
+        self.replay_path = replay_path
+        self.speed = speed
+        self.loop = loop
+        self.segments = any(file_name.endswith(SEGMENT_EXTENSION) for file_name in os.listdir(replay_path))
+
+        # Counters, see stats()
+        self.replayed = 0
+        self.passthrough = 0
+        self.decoded = 0
+        self.lag_ms = 0.0
+        # Time waited for the recorded timing of the images
+        self.paced_ns = 0
+
+        # Timestamp of the first image of the current pass and the
+        #   monotonic time at which it was replayed
+        self._first_ms = None
+        self._start = None
+        self._previous_ms = None
+        self._finished = False
+
+        self._queue = StageQueue(prefetch, QUEUE_POLICY_BLOCK)
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._prefetch, name="replay", daemon=True)
+        self._thread.start()
+        logging.info("Replaying {} ({}).".format(replay_path, "segments" if self.segments else "files"))
+
+    def acquire_frame(self, request=None):
+        """
+        Acquisition stage: waits until the next image of the archive
+        is due and returns it.
+
+        Args:
+            (opt.) request[CaptureRequest]:
+                                    Request that triggered the
+                                    acquisition
+
+        Returns:
+            Frame or None if the replay is finished
+        """
+        if request is None:
+            request = CaptureRequest()
+        item = self._next_due_item()
+        if item is None:
+            return None
+        image, encoded, shape = item
+        fetch_ms = now_ms()
+        self.frames_captured += 1
+
+        frame = Frame(image, request)
+        if encoded is not None:
+            self.passthrough += 1
+            frame.encoded = encoded
+            frame.shape = shape
+        frame.stages[STAGE_FETCH] = fetch_ms
+        frame.stages[STAGE_CONVERT] = fetch_ms
+        return frame
+
+    def _acquire_image(self):
+        """
+        Returns the next image of the archive as soon as it is due.
+        Only used by the acquire_frame() of CamGeneral, which needs
+        the decoded image.
+
+        Args:
+            None
+
+        Returns:
+            Image as np.ndarray or None if the replay is finished
+        """
+        item = self._next_due_item()
+        if item is None:
+            return None
+        image, encoded, shape = item
+        self._mark_fetched()
+        if image is None:
+            # Passed through images are not decoded ahead
+            image = self._decode(encoded)
+        return image
+
+    def is_finished(self) -> bool:
+        """
+        Checks if all images of the archive were replayed.
+
+        Args:
+            None
+
+        Returns:
+            True after the last image if the replay does not loop
+        """
+        return self._finished
+
+    def stats(self) -> dict:
+        """
+        Replay counters together with the counters of CamGeneral.
+
+        Args:
+            None
+
+        Returns:
+            Dictionary with the counters
+        """
+        stats = super().stats()
+        stats['replay_frames'] = self.replayed
+        stats['replay_passthrough'] = self.passthrough
+        stats['replay_decoded'] = self.decoded
+        stats['replay_lag_ms'] = self.lag_ms
+        return stats
+
+    def disconnect(self) -> None:
+        """
+        Stops the prefetching and disconnects from MQTT broker.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        self._stopped.set()
+        self._queue.close()
+        # Unblock the prefetch thread if it waits for space
+        while self._queue.get() is not None:
+            pass
+        self._thread.join()
+        super().disconnect()
+
+    def _next_item(self):
+        item = self._queue.get()
+        if item is None and not self._finished:
+            self._finished = True
+            logging.info("Replay of {} finished after {} images.".format(self.replay_path, self.replayed))
+        return item
+
+    def _next_due_item(self):
+        # (image or None, encoded image or None, shape) of the next
+        #   image as soon as it is due, None if the replay is
+        #   finished
+        item = self._next_item()
+        if item is None:
+            return None
+        timestamp_ms, image_id, image, encoded, shape = item
+        self._wait_until_due(timestamp_ms)
+        self.replayed += 1
+        logging.debug(HORIZONTAL_CONSOLE_LINE)
+        logging.debug("Image {} replayed.".format(image_id))
+        return image, encoded, shape
+
+    def _wait_until_due(self, timestamp_ms) -> None:
+        now = time.monotonic()
+        # Start a new pass for the first image, after a loop and if
+        #   the archive jumps back in time
+        if self._first_ms is None or timestamp_ms < self._previous_ms:
+            self._first_ms = timestamp_ms
+            self._start = now
+        self._previous_ms = timestamp_ms
+        if self.speed == 0:
+            return
+
+        due = self._start + (timestamp_ms - self._first_ms) / 1000 / self.speed
+        if now < due:
+            time.sleep(due - now)
+            self.paced_ns += int((time.monotonic() - now) * 1e9)
+            self.lag_ms = 0.0
+        else:
+            # The trigger or the consumers are slower than the
+            #   recording
+            self.lag_ms = (now - due) * 1000
+
+    def _prefetch(self) -> None:
+        try:
+            while not self._stopped.is_set():
+                count = 0
+                for timestamp_ms, image_id, data in self._read_archive():
+                    item = self._prepare(timestamp_ms, image_id, data)
+                    if item is None:
+                        continue
+                    if not self._queue.put(item):
+                        return
+                    count += 1
+                if not self.loop or count == 0:
+                    break
+        except Exception:
+            logging.exception("Reading the replay archive failed.")
+        finally:
+            self._queue.close()
+
+    def _read_archive(self):
+        """
+        All images of the archive, oldest first.
+
+        Args:
+            None
+
+        Returns:
+            Generator of (timestamp_ms, image_id, encoded image as
+            bytes)
+        """
+        if self.segments:
+            with SegmentReader(self.replay_path) as reader:
+                for timestamp_ms, image_id, view in reader.frames():
+                    # Copied, the segment is unmapped at the end
+                    yield timestamp_ms, image_id, bytes(view)
+            return
+
+        files = []
+        for directory, irrelevant, file_names in os.walk(self.replay_path):
+            for file_name in file_names:
+                if os.path.splitext(file_name)[1].lower() not in REPLAY_EXTENSIONS:
+                    continue
+                path = os.path.join(directory, file_name)
+                timestamp_ms = parse_image_file_name(file_name)
+                if timestamp_ms is None:
+                    timestamp_ms = int(os.path.getmtime(path) * 1000)
+                files.append((timestamp_ms, path))
+        files.sort()
+        for timestamp_ms, path in files:
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except OSError:
+                logging.warning("Image {} could not be read.".format(path))
+                continue
+            yield timestamp_ms, os.path.splitext(os.path.basename(path))[0], data
+
+    def _prepare(self, timestamp_ms, image_id, data) -> tuple:
+        """
+        Keeps the encoded image if it matches the codec, otherwise
+        decodes it.
+
+        Args:
+            timestamp_ms[int]:      Recording time of the image
+            image_id[string]:       Id of the image in the archive
+            data[bytes]:            Encoded image
+
+        Returns:
+            (timestamp_ms, image_id, image or None, encoded image or
+            None, shape) or None if the image can not be decoded
+        """
+        if detect_encoding(data) == self.codec.name:
+            shape = encoded_image_shape(data)
+            if shape is not None:
+                return timestamp_ms, image_id, None, np.frombuffer(data, dtype=np.uint8), shape
+        image = self._decode(data)
+        if image is None:
+            logging.warning("Image {} of the replay archive could not be decoded.".format(image_id))
+            return None
+        return timestamp_ms, image_id, image, None, image.shape
+
+    def _decode(self, data):
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+        if image is None:
+            return None
+        self.decoded += 1
+        if image.ndim == 2:
+            image = image[:, :, np.newaxis]
+        return image
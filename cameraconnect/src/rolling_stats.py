@@ -0,0 +1,75 @@
+"""
+Rolling window of measurements, e.g. latencies or jitter, with
+percentiles over the most recent values.
+"""
+
+# Import python in-built libraries
+import collections
+import threading
+
+# Import libraries that had been installed with pip install
+import numpy as np
+
+
+class RollingWindow:
+    """
+    Keeps the most recent measurements. Thread safe.
+
+    Args of constructor:
+        (opt.) size[int]:       Number of measurements kept
+                                Default value: 1000
+
+    Returns of constructor:
+        An empty window
+    """
+
+    def __init__(self, size=1000) -> None:
+        self.count = 0
+        self._values = collections.deque(maxlen=size)
+        self._lock = threading.Lock()
+        # (count, percents, percentiles) of the last computation,
+        #   reused until a measurement is added
+        self._cached = None
+
+    def add(self, value) -> None:
+        """
+        Adds a measurement, the oldest one is discarded once the
+        window is full.
+
+        Args:
+            value[float]:           Measurement
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._values.append(value)
+            self.count += 1
+
+    def percentiles(self, percents=(50, 95, 99)) -> dict:
+        """
+        Percentiles of the measurements in the window. Only
+        computed again after new measurements were added, e.g. not
+        on every scrape of the metrics.
+
+        Args:
+            (opt.) percents[tuple]: Percentiles to compute
+                                    Default value: (50, 95, 99)
+
+        Returns:
+            Dictionary like {'p50': ..., 'p95': ..., 'p99': ...},
+            all values 0.0 if the window is empty
+        """
+        with self._lock:
+            count = self.count
+            cached = self._cached
+            if cached is not None and cached[0] == count and cached[1] == percents:
+                return dict(cached[2])
+            values = list(self._values)
+        if not values:
+            return {'p{}'.format(p): 0.0 for p in percents}
+        results = np.percentile(values, percents)
+        percentiles = {'p{}'.format(p): float(result) for p, result in zip(percents, results)}
+        with self._lock:
+            self._cached = (count, percents, percentiles)
+        return dict(percentiles)
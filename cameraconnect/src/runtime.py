@@ -0,0 +1,388 @@
+"""
+asyncio runtime of cameraconnect.
+
+The AsyncRuntime owns the main thread of the process. Its event loop
+runs the network I/O of the MQTT trigger clients (instead of a
+private paho thread per client), reports the statistics of the
+triggers and cameras and shuts everything down in order on SIGTERM
+or SIGINT:
+
+    1. stop the trigger intake, requests that are already scheduled
+       are still dispatched
+    2. finish the queued frames of the pipelines
+    3. disconnect the cameras, which writes the archived images and
+       disconnects from the MQTT broker
+
+If a metrics port is given, the metrics and the liveness and
+readiness checks are served over HTTP (see metrics.py). If a
+profiler is given, SIGUSR1 starts a profiling session (see
+profiling.py).
+
+Blocking calls (camera, encoding, disk) never run on the event loop.
+They run in the threads of the trigger scheduler and the frame
+pipeline or in the executor of the runtime.
+
+The MQTT clients of the cameras keep the network thread of paho.
+They publish from the threads above, and paho loses the write
+registration of a message that is queued by another thread while
+the event loop finishes the previous write. The message would wait
+for the next one.
+
+Only asyncio functions that are available in Python 3.6 are used.
+"""
+
+# Import python in-built libraries
+import asyncio
+import logging
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Import libraries that had been installed with pip install
+import paho.mqtt.client as mqtt
+
+# Import self-written modules
+from camera_group import CameraGroup, disconnect_camera
+from metrics import METRIC_GAUGE, METRIC_HISTOGRAM, MetricsRegistry, MetricsServer, rss_bytes
+
+# Keys of the stats() dictionaries that are exported as counters
+CAMERA_COUNTERS = ('frames_captured', 'frames_published', 'bytes_sent', 'mqtt_reconnects', 'timeouts',
+                   'transport_errors', 'conversion_errors', 'recovery_failures', 'recoveries_stream',
+                   'recoveries_device', 'recoveries_harvester', 'dropped_capture_requests', 'dropped_frames',
+                   'published_qos', 'acknowledged', 'replayed', 'publish_dropped', 'spooled', 'spool_dropped',
+                   'frames_generated', 'replay_frames', 'replay_passthrough', 'replay_decoded')
+ARCHIVE_COUNTERS = ('dropped_writes', 'written', 'write_errors', 'bytes_written', 'deleted')
+BUFFER_POOL_COUNTERS = ('allocations', 'reuses')
+TRIGGER_COUNTERS = ('scheduled', 'dispatched', 'missed', 'coalesced', 'late', 'mqtt_reconnects')
+CONTINUOUS_COUNTERS = ('frames', 'errors', 'late', 'missed')
+
+# The process is not alive anymore if the event loop did not run
+#   for this time in seconds
+HEARTBEAT_TIMEOUT = 10.0
+
+
+class AsyncioMqttHelper:
+    """
+    Runs the network I/O of a paho client on an asyncio event loop.
+    The socket of the client is watched by the event loop and the
+    keep alive and reconnects are handled by a coroutine. Must be
+    created before the client connects.
+
+    Args of constructor:
+        loop[AbstractEventLoop]:
+                                Event loop that runs the network I/O
+        client[mqtt.Client]:    Client that is not connected yet
+
+    Returns of constructor:
+        A helper that runs the network I/O once the loop runs
+    """
+
+    def __init__(self, loop, client) -> None:
+        self.loop = loop
+        self.client = client
+        self.client.on_socket_open = self._on_socket_open
+        self.client.on_socket_close = self._on_socket_close
+        self.client.on_socket_register_write = self._on_socket_register_write
+        self.client.on_socket_unregister_write = self._on_socket_unregister_write
+        self._misc = asyncio.ensure_future(self._misc_loop(), loop=loop)
+
+    def stop(self) -> None:
+        """
+        Stops the keep alive coroutine. Safe to be called from any
+        thread.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        self.loop.call_soon_threadsafe(self._misc.cancel)
+
+    # The socket callbacks may be called from other threads, e.g.
+    #   by disconnect(), so the event loop is only changed from its
+    #   own thread. The file descriptor is taken right away, because
+    #   the socket may already be closed once the loop runs the call.
+    def _on_socket_open(self, client, userdata, sock) -> None:
+        self.loop.call_soon_threadsafe(self.loop.add_reader, sock.fileno(), client.loop_read)
+
+    def _on_socket_close(self, client, userdata, sock) -> None:
+        self.loop.call_soon_threadsafe(self._unwatch, self.loop.remove_reader, sock.fileno())
+
+    def _on_socket_register_write(self, client, userdata, sock) -> None:
+        self.loop.call_soon_threadsafe(self.loop.add_writer, sock.fileno(), client.loop_write)
+
+    def _on_socket_unregister_write(self, client, userdata, sock) -> None:
+        self.loop.call_soon_threadsafe(self._unwatch, self.loop.remove_writer, sock.fileno())
+
+    @staticmethod
+    def _unwatch(remove, fd) -> None:
+        try:
+            remove(fd)
+        except (OSError, ValueError):
+            # Socket already closed, the selector dropped it anyway
+            pass
+
+    async def _misc_loop(self) -> None:
+        while True:
+            if self.client.loop_misc() == mqtt.MQTT_ERR_NO_CONN:
+                try:
+                    self.client.reconnect()
+                    logging.info("Reconnected to the MQTT broker.")
+                except OSError:
+                    logging.debug("Reconnect to the MQTT broker failed.")
+            await asyncio.sleep(1)
+
+
+class AsyncRuntime:
+    """
+    Event loop that runs the triggers until SIGTERM or SIGINT and
+    then drains and disconnects everything.
+
+    Args of constructor:
+        cams[list]:             Cameras or FramePipelines
+        (opt.) report_interval[float]:
+                                Time between two reports of the
+                                statistics in seconds
+                                Default value: 10.0
+        (opt.) drain_timeout[float]:
+                                Maximum time in seconds to dispatch
+                                scheduled triggers at shutdown
+                                Default value: 10.0
+        (opt.) metrics_port[int]:
+                                Port of the metrics and health
+                                endpoints, None to disable them
+                                Default value: None
+        (opt.) profiler[Profiler]:
+                                Profiler started by SIGUSR1, None to
+                                ignore the signal
+                                Default value: None
+
+    Returns of constructor:
+        A runtime without triggers
+    """
+
+    def __init__(self, cams, report_interval=10.0, drain_timeout=10.0, metrics_port=None, profiler=None) -> None:
+        self.cams = list(cams)
+        self.report_interval = report_interval
+        self.drain_timeout = drain_timeout
+        self.metrics_port = metrics_port
+        self.profiler = profiler
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.executor = ThreadPoolExecutor(max_workers=4)
+        self.loop.set_default_executor(self.executor)
+
+        self.triggers = []
+        self.continuous = None
+        self._continuous_future = None
+        self._stopping = False
+        self._heartbeat = time.monotonic()
+        self._started = time.monotonic()
+
+    def add_trigger(self, trigger) -> None:
+        """
+        Adds an MqttTrigger that is stopped at shutdown.
+
+        Args:
+            trigger[MqttTrigger]:   Trigger created with the event
+                                    loop of this runtime
+
+        Returns:
+            None
+        """
+        self.triggers.append(trigger)
+
+    def run(self, continuous=None) -> None:
+        """
+        Runs the event loop until the process is asked to stop.
+
+        Args:
+            (opt.) continuous[ContinuousTrigger]:
+                                    Continuous trigger created with
+                                    start=False, runs in the
+                                    executor of the runtime
+                                    Default value: None
+
+        Returns:
+            None
+        """
+        for signal_number in (signal.SIGTERM, signal.SIGINT):
+            self.loop.add_signal_handler(signal_number, self._on_signal, signal_number)
+        if self.profiler is not None:
+            self.loop.add_signal_handler(signal.SIGUSR1, self.profiler.start)
+
+        tasks = [asyncio.ensure_future(self._report(), loop=self.loop),
+                 asyncio.ensure_future(self._beat(), loop=self.loop)]
+        if continuous is not None:
+            self.continuous = continuous
+            self._continuous_future = self.loop.run_in_executor(None, continuous.run)
+            self._continuous_future.add_done_callback(self._on_continuous_done)
+
+        metrics_server = None
+        if self.metrics_port is not None:
+            metrics_server = MetricsServer(self._create_registry(), self.is_alive, self.is_ready,
+                                           port=self.metrics_port)
+
+        try:
+            self.loop.run_forever()
+        finally:
+            for task in tasks:
+                task.cancel()
+            if metrics_server is not None:
+                metrics_server.stop()
+            self.loop.run_until_complete(asyncio.sleep(0))
+            self.executor.shutdown(wait=True)
+            self.loop.close()
+        logging.info("Stopped.")
+
+    def is_alive(self) -> bool:
+        """
+        Liveness of the process: the event loop runs, the
+        continuous trigger did not fail and the frame pipelines run.
+        Always True while shutting down. Safe to be called from any
+        thread.
+
+        Args:
+            None
+
+        Returns:
+            True if the process is alive
+        """
+        if self._stopping:
+            return True
+        if time.monotonic() - self._heartbeat > HEARTBEAT_TIMEOUT:
+            return False
+        if self._continuous_future is not None and self._continuous_future.done():
+            return False
+        return all(cam.is_alive() for cam in self.cams if hasattr(cam, "is_alive"))
+
+    def is_ready(self) -> bool:
+        """
+        Readiness of the process: all cameras and triggers are
+        connected to the MQTT broker and no camera recovery failed.
+        False while shutting down. Safe to be called from any
+        thread.
+
+        Args:
+            None
+
+        Returns:
+            True if the process is ready
+        """
+        if self._stopping:
+            return False
+        return all(cam.is_ready() for cam in self.cams) and all(trigger.is_ready() for trigger in self.triggers)
+
+    async def shutdown(self) -> None:
+        """
+        Stops the trigger intake, drains the scheduled triggers and
+        the queued frames, disconnects the cameras and stops the
+        event loop.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        if self._stopping:
+            return
+        self._stopping = True
+        logging.info("Shutting down, draining in-flight frames.")
+
+        try:
+            for trigger in self.triggers:
+                await self.loop.run_in_executor(None, self._disconnect_trigger, trigger)
+            if self.continuous is not None:
+                self.continuous.stop()
+                try:
+                    await self._continuous_future
+                except Exception:
+                    # Already logged by _on_continuous_done()
+                    pass
+                # Ends the threads of a CameraGroup, its cameras are
+                #   disconnected one by one below
+                group = getattr(self.continuous, "cam", None)
+                if isinstance(group, CameraGroup):
+                    await self.loop.run_in_executor(None, group.close)
+            for cam in self.cams:
+                await self.loop.run_in_executor(None, disconnect_camera, cam)
+            if self.profiler is not None:
+                # Writes the frames profiled so far
+                await self.loop.run_in_executor(None, self.profiler.stop)
+        except Exception:
+            logging.exception("Shutdown failed.")
+        finally:
+            self.loop.stop()
+
+    def _disconnect_trigger(self, trigger) -> None:
+        trigger.disconnect(drain=True, timeout=self.drain_timeout)
+
+    def _on_signal(self, signal_number) -> None:
+        logging.info("Received signal {}.".format(signal_number))
+        asyncio.ensure_future(self.shutdown(), loop=self.loop)
+
+    def _on_continuous_done(self, future) -> None:
+        # The continuous trigger returns after stop(), if it failed
+        #   or if the camera is finished, e.g. a replay
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            logging.error("Continuous trigger failed.", exc_info=future.exception())
+        elif self._stopping:
+            return
+        else:
+            logging.info("Continuous trigger finished.")
+        asyncio.ensure_future(self.shutdown(), loop=self.loop)
+
+    def _create_registry(self) -> MetricsRegistry:
+        registry = MetricsRegistry()
+        for entry in self.cams:
+            # FramePipelines wrap the camera
+            cam = getattr(entry, "cam", entry)
+            labels = {'camera': cam.mqtt_topic}
+            registry.add_stats("camera", entry.stats, labels, counters=CAMERA_COUNTERS)
+            registry.add_collector(self._latency_collector(cam, labels))
+            if cam.archive is not None:
+                registry.add_stats("archive", cam.archive.stats, labels, counters=ARCHIVE_COUNTERS)
+            registry.add_stats("buffer_pool", self._buffer_pool_stats(cam), labels, counters=BUFFER_POOL_COUNTERS)
+        for trigger in self.triggers:
+            registry.add_stats("trigger", trigger.stats, {'topic': trigger.mqtt_topic}, counters=TRIGGER_COUNTERS)
+        if self.continuous is not None:
+            registry.add_stats("continuous_trigger", self.continuous.stats, counters=CONTINUOUS_COUNTERS)
+        registry.add_collector(self._process_metrics)
+        return registry
+
+    @staticmethod
+    def _latency_collector(cam, labels):
+        def collect():
+            for stage, histogram in cam.latency.histograms.items():
+                yield ("frame_latency_ms", METRIC_HISTOGRAM, "latency of the frames between the stages in ms",
+                       dict(labels, stage=stage), histogram)
+        return collect
+
+    @staticmethod
+    def _buffer_pool_stats(cam):
+        # The pool is replaced when the camera is recovered
+        return lambda: cam.buffer_pool.stats() if cam.buffer_pool is not None else {}
+
+    def _process_metrics(self):
+        yield "process_resident_memory_bytes", METRIC_GAUGE, "resident set size of the process", {}, rss_bytes()
+        yield ("process_uptime_seconds", METRIC_GAUGE, "time since the start of the runtime", {},
+               time.monotonic() - self._started)
+
+    async def _beat(self) -> None:
+        while True:
+            self._heartbeat = time.monotonic()
+            await asyncio.sleep(1)
+
+    async def _report(self) -> None:
+        while True:
+            await asyncio.sleep(self.report_interval)
+            logging.debug("Still running.")
+            for trigger in self.triggers:
+                logging.debug("Trigger statistics {}: {}".format(trigger.mqtt_topic, trigger.stats()))
+            for cam in self.cams:
+                if hasattr(cam, "stats"):
+                    logging.debug("Camera statistics: {}".format(cam.stats()))
@@ -0,0 +1,261 @@
+"""
+Scheduler that dispatches capture requests at a given point in time.
+
+The MQTT callback runs in the network thread of paho. Waiting there
+for the acquisition delay blocks every other message including the
+next trigger, and polling with sleeps adds jitter. The
+TriggerScheduler keeps the pending requests in a timer heap ordered
+by their due time on the monotonic clock and dispatches each one
+from its own thread as soon as it is due, so the MQTT callback only
+schedules the request and returns.
+
+The number of pending requests is bounded. With every policy a
+request whose due time already passed is dispatched immediately and
+flagged as late instead of stopping the process. Under overload the
+trigger policy decides which triggers are missed:
+- "DropNewest": a trigger arriving at a full queue is missed, the
+            pending ones are kept
+- "DropOldest": a trigger arriving at a full queue replaces the
+            pending trigger that was received first, which is missed
+- "Coalesce": a trigger due within the coalesce window of a pending
+            trigger is merged into it, a trigger arriving at a full
+            queue is missed
+"""
+
+# Import python in-built libraries
+import heapq
+import itertools
+import logging
+import sys
+import threading
+import time
+
+TRIGGER_POLICY_DROP_NEWEST = "DropNewest"
+TRIGGER_POLICY_DROP_OLDEST = "DropOldest"
+TRIGGER_POLICY_COALESCE = "Coalesce"
+TRIGGER_POLICIES = (TRIGGER_POLICY_DROP_NEWEST, TRIGGER_POLICY_DROP_OLDEST, TRIGGER_POLICY_COALESCE)
+# Change of the offset between the wall clock and the monotonic clock
+#   in seconds that is treated as a clock adjustment. Smaller
+#   changes are jitter of reading the two clocks.
+CLOCK_ADJUSTMENT = 0.001
+
+
+class TriggerScheduler:
+    """
+    Dispatches capture requests at their due time in a background
+    thread. Requests with the same due time are dispatched in the
+    order in which they were scheduled.
+
+    Args of constructor:
+        dispatch[callable]:     Called with the request once it is
+                                due, e.g. get_image() of a camera
+        (opt.) max_pending[int]:
+                                Maximum number of pending requests
+                                Default value: 8
+        (opt.) policy[string]:  Overload policy, see module
+                                description.
+                                Possible values: "DropNewest",
+                                    "DropOldest", "Coalesce"
+                                Default value: "DropNewest"
+        (opt.) coalesce_ms[float]:
+                                Window of the "Coalesce" policy in
+                                ms
+                                Default value: 100
+        (opt.) late_tolerance_ms[float]:
+                                A request dispatched more than this
+                                after its due time is flagged late
+                                Default value: 5
+
+    Returns of constructor:
+        A running scheduler without pending requests
+    """
+
+    def __init__(self, dispatch, max_pending=8, policy=TRIGGER_POLICY_DROP_NEWEST, coalesce_ms=100,
+                 late_tolerance_ms=5) -> None:
+        if policy not in TRIGGER_POLICIES:
+            sys.exit("Unsupported trigger policy: %s" % policy)
+
+        self.dispatch = dispatch
+        self.max_pending = max(1, max_pending)
+        self.policy = policy
+        self.coalesce_ms = coalesce_ms
+        self.late_tolerance_ms = late_tolerance_ms
+
+        # Counters
+        self.scheduled = 0
+        self.dispatched = 0
+        self.missed = 0
+        self.coalesced = 0
+        self.late = 0
+        self.lateness_ms = 0.0
+        self.lateness_ms_max = 0.0
+
+        # Heap of (due time on the monotonic clock, sequence number,
+        #   request), the sequence number is the order of reception
+        self._heap = []
+        self._sequence = itertools.count()
+        # Wall clock minus monotonic clock in seconds, see
+        #   _monotonic_due()
+        self._clock_offset = None
+        self._running = True
+        self._accepting = True
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="scheduler", daemon=True)
+        self._thread.start()
+
+    def schedule(self, request, at_ms=None) -> bool:
+        """
+        Schedules a request according to the overload policy. Never
+        blocks. A due time in the past is dispatched immediately.
+
+        Args:
+            request[CaptureRequest]:
+                                    Request to dispatch
+            (opt.) at_ms[int]:      Point in time of the dispatch in
+                                    ms since epoch, None to dispatch
+                                    as soon as possible
+                                    Default value: None
+
+        Returns:
+            False if the request was missed or coalesced or the
+            scheduler is stopped, otherwise True
+        """
+        with self._condition:
+            if not self._accepting:
+                return False
+            due = self._monotonic_due(at_ms)
+            self.scheduled += 1
+            if self.policy == TRIGGER_POLICY_COALESCE and self._coalesce(due):
+                self.coalesced += 1
+                logging.debug("Trigger coalesced with a pending trigger.")
+                return False
+            if len(self._heap) >= self.max_pending:
+                self.missed += 1
+                if self.policy != TRIGGER_POLICY_DROP_OLDEST:
+                    logging.warning("Trigger queue full, trigger missed ({} missed).".format(self.missed))
+                    return False
+                # The first received request, which is not
+                #   necessarily the one due first
+                oldest = min(range(len(self._heap)), key=lambda position: self._heap[position][1])
+                self._heap[oldest] = self._heap[-1]
+                self._heap.pop()
+                heapq.heapify(self._heap)
+                logging.warning("Trigger queue full, oldest trigger missed ({} missed).".format(self.missed))
+            heapq.heappush(self._heap, (due, next(self._sequence), request))
+            self._condition.notify()
+        return True
+
+    def pending(self) -> int:
+        """
+        Number of requests that are not dispatched yet.
+
+        Args:
+            None
+
+        Returns:
+            Number of pending requests
+        """
+        return len(self._heap)
+
+    def stats(self) -> dict:
+        """
+        Current counters of the scheduler.
+
+        Args:
+            None
+
+        Returns:
+            Dictionary with the counters
+        """
+        return {
+            'pending': len(self._heap),
+            'scheduled': self.scheduled,
+            'dispatched': self.dispatched,
+            'missed': self.missed,
+            'coalesced': self.coalesced,
+            'late': self.late,
+            'lateness_ms': self.lateness_ms,
+            'lateness_ms_max': self.lateness_ms_max,
+        }
+
+    def stop(self, drain=False, timeout=10.0) -> None:
+        """
+        Stops the scheduler. New requests are rejected right away.
+        Waits until the request that is currently dispatched is
+        done.
+
+        Args:
+            (opt.) drain[bool]:     Dispatch the pending requests at
+                                    their due time before stopping,
+                                    otherwise they are discarded
+                                    Default value: False
+            (opt.) timeout[float]:  Maximum time in seconds to wait
+                                    for the pending requests, the
+                                    remaining ones are discarded
+                                    Default value: 10.0
+
+        Returns:
+            None
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            self._accepting = False
+            while drain and self._heap:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logging.warning("{} pending capture requests discarded.".format(len(self._heap)))
+                    break
+                self._condition.wait(remaining)
+            self._running = False
+            self._condition.notify_all()
+        self._thread.join()
+
+    def _monotonic_due(self, at_ms) -> float:
+        # Converts once from the wall clock to the monotonic clock,
+        #   so clock adjustments do not shift the dispatch. The
+        #   offset is kept until the wall clock is adjusted, so the
+        #   same due time always converts to the same point and
+        #   keeps the order of scheduling.
+        now = time.monotonic()
+        if at_ms is None:
+            return now
+        offset = time.time() - now
+        if self._clock_offset is None or abs(offset - self._clock_offset) > CLOCK_ADJUSTMENT:
+            self._clock_offset = offset
+        return at_ms / 1000 - self._clock_offset
+
+    def _coalesce(self, due) -> bool:
+        window = self.coalesce_ms / 1000
+        return any(abs(pending_due - due) <= window for pending_due, irrelevant, request in self._heap)
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while self._running:
+                    if self._heap:
+                        remaining = self._heap[0][0] - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        # Woken up earlier if a request with an
+                        #   earlier due time is scheduled
+                        self._condition.wait(remaining)
+                    else:
+                        self._condition.wait()
+                if not self._running:
+                    return
+                due, irrelevant, request = heapq.heappop(self._heap)
+                # Wakes up stop() waiting for the pending requests
+                self._condition.notify_all()
+
+            self.lateness_ms = (time.monotonic() - due) * 1000
+            self.lateness_ms_max = max(self.lateness_ms_max, self.lateness_ms)
+            if self.lateness_ms > self.late_tolerance_ms:
+                # Captured anyway, the flag ends up in the message
+                request.late = True
+                self.late += 1
+                logging.debug("Trigger dispatched {:.1f} ms late.".format(self.lateness_ms))
+            try:
+                self.dispatch(request)
+            except Exception:
+                logging.exception("Dispatching a capture request failed.")
+            self.dispatched += 1
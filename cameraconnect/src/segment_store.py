@@ -0,0 +1,381 @@
+"""
+Packed storage of encoded images in rolling segment files.
+
+One file per image creates millions of small files per camera and
+month, which exhausts inodes and turns every lookup of a time range
+into a directory walk. The SegmentStorage appends the encoded images
+to segment files instead and writes a compact sidecar index:
+
+    <directory>/<timestamp_ms of first image>.seg   encoded images
+    <directory>/<timestamp_ms of first image>.idx   index records
+
+Index record (network byte order, 60 bytes):
+
+    timestamp_ms        8 bytes
+    image_id            40 bytes, utf-8, zero padded
+    offset in segment   8 bytes
+    length              4 bytes
+
+The index of a segment is sorted by timestamp. A timestamp that goes
+backwards (e.g. after the clock was set) starts a new segment, named
+1 ms earlier if a newer segment already has that name. The
+SegmentReader uses mmap and binary search on the index to get the
+images of a time range without scanning. Command line usage:
+
+    python3 segment_store.py list <directory>
+    python3 segment_store.py extract <directory> --start 2022-06-15T10:00:00+00:00 \\
+        --end 2022-06-15T11:00:00+00:00 --out /tmp/images
+"""
+
+# Import python in-built libraries
+import argparse
+import datetime
+import logging
+import mmap
+import os
+import struct
+
+# Import self-written modules
+from archive import image_file_name, sync_directory
+
+SEGMENT_EXTENSION = ".seg"
+INDEX_EXTENSION = ".idx"
+INDEX_RECORD = struct.Struct("!Q40sQI")
+IMAGE_ID_BYTES = 40
+
+
+def index_image_id(image_id) -> bytes:
+    """
+    Encodes an image_id for the index. Longer ids are cut to
+    IMAGE_ID_BYTES without splitting a multi-byte utf-8 character.
+
+    Args:
+        image_id[string]:       Image id
+
+    Returns:
+        At most IMAGE_ID_BYTES bytes of utf-8
+    """
+    encoded = image_id.encode("utf-8")
+    if len(encoded) <= IMAGE_ID_BYTES:
+        return encoded
+    return encoded[:IMAGE_ID_BYTES].decode("utf-8", "ignore").encode("utf-8")
+
+
+class SegmentStorage:
+    """
+    Storage backend for the ImageArchiveWriter (see archive.py) that
+    appends the images to rolling segment files. Every segment is
+    one retention unit, the key is the path of the segment file.
+    The segment that is currently written is never deleted.
+
+    Args of constructor:
+        directory[string]:      Directory of the segments
+        (opt.) segment_bytes[int]:
+                                Size after which a new segment is
+                                started
+                                Default value: 256 MB
+
+    Returns of constructor:
+        A storage without an open segment
+    """
+
+    def __init__(self, directory, segment_bytes=256 * 1024 * 1024) -> None:
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        os.makedirs(directory, exist_ok=True)
+
+        self._segment = None
+        self._index = None
+        self._segment_path = None
+        self._segment_size = 0
+        self._last_ms = None
+        self._new_segment = False
+
+    def scan(self) -> list:
+        units = []
+        reader = SegmentReader(self.directory)
+        for start_ms, segment_path, index_path in reader.segments():
+            size = os.path.getsize(segment_path) + os.path.getsize(index_path)
+            last_ms = reader.last_timestamp_ms(index_path)
+            timestamp = last_ms / 1000 if last_ms is not None else os.path.getmtime(segment_path)
+            units.append((segment_path, timestamp, size))
+        reader.close()
+        return units
+
+    def write(self, timestamp_ms, image_id, encoded) -> tuple:
+        # The binary search of the reader needs a sorted index
+        if self._segment is None or self._segment_size >= self.segment_bytes or timestamp_ms < self._last_ms:
+            self._open_segment(timestamp_ms)
+
+        offset = self._segment_size
+        length = self._segment.write(encoded)
+        self._index.write(INDEX_RECORD.pack(timestamp_ms, index_image_id(image_id), offset, length))
+        self._segment_size += length
+        self._last_ms = timestamp_ms
+        return self._segment_path, length + INDEX_RECORD.size
+
+    def sync(self) -> None:
+        if self._segment is None:
+            return
+        for f in (self._segment, self._index):
+            f.flush()
+            os.fsync(f.fileno())
+        if self._new_segment:
+            sync_directory(self.directory)
+            self._new_segment = False
+
+    def flush(self) -> None:
+        # Hands the written images to the OS without syncing them,
+        #   so readers of the files see them
+        if self._segment is None:
+            return
+        self._segment.flush()
+        self._index.flush()
+
+    def remove(self, key) -> bool:
+        if key == self._segment_path:
+            return False
+        os.remove(key)
+        os.remove(key[:-len(SEGMENT_EXTENSION)] + INDEX_EXTENSION)
+        return True
+
+    def close(self) -> None:
+        if self._segment is None:
+            return
+        self.sync()
+        self._segment.close()
+        self._index.close()
+        self._segment = None
+        self._index = None
+        self._segment_path = None
+
+    def _open_segment(self, timestamp_ms) -> None:
+        self.close()
+        # An existing segment is only continued if its images are not
+        #   newer, otherwise the name is moved back to a free one
+        name_ms = timestamp_ms
+        reader = SegmentReader(self.directory)
+        while True:
+            base = os.path.join(self.directory, "{:013d}".format(name_ms))
+            if not os.path.exists(base + INDEX_EXTENSION):
+                break
+            last_ms = reader.last_timestamp_ms(base + INDEX_EXTENSION)
+            if last_ms is None or last_ms <= timestamp_ms:
+                break
+            name_ms -= 1
+        self._segment_path = base + SEGMENT_EXTENSION
+        self._segment = open(self._segment_path, "ab")
+        self._index = open(base + INDEX_EXTENSION, "ab")
+        self._segment_size = self._segment.tell()
+        self._new_segment = True
+
+
+class SegmentReader:
+    """
+    Reads images out of the segments of a directory. The segments
+    are memory mapped and stay mapped until close() is called, so
+    the returned images are views into the files without copies.
+
+    Args of constructor:
+        directory[string]:      Directory of the segments
+
+    Returns of constructor:
+        A reader
+    """
+
+    def __init__(self, directory) -> None:
+        self.directory = directory
+        self._maps = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def segments(self) -> list:
+        """
+        All segments of the directory, oldest first.
+
+        Args:
+            None
+
+        Returns:
+            List of (timestamp_ms of first image, segment path,
+            index path)
+        """
+        segments = []
+        for file_name in os.listdir(self.directory):
+            if not file_name.endswith(SEGMENT_EXTENSION):
+                continue
+            base = file_name[:-len(SEGMENT_EXTENSION)]
+            index_path = os.path.join(self.directory, base + INDEX_EXTENSION)
+            if not base.isdigit() or not os.path.exists(index_path):
+                continue
+            segments.append((int(base), os.path.join(self.directory, file_name), index_path))
+        segments.sort()
+        return segments
+
+    def last_timestamp_ms(self, index_path):
+        """
+        Timestamp of the last image of a segment.
+
+        Args:
+            index_path[string]:     Path of the index file
+
+        Returns:
+            Timestamp in ms since epoch or None if the index is empty
+        """
+        count = os.path.getsize(index_path) // INDEX_RECORD.size
+        if count == 0:
+            return None
+        with open(index_path, "rb") as f:
+            f.seek((count - 1) * INDEX_RECORD.size)
+            return INDEX_RECORD.unpack(f.read(INDEX_RECORD.size))[0]
+
+    def frames(self, start_ms=None, end_ms=None):
+        """
+        Images with start_ms <= timestamp_ms < end_ms. Only the
+        segments overlapping the time range are opened and the first
+        image is found by binary search in the index.
+
+        Args:
+            (opt.) start_ms[int]:   Start of the time range in ms since
+                                    epoch, None for no limit
+            (opt.) end_ms[int]:     End of the time range in ms since
+                                    epoch, None for no limit
+
+        Returns:
+            Generator of (timestamp_ms, image_id, memoryview of the
+            encoded image)
+        """
+        segments = self.segments()
+        for i, (first_ms, segment_path, index_path) in enumerate(segments):
+            if end_ms is not None and first_ms >= end_ms:
+                break
+            # Skip segments that end before the time range. Segments
+            #   can overlap if a timestamp went backwards.
+            if start_ms is not None and i + 1 < len(segments) and segments[i + 1][0] <= start_ms:
+                last_ms = self.last_timestamp_ms(index_path)
+                if last_ms is None or last_ms < start_ms:
+                    continue
+
+            index = self._map(index_path)
+            segment = self._map(segment_path)
+            if index is None or segment is None:
+                continue
+            count = len(index) // INDEX_RECORD.size
+
+            position = self._bisect(index, count, start_ms) if start_ms is not None else 0
+            while position < count:
+                timestamp_ms, image_id, offset, length = INDEX_RECORD.unpack_from(index, position * INDEX_RECORD.size)
+                if end_ms is not None and timestamp_ms >= end_ms:
+                    break
+                yield timestamp_ms, image_id.rstrip(b"\0").decode("utf-8"), memoryview(segment)[offset:offset + length]
+                position += 1
+
+    def close(self) -> None:
+        """
+        Unmaps all segments. Views returned by frames() must not be
+        used anymore.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        for m in self._maps:
+            try:
+                m.close()
+            except BufferError:
+                # Views still exported, unmapped once released
+                logging.warning("Segment still in use by views of frames(), unmapped once they are released.")
+        self._maps = []
+
+    def _map(self, path):
+        size = os.path.getsize(path)
+        if size == 0:
+            return None
+        with open(path, "rb") as f:
+            m = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+        self._maps.append(m)
+        return m
+
+    @staticmethod
+    def _bisect(index, count, start_ms) -> int:
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            if INDEX_RECORD.unpack_from(index, middle * INDEX_RECORD.size)[0] < start_ms:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+
+def parse_time_ms(value) -> int:
+    """
+    Parses a point in time given as ms since epoch or in ISO 8601
+    format (e.g. "2022-06-15T10:00:00+00:00", UTC if no time zone).
+
+    Args:
+        value[string]:          Point in time
+
+    Returns:
+        Time in ms since epoch
+    """
+    if value.isdigit():
+        return int(value)
+    value = value.replace("Z", "+00:00")
+    # Python 3.6 can not parse the colon of the time zone offset
+    if len(value) > 6 and value[-3] == ":" and value[-6] in "+-":
+        value = value[:-3] + value[-2:]
+    for time_format in ("%Y-%m-%dT%H:%M:%S.%f%z", "%Y-%m-%dT%H:%M:%S%z", "%Y-%m-%dT%H:%M:%S.%f", "%Y-%m-%dT%H:%M:%S"):
+        try:
+            point = datetime.datetime.strptime(value, time_format)
+        except ValueError:
+            continue
+        if point.tzinfo is None:
+            point = point.replace(tzinfo=datetime.timezone.utc)
+        return int(round(point.timestamp() * 1000))
+    raise ValueError("Invalid point in time: {}".format(value))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Inspect and extract images of a segment archive.")
+    subparsers = parser.add_subparsers(dest="command")
+    list_parser = subparsers.add_parser("list", help="list the segments and their time ranges")
+    list_parser.add_argument("directory")
+    extract_parser = subparsers.add_parser("extract", help="write the images of a time range into files")
+    extract_parser.add_argument("directory")
+    extract_parser.add_argument("--start", default=None, help="ms since epoch or ISO 8601")
+    extract_parser.add_argument("--end", default=None, help="ms since epoch or ISO 8601")
+    extract_parser.add_argument("--out", required=True, help="output directory")
+    extract_parser.add_argument("--extension", default=".jpg", help="file extension of the images")
+    args = parser.parse_args()
+
+    with SegmentReader(args.directory) as reader:
+        if args.command == "list":
+            for first_ms, segment_path, index_path in reader.segments():
+                count = os.path.getsize(index_path) // INDEX_RECORD.size
+                print("{}  {} - {}  {} images  {} bytes".format(
+                    os.path.basename(segment_path), first_ms, reader.last_timestamp_ms(index_path), count,
+                    os.path.getsize(segment_path)))
+        elif args.command == "extract":
+            start_ms = parse_time_ms(args.start) if args.start else None
+            end_ms = parse_time_ms(args.end) if args.end else None
+            os.makedirs(args.out, exist_ok=True)
+            count = 0
+            for timestamp_ms, image_id, data in reader.frames(start_ms, end_ms):
+                with open(os.path.join(args.out, image_file_name(timestamp_ms, args.extension)), "wb") as f:
+                    f.write(data)
+                data.release()
+                count += 1
+            print("Extracted {} images to {}".format(count, args.out))
+        else:
+            parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
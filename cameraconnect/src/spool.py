@@ -0,0 +1,572 @@
+"""
+Reliable publishing of the image messages with QoS 1.
+
+With QoS 0 every frame that is published during a broker restart or
+a network interruption is lost. The ReliablePublisher publishes with
+QoS 1 and keeps up to max_inflight messages unacknowledged, so the
+throughput is not limited by the round-trip time to the broker.
+
+While the broker is unreachable, or the window stays full because the
+broker stopped acknowledging (e.g. a half-open connection), the
+messages are spilled to a PublishSpool on disk, which appends them to rolling segment files
+(see segment_store.py) and drops the oldest segments once it exceeds
+its size limit. After the reconnect the spool is replayed in order in
+a background thread. New messages are appended to the spool as long
+as it is not empty, so the broker receives all messages in the order
+in which they were published.
+
+The spool survives restarts of the container: messages that are
+still spooled at startup are replayed after the first connect. The
+spooled messages are synced to disk in batches, so a power loss
+loses at most the messages of the last fsync_interval.
+Replayed messages may be delivered twice (QoS 1 is at least once).
+"""
+
+# Import python in-built libraries
+import collections
+import logging
+import os
+import threading
+import time
+
+# Import libraries that had been installed with pip install
+import paho.mqtt.client as mqtt
+
+# Import self-written modules
+from segment_store import INDEX_EXTENSION, INDEX_RECORD, SEGMENT_EXTENSION, SegmentReader, SegmentStorage
+
+# Time window of the replay rate in seconds
+REPLAY_RATE_WINDOW = 10.0
+
+
+class PublishSpool:
+    """
+    Size capped FIFO of messages in segment files. Not thread safe,
+    used under the lock of the ReliablePublisher.
+
+    Args of constructor:
+        directory[string]:      Directory of the segments
+        (opt.) max_bytes[int]:  Maximum size of the spool, the oldest
+                                segments are dropped above it
+                                Default value: 1 GB
+        (opt.) fsync_batch[int]:
+                                Number of appended messages after
+                                which they are synced to disk
+                                Default value: 16
+        (opt.) fsync_interval[float]:
+                                Maximum time in seconds an appended
+                                message stays unsynced, see sync()
+                                Default value: 1.0
+
+    Returns of constructor:
+        A spool with the messages left in the directory
+    """
+
+    def __init__(self, directory, max_bytes=1024 * 1024 * 1024, fsync_batch=16, fsync_interval=1.0) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.fsync_batch = max(1, fsync_batch)
+        self.fsync_interval = fsync_interval
+        # Eight segments, so dropping one only loses an eighth of
+        #   the spool
+        self._storage = SegmentStorage(directory, segment_bytes=max(1024 * 1024, max_bytes // 8))
+
+        # Counters
+        self.spooled = 0
+        self.dropped = 0
+
+        # Segments oldest first and the position of the next message
+        #   to replay in the first one
+        with SegmentReader(directory) as reader:
+            self._segments = [segment_path for start_ms, segment_path, index_path in reader.segments()]
+        self._position = 0
+        self._write_path = None
+        # Appended messages that are not synced yet and the time of
+        #   the oldest one
+        self._unsynced = 0
+        self._unsynced_since = None
+        self._depth = sum(self._records(segment_path) for segment_path in self._segments)
+        self._bytes = sum(self._size(segment_path) for segment_path in self._segments)
+        if self._depth:
+            logging.info("Publish spool {} contains {} messages to replay.".format(directory, self._depth))
+
+    def append(self, timestamp_ms, image_id, message) -> None:
+        """
+        Appends a message. The messages are synced to disk every
+        fsync_batch messages or once the oldest unsynced message is
+        older than fsync_interval.
+
+        Args:
+            timestamp_ms[int]:      Timestamp of the image in ms since
+                                    epoch
+            image_id[string]:       Id of the image
+            message[bytes]:         Serialized message
+
+        Returns:
+            None
+        """
+        segment_path, size = self._storage.write(timestamp_ms, image_id, message)
+        # Readable for peek() right away, synced in batches
+        self._storage.flush()
+        self._unsynced += 1
+        if self._unsynced_since is None:
+            self._unsynced_since = time.monotonic()
+        if self._unsynced >= self.fsync_batch:
+            self.sync()
+        else:
+            self.sync(min_age=self.fsync_interval)
+        if segment_path != self._write_path:
+            self._write_path = segment_path
+            if segment_path not in self._segments:
+                self._segments.append(segment_path)
+        self._depth += 1
+        self._bytes += size
+        self.spooled += 1
+        self._enforce_limit()
+
+    def peek(self):
+        """
+        Oldest message that is not replayed yet.
+
+        Args:
+            None
+
+        Returns:
+            (timestamp_ms, image_id, message as bytes) or None if
+            the spool is empty
+        """
+        while self._segments:
+            segment_path = self._segments[0]
+            if self._position < self._records(segment_path):
+                return self._read(segment_path, self._position)
+            if segment_path == self._write_path:
+                return None
+            # Completely replayed
+            self._remove_first()
+        # Nothing left, e.g. an incomplete record after a crash
+        self._depth = 0
+        return None
+
+    def advance(self) -> None:
+        """
+        Marks the message returned by peek() as replayed. The spool
+        files are deleted once everything is replayed.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        self._position += 1
+        self._depth -= 1
+        if self._depth <= 0:
+            self._close_storage()
+            while self._segments:
+                self._remove_first()
+            self._depth = 0
+            self._bytes = 0
+
+    def sync(self, min_age=0.0) -> None:
+        """
+        Syncs the appended messages to disk, if there are any. Called
+        by append() and periodically by the ReliablePublisher.
+
+        Args:
+            (opt.) min_age[float]:  Only sync if the oldest unsynced
+                                    message is at least this old, in
+                                    seconds
+                                    Default value: 0.0
+
+        Returns:
+            None
+        """
+        if not self._unsynced or time.monotonic() - self._unsynced_since < min_age:
+            return
+        self._storage.sync()
+        self._unsynced = 0
+        self._unsynced_since = None
+
+    def pending(self) -> int:
+        """
+        Number of messages that are not replayed yet.
+
+        Args:
+            None
+
+        Returns:
+            Number of messages
+        """
+        return self._depth
+
+    def stats(self) -> dict:
+        """
+        Depth, size and counters of the spool.
+
+        Args:
+            None
+
+        Returns:
+            Dictionary with the counters
+        """
+        return {
+            'spool_depth': self._depth,
+            'spool_bytes': self._bytes,
+            'spooled': self.spooled,
+            'spool_dropped': self.dropped,
+        }
+
+    def close(self) -> None:
+        """
+        Syncs and closes the segment that is written. Spooled
+        messages stay on disk for the next start.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        self._close_storage()
+
+    def _close_storage(self) -> None:
+        # Closing syncs the segment
+        self._storage.close()
+        self._write_path = None
+        self._unsynced = 0
+        self._unsynced_since = None
+
+    def _enforce_limit(self) -> None:
+        while self._bytes > self.max_bytes and len(self._segments) > 1:
+            dropped = self._records(self._segments[0]) - self._position
+            self._depth -= dropped
+            self.dropped += dropped
+            self._remove_first()
+            logging.warning("Publish spool full, {} oldest messages dropped.".format(dropped))
+
+    def _remove_first(self) -> None:
+        segment_path = self._segments.pop(0)
+        self._bytes -= self._size(segment_path)
+        self._position = 0
+        if segment_path == self._write_path:
+            self._close_storage()
+        try:
+            self._storage.remove(segment_path)
+        except OSError:
+            logging.exception("Spool segment {} could not be deleted.".format(segment_path))
+
+    @staticmethod
+    def _index_path(segment_path) -> str:
+        return segment_path[:-len(SEGMENT_EXTENSION)] + INDEX_EXTENSION
+
+    def _records(self, segment_path) -> int:
+        try:
+            return os.path.getsize(self._index_path(segment_path)) // INDEX_RECORD.size
+        except OSError:
+            return 0
+
+    def _size(self, segment_path) -> int:
+        try:
+            return os.path.getsize(segment_path) + os.path.getsize(self._index_path(segment_path))
+        except OSError:
+            return 0
+
+    def _read(self, segment_path, position) -> tuple:
+        with open(self._index_path(segment_path), "rb") as index:
+            index.seek(position * INDEX_RECORD.size)
+            timestamp_ms, image_id, offset, length = INDEX_RECORD.unpack(index.read(INDEX_RECORD.size))
+        with open(segment_path, "rb") as segment:
+            segment.seek(offset)
+            message = segment.read(length)
+        return timestamp_ms, image_id.rstrip(b"\0").decode("utf-8"), message
+
+
+class ReliablePublisher:
+    """
+    Publishes messages with QoS 1 and a bounded window of
+    unacknowledged messages, spills them to a PublishSpool while the
+    broker is unreachable and replays the spool after the reconnect,
+    see module description.
+
+    The owner of the client must call set_connected() from the
+    on_connect and on_disconnect callbacks. The on_publish callback
+    of the client is used by the publisher.
+
+    Args of constructor:
+        client[mqtt.Client]:    Client that publishes the messages
+        topic[string]:          Topic of the messages
+        (opt.) qos[int]:        QoS level of the messages
+                                Default value: 1
+        (opt.) max_inflight[int]:
+                                Maximum number of unacknowledged
+                                messages
+                                Default value: 20
+        (opt.) spool[PublishSpool]:
+                                Spool for the messages that can not
+                                be published, None to drop them
+                                Default value: None
+        (opt.) window_timeout[float]:
+                                Maximum time in seconds to wait for
+                                space in the window before a message
+                                is spilled
+                                Default value: 5.0
+        (opt.) stall_timeout[float]:
+                                Time in seconds without any
+                                acknowledgment after which a full
+                                window is stalled, then messages are
+                                spilled without waiting
+                                Default value: 1.0
+
+    Returns of constructor:
+        A publisher that waits for the connection
+    """
+
+    def __init__(self, client, topic, qos=1, max_inflight=20, spool=None, window_timeout=5.0,
+                 stall_timeout=1.0) -> None:
+        self.client = client
+        self.topic = topic
+        self.qos = qos
+        self.max_inflight = max(1, max_inflight)
+        self.spool = spool
+        self.window_timeout = window_timeout
+        self.stall_timeout = stall_timeout
+        self.connected = False
+
+        # Counters
+        self.published = 0
+        self.acknowledged = 0
+        self.replayed = 0
+        self.dropped = 0
+        self._replay_times = collections.deque(maxlen=100000)
+
+        # Message ids of the unacknowledged messages and of the
+        #   messages acknowledged before publish() returned their id
+        self._inflight = 0
+        # Time of the last acknowledgment or of the first message in
+        #   an empty window, see _send()
+        self._progress = time.monotonic()
+        self._unacknowledged = set()
+        self._early_acknowledged = set()
+        self._condition = threading.Condition()
+        # Keeps the order of live and replayed messages
+        self._order_lock = threading.Lock()
+
+        self.client.max_inflight_messages_set(self.max_inflight)
+        self.client.on_publish = self._on_publish
+
+        self._running = True
+        self._replay_thread = None
+        if self.spool is not None:
+            self._replay_thread = threading.Thread(target=self._run_replay, name="replay", daemon=True)
+            self._replay_thread.start()
+
+    def publish(self, message, timestamp_ms, image_id) -> None:
+        """
+        Publishes a message or spills it to the spool. Blocks while
+        the window is full, at most window_timeout. A stalled window
+        (see stall_timeout) does not block.
+
+        Args:
+            message[str/bytes]:     Serialized message
+            timestamp_ms[int]:      Timestamp of the image in ms since
+                                    epoch
+            image_id[string]:       Id of the image
+
+        Returns:
+            None
+        """
+        with self._order_lock:
+            spooled = self.spool is not None and self.spool.pending() > 0
+            if not spooled and self._send(message):
+                return
+            self._spill(message, timestamp_ms, image_id)
+
+    def set_connected(self, connected) -> None:
+        """
+        Updates the connection state, to be called from the
+        on_connect and on_disconnect callbacks of the client.
+
+        Args:
+            connected[bool]:        Client is connected to the broker
+
+        Returns:
+            None
+        """
+        with self._condition:
+            self.connected = connected
+            self._condition.notify_all()
+
+    def stats(self) -> dict:
+        """
+        Window, replay and spool counters.
+
+        Args:
+            None
+
+        Returns:
+            Dictionary with the counters
+        """
+        now = time.monotonic()
+        replays = sum(1 for replay_time in self._replay_times if now - replay_time <= REPLAY_RATE_WINDOW)
+        stats = {
+            'inflight': self._inflight,
+            'published_qos': self.published,
+            'acknowledged': self.acknowledged,
+            'replayed': self.replayed,
+            'replay_rate': replays / REPLAY_RATE_WINDOW,
+            'publish_dropped': self.dropped,
+        }
+        if self.spool is not None:
+            stats.update(self.spool.stats())
+        return stats
+
+    def stop(self, timeout=10.0) -> None:
+        """
+        Stops the replay and waits until the messages in the window
+        are acknowledged. Spooled messages stay on disk.
+
+        Args:
+            (opt.) timeout[float]:  Maximum time in seconds to wait for
+                                    the acknowledgments
+                                    Default value: 10.0
+
+        Returns:
+            None
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+            while self._inflight > 0 and self.connected:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logging.warning("{} published messages not acknowledged.".format(self._inflight))
+                    break
+                self._condition.wait(remaining)
+        if self._replay_thread is not None:
+            self._replay_thread.join()
+        if self.spool is not None:
+            with self._order_lock:
+                self.spool.close()
+
+    def _send(self, message) -> bool:
+        return self._reserve() and self._transmit(message)
+
+    def _reserve(self) -> bool:
+        # Wait for space in the window, but only as long as the
+        #   broker acknowledges. A half-open connection never does,
+        #   so the message is spilled at once instead of stalling
+        #   the publishing stage.
+        with self._condition:
+            deadline = time.monotonic() + self.window_timeout
+            while self.connected and self._inflight >= self.max_inflight:
+                remaining = min(deadline, self._progress + self.stall_timeout) - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            if not self.connected or self._inflight >= self.max_inflight:
+                return False
+            if self._inflight == 0:
+                self._progress = time.monotonic()
+            self._inflight += 1
+        return True
+
+    def _release(self) -> None:
+        # Gives back a reserved space that was not used
+        with self._condition:
+            self._inflight -= 1
+            self._condition.notify_all()
+
+    def _transmit(self, message) -> bool:
+        # Publishes into a reserved space of the window. Not
+        #   published under the condition, paho calls on_publish
+        #   with its own locks held
+        info = self.client.publish(self.topic, message, qos=self.qos)
+        with self._condition:
+            if info.rc not in (mqtt.MQTT_ERR_SUCCESS, mqtt.MQTT_ERR_NO_CONN):
+                self._inflight -= 1
+                self._condition.notify_all()
+                return False
+            # MQTT_ERR_NO_CONN: the connection dropped just now, paho
+            #   keeps the message and sends it after the reconnect
+            self.published += 1
+            if info.mid in self._early_acknowledged:
+                self._early_acknowledged.discard(info.mid)
+                self._acknowledge()
+            else:
+                self._unacknowledged.add(info.mid)
+        return True
+
+    def _spill(self, message, timestamp_ms, image_id) -> None:
+        if self.spool is None:
+            self.dropped += 1
+            logging.warning("MQTT broker not reachable, image {} dropped.".format(image_id))
+            return
+        if isinstance(message, str):
+            message = message.encode("utf-8")
+        try:
+            self.spool.append(timestamp_ms, image_id, message)
+        except OSError:
+            self.dropped += 1
+            logging.exception("Image {} could not be spooled.".format(image_id))
+            return
+        with self._condition:
+            self._condition.notify_all()
+
+    def _on_publish(self, client, userdata, mid) -> None:
+        with self._condition:
+            if mid in self._unacknowledged:
+                self._unacknowledged.discard(mid)
+                self._acknowledge()
+            else:
+                self._early_acknowledged.add(mid)
+
+    def _acknowledge(self) -> None:
+        # Called with the condition held
+        self._inflight -= 1
+        self.acknowledged += 1
+        self._progress = time.monotonic()
+        self._condition.notify_all()
+
+    def _run_replay(self) -> None:
+        while True:
+            with self._condition:
+                if self._running and not (self.connected and self.spool.pending() > 0):
+                    self._condition.wait(self.spool.fsync_interval)
+                if not self._running:
+                    return
+                ready = self.connected and self.spool.pending() > 0
+            if not ready:
+                self._sync_spool()
+                continue
+
+            # The space in the window is reserved before the order
+            #   lock is taken, so publish() is not blocked while the
+            #   replay waits for acknowledgments
+            if self._reserve():
+                with self._order_lock:
+                    record = self.spool.peek()
+                    sent = record is not None and self._transmit(record[2])
+                    if sent:
+                        self.spool.advance()
+                        self.replayed += 1
+                        self._replay_times.append(time.monotonic())
+                        if self.spool.pending() == 0:
+                            logging.info("Publish spool replayed ({} messages).".format(self.replayed))
+                if sent:
+                    continue
+                if record is None:
+                    # Dropped in the meantime by the size limit of
+                    #   the spool
+                    self._release()
+                    continue
+
+            # Disconnected again or the window stays full
+            self._sync_spool()
+            with self._condition:
+                self._condition.wait(0.1)
+
+    def _sync_spool(self) -> None:
+        # Sync the last spilled messages, which did not fill a batch
+        with self._order_lock:
+            self.spool.sync(min_age=self.spool.fsync_interval)
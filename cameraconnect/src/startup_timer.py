@@ -0,0 +1,56 @@
+"""
+Measures the startup time of cameraconnect broken down by phase,
+e.g. imports, producer discovery and camera configuration. The
+report shows which phase slows down pod restarts and rollouts.
+"""
+
+# Import python in-built libraries
+import time
+
+
+class StartupTimer:
+    """
+    Records the duration of consecutive startup phases.
+
+    Args of constructor:
+        (opt.) start[float]:    time.perf_counter() at the start of
+                                the process, None for now
+                                Default value: None
+
+    Returns of constructor:
+        A timer without recorded phases
+    """
+
+    def __init__(self, start=None) -> None:
+        self.start = start if start is not None else time.perf_counter()
+        self.phases = []
+        self._last = self.start
+
+    def phase(self, name) -> None:
+        """
+        Ends the current phase. It started at the end of the
+        previous phase or the start of the timer.
+
+        Args:
+            name[string]:           Name of the phase
+
+        Returns:
+            None
+        """
+        now = time.perf_counter()
+        self.phases.append((name, (now - self._last) * 1000))
+        self._last = now
+
+    def report(self) -> str:
+        """
+        Summary of the total startup time and all phases.
+
+        Args:
+            None
+
+        Returns:
+            Report, e.g. "Startup took 812 ms (imports: 402 ms, ...)"
+        """
+        total_ms = (self._last - self.start) * 1000
+        phases = ", ".join("{}: {:.0f} ms".format(name, duration_ms) for name, duration_ms in self.phases)
+        return "Startup took {:.0f} ms ({})".format(total_ms, phases)
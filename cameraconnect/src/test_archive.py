@@ -0,0 +1,229 @@
+"""
+Tests of the image archive (archive.py).
+"""
+
+# Import python in-built libraries
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+# Import self-written modules
+from archive import (FileStorage, ImageArchiveWriter, image_file_name, is_day_directory_name,
+                     parse_image_file_name)
+
+# 2022-06-15T10:00:00.123 UTC
+TIMESTAMP_MS = 1655287200123
+
+
+class BlockingStorage:
+    """
+    Storage whose writes wait until they are released.
+    """
+
+    def __init__(self) -> None:
+        self.writing = threading.Event()
+        self.release = threading.Event()
+        self.written = []
+
+    def scan(self):
+        return []
+
+    def write(self, timestamp_ms, image_id, encoded):
+        self.writing.set()
+        self.release.wait()
+        self.written.append(image_id)
+        return image_id, len(encoded)
+
+    def sync(self):
+        pass
+
+    def remove(self, key):
+        return True
+
+    def close(self):
+        pass
+
+
+class TestFileNames(unittest.TestCase):
+
+    def test_round_trip(self):
+        name = image_file_name(TIMESTAMP_MS, ".jpg")
+
+        self.assertEqual(name, "2022-06-15T10_00_00_123000_00_00.jpg")
+        self.assertEqual(parse_image_file_name(name), TIMESTAMP_MS)
+        self.assertEqual(parse_image_file_name(os.path.join("/archive", "2022-06-15", name)), TIMESTAMP_MS)
+
+    def test_round_trip_full_second(self):
+        # isoformat() leaves out the microseconds
+        name = image_file_name(1655287200000, ".png")
+
+        self.assertEqual(name, "2022-06-15T10_00_00_00_00.png")
+        self.assertEqual(parse_image_file_name(name), 1655287200000)
+
+    def test_sequence_number(self):
+        for timestamp_ms in (TIMESTAMP_MS, 1655287200000):
+            name = image_file_name(timestamp_ms, ".jpg", sequence=2)
+
+            self.assertTrue(name.endswith("_00_00-2.jpg"), name)
+            self.assertEqual(parse_image_file_name(name), timestamp_ms)
+
+    def test_foreign_names(self):
+        for name in ("profile_1.prof", "notes.txt", "2022-06-15T10_00_00_abc_00_00.jpg", "a_b_c_d_e.jpg",
+                     "2022-06-15T10_00_00_123000_00_00-copy.jpg"):
+            self.assertIsNone(parse_image_file_name(name), name)
+
+    def test_day_directory_name(self):
+        self.assertTrue(is_day_directory_name("2022-06-15"))
+        for name in ("2022-6-15", "2022-06-15x", "spool", "2022-13-01"):
+            self.assertFalse(is_day_directory_name(name), name)
+
+
+class ArchiveTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+
+    def archived_files(self):
+        files = []
+        for root, directories, file_names in os.walk(self.path):
+            files.extend(os.path.relpath(os.path.join(root, name), self.path) for name in file_names)
+        return sorted(files)
+
+    def write_file(self, relative_path, data=b"x" * 10):
+        path = os.path.join(self.path, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+
+class TestFileStorage(ArchiveTestCase):
+
+    def test_write(self):
+        storage = FileStorage(self.path)
+        key, size = storage.write(TIMESTAMP_MS, "AA_1", b"\xff\xd8\xff")
+        storage.close()
+
+        self.assertEqual(key, os.path.join(self.path, "2022-06-15", "2022-06-15T10_00_00_123000_00_00.jpg"))
+        self.assertEqual(size, 3)
+        with open(key, "rb") as f:
+            self.assertEqual(f.read(), b"\xff\xd8\xff")
+
+    def test_scan_only_archived_images(self):
+        old = self.write_file(os.path.join("2022-06-14", image_file_name(TIMESTAMP_MS - 86400000, ".png")))
+        new = self.write_file(os.path.join("2022-06-15", image_file_name(TIMESTAMP_MS, ".jpg")))
+        # Flat layout of earlier versions
+        flat = self.write_file(image_file_name(TIMESTAMP_MS - 2 * 86400000, ".jpg"))
+        os.utime(flat, (500, 500))
+        os.utime(old, (1000, 1000))
+        os.utime(new, (2000, 2000))
+        self.write_file(os.path.join("2022-06-15", "notes.txt"))
+        self.write_file(os.path.join("profiles", image_file_name(TIMESTAMP_MS, ".jpg")))
+        self.write_file("notes.txt")
+
+        units = FileStorage(self.path).scan()
+
+        self.assertEqual(units, [(flat, 500, 10), (old, 1000, 10), (new, 2000, 10)])
+
+    def test_images_of_the_same_millisecond(self):
+        storage = FileStorage(self.path)
+        keys = [storage.write(TIMESTAMP_MS, "AA_{}".format(index), bytes([index]))[0] for index in range(3)]
+        storage.close()
+
+        self.assertEqual(len(set(keys)), 3)
+        self.assertEqual(os.path.basename(keys[1]), image_file_name(TIMESTAMP_MS, ".jpg", sequence=1))
+        for index, key in enumerate(keys):
+            with open(key, "rb") as f:
+                self.assertEqual(f.read(), bytes([index]))
+
+    def test_remove_empty_day(self):
+        storage = FileStorage(self.path)
+        key, size = storage.write(TIMESTAMP_MS, "AA_1", b"\x01")
+        storage.sync()
+        storage.remove(key)
+
+        self.assertEqual(os.listdir(self.path), [])
+
+
+class TestImageArchiveWriter(ArchiveTestCase):
+
+    def test_writes_submitted_images(self):
+        writer = ImageArchiveWriter(self.path)
+        for index in range(3):
+            writer.submit(TIMESTAMP_MS + index, "AA_{}".format(index), bytes([index]) * 4)
+        writer.stop()
+
+        self.assertEqual(len(self.archived_files()), 3)
+        stats = writer.stats()
+        self.assertEqual(stats['written'], 3)
+        self.assertEqual(stats['bytes_written'], 12)
+        self.assertEqual(stats['total_bytes'], 12)
+
+    def test_size_limit_deletes_oldest(self):
+        now_ms = int(time.time() * 1000)
+        writer = ImageArchiveWriter(self.path, max_bytes=250)
+        for index in range(5):
+            writer.submit(now_ms + index, "AA_{}".format(index), b"x" * 100)
+        writer.stop()
+
+        self.assertEqual(sorted(os.path.basename(path) for path in self.archived_files()),
+                         [image_file_name(now_ms + 3, ".jpg"), image_file_name(now_ms + 4, ".jpg")])
+        self.assertEqual(writer.deleted, 3)
+        self.assertEqual(writer.total_bytes, 200)
+
+    def test_age_limit(self):
+        now_ms = int(time.time() * 1000)
+        writer = ImageArchiveWriter(self.path, max_age=60)
+        writer.submit(now_ms - 120000, "AA_old", b"x")
+        writer.submit(now_ms, "AA_new", b"x")
+        writer.stop()
+
+        self.assertEqual([os.path.basename(path) for path in self.archived_files()],
+                         [image_file_name(now_ms, ".jpg")])
+
+    def test_earlier_runs_are_retained(self):
+        old = self.write_file(os.path.join("2022-06-15", image_file_name(TIMESTAMP_MS, ".jpg")), b"x" * 100)
+        foreign = [self.write_file(os.path.join("profiles", "cameraconnect_1.prof"), b"x" * 100),
+                   self.write_file(os.path.join("2022-06-15", "notes.txt"), b"x" * 100)]
+
+        writer = ImageArchiveWriter(self.path, max_bytes=150)
+        self.assertEqual(writer.total_bytes, 100)
+        writer.submit(int(time.time() * 1000), "AA_1", b"x" * 100)
+        writer.stop()
+
+        self.assertFalse(os.path.exists(old))
+        for path in foreign:
+            self.assertTrue(os.path.exists(path))
+        self.assertEqual(writer.total_bytes, 100)
+
+    def test_same_millisecond_is_counted_once(self):
+        writer = ImageArchiveWriter(self.path)
+        now_ms = int(time.time() * 1000)
+        for index in range(3):
+            writer.submit(now_ms, "AA_{}".format(index), b"x" * 10)
+        writer.stop()
+
+        self.assertEqual(len(self.archived_files()), 3)
+        self.assertEqual(writer.total_bytes, 30)
+        self.assertEqual(writer.total_bytes, sum(size for key, (timestamp, size) in writer._units.items()))
+
+    def test_full_queue_drops_oldest(self):
+        storage = BlockingStorage()
+        writer = ImageArchiveWriter(self.path, queue_depth=2, storage=storage)
+        writer.submit(TIMESTAMP_MS, "AA_0", b"x")
+        self.assertTrue(storage.writing.wait(1))
+        for index in range(1, 4):
+            writer.submit(TIMESTAMP_MS + index, "AA_{}".format(index), b"x")
+        storage.release.set()
+        writer.stop()
+
+        self.assertEqual(storage.written, ["AA_0", "AA_2", "AA_3"])
+        self.assertEqual(writer.stats()['dropped_writes'], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+"""
+Tests of the benchmark of the hot path (benchmark.py).
+"""
+
+# Import python in-built libraries
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+# Import libraries that had been installed with pip install
+import numpy as np
+import paho.mqtt.client as mqtt
+
+# Import self-written modules
+from benchmark import (StandInBroker, benchmark_convert, benchmark_publish, compare, measure_allocations,
+                       percentiles)
+from benchmark_codecs import synthetic_frame
+from image_codecs import create_codec
+from payload import PAYLOAD_FORMAT_BINARY
+
+
+class TestMeasurements(unittest.TestCase):
+
+    def test_percentiles(self):
+        self.assertEqual(percentiles(list(range(1, 101))), {'p50_ms': 50.5, 'p95_ms': 95.05, 'p99_ms': 99.01})
+
+    def test_allocations_that_are_kept(self):
+        kept = []
+        result = measure_allocations(lambda: kept.append(bytearray(1024)), 20)
+
+        self.assertGreaterEqual(result['allocated_peak_bytes'], 20 * 1024)
+        self.assertGreaterEqual(result['allocated_blocks_per_frame'], 1)
+
+    def test_no_allocations(self):
+        result = measure_allocations(lambda: None, 20)
+
+        self.assertLess(result['allocated_blocks_per_frame'], 0.5)
+
+
+class TestStandInBroker(unittest.TestCase):
+
+    def setUp(self):
+        self.broker = StandInBroker()
+        self.addCleanup(self.broker.stop)
+
+    def test_messages_are_acknowledged_and_counted(self):
+        acknowledged = threading.Event()
+        connected = threading.Event()
+        client = mqtt.Client()
+        client.on_connect = lambda *args: connected.set()
+        client.on_publish = lambda *args: acknowledged.set()
+        client.connect(self.broker.host, self.broker.port)
+        client.loop_start()
+        self.addCleanup(client.loop_stop)
+        self.addCleanup(client.disconnect)
+        self.assertTrue(connected.wait(5))
+
+        client.publish("benchmark/cameraconnect", b"x" * 300, qos=1)
+        client.publish("benchmark/cameraconnect", b"y" * 200, qos=0)
+
+        self.assertTrue(self.broker.wait_for(2, timeout=5))
+        self.assertTrue(acknowledged.wait(5))
+        self.assertEqual(self.broker.bytes, 500)
+        self.assertFalse(self.broker.wait_for(3, timeout=0.05))
+
+
+class TestScenarios(unittest.TestCase):
+
+    def test_publish(self):
+        broker = StandInBroker()
+        self.addCleanup(broker.stop)
+        result = benchmark_publish(broker, broker.host, broker.port, synthetic_frame(48, 64, 3), create_codec(),
+                                   PAYLOAD_FORMAT_BINARY, 1, 5)
+
+        self.assertTrue(result['complete'])
+        self.assertGreater(result['fps'], 0)
+        # The stand-in broker received the messages of the warm up
+        #   and of the measured frames
+        self.assertEqual(broker.bytes // broker.messages, result['bytes_per_frame'])
+        for key in ('p50_ms', 'encode_p99_ms', 'publish_p95_ms', 'allocated_peak_bytes'):
+            self.assertIn(key, result)
+
+    def test_convert(self):
+        result = benchmark_convert("Mono12p", 8, 16, 5)
+
+        self.assertGreater(result['fps'], 0)
+        # Scaled to 8 bit like in the GenICam camera
+        self.assertEqual(result['bytes_per_frame'], 8 * 16)
+        self.assertEqual(benchmark_convert("BayerRG8", 8, 16, 5)['bytes_per_frame'], 8 * 16 * 3)
+
+
+class TestCompare(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.baseline_path = os.path.join(directory, "before.json")
+
+    def test_slower_scenarios_are_marked(self):
+        baseline = [{'scenario': "convert 640x480 Mono8", 'fps': 100.0, 'cpu_ms_per_frame': 1.0},
+                    {'scenario': "convert 640x480 RGB8", 'fps': 100.0, 'cpu_ms_per_frame': 1.0}]
+        with open(self.baseline_path, "w") as f:
+            json.dump({'results': baseline}, f)
+        results = [{'scenario': "convert 640x480 Mono8", 'fps': 90.0, 'cpu_ms_per_frame': 1.1},
+                   {'scenario': "convert 640x480 RGB8", 'fps': 98.0, 'cpu_ms_per_frame': 1.0},
+                   {'scenario': "convert 640x480 Mono10p", 'fps': 50.0, 'cpu_ms_per_frame': 2.0}]
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            compare(results, self.baseline_path)
+        lines = output.getvalue().splitlines()
+
+        self.assertIn("-10.0%", lines[1])
+        self.assertTrue(lines[1].endswith("<-- slower"))
+        # Within the threshold
+        self.assertNotIn("slower", lines[2])
+        self.assertTrue(lines[3].endswith("new"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+"""
+Tests of the pool of reusable image arrays (buffer_pool.py).
+"""
+
+# Import python in-built libraries
+import threading
+import unittest
+
+# Import libraries that had been installed with pip install
+import numpy as np
+
+# Import self-written modules
+from buffer_pool import FrameBufferPool, peak_rss_mb
+from pixel_formats import PixelConverter
+
+
+class TestFrameBufferPool(unittest.TestCase):
+
+    def test_preallocated_arrays_are_reused(self):
+        pool = FrameBufferPool((4, 6, 3), preallocate=2)
+        first = pool.acquire()
+        pool.release(first)
+        second = pool.acquire()
+
+        self.assertIs(second, first)
+        self.assertEqual(second.shape, (4, 6, 3))
+        self.assertEqual(second.dtype, np.uint8)
+        self.assertEqual(pool.allocations, 2)
+        self.assertEqual(pool.reuses, 2)
+
+    def test_grows_with_frames_in_flight(self):
+        pool = FrameBufferPool((2, 2), preallocate=1)
+        arrays = [pool.acquire() for _ in range(3)]
+
+        self.assertEqual(len({id(array) for array in arrays}), 3)
+        self.assertEqual(pool.allocations, 3)
+        self.assertEqual(pool.in_use, 3)
+        for array in arrays:
+            pool.release(array)
+        stats = pool.stats()
+        self.assertEqual((stats['in_use'], stats['free']), (0, 3))
+        # No new allocations once the pool is large enough
+        for _ in range(10):
+            pool.release(pool.acquire())
+        self.assertEqual(pool.allocations, 3)
+
+    def test_foreign_arrays_are_dropped(self):
+        pool = FrameBufferPool((2, 2), dtype=np.uint16, preallocate=0)
+        arrays = [pool.acquire() for _ in range(3)]
+        # E.g. handed out in place of the pooled arrays before the
+        #   region of interest changed
+        pool.release(np.empty((3, 2), dtype=np.uint16))
+        pool.release(np.empty((2, 2), dtype=np.uint8))
+
+        self.assertEqual(pool.stats()['free'], 0)
+        # Still counted as given back
+        self.assertEqual(pool.in_use, 1)
+        pool.release(arrays[0])
+        self.assertEqual(pool.stats()['free'], 1)
+        self.assertEqual(pool.in_use, 0)
+
+    def test_thread_safe(self):
+        pool = FrameBufferPool((8, 8), preallocate=0)
+
+        def work():
+            for _ in range(500):
+                array = pool.acquire()
+                array[:] = 1
+                pool.release(array)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(pool.in_use, 0)
+        self.assertEqual(pool.allocations, pool.stats()['free'])
+        self.assertLessEqual(pool.allocations, 4)
+
+    def test_peak_rss(self):
+        self.assertGreater(peak_rss_mb(), 0)
+
+
+class TestConversionIntoPool(unittest.TestCase):
+
+    def test_buffer_is_converted_into_pooled_array(self):
+        pool = FrameBufferPool((2, 3, 1), preallocate=1)
+        # Buffers of the GenTL producer are read only
+        data = bytes(range(6))
+        out = pool.acquire()
+        image = PixelConverter("Mono8").convert(data, 2, 3, out=out)
+
+        self.assertIs(image, out)
+        np.testing.assert_array_equal(image[:, :, 0], [[0, 1, 2], [3, 4, 5]])
+        self.assertEqual(pool.allocations, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
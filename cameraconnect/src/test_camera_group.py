@@ -0,0 +1,101 @@
+"""
+Tests of the group of cameras served by one process
+(camera_group.py).
+"""
+
+# Import python in-built libraries
+import threading
+import unittest
+
+# Import self-written modules
+from camera_group import CameraGroup, disconnect_camera
+from frame import CaptureRequest
+from test_fakes import FakeCamera, FakePipeline
+
+
+class TestCameraGroup(unittest.TestCase):
+
+    def test_cameras_acquire_in_parallel(self):
+        barrier = threading.Barrier(3)
+        cams = [FakeCamera("AA_{}".format(index), barrier=barrier) for index in range(3)]
+        group = CameraGroup(cams)
+        request = CaptureRequest()
+        group.get_image(request)
+        group.disconnect()
+
+        self.assertFalse(barrier.broken)
+        # Every camera gets its own copy of the request of the
+        #   trigger
+        requests = [cam.requests[0] for cam in cams]
+        self.assertEqual(len(set(map(id, requests + [request]))), 4)
+        for copy in requests:
+            self.assertEqual((copy.correlation_id, copy.received_ms), (request.correlation_id, request.received_ms))
+
+    def test_failing_camera_does_not_stop_the_others(self):
+        cams = [FakeCamera("AA_0"), FakeCamera("AA_1", fail=True), FakeCamera("AA_2")]
+        group = CameraGroup(cams)
+        with self.assertLogs(level="ERROR") as logs:
+            group.get_image()
+        group.disconnect()
+
+        self.assertEqual(len(cams[0].requests), 1)
+        self.assertEqual(len(cams[2].requests), 1)
+        self.assertIn("AA_1", logs.output[0])
+        self.assertEqual(group.failures, [0, 1, 0])
+
+    def test_stats_and_readiness_per_camera(self):
+        cams = [FakeCamera("AA_0"), FakeCamera("AA_1")]
+        group = CameraGroup([cams[0], FakePipeline(cams[1])])
+        group.get_image()
+        self.assertTrue(group.is_ready())
+        cams[1].fail = True
+        with self.assertLogs(level="ERROR"):
+            group.get_image()
+        group.disconnect()
+
+        self.assertFalse(group.is_ready())
+        self.assertEqual(group.stats(), {
+            'AA_0': {'frames_published': 2, 'ready': 1, 'group_failures': 0},
+            'AA_1': {'frames_published': 1, 'ready': 0, 'group_failures': 1},
+        })
+
+    def test_close_keeps_the_cameras_connected(self):
+        cam = FakeCamera("AA_0")
+        group = CameraGroup([cam])
+        group.close()
+
+        self.assertEqual(cam.calls, [])
+        with self.assertRaises(RuntimeError):
+            group.get_image()
+
+    def test_finished_when_all_cameras_are_finished(self):
+        cams = [FakeCamera("AA_0", finished=True), FakeCamera("AA_1")]
+        group = CameraGroup(cams)
+        self.assertFalse(group.is_finished())
+        cams[1].finished = True
+        self.assertTrue(group.is_finished())
+        group.disconnect()
+
+    def test_paced_ns(self):
+        group = CameraGroup([FakeCamera("AA_0", paced_ns=5), FakePipeline(FakeCamera("AA_1")),
+                             FakeCamera("AA_2", paced_ns=7)])
+        self.assertEqual(group.paced_ns, 12)
+        group.disconnect()
+
+    def test_disconnect_stops_pipelines_first(self):
+        cams = [FakeCamera("AA_0"), FakeCamera("AA_1")]
+        group = CameraGroup([cams[0], FakePipeline(cams[1])])
+        group.disconnect()
+
+        self.assertEqual(cams[0].calls, ["disconnect"])
+        self.assertEqual(cams[1].calls, ["stop", "disconnect"])
+
+    def test_disconnect_camera(self):
+        cam = FakeCamera("AA_0")
+        disconnect_camera(FakePipeline(cam))
+
+        self.assertEqual(cam.calls, ["stop", "disconnect"])
+
+
+if __name__ == "__main__":
+    unittest.main()
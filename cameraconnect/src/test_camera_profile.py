@@ -0,0 +1,109 @@
+"""
+Tests of the cached configuration profile of a camera
+(camera_profile.py).
+"""
+
+# Import python in-built libraries
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+# Import self-written modules
+from camera_profile import CameraProfile
+
+DEVICE_ID = "devicemodul00_30_53_2B_87_9C"
+
+
+class TestCameraProfile(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, "profiles", "camera.json")
+
+    def test_features_of_device(self):
+        profile = CameraProfile()
+        self.assertIsNone(profile.features_of(DEVICE_ID))
+        profile.set_features(DEVICE_ID, ["Width", "Height"])
+
+        self.assertEqual(profile.features_of(DEVICE_ID), frozenset(["Width", "Height"]))
+        self.assertIsNone(profile.features_of("other"))
+
+    def test_applied_settings(self):
+        profile = CameraProfile()
+        profile.set_features(DEVICE_ID, ["Width"])
+        self.assertFalse(profile.is_applied("Width", 800))
+        profile.mark_applied("Width", 800)
+
+        self.assertTrue(profile.is_applied("Width", 800))
+        self.assertFalse(profile.is_applied("Width", 640))
+
+    def test_invalidate(self):
+        profile = CameraProfile()
+        profile.mark_applied("Width", 800)
+        profile.invalidate()
+
+        self.assertFalse(profile.is_applied("Width", 800))
+        # The value is kept to detect changes
+        self.assertEqual(profile.applied, {'Width': 800})
+
+    def test_other_device_discards_settings(self):
+        profile = CameraProfile()
+        profile.set_features(DEVICE_ID, ["Width"])
+        profile.mark_applied("Width", 800)
+        profile.set_features(DEVICE_ID, ["Width"])
+        self.assertTrue(profile.is_applied("Width", 800))
+        profile.set_features("other", ["Width"])
+
+        self.assertEqual(profile.applied, {})
+        self.assertFalse(profile.is_applied("Width", 800))
+
+    def test_save_and_load(self):
+        profile = CameraProfile(self.path)
+        profile.set_features(DEVICE_ID, ["Width", "PixelFormat"])
+        profile.mark_applied("PixelFormat", "Mono8")
+        profile.save()
+
+        with open(self.path) as f:
+            self.assertEqual(json.load(f), {'device_id': DEVICE_ID, 'features': ["PixelFormat", "Width"],
+                                            'applied': {'PixelFormat': "Mono8"}})
+        loaded = CameraProfile(self.path)
+        self.assertEqual(loaded.features_of(DEVICE_ID), frozenset(["Width", "PixelFormat"]))
+        self.assertEqual(loaded.applied, {'PixelFormat': "Mono8"})
+        # Loaded settings are read back from the camera once
+        self.assertFalse(loaded.is_applied("PixelFormat", "Mono8"))
+
+    def test_unchanged_profile_is_not_written(self):
+        profile = CameraProfile(self.path)
+        profile.set_features(DEVICE_ID, ["Width"])
+        profile.save()
+        modified = os.stat(self.path).st_mtime_ns
+        os.utime(self.path, ns=(0, 0))
+        loaded = CameraProfile(self.path)
+        loaded.save()
+
+        self.assertNotEqual(modified, 0)
+        self.assertEqual(os.stat(self.path).st_mtime_ns, 0)
+
+    def test_invalid_file_is_ignored(self):
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, "w") as f:
+            f.write('{"device_id": ')
+        with self.assertLogs(level="WARNING"):
+            profile = CameraProfile(self.path)
+
+        self.assertIsNone(profile.features)
+        self.assertEqual(profile.applied, {})
+
+    def test_without_path_nothing_is_written(self):
+        profile = CameraProfile()
+        profile.set_features(DEVICE_ID, ["Width"])
+        profile.save()
+
+        self.assertFalse(os.path.exists(self.path))
+
+
+if __name__ == "__main__":
+    unittest.main()
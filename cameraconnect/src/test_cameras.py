@@ -0,0 +1,282 @@
+"""
+Tests of the camera base class and the DummyCamera (cameras.py).
+"""
+
+# Import python in-built libraries
+import base64
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+# Import libraries that had been installed with pip install
+import cv2
+import numpy as np
+
+# Import self-written modules
+from buffer_pool import FrameBufferPool
+from cameras import (DUMMY_NOISE_AMPLITUDE, DUMMY_PIXEL_FORMAT_MONO8, DUMMY_VARIATION_NOISE, DUMMY_VARIATION_PATTERN,
+                     CamGeneral, DummyCamera)
+from frame import CaptureRequest
+from image_codecs import JpegCodec, RawCodec
+from payload import PAYLOAD_FORMAT_BINARY, decode_binary_payload
+
+
+class FakeArchive:
+
+    def __init__(self) -> None:
+        self.submitted = []
+
+    def submit(self, timestamp_ms, image_id, data):
+        self.submitted.append((timestamp_ms, image_id, bytes(data)))
+
+    def stop(self):
+        pass
+
+
+class CountingCodec(JpegCodec):
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.calls = 0
+
+    def encode(self, image):
+        self.calls += 1
+        return super().encode(image)
+
+
+class StaticCamera(CamGeneral):
+    """
+    Camera that returns pooled copies of one image.
+    """
+
+    def __init__(self, **kwargs) -> None:
+        super().__init__("localhost", 1883, "test/images", "AA", **kwargs)
+        rows = np.arange(24, dtype=np.uint8)[:, np.newaxis]
+        self.image = np.repeat((rows * 10 + np.arange(32, dtype=np.uint8))[:, :, np.newaxis], 3, axis=2)
+        self.buffer_pool = FrameBufferPool(self.image.shape)
+
+    def _acquire_image(self):
+        image = self.buffer_pool.acquire()
+        image[:] = self.image
+        return image
+
+
+class CameraTestCase(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch("cameras.mqtt.Client")
+        self.client_class = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = self.client_class.return_value
+
+    def published_messages(self):
+        return [call[0][1] for call in self.client.publish.call_args_list]
+
+
+class TestEncodeOnce(CameraTestCase):
+
+    def test_mqtt_and_archive_share_the_encoding(self):
+        codec = CountingCodec()
+        archive = FakeArchive()
+        cam = StaticCamera(codec=codec, archive=archive)
+        cam.get_image()
+
+        self.assertEqual(codec.calls, 1)
+        message = json.loads(self.published_messages()[0])
+        timestamp_ms, image_id, data = archive.submitted[0]
+        self.assertEqual(base64.b64decode(message['image']['image_bytes']), data)
+        self.assertEqual(message['image']['image_id'], image_id)
+        self.assertEqual(message['timestamp_ms'], timestamp_ms)
+
+    def test_binary_payload_carries_the_archived_bytes(self):
+        archive = FakeArchive()
+        cam = StaticCamera(payload_format=PAYLOAD_FORMAT_BINARY, archive=archive)
+        cam.get_image()
+
+        decoded = decode_binary_payload(self.published_messages()[0])
+        self.assertEqual(bytes(decoded['image_bytes']), archive.submitted[0][2])
+        decoded_image = cv2.imdecode(np.frombuffer(archive.submitted[0][2], dtype=np.uint8), cv2.IMREAD_COLOR)
+        self.assertEqual(decoded_image.shape, cam.image.shape)
+
+    def test_image_back_in_pool_after_encoding(self):
+        cam = StaticCamera(archive=FakeArchive())
+        frame = cam.acquire_frame()
+        self.assertEqual(cam.buffer_pool.in_use, 1)
+        cam.encode_frame(frame)
+
+        self.assertIsNone(frame.image)
+        self.assertEqual(cam.buffer_pool.in_use, 0)
+        self.assertEqual(frame.shape, cam.image.shape)
+
+    def test_raw_codec_copies_pooled_image_for_archive(self):
+        archive = FakeArchive()
+        cam = StaticCamera(payload_format=PAYLOAD_FORMAT_BINARY, codec=RawCodec(), archive=archive)
+        cam.get_image()
+        # The pooled array is reused and overwritten by the next
+        #   acquisition
+        cam.image[:] = 0
+        cam.get_image()
+
+        np.testing.assert_array_equal(np.frombuffer(archive.submitted[0][2], dtype=np.uint8),
+                                      StaticCamera(codec=RawCodec()).image.reshape(-1))
+
+    def test_already_encoded_frame_is_passed_through(self):
+        codec = CountingCodec()
+        archive = FakeArchive()
+        cam = StaticCamera(codec=codec, archive=archive)
+        frame = cam.acquire_frame()
+        frame.release_image()
+        frame.encoded = b"\xff\xd8\xffencoded"
+        cam.encode_frame(frame)
+        cam.publish_frame(frame)
+
+        self.assertEqual(codec.calls, 0)
+        self.assertEqual(archive.submitted[0][2], b"\xff\xd8\xffencoded")
+
+
+class TestCamGeneral(CameraTestCase):
+
+    def test_message_fields(self):
+        cam = StaticCamera()
+        request = CaptureRequest(correlation_id="trigger-1")
+        request.late = True
+        cam.get_image(request)
+
+        message = json.loads(self.published_messages()[0])
+        self.assertEqual(message['correlation_id'], "trigger-1")
+        self.assertTrue(message['late'])
+        self.assertTrue(message['image']['image_id'].startswith("AA_"))
+        self.assertEqual(set(message['stages']), {'trigger_ms', 'fetch_ms', 'convert_ms', 'encode_ms'})
+
+    def test_stages_are_traced(self):
+        cam = StaticCamera()
+        request = CaptureRequest()
+        frame = cam.acquire_frame(request)
+        cam.encode_frame(frame)
+        cam.publish_frame(frame)
+
+        times = [frame.stages[stage] for stage in ("trigger", "fetch", "convert", "encode", "publish")]
+        self.assertEqual(times[0], request.received_ms)
+        self.assertEqual(times, sorted(times))
+        stats = cam.stats()
+        self.assertAlmostEqual(stats['latency_ms_end_to_end_p50'], times[-1] - times[0])
+        self.assertEqual(cam.latency.histograms["end_to_end"].snapshot()[0][-1], 1)
+
+    def test_counters(self):
+        cam = StaticCamera()
+        cam._on_connect(self.client, None, None, 0)
+        cam.get_image()
+        cam.get_image()
+        stats = cam.stats()
+
+        self.assertEqual(stats['frames_captured'], 2)
+        self.assertEqual(stats['frames_published'], 2)
+        self.assertEqual(stats['bytes_sent'], sum(len(message) for message in self.published_messages()))
+        self.assertEqual(stats['mqtt_connected'], 1)
+        self.assertTrue(cam.is_ready())
+        self.assertFalse(cam.is_finished())
+
+    def test_unsupported_payload_format(self):
+        with self.assertRaises(SystemExit):
+            StaticCamera(payload_format="XML")
+
+
+class TestDummyCamera(CameraTestCase):
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.source_path = os.path.join(directory, "dummy_image.png")
+        columns = np.arange(200, dtype=np.uint8)[np.newaxis, :, np.newaxis]
+        self.source = np.ascontiguousarray(np.broadcast_to(columns, (100, 200, 3)))
+        self.source[:, :, 1] = 255 - self.source[:, :, 1]
+        cv2.imwrite(self.source_path, self.source)
+
+    def create_camera(self, **kwargs):
+        return DummyCamera("localhost", 1883, "test/images", "AA", source_path=self.source_path, **kwargs)
+
+    def test_static_image_is_not_copied(self):
+        cam = self.create_camera()
+        first = cam.acquire_frame()
+        second = cam.acquire_frame()
+
+        np.testing.assert_array_equal(first.image, self.source)
+        self.assertIs(first.image, second.image)
+        self.assertIsNone(cam.buffer_pool)
+
+    def test_size_and_mono8(self):
+        cam = self.create_camera(image_width=50, image_height=40, pixel_format=DUMMY_PIXEL_FORMAT_MONO8)
+        frame = cam.acquire_frame()
+
+        self.assertEqual(frame.image.shape, (40, 50, 1))
+        self.assertEqual(frame.image.dtype, np.uint8)
+
+    def test_pattern_moves_horizontally(self):
+        cam = self.create_camera(variation=DUMMY_VARIATION_PATTERN)
+        for frame_number in (1, 2):
+            frame = cam.acquire_frame()
+            # Shifted by 1 % of the width per frame
+            np.testing.assert_array_equal(frame.image, np.roll(self.source, 2 * frame_number, axis=1))
+            frame.release_image()
+
+        # The source stays unchanged
+        np.testing.assert_array_equal(cam.image, self.source)
+
+    def test_noise_changes_every_frame(self):
+        cam = self.create_camera(variation=DUMMY_VARIATION_NOISE)
+        first = cam.acquire_frame().image.copy()
+        second = cam.acquire_frame().image
+
+        self.assertFalse(np.array_equal(first, second))
+        # The scaled image plus the noise never overflows
+        difference = second.astype(np.int16) - cam.image
+        self.assertGreaterEqual(difference.min(), 0)
+        self.assertLessEqual(difference.max(), DUMMY_NOISE_AMPLITUDE)
+
+    def test_variations_reuse_pooled_arrays(self):
+        cam = self.create_camera(variation=DUMMY_VARIATION_PATTERN)
+        for _ in range(5):
+            cam.get_image()
+
+        stats = cam.buffer_pool.stats()
+        # Only the preallocated arrays
+        self.assertEqual(stats['allocations'], 3)
+        self.assertEqual(stats['reuses'], 5)
+        self.assertEqual(stats['in_use'], 0)
+        self.assertEqual(len(self.published_messages()), 5)
+
+    def test_target_fps(self):
+        cam = self.create_camera(target_fps=50)
+        start = time.monotonic()
+        for _ in range(6):
+            cam.acquire_frame()
+
+        # The first frame is delivered at once
+        self.assertGreaterEqual(time.monotonic() - start, 5 * 0.02 - 0.005)
+        self.assertEqual(cam.stats()['frames_generated'], 6)
+
+    def test_injected_timeouts(self):
+        cam = self.create_camera(timeout_rate=1, timeout_ms=10)
+        self.assertIsNone(cam.acquire_frame())
+        cam.get_image()
+
+        stats = cam.stats()
+        self.assertEqual((stats['timeouts'], stats['frames_generated']), (2, 0))
+        self.assertEqual(self.published_messages(), [])
+
+    def test_invalid_configuration(self):
+        with self.assertRaises(SystemExit):
+            self.create_camera(pixel_format="RGB8")
+        with self.assertRaises(SystemExit):
+            self.create_camera(variation="Flicker")
+        with self.assertRaises(SystemExit):
+            DummyCamera("localhost", 1883, "test/images", "AA", source_path=self.source_path + ".missing")
+
+
+if __name__ == "__main__":
+    unittest.main()
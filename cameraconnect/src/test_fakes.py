@@ -0,0 +1,311 @@
+"""
+Fakes of the cameras and of the GenICam device that are shared by
+the tests. The GenICam fakes can only be used if the GenICam
+libraries are installed.
+"""
+
+# Import python in-built libraries
+import contextlib
+import threading
+from types import SimpleNamespace
+
+# Import libraries that had been installed with pip install
+import numpy as np
+
+# Import self-written modules
+from frame import Frame
+
+# Import libraries that are only needed for GenICam
+try:
+    from genicam.gentl import TimeoutException
+except ImportError:
+    TimeoutException = None
+
+DEVICE_ID = "devicemodul00_30_53_2B_87_9C"
+
+DEVICE_FEATURES = {
+    'ChunkModeActive': True,
+    'Width': 64,
+    'Height': 48,
+    'WidthMax': 128,
+    'HeightMax': 96,
+    'PixelFormat': "Mono8",
+    'TriggerSelector': "FrameStart",
+    'TriggerMode': "Off",
+    'TriggerSource': "Line0",
+    'TriggerSoftware': None,
+    'UserSetSelector': "Default",
+    'UserSetLoad': None,
+}
+
+
+class FakeCamera:
+    """
+    Camera with the stage methods of CamGeneral. The images are
+    numbered in order of acquisition and the numbers of the
+    published images and of the images given back are recorded.
+
+    Args of constructor:
+        (opt.) mac_address[string]: Name of the camera
+        (opt.) events[list]:        Shared list that disconnect()
+                                    appends to, to check the order
+                                    of several components
+        (opt.) barrier[threading.Barrier]:
+                                    Barrier that every acquisition
+                                    waits for
+        (opt.) fail[bool]:          Acquisitions fail
+        (opt.) fail_encoding[set]:  Numbers of the images whose
+                                    encoding fails
+        (opt.) finished[bool]:      See CamGeneral.is_finished()
+        (opt.) ready[bool]:         See CamGeneral.is_ready()
+        (opt.) alive[bool]:         See CamGeneral.is_alive()
+        (opt.) paced_ns[int]:       See CamGeneral.paced_ns
+    """
+
+    def __init__(self, mac_address="AA", events=None, barrier=None, fail=False, fail_encoding=(), finished=False,
+                 ready=True, alive=True, paced_ns=0) -> None:
+        self.mac_address = mac_address
+        self.events = events
+        self.barrier = barrier
+        self.fail = fail
+        self.fail_encoding = set(fail_encoding)
+        self.finished = finished
+        self.ready = ready
+        self.alive = alive
+        self.paced_ns = paced_ns
+        self.requests = []
+        self.published = []
+        self.released = []
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def acquire_frame(self, request=None):
+        if self.barrier is not None:
+            # Only passes if all threads acquire at the same time
+            self.barrier.wait(timeout=5)
+        if self.fail:
+            raise RuntimeError("camera failed")
+        with self._lock:
+            index = len(self.requests)
+            self.requests.append(request)
+        frame = Frame(np.full((2, 2, 1), index, dtype=np.uint8), request=request, release=self._release)
+        frame.image_id = index
+        return frame
+
+    def encode_frame(self, frame):
+        if frame.image_id in self.fail_encoding:
+            raise RuntimeError("encoding failed")
+        frame.encoded = frame.image.tobytes()
+        frame.release_image()
+
+    def publish_frame(self, frame):
+        with self._lock:
+            self.published.append(frame.image_id)
+
+    def get_image(self, request=None):
+        frame = self.acquire_frame(request)
+        self.encode_frame(frame)
+        self.publish_frame(frame)
+
+    def is_finished(self):
+        return self.finished
+
+    def is_ready(self):
+        return self.ready and not self.fail
+
+    def is_alive(self):
+        return self.alive
+
+    def stats(self):
+        return {'frames_published': len(self.published)}
+
+    def disconnect(self):
+        self.calls.append("disconnect")
+        if self.events is not None:
+            self.events.append(("disconnect camera", self.mac_address))
+
+    def _release(self, image):
+        with self._lock:
+            self.released.append(int(image[0, 0, 0]))
+
+
+class FakePipeline:
+    """
+    FramePipeline that hands the triggers to its camera.
+    """
+
+    def __init__(self, cam) -> None:
+        self.cam = cam
+
+    def get_image(self, request=None):
+        self.cam.get_image(request)
+
+    def is_ready(self):
+        return self.cam.is_ready()
+
+    def stats(self):
+        return self.cam.stats()
+
+    def stop(self):
+        self.cam.calls.append("stop")
+
+
+class FakeNode:
+    """
+    Feature of a node map that counts the reads, writes and
+    executions.
+    """
+
+    def __init__(self, value) -> None:
+        self._value = value
+        self.reads = 0
+        self.writes = 0
+        self.executions = 0
+        self.on_execute = None
+
+    @property
+    def value(self):
+        self.reads += 1
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        self.writes += 1
+        self._value = value
+
+    def execute(self):
+        self.executions += 1
+        if self.on_execute is not None:
+            self.on_execute()
+
+
+class FakeNodeMap:
+
+    def __init__(self, features) -> None:
+        self.__dict__['_nodes'] = {name: FakeNode(value) for name, value in features.items()}
+        self.__dict__['listings'] = 0
+
+    def __getattr__(self, name):
+        try:
+            return self._nodes[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __dir__(self):
+        self.__dict__['listings'] += 1
+        return list(self._nodes)
+
+    def reset_counters(self):
+        self.__dict__['listings'] = 0
+        for node in self._nodes.values():
+            node.reads = node.writes = node.executions = 0
+
+
+class FakeDevice:
+    """
+    State of a camera that survives its image acquirers: the node
+    map, pending software triggers and injected failures.
+    """
+
+    def __init__(self, features=None) -> None:
+        self.node_map = FakeNodeMap(DEVICE_FEATURES if features is None else features)
+        self.pending_triggers = 0
+        self.fail_fetches = 0
+        self.fail_opens = 0
+        # Raised once by the next fetch
+        self.error = None
+        self.fetches = 0
+        # Buffers that were fetched and queued again
+        self.returned = 0
+        self.condition = threading.Condition()
+        if "TriggerSoftware" in dir(self.node_map):
+            self.node_map.TriggerSoftware.on_execute = self._trigger
+
+    def wait_until_returned(self, count, timeout=1.0) -> bool:
+        with self.condition:
+            return self.condition.wait_for(lambda: self.returned >= count, timeout)
+
+    def _trigger(self):
+        with self.condition:
+            self.pending_triggers += 1
+            self.condition.notify_all()
+
+
+class FakeImageAcquirer:
+    """
+    Image acquirer of harvesters. A free running device delivers a
+    buffer on every fetch, a triggered device waits for a software
+    trigger. The pixels of a buffer are the number of the fetch.
+    """
+
+    def __init__(self, device) -> None:
+        self.device = device
+        self.remote_device = SimpleNamespace(node_map=device.node_map)
+        self.num_buffers = 1
+        self.data_streams = []
+        self.running = False
+        self.destroyed = False
+
+    def start_acquisition(self):
+        self.running = True
+
+    def stop_acquisition(self):
+        self.running = False
+
+    def destroy(self):
+        self.running = False
+        self.destroyed = True
+
+    @contextlib.contextmanager
+    def fetch_buffer(self, timeout=None):
+        device = self.device
+        with device.condition:
+            if device.error is not None:
+                error, device.error = device.error, None
+                raise error
+            if not self.running or device.fail_fetches > 0:
+                device.fail_fetches = max(0, device.fail_fetches - 1)
+                raise TimeoutException("No buffer")
+            if device.node_map.TriggerMode._value == "On":
+                # A triggered camera only delivers triggered frames
+                if not device.condition.wait_for(lambda: device.pending_triggers > 0, timeout):
+                    raise TimeoutException("No trigger")
+                device.pending_triggers -= 1
+            device.fetches += 1
+            fetches = device.fetches
+        node_map = device.node_map
+        height, width = node_map.Height._value, node_map.Width._value
+        data = np.full(height * width, fetches % 256, dtype=np.uint8)
+        component = SimpleNamespace(data=data, height=height, width=width, data_format=node_map.PixelFormat._value)
+        yield SimpleNamespace(payload=SimpleNamespace(components=[component]), timestamp_ns=fetches)
+        with device.condition:
+            device.returned += 1
+            device.condition.notify_all()
+
+
+class FakeHarvester:
+
+    def __init__(self, device=None) -> None:
+        self.device = device if device is not None else FakeDevice()
+        self.files = []
+        self.device_info_list = [SimpleNamespace(id_=DEVICE_ID)]
+        self.acquirers = []
+        self.resets = 0
+
+    def add_file(self, path):
+        self.files.append(path)
+
+    def update(self):
+        self.device_info_list = [SimpleNamespace(id_=DEVICE_ID)]
+
+    def reset(self):
+        self.resets += 1
+        self.device_info_list = []
+
+    def create_image_acquirer(self, id_=None):
+        if self.device.fail_opens > 0:
+            self.device.fail_opens -= 1
+            raise RuntimeError("Device not reachable")
+        ia = FakeImageAcquirer(self.device)
+        self.acquirers.append(ia)
+        return ia
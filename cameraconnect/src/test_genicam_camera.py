@@ -0,0 +1,387 @@
+"""
+Tests of the GenICam camera (genicam_camera.py) with a simulated
+device. Skipped if the GenICam libraries are not installed.
+"""
+
+# Import python in-built libraries
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+# Import self-written modules
+from frame import CaptureRequest
+from test_fakes import DEVICE_FEATURES, FakeDevice, FakeHarvester, FakeNode
+
+# Import libraries that are only needed for GenICam
+try:
+    from genicam_camera import (ACQUISITION_MODE_FLUSH, ACQUISITION_MODE_SOFTWARE_TRIGGER, RECOVERY_DEVICE,
+                                RECOVERY_HARVESTER, RECOVERY_STREAM, GenICam, create_harvester)
+    GENICAM_AVAILABLE = True
+except ImportError:
+    GENICAM_AVAILABLE = False
+
+MAC_ADDRESS = "00:30:53:2B:87:9C"
+
+
+@unittest.skipUnless(GENICAM_AVAILABLE, "genicam is not installed")
+class GenICamTestCase(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch("cameras.mqtt.Client")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.harvester = FakeHarvester()
+        self.device = self.harvester.device
+
+    def create_camera(self, **kwargs):
+        kwargs.setdefault('harvester', self.harvester)
+        cam = GenICam("localhost", 1883, "test/images", MAC_ADDRESS, ["producer.cti"], **kwargs)
+        self.addCleanup(cam.disconnect)
+        return cam
+
+
+class TestSoftwareTrigger(GenICamTestCase):
+
+    def test_trigger_is_configured(self):
+        self.create_camera(acquisition_mode=ACQUISITION_MODE_SOFTWARE_TRIGGER)
+        node_map = self.device.node_map
+
+        self.assertEqual(node_map.TriggerSelector._value, "FrameStart")
+        self.assertEqual(node_map.TriggerMode._value, "On")
+        self.assertEqual(node_map.TriggerSource._value, "Software")
+
+    def test_one_trigger_and_fetch_per_image(self):
+        cam = self.create_camera(acquisition_mode=ACQUISITION_MODE_SOFTWARE_TRIGGER)
+        for _ in range(3):
+            frame = cam.acquire_frame()
+            self.assertEqual(frame.shape, (48, 64, 1))
+            frame.release_image()
+
+        self.assertEqual(self.device.node_map.TriggerSoftware.executions, 3)
+        # No buffer is flushed
+        self.assertEqual(self.device.fetches, 3)
+        self.assertEqual(cam.timeouts, 0)
+
+    def test_flush_fetches_two_buffers(self):
+        cam = self.create_camera(acquisition_mode=ACQUISITION_MODE_FLUSH)
+        cam.acquire_frame().release_image()
+
+        self.assertEqual(self.device.fetches, 2)
+        self.assertEqual(self.device.node_map.TriggerSoftware.executions, 0)
+
+    def test_fall_back_without_software_trigger(self):
+        features = {name: value for name, value in DEVICE_FEATURES.items() if name != "TriggerSoftware"}
+        self.harvester = FakeHarvester(FakeDevice(features))
+        self.device = self.harvester.device
+        with self.assertLogs(level="WARNING"):
+            cam = self.create_camera(acquisition_mode=ACQUISITION_MODE_SOFTWARE_TRIGGER)
+
+        self.assertEqual(cam.acquisition_mode, ACQUISITION_MODE_FLUSH)
+        self.assertEqual(self.device.node_map.TriggerMode._value, "Off")
+        self.assertIsNotNone(cam.acquire_frame())
+
+    def test_trigger_mode_is_undone(self):
+        cam = self.create_camera(acquisition_mode=ACQUISITION_MODE_SOFTWARE_TRIGGER)
+        # Same camera configured for another mode
+        cam.acquisition_mode = ACQUISITION_MODE_FLUSH
+        cam._apply_settings()
+
+        self.assertEqual(self.device.node_map.TriggerMode._value, "Off")
+
+    def test_unsupported_acquisition_mode(self):
+        with self.assertRaises(SystemExit):
+            self.create_camera(acquisition_mode="Burst")
+
+
+class TestLatencyTracing(GenICamTestCase):
+
+    def test_exposure_timestamp_of_buffer(self):
+        cam = self.create_camera(acquisition_mode=ACQUISITION_MODE_SOFTWARE_TRIGGER)
+        request = CaptureRequest()
+        frame = cam.acquire_frame(request)
+        frame.release_image()
+
+        # The fake buffers carry the number of the fetch
+        self.assertEqual(frame.exposure_ns, 1)
+        self.assertLessEqual(request.received_ms, frame.stages["fetch"])
+        self.assertLessEqual(frame.stages["fetch"], frame.stages["convert"])
+
+class TestSharedHarvester(GenICamTestCase):
+
+    def test_create_harvester(self):
+        with mock.patch("genicam_camera.Harvester", return_value=self.harvester):
+            harvester = create_harvester(["a.cti", "b.cti"])
+
+        self.assertIs(harvester, self.harvester)
+        self.assertEqual(harvester.files, ["a.cti", "b.cti"])
+
+    def test_no_producer(self):
+        with mock.patch("genicam_camera.Harvester", return_value=self.harvester):
+            with self.assertRaises(SystemExit):
+                create_harvester([])
+
+    def test_shared_harvester_is_not_reset(self):
+        with mock.patch("genicam_camera.Harvester") as harvester_class:
+            cam = self.create_camera()
+            cam.disconnect()
+
+        harvester_class.assert_not_called()
+        self.assertEqual(self.harvester.resets, 0)
+        self.assertTrue(self.harvester.acquirers[0].destroyed)
+
+    def test_own_harvester_is_reset(self):
+        with mock.patch("genicam_camera.Harvester", return_value=self.harvester):
+            cam = self.create_camera(harvester=None)
+        cam.disconnect()
+
+        self.assertEqual(self.harvester.resets, 1)
+
+    def test_unknown_mac_address(self):
+        self.harvester.device_info_list = [SimpleNamespace(id_="devicemodul00_0F_31_5C_D0_B5")]
+        with self.assertRaises(SystemExit):
+            with self.assertLogs(level="ERROR"):
+                self.create_camera()
+
+
+class TestRecovery(GenICamTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # Shorter backoff between failed recovery attempts
+        patcher = mock.patch("genicam_camera.RECOVERY_BACKOFF_BASE", 0.01)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def connected_camera(self, **kwargs):
+        cam = self.create_camera(acquisition_mode=ACQUISITION_MODE_SOFTWARE_TRIGGER, **kwargs)
+        cam._on_connect(None, None, None, 0)
+        return cam
+
+    def test_stream_restart(self):
+        cam = self.connected_camera()
+        self.device.fail_fetches = 1
+        with self.assertLogs(level="ERROR"):
+            frame = cam.acquire_frame()
+
+        self.assertIsNotNone(frame)
+        stats = cam.stats()
+        self.assertEqual(stats['timeouts'], 1)
+        self.assertEqual(stats['recoveries_' + RECOVERY_STREAM], 1)
+        self.assertEqual(stats['recoveries_' + RECOVERY_DEVICE], 0)
+        # The image acquirer is kept
+        self.assertEqual(len(self.harvester.acquirers), 1)
+        self.assertTrue(cam.is_ready())
+
+    def test_device_reopen(self):
+        cam = self.connected_camera()
+        self.device.fail_fetches = 2
+        with self.assertLogs(level="WARNING"):
+            frame = cam.acquire_frame()
+
+        self.assertIsNotNone(frame)
+        self.assertEqual(cam.recoveries[RECOVERY_DEVICE], 1)
+        self.assertTrue(self.harvester.acquirers[0].destroyed)
+        self.assertIs(cam.ia, self.harvester.acquirers[1])
+        # The settings survive in the device, nothing is written
+        #   again
+        self.assertEqual(self.device.node_map.TriggerMode.writes, 1)
+
+    def test_harvester_rebuild(self):
+        with mock.patch("genicam_camera.Harvester", return_value=self.harvester):
+            cam = self.connected_camera(harvester=None)
+            self.device.fail_fetches = 2
+            self.device.fail_opens = 1
+            # E.g. a power cycle reset the settings of the camera
+            self.device.node_map.TriggerMode.value = "Off"
+            with self.assertLogs(level="WARNING"):
+                frame = cam.acquire_frame()
+
+        self.assertIsNotNone(frame)
+        self.assertEqual(cam.recoveries[RECOVERY_HARVESTER], 1)
+        self.assertEqual(self.harvester.resets, 1)
+        self.assertEqual(self.device.node_map.TriggerMode._value, "On")
+
+    def test_recovery_after_destroyed_image_acquirer(self):
+        cam = self.connected_camera()
+        self.device.fail_fetches = 2
+        self.device.fail_opens = 1
+        with self.assertLogs(level="ERROR"):
+            self.assertIsNone(cam.acquire_frame())
+
+        # The shared Harvester is not rebuilt, the device is not open
+        self.assertIsNone(cam.ia)
+        self.assertFalse(cam.is_ready())
+        self.assertEqual(cam.recovery_failures, 1)
+
+        with self.assertLogs(level="INFO"):
+            frame = cam.acquire_frame()
+
+        self.assertIsNotNone(frame)
+        self.assertEqual(cam.recoveries[RECOVERY_DEVICE], 1)
+        self.assertEqual(cam.recoveries[RECOVERY_STREAM], 0)
+        self.assertTrue(cam.is_ready())
+
+    def test_transport_error_is_recovered(self):
+        cam = self.connected_camera()
+        fetch_buffer = cam.ia.fetch_buffer
+        errors = [RuntimeError("Incomplete buffer")]
+
+        def failing_fetch_buffer(timeout=None):
+            if errors:
+                raise errors.pop()
+            return fetch_buffer(timeout=timeout)
+
+        cam.ia.fetch_buffer = failing_fetch_buffer
+        with self.assertLogs(level="ERROR"):
+            frame = cam.acquire_frame()
+
+        self.assertIsNotNone(frame)
+        stats = cam.stats()
+        self.assertEqual((stats['transport_errors'], stats['timeouts']), (1, 0))
+        self.assertEqual(stats['recoveries_' + RECOVERY_STREAM], 1)
+
+    def test_unconvertible_image_is_dropped(self):
+        cam = self.connected_camera()
+        # E.g. changed by another application
+        self.device.node_map.PixelFormat._value = "Mono14"
+        with self.assertLogs(level="ERROR"):
+            self.assertIsNone(cam.acquire_frame())
+
+        stats = cam.stats()
+        self.assertEqual(stats['conversion_errors'], 1)
+        self.assertEqual(stats['recoveries_' + RECOVERY_STREAM], 0)
+        self.assertTrue(cam.is_ready())
+
+    def test_backoff_is_interrupted_by_disconnect(self):
+        cam = self.connected_camera()
+        self.device.fail_fetches = 1
+        # Many failed attempts, the next one waits for the maximum
+        #   backoff
+        cam._failed_attempts = 20
+        results = []
+        thread = threading.Thread(target=lambda: results.append(cam.acquire_frame()))
+        start = time.monotonic()
+        with self.assertLogs(level="ERROR"):
+            thread.start()
+            time.sleep(0.05)
+            cam.disconnect()
+            thread.join(5)
+
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertEqual(results, [None])
+
+
+class TestPixelFormats(GenICamTestCase):
+
+    def test_bayer_is_demosaiced_on_the_host(self):
+        cam = self.create_camera(pixel_format="BayerRG8")
+        frame = cam.acquire_frame()
+
+        self.assertEqual(self.device.node_map.PixelFormat._value, "BayerRG8")
+        self.assertEqual(frame.shape, (48, 64, 3))
+        # Converted into an array of the buffer pool
+        self.assertEqual(cam.buffer_pool.in_use, 1)
+        frame.release_image()
+
+    def test_set_image_channels_are_kept(self):
+        cam = self.create_camera(pixel_format="BayerRG8", image_channels=1)
+        frame = cam.acquire_frame()
+
+        self.assertEqual(frame.shape, (48, 64, 1))
+        self.assertEqual(cam.image_channels, 1)
+        self.assertEqual(cam.buffer_pool.in_use, 1)
+        frame.release_image()
+
+    def test_invalid_configuration(self):
+        with self.assertRaises(SystemExit):
+            self.create_camera(pixel_format="Mono14")
+        with self.assertRaises(SystemExit):
+            self.create_camera(image_channels=2)
+        with self.assertRaises(SystemExit):
+            self.create_camera(bit_depth=12)
+        # 16 bit images can only be encoded as PNG
+        with self.assertRaises(SystemExit):
+            self.create_camera(bit_depth=16)
+
+class TestExposure(GenICamTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.device.node_map._nodes['ExposureTimeAbs'] = FakeNode(5000.0)
+        self.device.node_map._nodes['ExposureAuto'] = FakeNode("Continuous")
+
+    def test_exposure_time_is_set(self):
+        self.create_camera(exposure_time=2000.0, exposure_auto="Off")
+
+        self.assertEqual(self.device.node_map.ExposureTimeAbs._value, 2000.0)
+        self.assertEqual(self.device.node_map.ExposureAuto._value, "Off")
+
+    def test_camera_keeps_exposure_time_without_value(self):
+        self.create_camera(exposure_auto="Continuous")
+
+        self.assertEqual(self.device.node_map.ExposureTimeAbs.writes, 0)
+        self.assertEqual(self.device.node_map.ExposureTimeAbs._value, 5000.0)
+
+
+class TestAppliedSettings(GenICamTestCase):
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.profile_path = os.path.join(directory, "camera.json")
+
+    def test_applied_settings_are_not_read_again(self):
+        cam = self.create_camera(pixel_format="Mono12p", image_width=32)
+        node_map = self.device.node_map
+        self.assertEqual((node_map.PixelFormat._value, node_map.Width._value), ("Mono12p", 32))
+        node_map.reset_counters()
+        cam._apply_settings()
+
+        self.assertEqual(node_map.PixelFormat.reads + node_map.PixelFormat.writes, 0)
+        self.assertEqual(node_map.Width.reads + node_map.Width.writes, 0)
+
+    def test_equal_value_is_not_written(self):
+        self.create_camera(pixel_format="Mono8")
+
+        self.assertEqual(self.device.node_map.PixelFormat.writes, 0)
+
+    def test_profile_of_earlier_run(self):
+        self.create_camera(pixel_format="Mono12p", profile_path=self.profile_path).disconnect()
+        node_map = self.device.node_map
+        node_map.reset_counters()
+        self.create_camera(pixel_format="Mono12p", profile_path=self.profile_path)
+
+        # The features are taken from the profile and the setting
+        #   is read back once without writing it
+        self.assertEqual(node_map.listings, 0)
+        self.assertEqual(node_map.PixelFormat.writes, 0)
+        self.assertGreaterEqual(node_map.PixelFormat.reads, 1)
+
+    def test_changed_setting_of_earlier_run(self):
+        self.create_camera(pixel_format="Mono12p", profile_path=self.profile_path).disconnect()
+        with self.assertLogs(level="INFO") as logs:
+            self.create_camera(pixel_format="Mono8", profile_path=self.profile_path)
+
+        self.assertEqual(self.device.node_map.PixelFormat._value, "Mono8")
+        self.assertTrue(any("PixelFormat changed from Mono12p to Mono8" in line for line in logs.output))
+
+    def test_user_set_invalidates_settings(self):
+        cam = self.create_camera(acquisition_mode=ACQUISITION_MODE_SOFTWARE_TRIGGER)
+        cam.user_set_selector = "UserSet1"
+        node_map = self.device.node_map
+        # The user set switches the trigger off
+        node_map.UserSetLoad.on_execute = lambda: setattr(node_map.TriggerMode, "_value", "Off")
+        cam._apply_settings()
+
+        self.assertEqual(node_map.UserSetLoad.executions, 1)
+        self.assertEqual(node_map.TriggerMode._value, "On")
+
+
+if __name__ == "__main__":
+    unittest.main()
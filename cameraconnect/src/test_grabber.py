@@ -0,0 +1,72 @@
+"""
+Tests of the newest frame grabber (grabber.py). Skipped if the
+GenICam libraries are not installed.
+"""
+
+# Import python in-built libraries
+import threading
+import unittest
+
+# Import self-written modules
+from test_fakes import DEVICE_FEATURES, FakeDevice, FakeImageAcquirer
+
+# Import libraries that are only needed for GenICam
+try:
+    from genicam.gentl import TimeoutException
+    from grabber import LatestFrameGrabber
+    GENICAM_AVAILABLE = True
+except ImportError:
+    GENICAM_AVAILABLE = False
+
+
+@unittest.skipUnless(GENICAM_AVAILABLE, "genicam is not installed")
+class TestLatestFrameGrabber(unittest.TestCase):
+
+    def setUp(self):
+        # A triggered device delivers a buffer on every deliver()
+        self.device = FakeDevice(dict(DEVICE_FEATURES, TriggerMode="On"))
+        self.ia = FakeImageAcquirer(self.device)
+        self.ia.start_acquisition()
+        self.released = []
+        self.grabber = LatestFrameGrabber(self.ia, convert=lambda component: int(component.data[0]) * 10,
+                                          release=self.released.append, fetch_timeout=0.05)
+        self.addCleanup(self.grabber.stop)
+
+    def deliver(self, count=1):
+        for _ in range(count):
+            self.device.node_map.TriggerSoftware.execute()
+
+    def test_waits_for_next_frame(self):
+        self.deliver()
+        self.assertTrue(self.device.wait_until_returned(1))
+        # Frame 1 was completed before the trigger, so the trigger
+        #   waits for the next one instead of getting a stale frame
+        threading.Timer(0.05, self.deliver).start()
+
+        self.assertEqual(self.grabber.wait_for_frame(1.0), 20)
+
+    def test_frames_nobody_took_are_released(self):
+        self.deliver(3)
+        self.assertTrue(self.device.wait_until_returned(3))
+        threading.Timer(0.05, self.deliver).start()
+        self.assertEqual(self.grabber.wait_for_frame(1.0), 40)
+        threading.Timer(0.05, self.deliver).start()
+        self.assertEqual(self.grabber.wait_for_frame(1.0), 50)
+
+        # The frames taken by a trigger belong to the caller
+        self.assertEqual(self.released, [10, 20, 30])
+        self.assertEqual(self.grabber.grabbed, 5)
+
+    def test_timeout(self):
+        with self.assertRaises(TimeoutException):
+            self.grabber.wait_for_frame(0.1)
+
+    def test_error_is_handed_to_the_trigger(self):
+        with self.assertLogs(level="ERROR"):
+            self.device.error = RuntimeError("stream lost")
+            with self.assertRaises(RuntimeError):
+                self.grabber.wait_for_frame(1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,163 @@
+"""
+Tests of the image codecs (image_codecs.py).
+"""
+
+# Import python in-built libraries
+import unittest
+
+# Import libraries that had been installed with pip install
+import cv2
+import numpy as np
+
+# Import self-written modules
+from benchmark_codecs import benchmark_codec, synthetic_frame
+from image_codecs import (CODEC_JPG, CODEC_PNG, CODEC_RAW, CODEC_TURBOJPEG, CODEC_WEBP, JpegCodec, PngCodec,
+                          RawCodec, WebpCodec, create_codec, detect_encoding, encoded_image_shape)
+
+
+def gradient_image(height=48, width=64, channels=3):
+    rows = np.arange(height, dtype=np.uint16)[:, np.newaxis]
+    columns = np.arange(width, dtype=np.uint16)[np.newaxis, :]
+    image = ((rows * 3 + columns * 2) % 256).astype(np.uint8)
+    return np.repeat(image[:, :, np.newaxis], channels, axis=2)
+
+
+class TestCreateCodec(unittest.TestCase):
+
+    def test_codec_by_name(self):
+        self.assertIsInstance(create_codec(CODEC_JPG), JpegCodec)
+        self.assertIsInstance(create_codec(CODEC_PNG), PngCodec)
+        self.assertIsInstance(create_codec(CODEC_WEBP), WebpCodec)
+        self.assertIsInstance(create_codec(CODEC_RAW), RawCodec)
+
+    def test_preset_settings(self):
+        codec = create_codec(CODEC_JPG, preset="Small")
+        self.assertEqual(codec.params, [cv2.IMWRITE_JPEG_QUALITY, 85, cv2.IMWRITE_JPEG_OPTIMIZE, 1])
+
+        codec = create_codec(CODEC_PNG, preset="Balanced")
+        self.assertEqual(codec.params, [cv2.IMWRITE_PNG_COMPRESSION, 3])
+
+        # The default preset keeps the defaults of OpenCV
+        self.assertEqual(create_codec(CODEC_WEBP).params, [])
+
+    def test_explicit_settings_override_preset(self):
+        codec = create_codec(CODEC_JPG, preset="Small", quality=60, optimize=False)
+        self.assertEqual(codec.params, [cv2.IMWRITE_JPEG_QUALITY, 60])
+
+        codec = create_codec(CODEC_PNG, preset="Small", compression=1)
+        self.assertEqual(codec.params, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+
+    def test_turbojpeg_falls_back_to_opencv(self):
+        try:
+            import turbojpeg  # noqa: F401
+            self.skipTest("PyTurboJPEG is installed")
+        except ImportError:
+            pass
+        with self.assertLogs(level="WARNING"):
+            codec = create_codec(CODEC_TURBOJPEG, quality=70)
+
+        self.assertIsInstance(codec, JpegCodec)
+        self.assertEqual(codec.params, [cv2.IMWRITE_JPEG_QUALITY, 70])
+
+    def test_unsupported(self):
+        with self.assertRaises(SystemExit):
+            create_codec("bmp")
+        with self.assertRaises(SystemExit):
+            create_codec(CODEC_JPG, preset="Tiny")
+
+
+class TestCodecs(unittest.TestCase):
+
+    def test_lossless_codecs(self):
+        image = gradient_image()
+        for name in (CODEC_PNG, CODEC_RAW):
+            codec = create_codec(name)
+            encoded = codec.encode(image)
+            if name == CODEC_PNG:
+                decoded = cv2.imdecode(encoded, cv2.IMREAD_UNCHANGED)
+            else:
+                decoded = np.frombuffer(encoded, dtype=np.uint8).reshape(image.shape)
+            np.testing.assert_array_equal(decoded, image)
+
+    def test_lossy_codecs_are_decodable(self):
+        image = gradient_image()
+        for name in (CODEC_JPG, CODEC_WEBP):
+            encoded = create_codec(name).encode(image)
+            decoded = cv2.imdecode(encoded, cv2.IMREAD_COLOR)
+            self.assertEqual(decoded.shape, image.shape)
+            self.assertLess(np.abs(decoded.astype(int) - image).mean(), 8)
+
+    def test_raw_does_not_copy_contiguous_images(self):
+        image = gradient_image(channels=1)
+        encoded = RawCodec().encode(image)
+
+        self.assertTrue(np.shares_memory(encoded, image))
+        self.assertFalse(RawCodec.copies_image)
+
+    def test_raw_copies_views(self):
+        image = gradient_image()[:, ::2]
+        encoded = RawCodec().encode(image)
+
+        np.testing.assert_array_equal(encoded, image.reshape(-1))
+
+
+class TestInspectEncodedImages(unittest.TestCase):
+
+    def test_detect_encoding(self):
+        image = gradient_image()
+        self.assertEqual(detect_encoding(JpegCodec().encode(image)), CODEC_JPG)
+        self.assertEqual(detect_encoding(PngCodec().encode(image)), CODEC_PNG)
+        self.assertEqual(detect_encoding(WebpCodec().encode(image)), CODEC_WEBP)
+        self.assertIsNone(detect_encoding(RawCodec().encode(image)))
+        self.assertIsNone(detect_encoding(b""))
+
+    def test_encoded_image_shape(self):
+        for channels in (1, 3):
+            image = gradient_image(height=30, width=50, channels=channels)
+            if channels == 1:
+                image = image[:, :, 0]
+            self.assertEqual(encoded_image_shape(JpegCodec().encode(image)), (30, 50, channels))
+            self.assertEqual(encoded_image_shape(PngCodec().encode(image)), (30, 50, channels))
+
+    def test_encoded_image_shape_of_webp(self):
+        image = gradient_image(height=30, width=50, channels=3)
+        # Lossy, lossless and the extended format with alpha
+        self.assertEqual(encoded_image_shape(WebpCodec(quality=80).encode(image)), (30, 50, 3))
+        self.assertEqual(encoded_image_shape(WebpCodec(quality=101).encode(image)), (30, 50, 3))
+        alpha = np.concatenate([image, np.full((30, 50, 1), 128, dtype=np.uint8)], axis=2)
+        for quality in (80, 101):
+            encoded = WebpCodec(quality=quality).encode(alpha)
+            self.assertEqual(encoded_image_shape(encoded), (30, 50, 4))
+            self.assertEqual(encoded_image_shape(encoded), cv2.imdecode(encoded, cv2.IMREAD_UNCHANGED).shape)
+
+    def test_encoded_image_shape_of_bytes(self):
+        encoded = JpegCodec(optimize=True).encode(gradient_image()).tobytes()
+        self.assertEqual(encoded_image_shape(encoded), (48, 64, 3))
+
+    def test_encoded_image_shape_unknown(self):
+        self.assertIsNone(encoded_image_shape(b"RIFF\x00\x00\x00\x00WEBP"))
+        self.assertIsNone(encoded_image_shape(b"\xff\xd8\xff"))
+        # Broken marker
+        self.assertIsNone(encoded_image_shape(b"\xff\xd8\x00\x00\x00\x00"))
+
+
+class TestCodecBenchmark(unittest.TestCase):
+
+    def test_synthetic_frame(self):
+        frame = synthetic_frame(40, 60, 3)
+
+        self.assertEqual(frame.shape, (40, 60, 3))
+        self.assertEqual(frame.dtype, np.uint8)
+        np.testing.assert_array_equal(frame, synthetic_frame(40, 60, 3))
+
+    def test_benchmark_codec(self):
+        frame = synthetic_frame(40, 60, 1)
+        result = benchmark_codec(RawCodec(), frame, 3)
+
+        self.assertEqual(result['bytes'], frame.nbytes)
+        self.assertEqual(result['ratio'], 1.0)
+        self.assertGreaterEqual(result['p95_ms'], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+"""
+Tests of the latency tracing of the frames (latency.py).
+"""
+
+# Import python in-built libraries
+import re
+import unittest
+
+# Import self-written modules
+from frame import CaptureRequest, Frame
+from latency import (STAGE_CONVERT, STAGE_ENCODE, STAGE_FETCH, STAGE_PUBLISH, STAGE_TRIGGER, LatencyTracker,
+                     new_correlation_id)
+
+
+def stages(trigger, fetch, convert, encode, publish):
+    return {STAGE_TRIGGER: trigger, STAGE_FETCH: fetch, STAGE_CONVERT: convert, STAGE_ENCODE: encode,
+            STAGE_PUBLISH: publish}
+
+
+class TestLatencyTracker(unittest.TestCase):
+
+    def test_latencies_between_stages(self):
+        tracker = LatencyTracker()
+        tracker.record(stages(1000.0, 1004.0, 1005.5, 1010.0, 1012.0))
+        stats = tracker.stats()
+
+        self.assertEqual(stats['latency_ms_fetch_p50'], 4.0)
+        self.assertEqual(stats['latency_ms_convert_p50'], 1.5)
+        self.assertEqual(stats['latency_ms_encode_p50'], 4.5)
+        self.assertEqual(stats['latency_ms_publish_p50'], 2.0)
+        self.assertEqual(stats['latency_ms_end_to_end_p99'], 12.0)
+
+    def test_percentiles(self):
+        tracker = LatencyTracker()
+        for total in range(1, 101):
+            tracker.record({STAGE_TRIGGER: 0.0, STAGE_PUBLISH: float(total)})
+        stats = tracker.stats()
+
+        self.assertAlmostEqual(stats['latency_ms_end_to_end_p50'], 50.5)
+        self.assertAlmostEqual(stats['latency_ms_end_to_end_p95'], 95.05)
+        self.assertAlmostEqual(stats['latency_ms_end_to_end_p99'], 99.01)
+
+    def test_missing_stages_are_skipped(self):
+        tracker = LatencyTracker()
+        # e.g. a continuous frame of a camera without convert stage
+        tracker.record({STAGE_TRIGGER: 0.0, STAGE_FETCH: 3.0, STAGE_ENCODE: 5.0, STAGE_PUBLISH: 6.0})
+
+        self.assertEqual(tracker.histograms[STAGE_FETCH].snapshot()[0][-1], 1)
+        self.assertEqual(tracker.histograms[STAGE_CONVERT].snapshot()[0][-1], 0)
+        self.assertEqual(tracker.histograms[STAGE_ENCODE].snapshot()[0][-1], 0)
+        self.assertEqual(tracker.stats()['latency_ms_convert_p50'], 0.0)
+
+    def test_histograms(self):
+        tracker = LatencyTracker()
+        tracker.record(stages(0.0, 3.0, 3.5, 8.0, 9.0))
+        counts, total = tracker.histograms["end_to_end"].snapshot()
+
+        self.assertEqual(total, 9.0)
+        # Buckets 1, 2.5 and 5 ms are below, 10 ms and above contain
+        #   the latency
+        self.assertEqual(counts[:5], [0, 0, 0, 1, 1])
+
+    def test_rolling_window(self):
+        tracker = LatencyTracker(size=10)
+        for total in (1000.0,) * 10 + (1.0,) * 10:
+            tracker.record({STAGE_TRIGGER: 0.0, STAGE_PUBLISH: total})
+
+        self.assertEqual(tracker.stats()['latency_ms_end_to_end_p99'], 1.0)
+        # The histograms keep every frame
+        self.assertEqual(tracker.histograms["end_to_end"].snapshot()[0][-1], 20)
+
+
+class TestCorrelationId(unittest.TestCase):
+
+    def test_generated_ids_are_unique(self):
+        ids = {new_correlation_id() for _ in range(100)}
+
+        self.assertEqual(len(ids), 100)
+        for correlation_id in ids:
+            self.assertTrue(re.fullmatch("[0-9a-f]{32}", correlation_id))
+
+    def test_request_keeps_id_of_trigger(self):
+        self.assertEqual(CaptureRequest(correlation_id=42).correlation_id, "42")
+        self.assertEqual(len(CaptureRequest().correlation_id), 32)
+
+    def test_frame_starts_at_trigger(self):
+        request = CaptureRequest()
+        frame = Frame(None, request=request)
+
+        self.assertEqual(frame.stages, {STAGE_TRIGGER: request.received_ms})
+        self.assertEqual(Frame(None).stages, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,175 @@
+"""
+Tests of the Prometheus metrics and health checks (metrics.py).
+"""
+
+# Import python in-built libraries
+import threading
+import unittest
+import urllib.error
+import urllib.request
+
+# Import self-written modules
+from metrics import METRIC_GAUGE, METRIC_HISTOGRAM, Histogram, MetricsRegistry, MetricsServer, rss_bytes
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_cumulative_buckets(self):
+        histogram = Histogram(buckets=(1, 5, 10))
+        for value in (0.5, 1, 3, 10, 50):
+            histogram.observe(value)
+        counts, total = histogram.snapshot()
+
+        # A value equal to a bound is counted in its bucket (le)
+        self.assertEqual(counts, [2, 3, 4, 5])
+        self.assertEqual(total, 64.5)
+
+    def test_thread_safe(self):
+        histogram = Histogram(buckets=(1,))
+
+        def observe():
+            for _ in range(1000):
+                histogram.observe(2)
+
+        threads = [threading.Thread(target=observe) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(histogram.snapshot(), ([0, 4000], 8000))
+
+
+class TestMetricsRegistry(unittest.TestCase):
+
+    def test_counters_and_gauges_of_stats(self):
+        registry = MetricsRegistry()
+        stats = {'frames_published': 3, 'queue_depth': 2, 'mqtt_connected': True, 'codec': "jpeg"}
+        registry.add_stats("camera", lambda: stats, {'camera': "cam/1"}, counters=("frames_published",))
+        lines = registry.render().splitlines()
+
+        self.assertIn("# TYPE cameraconnect_camera_frames_published_total counter", lines)
+        self.assertIn('cameraconnect_camera_frames_published_total{camera="cam/1"} 3.0', lines)
+        self.assertIn("# TYPE cameraconnect_camera_queue_depth gauge", lines)
+        self.assertIn("# HELP cameraconnect_camera_queue_depth queue depth of the camera", lines)
+        # Flags and texts are no metrics
+        self.assertFalse(any("mqtt_connected" in line or "codec" in line for line in lines))
+
+    def test_stats_are_read_at_scrape_time(self):
+        registry = MetricsRegistry()
+        stats = {'written': 1}
+        registry.add_stats("archive", lambda: stats)
+        stats['written'] = 5
+
+        self.assertIn("cameraconnect_archive_written 5.0", registry.render().splitlines())
+
+    def test_one_family_per_name(self):
+        registry = MetricsRegistry()
+        for topic in ("cam/1", "cam/2"):
+            registry.add_stats("camera", lambda: {'timeouts': 0}, {'camera': topic})
+        lines = registry.render().splitlines()
+
+        self.assertEqual(lines, ["# HELP cameraconnect_camera_timeouts timeouts of the camera",
+                                 "# TYPE cameraconnect_camera_timeouts gauge",
+                                 'cameraconnect_camera_timeouts{camera="cam/1"} 0.0',
+                                 'cameraconnect_camera_timeouts{camera="cam/2"} 0.0'])
+
+    def test_labels_are_escaped(self):
+        registry = MetricsRegistry(prefix="")
+        registry.add_collector(lambda: [("up", METRIC_GAUGE, "up", {'b': 'say "hi"', 'a': "C:\\"}, 1)])
+
+        self.assertIn('up{a="C:\\\\",b="say \\"hi\\""} 1.0', registry.render().splitlines())
+
+    def test_histogram(self):
+        histogram = Histogram(buckets=(1, 5))
+        histogram.observe(2)
+        registry = MetricsRegistry()
+        registry.add_collector(lambda: [("latency_ms", METRIC_HISTOGRAM, "latency", {'stage': "total"}, histogram)])
+        lines = registry.render().splitlines()
+
+        self.assertEqual(lines[1:], ["# TYPE cameraconnect_latency_ms histogram",
+                                     'cameraconnect_latency_ms_bucket{le="1.0",stage="total"} 0',
+                                     'cameraconnect_latency_ms_bucket{le="5.0",stage="total"} 1',
+                                     'cameraconnect_latency_ms_bucket{le="+Inf",stage="total"} 1',
+                                     'cameraconnect_latency_ms_sum{stage="total"} 2.0',
+                                     'cameraconnect_latency_ms_count{stage="total"} 1'])
+
+    def test_failing_collector_is_skipped(self):
+        registry = MetricsRegistry()
+
+        def failing():
+            raise RuntimeError("camera gone")
+
+        registry.add_collector(failing)
+        registry.add_stats("trigger", lambda: {'missed': 1})
+        with self.assertLogs(level="ERROR"):
+            text = registry.render()
+
+        self.assertIn("cameraconnect_trigger_missed 1.0", text)
+
+
+class TestMetricsServer(unittest.TestCase):
+
+    def setUp(self):
+        self.alive = True
+        self.ready = True
+        registry = MetricsRegistry()
+        registry.add_stats("camera", lambda: {'timeouts': 2})
+        with self.assertLogs(level="INFO"):
+            # Port chosen by the operating system
+            self.server = MetricsServer(registry, lambda: self.alive, self.check_ready, port=0, host="127.0.0.1")
+        self.addCleanup(self.server.stop)
+        self.port = self.server._httpd.server_address[1]
+
+    def check_ready(self):
+        if self.ready is None:
+            raise RuntimeError("check failed")
+        return self.ready
+
+    def get(self, path):
+        try:
+            with urllib.request.urlopen("http://127.0.0.1:{}{}".format(self.port, path), timeout=5) as response:
+                return response.status, response.read().decode()
+        except urllib.error.HTTPError as error:
+            return error.code, error.read().decode()
+
+    def test_metrics(self):
+        status, body = self.get("/metrics")
+
+        self.assertEqual(status, 200)
+        self.assertIn("cameraconnect_camera_timeouts 2.0", body)
+
+    def test_health_checks(self):
+        self.assertEqual(self.get("/healthz"), (200, "ok\n"))
+        self.assertEqual(self.get("/readyz?verbose=1"), (200, "ok\n"))
+        self.alive = False
+        self.ready = False
+
+        self.assertEqual(self.get("/healthz")[0], 503)
+        self.assertEqual(self.get("/readyz")[0], 503)
+
+    def test_failing_check(self):
+        self.ready = None
+        with self.assertLogs(level="ERROR"):
+            status, body = self.get("/readyz")
+
+        self.assertEqual(status, 500)
+
+    def test_unknown_path(self):
+        self.assertEqual(self.get("/")[0], 404)
+
+
+class TestRssBytes(unittest.TestCase):
+
+    def test_rss_of_process(self):
+        rss = rss_bytes()
+
+        self.assertGreater(rss, 1024 * 1024)
+        # An array of 64 MB is resident once it is written
+        data = b"\x01" * (64 * 1024 * 1024)
+        self.assertGreater(rss_bytes(), rss + 32 * 1024 * 1024)
+        del data
+
+
+if __name__ == "__main__":
+    unittest.main()
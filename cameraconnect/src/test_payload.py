@@ -0,0 +1,121 @@
+"""
+Tests of the serialization of the image messages (payload.py).
+"""
+
+# Import python in-built libraries
+import base64
+import json
+import struct
+import unittest
+
+# Import libraries that had been installed with pip install
+import numpy as np
+
+# Import self-written modules
+from latency import MESSAGE_STAGES
+from payload import (BINARY_HEADER, BINARY_MAGIC, BINARY_VERSION, decode_binary_payload, encode_binary_payload,
+                     encode_json_payload)
+
+ENCODED_IMAGE = np.frombuffer(b"\xff\xd8\xff" + bytes(range(256)) * 4, dtype=np.uint8)
+
+
+class TestBinaryPayload(unittest.TestCase):
+
+    def test_round_trip(self):
+        stages = {stage: 1655287200000.0 + index + 0.25 for index, stage in enumerate(MESSAGE_STAGES)}
+        payload = encode_binary_payload(1655287200123, "AA_1655287200123", ENCODED_IMAGE, (480, 640, 3),
+                                        encoding="png", late=True, correlation_id="trigger-7", stages=stages,
+                                        exposure_ns=123456789)
+        decoded = decode_binary_payload(bytes(payload))
+
+        self.assertEqual(decoded['version'], BINARY_VERSION)
+        self.assertEqual(decoded['timestamp_ms'], 1655287200123)
+        self.assertEqual(decoded['image_id'], "AA_1655287200123")
+        self.assertEqual((decoded['image_height'], decoded['image_width'], decoded['image_channels']),
+                         (480, 640, 3))
+        self.assertEqual(decoded['encoding'], "png")
+        self.assertTrue(decoded['late'])
+        self.assertEqual(decoded['correlation_id'], "trigger-7")
+        self.assertEqual(decoded['stages'], stages)
+        self.assertEqual(decoded['exposure_ns'], 123456789)
+        self.assertEqual(bytes(decoded['image_bytes']), ENCODED_IMAGE.tobytes())
+
+    def test_unknown_trace_fields_are_none(self):
+        payload = encode_binary_payload(1, "id", b"\x01\x02", (1, 2, 1))
+        decoded = decode_binary_payload(payload)
+
+        self.assertFalse(decoded['late'])
+        self.assertEqual(decoded['correlation_id'], "")
+        self.assertEqual(decoded['stages'], dict.fromkeys(MESSAGE_STAGES))
+        self.assertIsNone(decoded['exposure_ns'])
+        self.assertEqual(decoded['encoding'], "jpg")
+
+    def test_header_layout(self):
+        payload = encode_binary_payload(42, "ä", b"\x09", (3, 4, 1))
+        magic, version, header_length, timestamp_ms, height, width, channels, encoding, image_id_length = \
+            BINARY_HEADER.unpack_from(payload, 0)
+
+        self.assertEqual(magic, BINARY_MAGIC)
+        self.assertEqual(version, BINARY_VERSION)
+        self.assertEqual((timestamp_ms, height, width, channels), (42, 3, 4, 1))
+        self.assertEqual(encoding, b"jpg\0\0\0\0\0")
+        # The image id is counted in utf-8 bytes
+        self.assertEqual(image_id_length, 2)
+        self.assertEqual(payload[header_length:], b"\x09")
+        self.assertEqual(len(payload), header_length + 1)
+
+    def test_version_1_payload(self):
+        # Consumers of version 1 only know the fixed header and the
+        #   image id
+        image_id = b"id"
+        header_length = BINARY_HEADER.size + len(image_id)
+        payload = BINARY_HEADER.pack(BINARY_MAGIC, 1, header_length, 7, 1, 1, 1, b"jpg", len(image_id)) + \
+            image_id + b"\xaa\xbb"
+        decoded = decode_binary_payload(payload)
+
+        self.assertEqual(decoded['version'], 1)
+        self.assertEqual(decoded['image_id'], "id")
+        self.assertEqual(bytes(decoded['image_bytes']), b"\xaa\xbb")
+        self.assertNotIn('late', decoded)
+
+    def test_image_found_by_header_length(self):
+        # Fields appended to the header in later versions are skipped
+        payload = bytearray(encode_binary_payload(1, "id", b"\x01\x02\x03", (1, 3, 1)))
+        header_length = struct.unpack_from("!H", payload, 5)[0]
+        extended = payload[:header_length] + b"\xee" * 5 + payload[header_length:]
+        struct.pack_into("!H", extended, 5, header_length + 5)
+
+        self.assertEqual(bytes(decode_binary_payload(extended)['image_bytes']), b"\x01\x02\x03")
+
+    def test_wrong_magic(self):
+        payload = bytearray(encode_binary_payload(1, "id", b"\x01", (1, 1, 1)))
+        payload[:4] = b"JSON"
+
+        with self.assertRaises(ValueError):
+            decode_binary_payload(payload)
+
+
+class TestJsonPayload(unittest.TestCase):
+
+    def test_legacy_message(self):
+        message = json.loads(encode_json_payload(1655287200123, "AA_1", ENCODED_IMAGE, (480, 640, 3)))
+
+        self.assertEqual(message['timestamp_ms'], 1655287200123)
+        self.assertEqual(message['image']['image_id'], "AA_1")
+        self.assertEqual(base64.b64decode(message['image']['image_bytes']), ENCODED_IMAGE.tobytes())
+        self.assertEqual((message['image']['image_height'], message['image']['image_width'],
+                          message['image']['image_channels']), (480, 640, 3))
+        # jpg messages stay unchanged for existing consumers
+        self.assertNotIn('image_encoding', message['image'])
+
+    def test_encoding_and_fields(self):
+        message = json.loads(encode_json_payload(1, "id", b"\x01", (1, 1, 1), encoding="webp",
+                                                 fields={'late': True, 'correlation_id': "c"}))
+
+        self.assertEqual(message['image']['image_encoding'], "webp")
+        self.assertTrue(message['late'])
+        self.assertEqual(message['correlation_id'], "c")
+
+
+if __name__ == "__main__":
+    unittest.main()
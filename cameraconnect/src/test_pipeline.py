@@ -0,0 +1,150 @@
+"""
+Tests of the staged frame pipeline (pipeline.py).
+"""
+
+# Import python in-built libraries
+import threading
+import time
+import unittest
+
+# Import self-written modules
+from frame import CaptureRequest
+from pipeline import QUEUE_POLICY_BLOCK, QUEUE_POLICY_DROP_OLDEST, FramePipeline, StageQueue
+from test_fakes import FakeCamera
+
+
+class ReversedCamera(FakeCamera):
+    """
+    Camera that encodes the frames in reverse order of acquisition
+    to check that the pipeline still publishes them in order.
+    """
+
+    def encode_frame(self, frame):
+        # Earlier frames take longer to encode
+        time.sleep(max(0, 4 - frame.image_id) * 0.01)
+        super().encode_frame(frame)
+
+
+class TestStageQueue(unittest.TestCase):
+
+    def test_fifo(self):
+        queue = StageQueue(3, QUEUE_POLICY_BLOCK)
+        for item in range(3):
+            self.assertTrue(queue.put(item))
+
+        self.assertEqual(len(queue), 3)
+        self.assertEqual([queue.get() for _ in range(3)], [0, 1, 2])
+
+    def test_block_waits_for_space(self):
+        queue = StageQueue(1, QUEUE_POLICY_BLOCK)
+        queue.put("first")
+        put_done = threading.Event()
+        thread = threading.Thread(target=lambda: (queue.put("second"), put_done.set()))
+        thread.start()
+
+        self.assertFalse(put_done.wait(0.1))
+        self.assertEqual(queue.get(), "first")
+        self.assertTrue(put_done.wait(1))
+        thread.join()
+        self.assertEqual(queue.get(), "second")
+        self.assertEqual(queue.dropped, 0)
+
+    def test_drop_oldest(self):
+        dropped = []
+        queue = StageQueue(2, QUEUE_POLICY_DROP_OLDEST, on_drop=dropped.append)
+        for item in range(5):
+            self.assertTrue(queue.put(item))
+
+        self.assertEqual(dropped, [0, 1, 2])
+        self.assertEqual(queue.dropped, 3)
+        self.assertEqual([queue.get(), queue.get()], [3, 4])
+
+    def test_close(self):
+        queue = StageQueue(2, QUEUE_POLICY_BLOCK)
+        queue.put("queued")
+        queue.close()
+
+        self.assertFalse(queue.put("rejected"))
+        # Queued items can still be taken out
+        self.assertEqual(queue.get(), "queued")
+        self.assertIsNone(queue.get())
+
+    def test_close_wakes_blocked_put(self):
+        queue = StageQueue(1, QUEUE_POLICY_BLOCK)
+        queue.put("first")
+        results = []
+        thread = threading.Thread(target=lambda: results.append(queue.put("second")))
+        thread.start()
+        time.sleep(0.05)
+        queue.close()
+        thread.join(1)
+
+        self.assertEqual(results, [False])
+
+    def test_close_wakes_blocked_get(self):
+        queue = StageQueue(1, QUEUE_POLICY_BLOCK)
+        results = []
+        thread = threading.Thread(target=lambda: results.append(queue.get()))
+        thread.start()
+        time.sleep(0.05)
+        queue.close()
+        thread.join(1)
+
+        self.assertEqual(results, [None])
+
+    def test_unknown_policy(self):
+        with self.assertRaises(SystemExit):
+            StageQueue(1, "DropAll")
+
+
+class TestFramePipeline(unittest.TestCase):
+
+    def test_published_in_order_of_acquisition(self):
+        cam = ReversedCamera()
+        pipeline = FramePipeline(cam, encode_workers=4, queue_depth=8)
+        for _ in range(6):
+            pipeline.get_image(CaptureRequest())
+        pipeline.stop()
+
+        self.assertEqual(cam.published, list(range(6)))
+        self.assertEqual(sorted(cam.released), list(range(6)))
+        self.assertFalse(pipeline.is_alive())
+
+    def test_image_released_on_failed_encoding(self):
+        cam = ReversedCamera(fail_encoding={1, 3})
+        pipeline = FramePipeline(cam, encode_workers=2, queue_depth=8)
+        for _ in range(5):
+            pipeline.get_image()
+        with self.assertLogs(level="ERROR"):
+            pipeline.stop()
+
+        self.assertEqual(cam.published, [0, 2, 4])
+        # Every image went back to the pool exactly once
+        self.assertEqual(sorted(cam.released), list(range(5)))
+
+    def test_stats(self):
+        cam = FakeCamera()
+        cam.stats = lambda: {'frames': 0}
+        pipeline = FramePipeline(cam)
+        stats = pipeline.stats()
+        pipeline.stop()
+
+        self.assertEqual(stats['frames'], 0)
+        self.assertEqual(stats['dropped_capture_requests'], 0)
+        self.assertEqual(stats['dropped_frames'], 0)
+
+    def test_health_checks(self):
+        cam = FakeCamera()
+        cam.is_ready = lambda: False
+        pipeline = FramePipeline(cam)
+        alive = pipeline.is_alive()
+        ready = pipeline.is_ready()
+        pipeline.stop()
+
+        self.assertTrue(alive)
+        self.assertFalse(ready)
+        self.assertFalse(pipeline.is_alive())
+
+
+if __name__ == "__main__":
+    unittest.main()
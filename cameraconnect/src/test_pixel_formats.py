@@ -0,0 +1,239 @@
+"""
+Tests of the conversion of the GenICam pixel formats
+(pixel_formats.py).
+"""
+
+# Import python in-built libraries
+import unittest
+
+# Import libraries that had been installed with pip install
+import cv2
+import numpy as np
+
+# Import self-written modules
+from pixel_formats import (MONO_HIGH_BIT_FORMATS, PixelConverter, mono_most_significant_bytes, packing_group,
+                           unpack_mono)
+
+
+def pack(values, bits, packing) -> np.ndarray:
+    """
+    Reference packing of monochrome pixels, bit by bit as described
+    by the standards.
+    """
+    if packing is None:
+        return np.array(values, dtype="<u2").view(np.uint8)
+    if packing == "PFNC":
+        # Little endian bit stream
+        stream = 0
+        for index, value in enumerate(values):
+            stream |= int(value) << (bits * index)
+        return np.frombuffer(stream.to_bytes(len(values) * bits // 8, "little"), dtype=np.uint8)
+    # GigE: two pixels in three bytes
+    low_bits = bits - 8
+    data = []
+    for first, second in zip(values[0::2], values[1::2]):
+        first, second = int(first), int(second)
+        data += [first >> low_bits, (first & ((1 << low_bits) - 1)) | ((second & ((1 << low_bits) - 1)) << 4),
+                 second >> low_bits]
+    return np.array(data, dtype=np.uint8)
+
+
+def random_values(bits, pixels) -> np.ndarray:
+    values = np.random.RandomState(bits).randint(0, 1 << bits, pixels).astype(np.uint16)
+    # Extreme values of every bit position
+    values[:4] = (0, (1 << bits) - 1, 1, 1 << (bits - 1))
+    return values
+
+
+class TestPacking(unittest.TestCase):
+
+    def test_known_bytes(self):
+        # Two pixels 0xABC and 0x123
+        self.assertEqual(pack([0xABC, 0x123], 12, "PFNC").tolist(), [0xBC, 0x3A, 0x12])
+        self.assertEqual(pack([0xABC, 0x123], 12, "GigE").tolist(), [0xAB, 0x3C, 0x12])
+        # Four pixels 0x3FF, 0x000, 0x155, 0x2AA
+        self.assertEqual(pack([0x3FF, 0x000, 0x155, 0x2AA], 10, "PFNC").tolist(), [0xFF, 0x03, 0x50, 0x95, 0xAA])
+
+        for bits, packing in ((12, "PFNC"), (12, "GigE")):
+            np.testing.assert_array_equal(unpack_mono(pack([0xABC, 0x123], bits, packing), bits, packing, 2),
+                                          [0xABC, 0x123])
+        np.testing.assert_array_equal(unpack_mono(np.array([0xFF, 0x03, 0x50, 0x95, 0xAA], dtype=np.uint8), 10,
+                                                  "PFNC", 4), [0x3FF, 0x000, 0x155, 0x2AA])
+
+    def test_packing_groups(self):
+        self.assertEqual(packing_group(10, None), (1, 2))
+        self.assertEqual(packing_group(10, "PFNC"), (4, 5))
+        self.assertEqual(packing_group(12, "PFNC"), (2, 3))
+        self.assertEqual(packing_group(10, "GigE"), (2, 3))
+
+    def test_unpack_all_formats(self):
+        for pixel_format, (bits, packing) in MONO_HIGH_BIT_FORMATS.items():
+            with self.subTest(pixel_format=pixel_format):
+                values = random_values(bits, 64)
+                unpacked = unpack_mono(pack(values, bits, packing), bits, packing, 64)
+
+                self.assertEqual(unpacked.dtype, np.uint16)
+                np.testing.assert_array_equal(unpacked, values)
+
+    def test_most_significant_bytes_of_all_formats(self):
+        for pixel_format, (bits, packing) in MONO_HIGH_BIT_FORMATS.items():
+            with self.subTest(pixel_format=pixel_format):
+                values = random_values(bits, 64)
+                out = np.empty(64, dtype=np.uint8)
+                mono_most_significant_bytes(pack(values, bits, packing), bits, packing, 64, out)
+
+                np.testing.assert_array_equal(out, values >> (bits - 8))
+
+
+class TestMonoConversion(unittest.TestCase):
+
+    def convert(self, pixel_format, values, **kwargs):
+        bits, packing = MONO_HIGH_BIT_FORMATS[pixel_format]
+        converter = PixelConverter(pixel_format, **kwargs)
+        return converter.convert(pack(values, bits, packing), 4, 8)
+
+    def test_8_most_significant_bits(self):
+        for pixel_format, (bits, packing) in MONO_HIGH_BIT_FORMATS.items():
+            with self.subTest(pixel_format=pixel_format):
+                values = random_values(bits, 32)
+                image = self.convert(pixel_format, values)
+
+                self.assertEqual((image.shape, image.dtype), ((4, 8, 1), np.uint8))
+                np.testing.assert_array_equal(image.reshape(-1), values >> (bits - 8))
+                # The same bits as the default
+                np.testing.assert_array_equal(self.convert(pixel_format, values, bit_shift=bits - 8), image)
+
+    def test_bit_shift_rounds_and_saturates(self):
+        for pixel_format, (bits, packing) in MONO_HIGH_BIT_FORMATS.items():
+            with self.subTest(pixel_format=pixel_format):
+                values = random_values(bits, 32)
+                values[4:8] = (3, 5, 6, 7)
+                image = self.convert(pixel_format, values, bit_shift=1)
+
+                expected = np.clip(np.rint(values / 2), 0, 255)
+                np.testing.assert_array_equal(image.reshape(-1), expected)
+
+    def test_no_bit_shift(self):
+        values = random_values(10, 32)
+        image = self.convert("Mono10p", values, bit_shift=0)
+
+        np.testing.assert_array_equal(image.reshape(-1), np.minimum(values, 255))
+
+    def test_16_bit_depth(self):
+        for pixel_format, (bits, packing) in MONO_HIGH_BIT_FORMATS.items():
+            with self.subTest(pixel_format=pixel_format):
+                values = random_values(bits, 32)
+                image = self.convert(pixel_format, values, bit_depth=16)
+
+                self.assertEqual(image.dtype, np.uint16)
+                # Scaled to the full 16 bit range
+                np.testing.assert_array_equal(image.reshape(-1), values << (16 - bits))
+
+    def test_unpacked_by_producer(self):
+        # Some GenTL producers deliver packed formats as 16 bit
+        values = random_values(12, 32)
+        image = PixelConverter("Mono12p").convert(values, 4, 8)
+
+        np.testing.assert_array_equal(image.reshape(-1), values >> 4)
+
+
+class TestColorConversion(unittest.TestCase):
+
+    # Color of every pixel in BGR
+    COLOR = (50, 100, 200)
+
+    def mosaic(self, pattern, height=8, width=8):
+        # pattern gives the colors of the first two pixels of the
+        #   first two rows, e.g. "RGGB"
+        blue, green, red = self.COLOR
+        values = {'R': red, 'G': green, 'B': blue}
+        data = np.empty((height, width), dtype=np.uint8)
+        data[0::2, 0::2] = values[pattern[0]]
+        data[0::2, 1::2] = values[pattern[1]]
+        data[1::2, 0::2] = values[pattern[2]]
+        data[1::2, 1::2] = values[pattern[3]]
+        return data
+
+    def test_bayer_channel_order(self):
+        for pixel_format, pattern in (("BayerRG8", "RGGB"), ("BayerBG8", "BGGR"), ("BayerGR8", "GRBG"),
+                                      ("BayerGB8", "GBRG")):
+            with self.subTest(pixel_format=pixel_format):
+                image = PixelConverter(pixel_format).convert(self.mosaic(pattern), 8, 8)
+
+                self.assertEqual(image.shape, (8, 8, 3))
+                # A uniform color is demosaiced exactly inside the
+                #   border
+                np.testing.assert_array_equal(image[2:-2, 2:-2], np.broadcast_to(self.COLOR, (4, 4, 3)))
+
+    def test_rgb8(self):
+        rgb = np.random.RandomState(0).randint(0, 256, (4, 6, 3)).astype(np.uint8)
+        for pixel_format in ("RGB8", "RGB8Packed"):
+            with self.subTest(pixel_format=pixel_format):
+                image = PixelConverter(pixel_format).convert(rgb.reshape(-1), 4, 6)
+
+                np.testing.assert_array_equal(image, rgb[:, :, ::-1])
+
+    def test_copied_formats(self):
+        bgr = np.random.RandomState(0).randint(0, 256, (4, 6, 3)).astype(np.uint8)
+        # Padding at the end of the buffer is ignored
+        data = np.concatenate([bgr.reshape(-1), np.zeros(16, dtype=np.uint8)])
+        np.testing.assert_array_equal(PixelConverter("BGR8").convert(data, 4, 6), bgr)
+        np.testing.assert_array_equal(PixelConverter("Mono8").convert(data, 4, 6).reshape(-1), data[:24])
+
+    def test_yuv422_byte_orders(self):
+        # Two pixel pairs: dark and bright, with a reddish color
+        y = (40, 200, 90, 160)
+        u, v = 100, 180
+        uyvy = np.array([[u, y[0], v, y[1], u, y[2], v, y[3]]], dtype=np.uint8)
+        yuyv = np.array([[y[0], u, y[1], v, y[2], u, y[3], v]], dtype=np.uint8)
+        images = {}
+        for pixel_format, data in (("YUV422Packed", uyvy), ("YUV422_8_UYVY", uyvy), ("YUV422_YUYV_Packed", yuyv),
+                                   ("YUV422_8", yuyv)):
+            images[pixel_format] = PixelConverter(pixel_format).convert(data.reshape(-1), 1, 4)
+
+        for image in images.values():
+            np.testing.assert_array_equal(image, images["YUV422Packed"])
+        image = images["YUV422Packed"]
+        self.assertEqual(image.shape, (1, 4, 3))
+        # Brightness follows Y, red is stronger than blue
+        brightness = image.astype(int).sum(axis=2)[0]
+        self.assertEqual(list(np.argsort(brightness)), [0, 2, 3, 1])
+        self.assertTrue(np.all(image[0, :, 2] > image[0, :, 0]))
+
+
+class TestPixelConverter(unittest.TestCase):
+
+    def test_output(self):
+        self.assertEqual(PixelConverter("BayerRG8").output_shape(4, 6), (4, 6, 3))
+        self.assertEqual(PixelConverter("Mono12").output_shape(4, 6), (4, 6, 1))
+        self.assertEqual(PixelConverter("Mono12", bit_depth=16).dtype, np.uint16)
+        self.assertEqual(PixelConverter("Mono8", bit_depth=16).dtype, np.uint8)
+
+    def test_into_given_array(self):
+        out = np.zeros((4, 8, 1), dtype=np.uint8)
+        image = PixelConverter("Mono10Packed").convert(pack(random_values(10, 32), 10, "GigE"), 4, 8, out=out)
+
+        self.assertIs(image, out)
+
+    def test_set_channels(self):
+        bayer = np.arange(24, dtype=np.uint8)
+        mono = PixelConverter("BayerRG8", channels=1).convert(bayer, 4, 6)
+        color = PixelConverter("BayerRG8").convert(bayer, 4, 6)
+        np.testing.assert_array_equal(mono[:, :, 0], cv2.cvtColor(color, cv2.COLOR_BGR2GRAY))
+
+        converter = PixelConverter("Mono8", channels=3)
+        image = converter.convert(bayer, 4, 6)
+        self.assertEqual(converter.output_shape(4, 6), (4, 6, 3))
+        np.testing.assert_array_equal(image, np.repeat(bayer.reshape(4, 6, 1), 3, axis=2))
+
+    def test_unsupported(self):
+        with self.assertRaises(ValueError):
+            PixelConverter("Mono14")
+        with self.assertRaises(ValueError):
+            PixelConverter("Mono8", channels=2)
+        with self.assertRaises(ValueError):
+            PixelConverter("Mono12", bit_depth=12)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,144 @@
+"""
+Tests of the opt-in profiling of the frames (profiling.py).
+"""
+
+# Import python in-built libraries
+import json
+import os
+import pstats
+import shutil
+import tempfile
+import threading
+import time
+import tracemalloc
+import unittest
+
+# Import self-written modules
+from profiling import Profiler
+from test_fakes import FakeCamera, FakePipeline
+
+
+class ProfilerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.cam = FakeCamera()
+
+    def create_profiler(self, **kwargs):
+        profiler = Profiler([FakePipeline(self.cam)], self.directory, **kwargs)
+        self.addCleanup(profiler.stop)
+        return profiler
+
+    def wait_for_sessions(self, profiler, sessions, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while profiler.sessions < sessions:
+            if time.monotonic() > deadline:
+                self.fail("profiling session did not end")
+            time.sleep(0.01)
+
+    def written(self, suffix):
+        return [os.path.join(self.directory, file_name) for file_name in sorted(os.listdir(self.directory))
+                if file_name.endswith(suffix)]
+
+    def summary(self):
+        with open(self.written("_summary.json")[0]) as f:
+            return json.load(f)
+
+
+class TestProfiler(ProfilerTestCase):
+
+    def test_session_ends_after_frames(self):
+        profiler = self.create_profiler(frames=3)
+        with self.assertLogs(level="INFO") as logs:
+            self.assertTrue(profiler.start())
+            for _ in range(5):
+                self.cam.get_image()
+            self.wait_for_sessions(profiler, 1)
+
+        self.assertIn("Profile of 3 frames written", logs.output[-1])
+        summary = self.summary()
+        self.assertEqual(summary['frames'], 3)
+        self.assertEqual(summary['threads'], 1)
+        self.assertEqual(set(summary['stages']), {"acquire_frame", "encode_frame", "publish_frame"})
+        self.assertGreaterEqual(summary['stages']['publish_frame']['calls'], 3)
+        self.assertIn('mean_memory_change_bytes', summary['stages']['acquire_frame'])
+        self.assertEqual(len(self.cam.published), 5)
+
+    def test_results(self):
+        profiler = self.create_profiler(frames=1)
+        with self.assertLogs(level="INFO"):
+            profiler.start()
+            self.cam.get_image()
+            self.wait_for_sessions(profiler, 1)
+
+        functions = {function for filename, line, function in pstats.Stats(self.written(".pstats")[0]).stats}
+        self.assertIn("encode_frame", functions)
+        with open(self.written("_profile.txt")[0]) as f:
+            self.assertIn("cumulative", f.read())
+        with open(self.written("_memory.txt")[0]) as f:
+            self.assertTrue(f.readline().startswith("Allocations between start and end"))
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_no_wrappers_outside_of_sessions(self):
+        profiler = self.create_profiler(frames=1)
+        with self.assertLogs(level="INFO"):
+            attributes = set(self.cam.__dict__)
+            profiler.start()
+            self.assertIn("encode_frame", self.cam.__dict__)
+            self.cam.get_image()
+            self.wait_for_sessions(profiler, 1)
+
+        self.assertEqual(set(self.cam.__dict__), attributes)
+
+    def test_only_one_session(self):
+        profiler = self.create_profiler()
+        with self.assertLogs(level="INFO"):
+            profiler.start()
+        with self.assertLogs(level="WARNING"):
+            self.assertFalse(profiler.start())
+
+    def test_stop_ends_session_early(self):
+        profiler = self.create_profiler(frames=100, memory=False)
+        with self.assertLogs(level="INFO"):
+            profiler.start()
+            self.cam.get_image()
+            profiler.stop()
+
+        self.assertEqual(self.summary()['frames'], 1)
+        self.assertEqual(self.written("_memory.txt"), [])
+        self.assertNotIn('mean_memory_change_bytes', self.summary()['stages']['encode_frame'])
+        self.assertEqual(profiler.sessions, 1)
+        # Nothing to stop
+        profiler.stop()
+        self.assertEqual(profiler.sessions, 1)
+
+    def test_tracemalloc_of_others_is_kept(self):
+        tracemalloc.start()
+        self.addCleanup(tracemalloc.stop)
+        profiler = self.create_profiler(frames=1)
+        with self.assertLogs(level="INFO"):
+            profiler.start()
+            self.cam.get_image()
+            self.wait_for_sessions(profiler, 1)
+
+        self.assertTrue(tracemalloc.is_tracing())
+        self.assertEqual(self.written("_memory.txt"), [])
+
+    def test_stages_in_several_threads(self):
+        profiler = self.create_profiler(frames=2, memory=False)
+        self.cam.barrier = threading.Barrier(2)
+        with self.assertLogs(level="INFO"):
+            profiler.start()
+            threads = [threading.Thread(target=self.cam.get_image) for _ in range(2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.wait_for_sessions(profiler, 1)
+
+        self.assertEqual(self.summary()['threads'], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,220 @@
+"""
+Tests of the camera that replays an image archive
+(replay_camera.py).
+"""
+
+# Import python in-built libraries
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+# Import libraries that had been installed with pip install
+import cv2
+import numpy as np
+
+# Import self-written modules
+from archive import image_file_name
+from image_codecs import PngCodec, WebpCodec
+from payload import PAYLOAD_FORMAT_BINARY, decode_binary_payload
+from replay_camera import ReplayCamera
+from segment_store import SegmentStorage
+
+TIMESTAMP_MS = 1655287200000
+
+
+def encoded_image(value, extension=".jpg"):
+    image = np.full((8, 12, 3), value, dtype=np.uint8)
+    return cv2.imencode(extension, image)[1].tobytes()
+
+
+class ReplayTestCase(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch("cameras.mqtt.Client")
+        self.client = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+
+    def create_camera(self, **kwargs):
+        with self.assertLogs(level="INFO"):
+            cam = ReplayCamera("localhost", 1883, "test/images", "AA", self.path, **kwargs)
+        self.addCleanup(cam.disconnect)
+        return cam
+
+    def write_segments(self, offsets_ms):
+        storage = SegmentStorage(self.path)
+        for index, offset_ms in enumerate(offsets_ms):
+            storage.write(TIMESTAMP_MS + offset_ms, "AA_{}".format(index), encoded_image(index * 20))
+        storage.close()
+
+    def write_file(self, data, file_name, directory="2022-06-15"):
+        directory = os.path.join(self.path, directory)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, file_name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def replay_all(self, cam):
+        frames = []
+        with self.assertLogs(level="INFO"):
+            while True:
+                frame = cam.acquire_frame()
+                if frame is None:
+                    return frames
+                frames.append(frame)
+
+
+class TestReplayCamera(ReplayTestCase):
+
+    def test_segments_are_passed_through(self):
+        self.write_segments((0, 10, 20))
+        cam = self.create_camera(speed=0)
+        frames = self.replay_all(cam)
+
+        self.assertEqual([bytes(frame.encoded) for frame in frames], [encoded_image(value) for value in (0, 20, 40)])
+        self.assertEqual(frames[0].shape, (8, 12, 3))
+        self.assertIsNone(frames[0].image)
+        self.assertTrue(cam.is_finished())
+        stats = cam.stats()
+        self.assertEqual((stats['replay_frames'], stats['replay_passthrough'], stats['replay_decoded']), (3, 3, 0))
+
+    def test_passthrough_is_counted_when_replayed(self):
+        self.write_segments((0, 10, 20))
+        cam = self.create_camera(speed=0)
+        # All images are read ahead
+        while len(cam._queue) < 3:
+            time.sleep(0.01)
+        self.assertEqual(cam.stats()['replay_passthrough'], 0)
+
+        cam.acquire_frame()
+        self.assertEqual(cam.stats()['replay_passthrough'], 1)
+
+    def test_webp_is_passed_through(self):
+        for index in range(2):
+            self.write_file(encoded_image(index * 20, ".webp"), image_file_name(TIMESTAMP_MS + index, ".webp"))
+        cam = self.create_camera(speed=0, codec=WebpCodec())
+        frames = self.replay_all(cam)
+
+        self.assertEqual([frame.shape for frame in frames], [(8, 12, 3)] * 2)
+        stats = cam.stats()
+        self.assertEqual((stats['replay_passthrough'], stats['replay_decoded']), (2, 0))
+
+    def test_published_without_encoding_again(self):
+        self.write_segments((0,))
+        cam = self.create_camera(speed=0, payload_format=PAYLOAD_FORMAT_BINARY)
+        cam.get_image()
+
+        message = self.client.publish.call_args[0][1]
+        self.assertEqual(bytes(decode_binary_payload(message)['image_bytes']), encoded_image(0))
+
+    def test_files_in_order_of_timestamp(self):
+        self.write_file(encoded_image(40), image_file_name(TIMESTAMP_MS + 2000, ".jpg"), "2022-06-16")
+        self.write_file(encoded_image(0), image_file_name(TIMESTAMP_MS, ".jpg"))
+        self.write_file(encoded_image(20), image_file_name(TIMESTAMP_MS + 1000, ".jpg"))
+        self.write_file(b"notes", "readme.txt")
+        cam = self.create_camera(speed=0)
+        frames = self.replay_all(cam)
+
+        self.assertEqual([bytes(frame.encoded) for frame in frames], [encoded_image(value) for value in (0, 20, 40)])
+
+    def test_foreign_file_names_by_modification_time(self):
+        later = self.write_file(encoded_image(20), "a.jpg")
+        earlier = self.write_file(encoded_image(0), "b.jpg")
+        os.utime(earlier, (1000, 1000))
+        os.utime(later, (2000, 2000))
+        cam = self.create_camera(speed=0)
+
+        self.assertEqual([bytes(frame.encoded) for frame in self.replay_all(cam)],
+                         [encoded_image(0), encoded_image(20)])
+
+    def test_other_encoding_is_decoded(self):
+        self.write_file(encoded_image(0, ".png"), image_file_name(TIMESTAMP_MS, ".png"))
+        cam = self.create_camera(speed=0)
+        frame = self.replay_all(cam)[0]
+
+        np.testing.assert_array_equal(frame.image, np.zeros((8, 12, 3), dtype=np.uint8))
+        self.assertIsNone(frame.encoded)
+        self.assertEqual(cam.stats()['replay_decoded'], 1)
+
+    def test_same_encoding_as_codec_is_passed_through(self):
+        self.write_file(encoded_image(0, ".png"), image_file_name(TIMESTAMP_MS, ".png"))
+        cam = self.create_camera(speed=0, codec=PngCodec())
+
+        self.assertEqual(bytes(self.replay_all(cam)[0].encoded), encoded_image(0, ".png"))
+
+    def test_undecodable_image_is_skipped(self):
+        self.write_file(b"\xff\xd8\xff broken", image_file_name(TIMESTAMP_MS, ".jpg"))
+        self.write_file(encoded_image(0, ".png"), image_file_name(TIMESTAMP_MS + 1, ".png"))
+        cam = ReplayCamera("localhost", 1883, "test/images", "AA", self.path, speed=0)
+        self.addCleanup(cam.disconnect)
+        with self.assertLogs(level="WARNING") as logs:
+            frame = cam.acquire_frame()
+
+        self.assertIsNotNone(frame.image)
+        self.assertIn("could not be decoded", logs.output[0])
+
+    def test_loop(self):
+        self.write_segments((0, 10))
+        cam = self.create_camera(speed=1, loop=True)
+        start = time.monotonic()
+        frames = [cam.acquire_frame() for _ in range(5)]
+
+        self.assertEqual([bytes(frame.encoded) for frame in frames],
+                         [encoded_image(value) for value in (0, 20, 0, 20, 0)])
+        self.assertFalse(cam.is_finished())
+        # Every pass starts at once with its first image
+        self.assertLess(time.monotonic() - start, 0.2)
+
+    def test_invalid_configuration(self):
+        with self.assertRaises(SystemExit):
+            ReplayCamera("localhost", 1883, "test/images", "AA", os.path.join(self.path, "missing"))
+        with self.assertRaises(SystemExit):
+            ReplayCamera("localhost", 1883, "test/images", "AA", self.path, speed=-1)
+
+
+class TestReplayTiming(ReplayTestCase):
+
+    def replay_times(self, cam, count):
+        times = []
+        for _ in range(count):
+            cam.acquire_frame()
+            times.append(time.monotonic())
+        return [later - earlier for earlier, later in zip(times, times[1:])]
+
+    def test_recorded_timing(self):
+        self.write_segments((0, 100, 150))
+        cam = self.create_camera()
+        gaps = self.replay_times(cam, 3)
+
+        self.assertAlmostEqual(gaps[0], 0.1, delta=0.03)
+        self.assertAlmostEqual(gaps[1], 0.05, delta=0.03)
+        # The waited time is not counted as late by the trigger
+        self.assertGreaterEqual(cam.paced_ns, 0.12e9)
+        self.assertEqual(cam.stats()['replay_lag_ms'], 0.0)
+
+    def test_speed(self):
+        self.write_segments((0, 200, 400))
+        cam = self.create_camera(speed=4)
+        gaps = self.replay_times(cam, 3)
+
+        for gap in gaps:
+            self.assertAlmostEqual(gap, 0.05, delta=0.03)
+
+    def test_lag_of_slow_consumer(self):
+        self.write_segments((0, 10))
+        cam = self.create_camera()
+        cam.acquire_frame()
+        time.sleep(0.1)
+        cam.acquire_frame()
+
+        self.assertGreaterEqual(cam.stats()['replay_lag_ms'], 80)
+        self.assertEqual(cam.paced_ns, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
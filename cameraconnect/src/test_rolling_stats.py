@@ -0,0 +1,55 @@
+"""
+Tests of the rolling window of measurements (rolling_stats.py).
+"""
+
+# Import python in-built libraries
+import unittest
+from unittest import mock
+
+# Import libraries that had been installed with pip install
+import numpy as np
+
+# Import self-written modules
+from rolling_stats import RollingWindow
+
+
+class TestRollingWindow(unittest.TestCase):
+
+    def test_percentiles(self):
+        window = RollingWindow()
+        for value in range(1, 101):
+            window.add(float(value))
+        percentiles = window.percentiles()
+
+        self.assertEqual(window.count, 100)
+        self.assertAlmostEqual(percentiles['p50'], 50.5)
+        self.assertAlmostEqual(percentiles['p99'], 99.01)
+
+    def test_only_recent_values(self):
+        window = RollingWindow(size=10)
+        for value in range(100):
+            window.add(value)
+
+        self.assertEqual(window.count, 100)
+        self.assertEqual(window.percentiles((0,)), {'p0': 90.0})
+
+    def test_cached_until_a_value_is_added(self):
+        window = RollingWindow()
+        window.add(1.0)
+        with mock.patch("rolling_stats.np.percentile", wraps=np.percentile) as percentile:
+            first = window.percentiles()
+            first['p50'] = -1.0
+            self.assertEqual(window.percentiles(), {'p50': 1.0, 'p95': 1.0, 'p99': 1.0})
+            self.assertEqual(percentile.call_count, 1)
+            window.percentiles((0,))
+            window.add(3.0)
+            self.assertEqual(window.percentiles((0, 100)), {'p0': 1.0, 'p100': 3.0})
+
+        self.assertEqual(percentile.call_count, 3)
+
+    def test_empty(self):
+        self.assertEqual(RollingWindow().percentiles(), {'p50': 0.0, 'p95': 0.0, 'p99': 0.0})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,330 @@
+"""
+Tests of the asyncio runtime (runtime.py).
+"""
+
+# Import python in-built libraries
+import asyncio
+import os
+import signal
+import socket
+import threading
+import time
+import unittest
+from unittest import mock
+
+# Import libraries that had been installed with pip install
+import paho.mqtt.client as mqtt
+
+# Import self-written modules
+from camera_group import CameraGroup
+from latency import LatencyTracker
+from runtime import HEARTBEAT_TIMEOUT, AsyncioMqttHelper, AsyncRuntime
+from test_fakes import FakeCamera
+
+
+class FakeTrigger:
+
+    def __init__(self, events, ready=True) -> None:
+        self.events = events
+        self.ready = ready
+        self.mqtt_topic = "test/trigger"
+
+    def disconnect(self, drain=False, timeout=10.0):
+        self.events.append(("disconnect trigger", drain))
+
+    def is_ready(self):
+        return self.ready
+
+    def stats(self):
+        return {}
+
+
+class MeteredCamera:
+    """
+    Camera with the components that are exported as metrics.
+    """
+
+    def __init__(self, mqtt_topic) -> None:
+        self.mqtt_topic = mqtt_topic
+        self.latency = LatencyTracker()
+        self.archive = mock.Mock()
+        self.archive.stats.return_value = {'written': 4}
+        self.buffer_pool = None
+
+    def stats(self):
+        return dict(self.latency.stats(), frames_published=3, timeouts=1, replay_frames=2, replay_lag_ms=0.5)
+
+
+class MeteredPipeline:
+
+    def __init__(self, cam) -> None:
+        self.cam = cam
+
+    def stats(self):
+        return dict(self.cam.stats(), publish_queue_depth=2)
+
+
+class FakeContinuous:
+    """
+    Continuous trigger that runs until it is stopped, fails or
+    returns right away.
+    """
+
+    def __init__(self, events, finish=False, error=None) -> None:
+        self.events = events
+        self.error = error
+        self.stopped = threading.Event()
+        if finish:
+            self.stopped.set()
+
+    def run(self):
+        self.stopped.wait(5)
+        if self.error is not None:
+            raise self.error
+
+    def stop(self):
+        self.events.append(("stop continuous", None))
+        self.stopped.set()
+
+
+class RuntimeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.events = []
+
+    def create_runtime(self, cams=None, triggers=(), **kwargs):
+        if cams is None:
+            cams = [FakeCamera("cam0", events=self.events), FakeCamera("cam1", events=self.events)]
+        runtime = AsyncRuntime(cams, drain_timeout=1.0, **kwargs)
+        self.addCleanup(asyncio.set_event_loop, None)
+        self.addCleanup(runtime.executor.shutdown)
+        self.addCleanup(runtime.loop.close)
+        for trigger in triggers:
+            runtime.add_trigger(trigger)
+        return runtime
+
+    def run_runtime(self, runtime, continuous=None):
+        # Stops the loop if the runtime never shuts down
+        watchdog = runtime.loop.call_later(5, runtime.loop.stop)
+        runtime.run(continuous)
+        watchdog.cancel()
+        self.assertTrue(runtime._stopping, "runtime did not shut down")
+
+    def request_shutdown(self, runtime, delay=0.05):
+        runtime.loop.call_later(delay, asyncio.ensure_future, runtime.shutdown())
+
+
+class TestShutdown(RuntimeTestCase):
+
+    def test_triggers_are_drained_before_cameras_are_disconnected(self):
+        runtime = self.create_runtime(triggers=[FakeTrigger(self.events)])
+        self.request_shutdown(runtime)
+        self.run_runtime(runtime)
+
+        self.assertEqual(self.events, [("disconnect trigger", True), ("disconnect camera", "cam0"),
+                                       ("disconnect camera", "cam1")])
+        self.assertTrue(runtime.loop.is_closed())
+
+    def test_sigterm_shuts_down(self):
+        runtime = self.create_runtime(triggers=[FakeTrigger(self.events)])
+        runtime.loop.call_later(0.05, os.kill, os.getpid(), signal.SIGTERM)
+        with self.assertLogs(level="INFO") as logs:
+            self.run_runtime(runtime)
+
+        self.assertIn("Received signal {}.".format(signal.SIGTERM), "\n".join(logs.output))
+        self.assertEqual(len(self.events), 3)
+
+    def test_continuous_trigger_is_stopped_before_cameras(self):
+        runtime = self.create_runtime()
+        continuous = FakeContinuous(self.events)
+        self.request_shutdown(runtime)
+        self.run_runtime(runtime, continuous)
+
+        self.assertEqual(self.events, [("stop continuous", None), ("disconnect camera", "cam0"),
+                                       ("disconnect camera", "cam1")])
+
+    def test_camera_group_is_closed_before_cameras(self):
+        runtime = self.create_runtime()
+        continuous = FakeContinuous(self.events)
+        continuous.cam = CameraGroup(runtime.cams)
+        close = continuous.cam.close
+        continuous.cam.close = lambda: (self.events.append(("close group", None)), close())
+        self.request_shutdown(runtime)
+        self.run_runtime(runtime, continuous)
+
+        self.assertEqual(self.events, [("stop continuous", None), ("close group", None),
+                                       ("disconnect camera", "cam0"), ("disconnect camera", "cam1")])
+        self.assertTrue(continuous.cam._executor._shutdown)
+
+    def test_finished_continuous_trigger_shuts_down(self):
+        runtime = self.create_runtime()
+        start = time.monotonic()
+        with self.assertLogs(level="INFO") as logs:
+            self.run_runtime(runtime, FakeContinuous(self.events, finish=True))
+
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertIn("Continuous trigger finished.", "\n".join(logs.output))
+        self.assertIn(("disconnect camera", "cam1"), self.events)
+
+    def test_failed_continuous_trigger_shuts_down(self):
+        runtime = self.create_runtime()
+        continuous = FakeContinuous(self.events, finish=True, error=RuntimeError("camera failed"))
+        with self.assertLogs(level="ERROR") as logs:
+            self.run_runtime(runtime, continuous)
+
+        self.assertIn("Continuous trigger failed.", logs.output[0])
+        self.assertIn(("disconnect camera", "cam0"), self.events)
+
+    def test_failed_disconnect_still_stops_the_loop(self):
+        cam = FakeCamera("cam0", events=self.events)
+        cam.disconnect = mock.Mock(side_effect=RuntimeError("camera failed"))
+        runtime = self.create_runtime(cams=[cam])
+        self.request_shutdown(runtime)
+        with self.assertLogs(level="ERROR") as logs:
+            self.run_runtime(runtime)
+
+        self.assertIn("Shutdown failed.", logs.output[0])
+        self.assertTrue(runtime.loop.is_closed())
+
+
+class TestHealth(RuntimeTestCase):
+
+    def test_ready(self):
+        trigger = FakeTrigger(self.events)
+        runtime = self.create_runtime(triggers=[trigger])
+        self.assertTrue(runtime.is_ready())
+        trigger.ready = False
+        self.assertFalse(runtime.is_ready())
+        trigger.ready = True
+        runtime.cams[0].ready = False
+        self.assertFalse(runtime.is_ready())
+
+    def test_alive(self):
+        runtime = self.create_runtime()
+        self.assertTrue(runtime.is_alive())
+        runtime.cams[1].alive = False
+        self.assertFalse(runtime.is_alive())
+
+    def test_stalled_event_loop_is_not_alive(self):
+        runtime = self.create_runtime()
+        runtime._heartbeat = time.monotonic() - HEARTBEAT_TIMEOUT - 1
+        self.assertFalse(runtime.is_alive())
+
+    def test_shutting_down_is_alive_but_not_ready(self):
+        runtime = self.create_runtime()
+        runtime.cams[0].alive = False
+        runtime._stopping = True
+
+        self.assertTrue(runtime.is_alive())
+        self.assertFalse(runtime.is_ready())
+
+
+class TestMetrics(RuntimeTestCase):
+
+    def test_components_are_exported(self):
+        cam = MeteredCamera("cam/1")
+        runtime = self.create_runtime(cams=[MeteredPipeline(cam), MeteredCamera("cam/2")],
+                                      triggers=[FakeTrigger(self.events)])
+        runtime.triggers[0].stats = lambda: {'missed': 2}
+        cam.latency.record({'trigger': 0.0, 'publish': 7.0})
+        lines = runtime._create_registry().render().splitlines()
+
+        self.assertIn('cameraconnect_camera_frames_published_total{camera="cam/1"} 3.0', lines)
+        self.assertIn('cameraconnect_camera_publish_queue_depth{camera="cam/1"} 2.0', lines)
+        self.assertIn('cameraconnect_camera_timeouts_total{camera="cam/2"} 1.0', lines)
+        self.assertIn('cameraconnect_archive_written_total{camera="cam/1"} 4.0', lines)
+        self.assertIn('cameraconnect_trigger_missed_total{topic="test/trigger"} 2.0', lines)
+        self.assertIn('cameraconnect_frame_latency_ms_count{camera="cam/1",stage="end_to_end"} 1', lines)
+        self.assertIn('cameraconnect_camera_replay_frames_total{camera="cam/2"} 2.0', lines)
+        self.assertIn('cameraconnect_camera_latency_ms_end_to_end_p50{camera="cam/1"} 7.0', lines)
+        # Only counters end with _total
+        for line in lines:
+            if line.startswith("# TYPE ") and line.split()[2].endswith("_total"):
+                self.assertEqual(line.split()[3], "counter", line)
+        self.assertTrue(any(line.startswith("cameraconnect_process_resident_memory_bytes ") for line in lines))
+        # The buffer pool is created with the first image
+        self.assertFalse(any("buffer_pool" in line for line in lines))
+
+
+class TestAsyncioMqttHelper(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        self.client = mock.Mock()
+        self.client.loop_misc.return_value = mqtt.MQTT_ERR_SUCCESS
+
+    def create_helper(self):
+        helper = AsyncioMqttHelper(self.loop, self.client)
+        self.addCleanup(self.loop.run_until_complete, asyncio.sleep(0))
+        self.addCleanup(helper.stop)
+        return helper
+
+    def run_briefly(self, duration=0.05):
+        self.loop.run_until_complete(asyncio.sleep(duration))
+
+    def test_socket_callbacks_are_registered(self):
+        helper = self.create_helper()
+        self.assertEqual(self.client.on_socket_open, helper._on_socket_open)
+        self.assertEqual(self.client.on_socket_register_write, helper._on_socket_register_write)
+
+    def test_reads_when_socket_is_readable(self):
+        helper = self.create_helper()
+        sock, other = socket.socketpair()
+        self.addCleanup(sock.close)
+        self.addCleanup(other.close)
+        received = []
+        self.client.loop_read.side_effect = lambda: received.append(sock.recv(16))
+
+        # Opened by the thread of a connect
+        thread = threading.Thread(target=helper._on_socket_open, args=(self.client, None, sock))
+        thread.start()
+        thread.join()
+        other.send(b"CONNACK")
+        self.run_briefly()
+        self.assertEqual(received, [b"CONNACK"])
+
+        helper._on_socket_close(self.client, None, sock)
+        self.run_briefly()
+        other.send(b"PUBLISH")
+        self.run_briefly()
+        self.assertEqual(received, [b"CONNACK"])
+
+    def test_closed_socket_is_unwatched_without_error(self):
+        helper = self.create_helper()
+        sock, other = socket.socketpair()
+        self.addCleanup(other.close)
+        helper._on_socket_register_write(self.client, None, sock)
+        self.run_briefly()
+        helper._on_socket_unregister_write(self.client, None, sock)
+        sock.close()
+        self.run_briefly()
+
+    def test_reconnects_without_connection(self):
+        self.client.loop_misc.return_value = mqtt.MQTT_ERR_NO_CONN
+        self.create_helper()
+        with self.assertLogs(level="INFO") as logs:
+            self.run_briefly()
+
+        self.client.reconnect.assert_called_once_with()
+        self.assertIn("Reconnected to the MQTT broker.", logs.output[0])
+
+    def test_failed_reconnect_is_retried(self):
+        self.client.loop_misc.return_value = mqtt.MQTT_ERR_NO_CONN
+        self.client.reconnect.side_effect = ConnectionRefusedError()
+        helper = self.create_helper()
+        self.run_briefly()
+
+        self.assertEqual(self.client.reconnect.call_count, 1)
+        self.assertFalse(helper._misc.done())
+
+    def test_connected_client_is_not_reconnected(self):
+        self.create_helper()
+        self.run_briefly()
+
+        self.client.loop_misc.assert_called_once_with()
+        self.client.reconnect.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,226 @@
+"""
+Tests of the trigger scheduler (scheduler.py).
+"""
+
+# Import python in-built libraries
+import threading
+import time
+import unittest
+
+# Import self-written modules
+from frame import CaptureRequest
+from scheduler import (TRIGGER_POLICY_COALESCE, TRIGGER_POLICY_DROP_NEWEST, TRIGGER_POLICY_DROP_OLDEST,
+                       TriggerScheduler)
+
+
+def requests(*names):
+    return [CaptureRequest(correlation_id=name) for name in names]
+
+
+class Recorder:
+    """
+    Dispatch target that records the correlation ids and the time
+    of the dispatch.
+    """
+
+    def __init__(self, blocked=False) -> None:
+        self.dispatched = []
+        self.times = {}
+        self.release = threading.Event()
+        self.started = threading.Event()
+        if not blocked:
+            self.release.set()
+        self._done = threading.Condition()
+
+    def __call__(self, request):
+        self.started.set()
+        self.release.wait(5)
+        with self._done:
+            self.dispatched.append(request.correlation_id)
+            self.times[request.correlation_id] = time.monotonic()
+            self._done.notify_all()
+
+    def wait_for(self, count, timeout=2.0) -> bool:
+        with self._done:
+            return self._done.wait_for(lambda: len(self.dispatched) >= count, timeout)
+
+
+class SchedulerTestCase(unittest.TestCase):
+
+    def create_scheduler(self, recorder, **kwargs):
+        scheduler = TriggerScheduler(recorder, **kwargs)
+        self.addCleanup(scheduler.stop)
+        self.addCleanup(recorder.release.set)
+        return scheduler
+
+
+class TestTriggerScheduler(SchedulerTestCase):
+
+    def test_dispatched_in_order_of_due_time(self):
+        recorder = Recorder()
+        scheduler = self.create_scheduler(recorder)
+        now_ms = time.time() * 1000
+        for request, delay_ms in zip(requests("c", "a", "b"), (150, 50, 100)):
+            self.assertTrue(scheduler.schedule(request, at_ms=now_ms + delay_ms))
+
+        self.assertTrue(recorder.wait_for(3))
+        self.assertEqual(recorder.dispatched, ["a", "b", "c"])
+
+    def test_dispatched_at_due_time(self):
+        recorder = Recorder()
+        scheduler = self.create_scheduler(recorder)
+        start = time.monotonic()
+        scheduler.schedule(requests("a")[0], at_ms=time.time() * 1000 + 100)
+
+        self.assertTrue(recorder.wait_for(1))
+        self.assertGreaterEqual(recorder.times["a"] - start, 0.09)
+        self.assertLess(recorder.times["a"] - start, 0.5)
+
+    def test_same_due_time_in_order_of_scheduling(self):
+        recorder = Recorder()
+        scheduler = self.create_scheduler(recorder)
+        at_ms = time.time() * 1000 + 50
+        for request in requests("a", "b", "c", "d"):
+            scheduler.schedule(request, at_ms=at_ms)
+
+        self.assertTrue(recorder.wait_for(4))
+        self.assertEqual(recorder.dispatched, ["a", "b", "c", "d"])
+
+    def test_past_due_time_is_dispatched_late(self):
+        recorder = Recorder()
+        scheduler = self.create_scheduler(recorder)
+        request = requests("a")[0]
+        scheduler.schedule(request, at_ms=time.time() * 1000 - 500)
+
+        self.assertTrue(recorder.wait_for(1))
+        self.assertTrue(request.late)
+        stats = scheduler.stats()
+        self.assertEqual(stats['late'], 1)
+        self.assertGreaterEqual(stats['lateness_ms_max'], 500)
+
+    def test_schedule_does_not_block(self):
+        recorder = Recorder(blocked=True)
+        scheduler = self.create_scheduler(recorder)
+        scheduler.schedule(requests("a")[0])
+        self.assertTrue(recorder.started.wait(1))
+        start = time.monotonic()
+        scheduler.schedule(requests("b")[0])
+
+        self.assertLess(time.monotonic() - start, 0.05)
+        self.assertEqual(scheduler.pending(), 1)
+
+    def test_failing_dispatch_does_not_stop_the_scheduler(self):
+        dispatched = []
+
+        def dispatch(request):
+            if request.correlation_id == "a":
+                raise RuntimeError("camera failed")
+            dispatched.append(request.correlation_id)
+
+        scheduler = TriggerScheduler(dispatch)
+        with self.assertLogs(level="ERROR"):
+            for request in requests("a", "b"):
+                scheduler.schedule(request)
+            scheduler.stop(drain=True)
+
+        self.assertEqual(dispatched, ["b"])
+        self.assertEqual(scheduler.dispatched, 2)
+
+    def test_stop_with_drain(self):
+        recorder = Recorder()
+        scheduler = TriggerScheduler(recorder)
+        at_ms = time.time() * 1000 + 50
+        for request in requests("a", "b"):
+            scheduler.schedule(request, at_ms=at_ms)
+        scheduler.stop(drain=True)
+
+        self.assertEqual(recorder.dispatched, ["a", "b"])
+        self.assertFalse(scheduler.schedule(requests("c")[0]))
+
+    def test_stop_discards_pending(self):
+        recorder = Recorder()
+        scheduler = TriggerScheduler(recorder)
+        scheduler.schedule(requests("a")[0], at_ms=time.time() * 1000 + 10000)
+        start = time.monotonic()
+        scheduler.stop()
+
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(recorder.dispatched, [])
+
+    def test_drain_timeout(self):
+        recorder = Recorder()
+        scheduler = TriggerScheduler(recorder)
+        scheduler.schedule(requests("a")[0], at_ms=time.time() * 1000 + 10000)
+        with self.assertLogs(level="WARNING"):
+            scheduler.stop(drain=True, timeout=0.1)
+
+        self.assertEqual(recorder.dispatched, [])
+
+    def test_unsupported_policy(self):
+        with self.assertRaises(SystemExit):
+            TriggerScheduler(Recorder(), policy="CaptureLate")
+
+
+class TestOverloadPolicies(SchedulerTestCase):
+
+    def schedule_all(self, scheduler, delays_ms):
+        now_ms = time.time() * 1000
+        names = [chr(ord("a") + index) for index in range(len(delays_ms))]
+        return [scheduler.schedule(request, at_ms=now_ms + delay_ms)
+                for request, delay_ms in zip(requests(*names), delays_ms)]
+
+    def test_drop_newest(self):
+        recorder = Recorder()
+        scheduler = self.create_scheduler(recorder, max_pending=2, policy=TRIGGER_POLICY_DROP_NEWEST)
+        with self.assertLogs(level="WARNING"):
+            accepted = self.schedule_all(scheduler, (150, 50, 100))
+
+        self.assertEqual(accepted, [True, True, False])
+        self.assertTrue(recorder.wait_for(2))
+        self.assertEqual(recorder.dispatched, ["b", "a"])
+        self.assertEqual(scheduler.stats()['missed'], 1)
+
+    def test_drop_oldest_drops_first_received(self):
+        recorder = Recorder()
+        scheduler = self.create_scheduler(recorder, max_pending=2, policy=TRIGGER_POLICY_DROP_OLDEST)
+        # "a" is received first but due last
+        with self.assertLogs(level="WARNING"):
+            accepted = self.schedule_all(scheduler, (150, 50, 100, 120))
+
+        self.assertEqual(accepted, [True, True, True, True])
+        self.assertTrue(recorder.wait_for(2))
+        time.sleep(0.1)
+        self.assertEqual(recorder.dispatched, ["c", "d"])
+        self.assertEqual(scheduler.stats()['missed'], 2)
+
+    def test_coalesce(self):
+        recorder = Recorder()
+        scheduler = self.create_scheduler(recorder, max_pending=2, policy=TRIGGER_POLICY_COALESCE,
+                                          coalesce_ms=100)
+        with self.assertLogs(level="WARNING"):
+            accepted = self.schedule_all(scheduler, (100, 180, 300, 500))
+
+        # "b" is merged into "a", "d" arrives at a full queue
+        self.assertEqual(accepted, [True, False, True, False])
+        self.assertTrue(recorder.wait_for(2))
+        self.assertEqual(recorder.dispatched, ["a", "c"])
+        stats = scheduler.stats()
+        self.assertEqual((stats['coalesced'], stats['missed']), (1, 1))
+
+    def test_busy_camera_flags_late_instead_of_exiting(self):
+        recorder = Recorder(blocked=True)
+        scheduler = self.create_scheduler(recorder, max_pending=1)
+        first, second = requests("a", "b")
+        scheduler.schedule(first)
+        self.assertTrue(recorder.started.wait(1))
+        scheduler.schedule(second)
+        time.sleep(0.05)
+        recorder.release.set()
+
+        self.assertTrue(recorder.wait_for(2))
+        self.assertFalse(first.late)
+        self.assertTrue(second.late)
+
+
+if __name__ == "__main__":
+    unittest.main()
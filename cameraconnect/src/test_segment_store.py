@@ -0,0 +1,190 @@
+"""
+Tests of the segment storage and its index (segment_store.py).
+"""
+
+# Import python in-built libraries
+import os
+import shutil
+import tempfile
+import unittest
+
+# Import self-written modules
+from archive import ImageArchiveWriter
+from segment_store import INDEX_RECORD, SegmentReader, SegmentStorage, parse_time_ms
+
+TIMESTAMP_MS = 1655287200000
+
+
+def read_frames(directory, start_ms=None, end_ms=None):
+    with SegmentReader(directory) as reader:
+        frames = []
+        for timestamp_ms, image_id, data in reader.frames(start_ms, end_ms):
+            frames.append((timestamp_ms, image_id, bytes(data)))
+            data.release()
+        return frames
+
+
+class SegmentTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+
+    def write_images(self, storage, count, size=10):
+        for index in range(count):
+            storage.write(TIMESTAMP_MS + index * 100, "AA_{}".format(index), bytes([index]) * size)
+
+
+class TestSegmentStorage(SegmentTestCase):
+
+    def test_round_trip(self):
+        storage = SegmentStorage(self.path)
+        self.write_images(storage, 5)
+        storage.close()
+
+        frames = read_frames(self.path)
+        self.assertEqual(frames, [(TIMESTAMP_MS + index * 100, "AA_{}".format(index), bytes([index]) * 10)
+                                  for index in range(5)])
+
+    def test_index_layout(self):
+        storage = SegmentStorage(self.path)
+        key, size = storage.write(TIMESTAMP_MS, "AA_1", b"\x01\x02\x03")
+        storage.write(TIMESTAMP_MS + 1, "AA_2", b"\x04")
+        storage.close()
+
+        self.assertEqual(key, os.path.join(self.path, "{:013d}.seg".format(TIMESTAMP_MS)))
+        self.assertEqual(size, 3 + INDEX_RECORD.size)
+        with open(os.path.join(self.path, "{:013d}.idx".format(TIMESTAMP_MS)), "rb") as f:
+            index = f.read()
+        self.assertEqual(len(index), 2 * INDEX_RECORD.size)
+        self.assertEqual(INDEX_RECORD.unpack_from(index, INDEX_RECORD.size),
+                         (TIMESTAMP_MS + 1, b"AA_2".ljust(40, b"\0"), 3, 1))
+
+    def test_rolls_over_to_new_segment(self):
+        storage = SegmentStorage(self.path, segment_bytes=25)
+        self.write_images(storage, 6)
+        storage.close()
+
+        with SegmentReader(self.path) as reader:
+            segments = reader.segments()
+            self.assertEqual([first_ms for first_ms, segment_path, index_path in segments],
+                             [TIMESTAMP_MS, TIMESTAMP_MS + 300])
+            self.assertEqual(reader.last_timestamp_ms(segments[0][2]), TIMESTAMP_MS + 200)
+        self.assertEqual(len(read_frames(self.path)), 6)
+
+    def test_backwards_timestamp_starts_new_segment(self):
+        storage = SegmentStorage(self.path)
+        for timestamp_ms in (TIMESTAMP_MS, TIMESTAMP_MS + 500, TIMESTAMP_MS + 200, TIMESTAMP_MS + 600,
+                             TIMESTAMP_MS):
+            storage.write(timestamp_ms, "AA", str(timestamp_ms).encode())
+        storage.close()
+
+        with SegmentReader(self.path) as reader:
+            segments = reader.segments()
+            self.assertEqual([first_ms for first_ms, segment_path, index_path in segments],
+                             [TIMESTAMP_MS - 1, TIMESTAMP_MS, TIMESTAMP_MS + 200])
+        # Every image is found in the overlapping segments
+        self.assertEqual(sorted(frame[0] for frame in read_frames(self.path, TIMESTAMP_MS + 400)),
+                         [TIMESTAMP_MS + 500, TIMESTAMP_MS + 600])
+        self.assertEqual(len(read_frames(self.path, TIMESTAMP_MS, TIMESTAMP_MS + 550)), 4)
+
+    def test_long_image_id_is_cut_between_characters(self):
+        storage = SegmentStorage(self.path)
+        storage.write(TIMESTAMP_MS, "A" * 39 + "äb", b"\x01")
+        storage.write(TIMESTAMP_MS + 1, "A" * 50, b"\x02")
+        storage.close()
+
+        self.assertEqual([frame[1] for frame in read_frames(self.path)], ["A" * 39, "A" * 40])
+
+    def test_current_segment_is_not_removed(self):
+        storage = SegmentStorage(self.path, segment_bytes=25)
+        self.write_images(storage, 4)
+        first, current = [unit[0] for unit in storage.scan()]
+
+        self.assertFalse(storage.remove(current))
+        self.assertTrue(storage.remove(first))
+        self.assertFalse(os.path.exists(first))
+        self.assertFalse(os.path.exists(first[:-4] + ".idx"))
+        storage.close()
+
+    def test_scan_only_segments(self):
+        storage = SegmentStorage(self.path)
+        self.write_images(storage, 2)
+        storage.close()
+        for file_name in ("spool.seg", "0000000000001.seg", "notes.idx"):
+            with open(os.path.join(self.path, file_name), "wb") as f:
+                f.write(b"x")
+
+        units = SegmentStorage(self.path).scan()
+
+        self.assertEqual(units, [(os.path.join(self.path, "{:013d}.seg".format(TIMESTAMP_MS)),
+                                  (TIMESTAMP_MS + 100) / 1000, 20 + 2 * INDEX_RECORD.size)])
+
+
+class TestSegmentReader(SegmentTestCase):
+
+    def setUp(self):
+        super().setUp()
+        storage = SegmentStorage(self.path, segment_bytes=35)
+        self.write_images(storage, 10)
+        storage.close()
+
+    def test_time_range(self):
+        frames = read_frames(self.path, TIMESTAMP_MS + 250, TIMESTAMP_MS + 700)
+
+        self.assertEqual([frame[1] for frame in frames], ["AA_3", "AA_4", "AA_5", "AA_6"])
+
+    def test_range_boundaries(self):
+        # start is included, end is excluded
+        frames = read_frames(self.path, TIMESTAMP_MS + 400, TIMESTAMP_MS + 800)
+
+        self.assertEqual([frame[0] for frame in frames], [TIMESTAMP_MS + index * 100 for index in range(4, 8)])
+
+    def test_open_ranges(self):
+        self.assertEqual(len(read_frames(self.path, start_ms=TIMESTAMP_MS + 850)), 1)
+        self.assertEqual(len(read_frames(self.path, end_ms=TIMESTAMP_MS + 150)), 2)
+        self.assertEqual(read_frames(self.path, start_ms=TIMESTAMP_MS + 5000), [])
+
+    def test_views_still_in_use_are_logged(self):
+        reader = SegmentReader(self.path)
+        data = next(reader.frames())[2]
+        with self.assertLogs(level="WARNING"):
+            reader.close()
+        data.release()
+
+
+class TestArchiveWithSegments(SegmentTestCase):
+
+    def test_retention_deletes_whole_segments(self):
+        storage = SegmentStorage(self.path, segment_bytes=100)
+        writer = ImageArchiveWriter(self.path, max_bytes=400, storage=storage)
+        for index in range(12):
+            writer.submit(TIMESTAMP_MS + index * 100, "AA_{}".format(index), b"x" * 50)
+        writer.stop()
+
+        frames = read_frames(self.path)
+        self.assertLessEqual(writer.total_bytes, 400)
+        self.assertEqual(writer.total_bytes, sum(unit[2] for unit in SegmentStorage(self.path).scan()))
+        # The newest images are kept, the oldest segments deleted
+        self.assertEqual(frames[-1][1], "AA_11")
+        self.assertEqual(len(frames) % 2, 0)
+        self.assertGreater(writer.deleted, 0)
+
+
+class TestParseTime(unittest.TestCase):
+
+    def test_formats(self):
+        self.assertEqual(parse_time_ms("1655287200123"), 1655287200123)
+        self.assertEqual(parse_time_ms("2022-06-15T10:00:00+00:00"), TIMESTAMP_MS)
+        self.assertEqual(parse_time_ms("2022-06-15T12:00:00+02:00"), TIMESTAMP_MS)
+        self.assertEqual(parse_time_ms("2022-06-15T10:00:00.5Z"), TIMESTAMP_MS + 500)
+        # UTC if no time zone is given
+        self.assertEqual(parse_time_ms("2022-06-15T10:00:00"), TIMESTAMP_MS)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            parse_time_ms("yesterday")
+
+
+if __name__ == "__main__":
+    unittest.main()
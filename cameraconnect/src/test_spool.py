@@ -0,0 +1,332 @@
+"""
+Tests of the reliable publishing with QoS 1 and the publish spool
+(spool.py).
+"""
+
+# Import python in-built libraries
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+# Import libraries that had been installed with pip install
+import paho.mqtt.client as mqtt
+
+# Import self-written modules
+from spool import PublishSpool, ReliablePublisher
+
+
+class FakeClient:
+    """
+    MQTT client that records the published messages. Messages are
+    acknowledged right away, at the given call or not at all.
+    """
+
+    def __init__(self, auto_acknowledge=True, acknowledge_early=False) -> None:
+        self.auto_acknowledge = auto_acknowledge
+        self.acknowledge_early = acknowledge_early
+        self.rc = mqtt.MQTT_ERR_SUCCESS
+        self.on_publish = None
+        self.max_inflight = None
+        self.published = []
+        self.pending = []
+        self._mid = 0
+        self._lock = threading.Lock()
+
+    def max_inflight_messages_set(self, inflight):
+        self.max_inflight = inflight
+
+    def publish(self, topic, payload, qos=0):
+        with self._lock:
+            self._mid += 1
+            mid = self._mid
+            if self.rc == mqtt.MQTT_ERR_SUCCESS:
+                self.published.append((topic, payload, qos))
+        if self.acknowledge_early:
+            # Acknowledged by the network thread before publish()
+            #   returns
+            self.on_publish(self, None, mid)
+        elif self.auto_acknowledge:
+            threading.Timer(0.001, self.on_publish, (self, None, mid)).start()
+        else:
+            self.pending.append(mid)
+        return SimpleNamespace(rc=self.rc, mid=mid)
+
+    def acknowledge_all(self):
+        while self.pending:
+            self.on_publish(self, None, self.pending.pop(0))
+
+    def payloads(self):
+        with self._lock:
+            return [payload for topic, payload, qos in self.published]
+
+
+class SpoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def create_spool(self, **kwargs):
+        spool = PublishSpool(self.directory, **kwargs)
+        self.addCleanup(spool.close)
+        return spool
+
+    def spool_files(self):
+        return sorted(os.listdir(self.directory))
+
+
+class TestPublishSpool(SpoolTestCase):
+
+    def test_fifo(self):
+        spool = self.create_spool()
+        for index in range(3):
+            spool.append(1000 + index, "img_{}".format(index), "message {}".format(index).encode())
+
+        replayed = []
+        while spool.pending():
+            replayed.append(spool.peek())
+            spool.advance()
+        self.assertEqual(replayed, [(1000, "img_0", b"message 0"), (1001, "img_1", b"message 1"),
+                                    (1002, "img_2", b"message 2")])
+        self.assertIsNone(spool.peek())
+        # Files are deleted once everything is replayed
+        self.assertEqual(self.spool_files(), [])
+
+    def test_append_while_replaying(self):
+        spool = self.create_spool()
+        spool.append(1000, "img_0", b"0")
+        self.assertEqual(spool.peek()[2], b"0")
+        spool.advance()
+        spool.append(1001, "img_1", b"1")
+        spool.append(1002, "img_2", b"2")
+
+        self.assertEqual(spool.pending(), 2)
+        self.assertEqual(spool.peek()[2], b"1")
+
+    def test_messages_survive_restart(self):
+        spool = PublishSpool(self.directory)
+        spool.append(1000, "img_0", b"0")
+        spool.append(1001, "img_1", b"1")
+        spool.close()
+
+        with self.assertLogs(level="INFO"):
+            restarted = self.create_spool()
+        self.assertEqual(restarted.pending(), 2)
+        self.assertEqual(restarted.peek(), (1000, "img_0", b"0"))
+        self.assertEqual(restarted.stats()['spool_depth'], 2)
+
+    def test_oldest_segment_dropped_above_size_limit(self):
+        # Segments of 1 MB, the first one is full after 3 messages
+        spool = self.create_spool(max_bytes=1536 * 1024)
+        message = bytes(400 * 1024)
+        with self.assertLogs(level="WARNING"):
+            for index in range(4):
+                spool.append(1000 + index, "img_{}".format(index), message)
+
+        stats = spool.stats()
+        self.assertEqual(stats['spool_dropped'], 3)
+        self.assertEqual(stats['spool_depth'], 1)
+        self.assertLessEqual(stats['spool_bytes'], 1536 * 1024)
+        self.assertEqual(spool.peek()[1], "img_3")
+
+    def test_fsync_in_batches(self):
+        spool = self.create_spool(fsync_batch=3, fsync_interval=60.0)
+        with mock.patch.object(spool._storage, "sync", wraps=spool._storage.sync) as sync:
+            spool.append(1000, "img_0", b"0")
+            spool.append(1001, "img_1", b"1")
+            self.assertEqual(sync.call_count, 0)
+            spool.append(1002, "img_2", b"2")
+            self.assertEqual(sync.call_count, 1)
+            spool.append(1003, "img_3", b"3")
+            # Periodic sync of the unsynced rest
+            spool.sync(min_age=60.0)
+            self.assertEqual(sync.call_count, 1)
+            spool.sync()
+            self.assertEqual(sync.call_count, 2)
+
+    def test_fsync_after_interval(self):
+        spool = self.create_spool(fsync_batch=100, fsync_interval=0.05)
+        with mock.patch.object(spool._storage, "sync", wraps=spool._storage.sync) as sync:
+            spool.append(1000, "img_0", b"0")
+            time.sleep(0.06)
+            spool.append(1001, "img_1", b"1")
+
+        self.assertEqual(sync.call_count, 1)
+
+    def test_unsynced_messages_are_readable(self):
+        spool = self.create_spool(fsync_batch=100, fsync_interval=60.0)
+        spool.append(1000, "img_0", b"0")
+
+        self.assertEqual(spool.peek(), (1000, "img_0", b"0"))
+
+
+class TestReliablePublisher(SpoolTestCase):
+
+    def create_publisher(self, client, spool=None, connected=True, **kwargs):
+        publisher = ReliablePublisher(client, "test/images", spool=spool, **kwargs)
+        publisher.set_connected(connected)
+        self.addCleanup(publisher.stop, timeout=1.0)
+        return publisher
+
+    def wait_until(self, condition, timeout=2.0):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                self.fail("condition not reached")
+            time.sleep(0.005)
+
+    def test_published_with_qos_1(self):
+        client = FakeClient()
+        publisher = self.create_publisher(client, max_inflight=5)
+        publisher.publish(b"0", 1000, "img_0")
+        self.wait_until(lambda: publisher.acknowledged == 1)
+
+        self.assertEqual(client.published, [("test/images", b"0", 1)])
+        self.assertEqual(client.max_inflight, 5)
+        self.assertEqual(publisher.stats()['inflight'], 0)
+
+    def test_acknowledged_before_publish_returned(self):
+        client = FakeClient(acknowledge_early=True)
+        publisher = self.create_publisher(client)
+        publisher.publish(b"0", 1000, "img_0")
+
+        stats = publisher.stats()
+        self.assertEqual((stats['inflight'], stats['acknowledged']), (0, 1))
+
+    def test_window_waits_for_acknowledgment(self):
+        client = FakeClient(auto_acknowledge=False)
+        publisher = self.create_publisher(client, spool=self.create_spool(), max_inflight=1)
+        publisher.publish(b"0", 1000, "img_0")
+        threading.Timer(0.05, client.acknowledge_all).start()
+        start = time.monotonic()
+        publisher.publish(b"1", 1001, "img_1")
+
+        self.assertGreaterEqual(time.monotonic() - start, 0.04)
+        self.assertEqual(client.payloads(), [b"0", b"1"])
+        self.assertEqual(publisher.stats()['spooled'], 0)
+
+    def test_stalled_window_spills_at_once(self):
+        client = FakeClient(auto_acknowledge=False)
+        publisher = self.create_publisher(client, spool=self.create_spool(), max_inflight=2, stall_timeout=0.1)
+        start = time.monotonic()
+        for index in range(5):
+            publisher.publish(str(index).encode(), 1000 + index, "img_{}".format(index))
+
+        # Only the first spilled message waits for the stall timeout
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(client.payloads(), [b"0", b"1"])
+        self.assertEqual(publisher.stats()['spooled'], 3)
+
+    def test_dropped_without_spool(self):
+        client = FakeClient()
+        publisher = self.create_publisher(client, connected=False)
+        with self.assertLogs(level="WARNING"):
+            publisher.publish(b"0", 1000, "img_0")
+
+        self.assertEqual(client.published, [])
+        self.assertEqual(publisher.stats()['publish_dropped'], 1)
+
+    def test_failed_publish_is_spilled(self):
+        client = FakeClient()
+        client.rc = mqtt.MQTT_ERR_QUEUE_SIZE
+        publisher = self.create_publisher(client, spool=self.create_spool())
+        publisher.publish("text message", 1000, "img_0")
+
+        self.assertEqual(publisher.stats()['inflight'], 0)
+        self.assertEqual(publisher.spool.peek(), (1000, "img_0", b"text message"))
+
+    def test_replayed_in_order_after_reconnect(self):
+        client = FakeClient()
+        publisher = self.create_publisher(client, spool=self.create_spool(), connected=False)
+        for index in range(5):
+            publisher.publish(str(index).encode(), 1000 + index, "img_{}".format(index))
+        self.assertEqual(client.published, [])
+        self.assertEqual(publisher.stats()['spool_depth'], 5)
+
+        with self.assertLogs(level="INFO") as logs:
+            publisher.set_connected(True)
+            # Published during the replay, sent after the spool
+            for index in range(5, 8):
+                publisher.publish(str(index).encode(), 1000 + index, "img_{}".format(index))
+            self.wait_until(lambda: len(client.published) == 8 and logs.output)
+
+        self.assertEqual(client.payloads(), [str(index).encode() for index in range(8)])
+        self.assertIn("Publish spool replayed", "\n".join(logs.output))
+        stats = publisher.stats()
+        self.assertGreaterEqual(stats['replayed'], 5)
+        self.assertGreater(stats['replay_rate'], 0)
+        self.wait_until(lambda: self.spool_files() == [])
+
+    def test_replay_waiting_for_the_window_does_not_block_publish(self):
+        client = FakeClient(auto_acknowledge=False)
+        spool = self.create_spool()
+        for index in range(3):
+            spool.append(1000 + index, "img_{}".format(index), str(index).encode())
+        publisher = self.create_publisher(client, spool=spool, connected=False, max_inflight=1,
+                                          window_timeout=5.0, stall_timeout=5.0)
+        publisher.set_connected(True)
+        # The replay waits for the acknowledgment of the first message
+        self.wait_until(lambda: client.payloads() == [b"0"])
+        time.sleep(0.05)
+        start = time.monotonic()
+        publisher.publish(b"3", 1003, "img_3")
+
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(publisher.stats()['spool_depth'], 3)
+        with self.assertLogs(level="INFO") as logs:
+            client.auto_acknowledge = True
+            client.acknowledge_all()
+            self.wait_until(lambda: logs.output)
+        self.assertEqual(client.payloads(), [b"0", b"1", b"2", b"3"])
+
+    def test_spool_of_previous_run_is_replayed(self):
+        spool = PublishSpool(self.directory)
+        spool.append(1000, "img_0", b"0")
+        spool.close()
+        client = FakeClient()
+        with self.assertLogs(level="INFO") as logs:
+            publisher = self.create_publisher(client, spool=self.create_spool())
+            # Logged after the replayed message was advanced
+            self.wait_until(lambda: "Publish spool replayed" in "\n".join(logs.output))
+
+        self.assertEqual(client.payloads(), [b"0"])
+
+        self.assertEqual(publisher.replayed, 1)
+
+    def test_spilled_messages_are_synced(self):
+        spool = self.create_spool(fsync_batch=100, fsync_interval=0.05)
+        publisher = self.create_publisher(FakeClient(), spool=spool, connected=False)
+        publisher.publish(b"0", 1000, "img_0")
+        self.assertEqual(spool._unsynced, 1)
+
+        # The replay thread syncs the rest that did not fill a batch
+        self.wait_until(lambda: spool._unsynced == 0)
+
+    def test_stop_waits_for_acknowledgments(self):
+        client = FakeClient(auto_acknowledge=False)
+        publisher = ReliablePublisher(client, "test/images")
+        publisher.set_connected(True)
+        publisher.publish(b"0", 1000, "img_0")
+        threading.Timer(0.05, client.acknowledge_all).start()
+        publisher.stop(timeout=2.0)
+
+        self.assertEqual(publisher.acknowledged, 1)
+
+    def test_stop_timeout(self):
+        publisher = ReliablePublisher(FakeClient(auto_acknowledge=False), "test/images")
+        publisher.set_connected(True)
+        publisher.publish(b"0", 1000, "img_0")
+        start = time.monotonic()
+        with self.assertLogs(level="WARNING"):
+            publisher.stop(timeout=0.1)
+
+        self.assertLess(time.monotonic() - start, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
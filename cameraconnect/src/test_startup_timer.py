@@ -0,0 +1,63 @@
+"""
+Tests of the startup timer (startup_timer.py) and of the lean
+startup path, which must not load the GenICam libraries.
+"""
+
+# Import python in-built libraries
+import os
+import subprocess
+import sys
+import unittest
+from unittest import mock
+
+# Import self-written modules
+from startup_timer import StartupTimer
+
+# Modules that main.py imports before it knows the configuration
+STARTUP_MODULES = ("startup_timer", "cameras", "runtime", "trigger", "image_codecs")
+
+
+class TestStartupTimer(unittest.TestCase):
+
+    def test_consecutive_phases(self):
+        with mock.patch("startup_timer.time.perf_counter", side_effect=[10.0, 10.25, 10.5, 11.0]):
+            timer = StartupTimer()
+            timer.phase("imports")
+            timer.phase("settings")
+            timer.phase("cameras")
+
+        self.assertEqual(timer.phases, [("imports", 250.0), ("settings", 250.0), ("cameras", 500.0)])
+        self.assertEqual(timer.report(),
+                         "Startup took 1000 ms (imports: 250 ms, settings: 250 ms, cameras: 500 ms)")
+
+    def test_start_of_process(self):
+        with mock.patch("startup_timer.time.perf_counter", return_value=5.0):
+            timer = StartupTimer(start=4.0)
+            timer.phase("imports")
+
+        self.assertEqual(timer.phases, [("imports", 1000.0)])
+
+
+class TestLeanStartup(unittest.TestCase):
+
+    def test_genicam_libraries_are_not_imported(self):
+        code = "import sys\n" \
+               "import {}\n" \
+               "print(sorted(m for m in sys.modules if m.split('.')[0] in ('harvesters', 'genicam')))"
+        output = subprocess.check_output([sys.executable, "-c", code.format(", ".join(STARTUP_MODULES))],
+                                         cwd=os.path.dirname(os.path.abspath(__file__)))
+
+        self.assertEqual(output.decode().strip(), "[]")
+
+    def test_profiler_is_not_imported(self):
+        code = "import sys\n" \
+               "import {}\n" \
+               "print(sorted(m for m in sys.modules if m in ('profiling', 'cProfile', 'tracemalloc')))"
+        output = subprocess.check_output([sys.executable, "-c", code.format(", ".join(STARTUP_MODULES))],
+                                         cwd=os.path.dirname(os.path.abspath(__file__)))
+
+        self.assertEqual(output.decode().strip(), "[]")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,253 @@
+"""
+Tests of the MQTT and continuous triggers (trigger.py).
+"""
+
+# Import python in-built libraries
+import json
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+# Import libraries that had been installed with pip install
+import numpy as np
+
+# Import self-written modules
+from frame import Frame
+from trigger import ContinuousTrigger, MqttTrigger
+
+
+class BlockingCamera:
+
+    def __init__(self) -> None:
+        self.requests = []
+        self.release = threading.Event()
+        self.captured = threading.Semaphore(0)
+
+    def get_image(self, request=None):
+        self.release.wait(5)
+        self.requests.append(request)
+        self.captured.release()
+
+
+class TestMqttTrigger(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch("trigger.mqtt.Client")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cam = BlockingCamera()
+        self.addCleanup(self.cam.release.set)
+
+    def create_trigger(self, acquisition_delay=0.0):
+        trigger = MqttTrigger(self.cam, "GenICam", acquisition_delay, "localhost", 1883, "test/trigger")
+        self.addCleanup(trigger.disconnect)
+        return trigger
+
+    def send(self, trigger, message):
+        trigger._on_message(None, None, SimpleNamespace(payload=json.dumps(message).encode()))
+
+    def test_trigger_is_logged(self):
+        trigger = self.create_trigger()
+        with self.assertLogs(level="DEBUG") as logs:
+            self.send(trigger, {})
+
+        self.assertIn("Image acquisition trigger received", "\n".join(logs.output))
+
+    def test_callback_does_not_wait_for_the_camera(self):
+        trigger = self.create_trigger()
+        start = time.monotonic()
+        self.send(trigger, {'correlation_id': "trigger-1"})
+        self.send(trigger, {'correlation_id': "trigger-2"})
+
+        self.assertLess(time.monotonic() - start, 0.1)
+        self.cam.release.set()
+        for _ in range(2):
+            self.assertTrue(self.cam.captured.acquire(timeout=1))
+        self.assertEqual([request.correlation_id for request in self.cam.requests], ["trigger-1", "trigger-2"])
+        self.assertEqual(self.cam.requests[0].source, "MQTT")
+
+    def test_acquisition_delay_from_message_timestamp(self):
+        trigger = self.create_trigger(acquisition_delay=0.2)
+        self.cam.release.set()
+        start = time.monotonic()
+        # Received 100 ms after it was sent
+        self.send(trigger, {'timestamp_ms': int(time.time() * 1000) - 100})
+
+        self.assertTrue(self.cam.captured.acquire(timeout=1))
+        # Due 100 ms after the reception
+        self.assertGreaterEqual(time.monotonic() - start, 0.08)
+        self.assertLess(time.monotonic() - start, 0.18)
+
+    def test_passed_acquisition_time_is_late(self):
+        trigger = self.create_trigger(acquisition_delay=0.1)
+        self.cam.release.set()
+        self.send(trigger, {'timestamp_ms': int(time.time() * 1000) - 1000})
+
+        self.assertTrue(self.cam.captured.acquire(timeout=1))
+        self.assertTrue(self.cam.requests[0].late)
+        self.assertEqual(trigger.stats()['late'], 1)
+
+    def test_resubscribe_after_reconnect(self):
+        trigger = self.create_trigger()
+        client = mock.Mock()
+        trigger._on_connect(client, None, None, 0)
+        client.subscribe.assert_not_called()
+        trigger._on_disconnect(client, None, 1)
+        self.assertFalse(trigger.is_ready())
+        trigger._on_connect(client, None, None, 0)
+
+        client.subscribe.assert_called_once_with("test/trigger")
+        self.assertTrue(trigger.is_ready())
+        self.assertEqual(trigger.stats()['mqtt_reconnects'], 1)
+
+
+class TimedCamera:
+    """
+    Camera whose captures take a given time. Records the start of
+    every capture.
+    """
+
+    def __init__(self, capture_time=0.0, paced=False, frames=None) -> None:
+        self.capture_time = capture_time
+        self.paced = paced
+        self.frames = frames
+        self.paced_ns = 0
+        self.starts = []
+        self.requests = []
+
+    def get_image(self, request=None):
+        self.starts.append(time.monotonic())
+        self.requests.append(request)
+        capture_time = self.capture_time(len(self.starts)) if callable(self.capture_time) else self.capture_time
+        time.sleep(capture_time)
+        if self.paced:
+            # Waited on purpose, e.g. for the recorded timing
+            self.paced_ns += int(capture_time * 1e9)
+
+    def is_finished(self):
+        return self.frames is not None and len(self.starts) >= self.frames
+
+
+class StagedCamera(TimedCamera):
+    """
+    Camera that provides the single stages of get_image().
+    """
+
+    def __init__(self, frames, fail_acquisition=(), fail_encoding=()) -> None:
+        super().__init__(frames=frames)
+        self.fail_acquisition = set(fail_acquisition)
+        self.fail_encoding = set(fail_encoding)
+        self.published = []
+        self.released = []
+
+    def acquire_frame(self, request=None):
+        self.get_image(request)
+        if len(self.starts) in self.fail_acquisition:
+            raise ValueError("Unsupported pixel format")
+        frame = Frame(np.zeros((1, 1, 1), dtype=np.uint8), request=request, release=self.released.append)
+        frame.image_id = len(self.starts)
+        return frame
+
+    def encode_frame(self, frame):
+        time.sleep(0.05)
+        if frame.image_id in self.fail_encoding:
+            raise RuntimeError("encoding failed")
+
+    def publish_frame(self, frame):
+        self.published.append(frame.image_id)
+
+
+class TestContinuousTrigger(unittest.TestCase):
+
+    def run_trigger(self, cam, cycle_time, duration=None):
+        trigger = ContinuousTrigger(cam, "GenICam", cycle_time, start=False)
+        thread = threading.Thread(target=trigger.run)
+        thread.start()
+        if duration is not None:
+            time.sleep(duration)
+            trigger.stop()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        return trigger
+
+    def test_deadlines_do_not_drift(self):
+        # Captures of varying length do not shift the deadlines
+        cam = TimedCamera(capture_time=lambda frame: 0.005 + 0.01 * (frame % 3), frames=20)
+        trigger = self.run_trigger(cam, 0.04)
+
+        offsets = [start - cam.starts[0] - index * 0.04 for index, start in enumerate(cam.starts)]
+        self.assertLess(max(offsets), 0.02)
+        self.assertGreaterEqual(min(offsets), 0)
+        self.assertEqual(trigger.late, 0)
+        self.assertEqual(trigger.stats()['frames'], 20)
+
+    def test_late_and_missed_deadlines(self):
+        cam = TimedCamera(capture_time=0.11, frames=4)
+        trigger = self.run_trigger(cam, 0.05)
+
+        # Every capture passed two deadlines: the next image is
+        #   taken late, the other deadline is missed
+        self.assertEqual(trigger.late, 3)
+        self.assertEqual(trigger.missed, 3)
+        self.assertEqual([request.late for request in cam.requests], [False, True, True, True])
+        # The phase of the deadlines is kept
+        self.assertAlmostEqual(cam.starts[1] - cam.starts[0], 0.11, delta=0.02)
+
+    def test_pacing_is_not_late(self):
+        cam = TimedCamera(capture_time=0.05, paced=True, frames=4)
+        trigger = self.run_trigger(cam, 0.01)
+
+        self.assertEqual(trigger.late, 0)
+        self.assertEqual(trigger.missed, 0)
+
+    def test_stop_interrupts_the_wait(self):
+        cam = TimedCamera()
+        start = time.monotonic()
+        self.run_trigger(cam, 60.0, duration=0.1)
+
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(len(cam.starts), 1)
+
+    def test_stops_when_camera_is_finished(self):
+        cam = TimedCamera(frames=3)
+        trigger = self.run_trigger(cam, 0.01)
+
+        self.assertEqual(trigger.frames, 3)
+
+    def test_next_image_acquired_while_previous_is_encoded(self):
+        cam = StagedCamera(frames=5)
+        trigger = self.run_trigger(cam, 0.001)
+
+        # The last frame is published before run() returns
+        self.assertEqual(cam.published, [1, 2, 3, 4, 5])
+        self.assertEqual(trigger.frames, 5)
+        # Encoding one frame takes 50 ms, the next frame is acquired
+        #   in the meantime
+        self.assertLess(cam.starts[-1] - cam.starts[0], 4 * 0.05)
+
+    def test_failed_images_do_not_end_the_loop(self):
+        cam = StagedCamera(frames=5, fail_acquisition={2}, fail_encoding={4})
+        with self.assertLogs(level="ERROR") as logs:
+            trigger = self.run_trigger(cam, 0.001)
+
+        self.assertEqual(cam.published, [1, 3, 5])
+        self.assertEqual(len(cam.released), 4)
+        self.assertEqual(trigger.stats()['errors'], 2)
+        self.assertEqual(trigger.frames, 5)
+        self.assertIn("Acquisition of an image failed.", logs.output[0])
+        self.assertIn("Encoding or publishing an image failed.", logs.output[1])
+
+    def test_failed_get_image_does_not_end_the_loop(self):
+        cam = TimedCamera(frames=3)
+        get_image = cam.get_image
+        cam.get_image = mock.Mock(side_effect=lambda request: (get_image(request), 1 / 0))
+        with self.assertLogs(level="ERROR"):
+            trigger = self.run_trigger(cam, 0.001)
+
+        self.assertEqual((trigger.frames, trigger.errors), (3, 3))
+
+
+if __name__ == "__main__":
+    unittest.main()
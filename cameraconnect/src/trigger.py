@@ -8,26 +8,45 @@ Provided classes:
 
 # Import python in-built libraries
 import json
-import sys
 import time
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 # Import libraries that had been installed with pip install
 import paho.mqtt.client as mqtt
 
+# Import self-written modules
+from frame import CaptureRequest
+from rolling_stats import RollingWindow
+from runtime import AsyncioMqttHelper
+from scheduler import TRIGGER_POLICY_DROP_NEWEST, TriggerScheduler
+
+# time.monotonic_ns is only available since Python 3.7
+if hasattr(time, "monotonic_ns"):
+    monotonic_ns = time.monotonic_ns
+else:
+    def monotonic_ns() -> int:
+        return int(time.monotonic() * 1e9)
+
 
 class MqttTrigger:
     """
     This class provides an MQTT client instance to receive 
     trigger from the MQTT broker. Each instance is automatically 
     connected to the set MQTT broker. As soon as a a trigger is
-    received, the callback function _on_message is executed.
+    received, the callback function _on_message is executed. It
+    hands the capture request to a TriggerScheduler, which gets
+    the image at the requested time in its own thread, so the
+    network thread of the MQTT client is never blocked.
     The method disconnect() disconnects from MQTT broker.
 
     Args of constructor:
         cam[Cognex/GenICam]:    A configured camera ready to
                                 get an image. get_image() function
-                                must be provided by object
+                                must be provided by object. If a
+                                FramePipeline is used, get_image()
+                                only enqueues a capture request
         interface[string]:      Camera interface that is used
         acquisition_delay[float]:
                                 Delay between trigger and 
@@ -39,12 +58,35 @@ class MqttTrigger:
         mqtt_topic[string]:     Topic on MQTT Broker where trigger
                                 signal to save an image is send to
                                 (e.g. "test/trigger/")
+        (opt.) queue_depth[int]:
+                                Maximum number of triggers waiting
+                                for their acquisition
+                                Default value: 8
+        (opt.) queue_policy[string]:
+                                What happens with triggers that can
+                                not be served in time, see
+                                scheduler.py.
+                                Possible values: "DropNewest",
+                                    "DropOldest", "Coalesce"
+                                Default value: "DropNewest"
+        (opt.) coalesce_ms[float]:
+                                Triggers due within this window of
+                                a waiting trigger are merged into it
+                                with the "Coalesce" policy
+                                Default value: 100
+        (opt.) loop[AbstractEventLoop]:
+                                asyncio event loop that runs the
+                                network I/O of the client (see
+                                runtime.py), None to use a network
+                                thread of paho
+                                Default value: None
 
     Returns of constructor:
         A connected instance of MqttTrigger
     """
 
-    def __init__(self,cam,interface,acquisition_delay,mqtt_host,mqtt_port,mqtt_topic) -> None:
+    def __init__(self,cam,interface,acquisition_delay,mqtt_host,mqtt_port,mqtt_topic,queue_depth=8,
+                 queue_policy=TRIGGER_POLICY_DROP_NEWEST,coalesce_ms=100,loop=None) -> None:
         """
         Connect MQTT client.
 
@@ -62,29 +104,54 @@ class MqttTrigger:
         self.mqtt_port = mqtt_port
         self.mqtt_topic = mqtt_topic
 
+        # Gets the images at their due time
+        self.scheduler = TriggerScheduler(self.cam.get_image, max_pending=queue_depth, policy=queue_policy,
+                                          coalesce_ms=coalesce_ms)
+
+        self.mqtt_connected = False
+        self.mqtt_connects = 0
+
         # Connect to the Broker
         self.client = mqtt.Client()
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self._helper = AsyncioMqttHelper(loop, self.client) if loop is not None else None
         self.client.connect(self.mqtt_host, self.mqtt_port) 
         # Start the loop to be always able to receive messages 
         #   from broker
         
         # Tests 10.04.2021
-        self.client.on_subscribe = lambda client, userdata, mid, granted_qos: print("Subscribed to topic: {}".format(self.mqtt_topic))
+        self.client.on_subscribe = lambda client, userdata, mid, granted_qos: logging.info(
+            "Subscribed to topic: {}".format(self.mqtt_topic))
         
-        self.client.loop_start()
+        if self._helper is None:
+            self.client.loop_start()
         # Subscribe to the given mqtt_topic
         self.client.subscribe(self.mqtt_topic)
-        print("Subscribed for input to topic: " + str(self.mqtt_topic))
+        logging.debug("Subscribed for input to topic: " + str(self.mqtt_topic))
         # Call the _on_message when message is received from broker
         self.client.on_message = self._on_message
 
+    def _on_connect(self, client, userdata, flags, rc) -> None:
+        if rc != 0:
+            return
+        self.mqtt_connected = True
+        self.mqtt_connects += 1
+        if self.mqtt_connects > 1:
+            # Subscribe again after a reconnect
+            client.subscribe(self.mqtt_topic)
+
+    def _on_disconnect(self, client, userdata, rc) -> None:
+        self.mqtt_connected = False
+
     # Is called always when a new message is received
     def _on_message(self,client,userdata,msg) -> None:
         """
         Callback function for MQTT on_message. 
         Message must be a encoded json!
 
-        Gets a new image with the cam object.
+        Schedules getting a new image with the cam object and
+        returns immediately.
 
         Args:
             client:         client instance for this callback
@@ -106,7 +173,9 @@ class MqttTrigger:
 
         # Deserialize Json
         message = json.loads(msg.payload)   
-        print("Image acquisition trigger received")
+        logging.debug("Image acquisition trigger received")
+        request = CaptureRequest(source="MQTT",
+                                 correlation_id=message.get('correlation_id') if isinstance(message, dict) else None)
 
         # If no acquisition delay skip the following
         if self.acquisition_delay > 0.0:        
@@ -118,55 +187,115 @@ class MqttTrigger:
 
         # If no acquisition delay skip the following
         if self.acquisition_delay > 0.0:
-            if time_to_get_image < round(time.time() * 1000):
-                sys.exit("Environment Error: ACQUISITION_DELAY to short ||| Set acquisition delay is shorter than the processing time.")
-            while time_to_get_image > round(time.time() * 1000):# Get an image 
-                # Avoid CPU overloading
-                time.sleep(0.1)
-
-        # Get an image 
-        print("Get an image.")
-        self.cam.get_image()
+            # Get an image at the requested time. If the time already
+            #   passed, the image is taken immediately and flagged
+            #   late.
+            self.scheduler.schedule(request, at_ms=time_to_get_image)
+        else:
+            # Get an image as soon as possible
+            self.scheduler.schedule(request)
     
-    def disconnect(self) -> None:
+    def stats(self) -> dict:
         """
-        Disconnects from MQTT broker.
+        Counters of received, missed, coalesced and late triggers
+        and of the connection to the MQTT broker.
 
         Args:
             None
+
+        Returns:
+            Dictionary with the counters
+        """
+        stats = self.scheduler.stats()
+        stats['mqtt_connected'] = int(self.mqtt_connected)
+        stats['mqtt_reconnects'] = max(0, self.mqtt_connects - 1)
+        return stats
+
+    def is_ready(self) -> bool:
+        """
+        Readiness of the trigger to receive triggers.
+
+        Args:
+            None
+
+        Returns:
+            True if the client is connected to the MQTT broker
+        """
+        return self.mqtt_connected
+
+    def disconnect(self, drain=False, timeout=10.0) -> None:
+        """
+        Disconnects from MQTT broker, so no new triggers are
+        received, and stops the scheduler.
+
+        Args:
+            (opt.) drain[bool]:     Get the images of the triggers
+                                    that are already scheduled
+                                    Default value: False
+            (opt.) timeout[float]:  Maximum time in seconds to wait
+                                    for the scheduled triggers
+                                    Default value: 10.0
  
         Returns:
             None
         """
-        self.client.loop_stop()
+        if self._helper is None:
+            self.client.loop_stop()
         self.client.disconnect()
+        if self._helper is not None:
+            self._helper.stop()
+        self.scheduler.stop(drain=drain, timeout=timeout)
 
 
 class ContinuousTrigger:
     """
     This class provides a continuous trigger that acquires images
-    with a fixed cycle time. All functionalities are provided
-    in the constructor. No methods. Object already stays in a 
-    while-loop so that the process never jumps out of this 
-    instance.
+    with a fixed cycle time. The object stays in a while-loop
+    started by the constructor or run() until stop() is called.
+
+    The images are taken at absolute deadlines on the monotonic
+    clock (start + n * cycle_time), so the phase stays fixed over
+    days and neither processing time nor wall-clock adjustments add
+    drift. If the camera provides the single stages (see
+    CamGeneral), the next image is acquired while the previous one
+    is still encoded and published. Achieved FPS and the jitter of
+    the acquisition start against its deadline are logged every
+    report_interval seconds.
 
     Args of constructor:
         cam[Cognex/GenICam]:    A configurated camera ready to 
                                 get an image. get_image() function
-                                must be provided by object
+                                must be provided by object. If a
+                                FramePipeline is used, get_image()
+                                only enqueues a capture request
         interface[string]:      Camera interface that is used
         cycle_time[float]:      Time between each image acqui-
                                 sition in seconds
+        (opt.) report_interval[float]:
+                                Time between two reports of the
+                                achieved FPS and jitter in seconds
+                                Default value: 60.0
+        (opt.) start[bool]:     Start the while-loop in the
+                                constructor. If False, run() has to
+                                be called, e.g. in an executor of
+                                the runtime (see runtime.py)
+                                Default value: True
 
     Returns of constructor:
         Continuous triggering instance in which the process will
-        stay forever.
+        stay until stop() is called or the camera is finished
+        (see CamGeneral.is_finished()). If taking an image takes
+        longer than the cycle time, the next image is taken
+        immediately and flagged late, deadlines that passed
+        completely are counted as missed. Time the camera waits on
+        purpose (paced_ns, e.g. the ReplayCamera for the recorded
+        timing) moves the following deadlines instead.
     """
 
-    def __init__(self,cam,interface,cycle_time) -> None:
+    def __init__(self,cam,interface,cycle_time,report_interval=60.0,start=True) -> None:
         """
-        While-loop with time measuring to have always the same 
-        cycle time.
+        Starts the while-loop that takes the images at the
+        deadlines.
 
         Args:
             see class description
@@ -177,25 +306,168 @@ class ContinuousTrigger:
         self.cam = cam
         self.interface = interface
         self.cycle_time = cycle_time
+        self.report_interval = report_interval
+
+        # Counters
+        self.frames = 0
+        self.errors = 0
+        self.late = 0
+        self.missed = 0
+        self.fps = 0.0
+        self.jitter_ms = RollingWindow()
+
+        # Encodes and publishes the previous frame while the next
+        #   one is acquired. A FramePipeline already runs the
+        #   stages concurrently.
+        self._encoder = None
+        self._pending = None
+        if hasattr(cam, "acquire_frame"):
+            self._encoder = ThreadPoolExecutor(max_workers=1)
+        self._stopped = threading.Event()
+
+        if start:
+            self.run()
+
+    def stop(self) -> None:
+        """
+        Stops the while-loop after the current image. Safe to be
+        called from any thread.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        self._stopped.set()
+
+    def stats(self) -> dict:
+        """
+        Achieved FPS, jitter percentiles, failed images and late
+        and missed deadlines.
+
+        Args:
+            None
+
+        Returns:
+            Dictionary with the counters
+        """
+        stats = {
+            'frames': self.frames,
+            'errors': self.errors,
+            'fps': self.fps,
+            'late': self.late,
+            'missed': self.missed,
+        }
+        for name, value in self.jitter_ms.percentiles().items():
+            stats['jitter_ms_' + name] = value
+        return stats
+
+    def run(self) -> None:
+        """
+        Takes the images at the deadlines until stop() is called.
+        The frame that is still encoded is published before
+        returning.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        cycle_ns = max(1, int(round(self.cycle_time * 1e9)))
+        start_ns = monotonic_ns()
+        cycle = 0
+        late = False
+        report_ns = start_ns
+        report_frames = 0
 
         # Start the loop to take an image according to cycle time
-        while True:
-            # Get actual time and save it as start time
-            timer_start = time.time()
-            
-            self.cam.get_image()
-
-            # Get actual time and subtract the start time from
-            #   it to get the time which the current loop needed 
-            #   to run the code
-            loop_time = time.time() - timer_start
-            # If the processing time is longer than the cycle 
-            #   time throw error
-            if loop_time > self.cycle_time:
-                sys.exit("Environment Error: CYCLE_TIME to short ||| Set cycle time is shorter than the processing time for each image.")
+        while not self._stopped.is_set():
+            deadline_ns = start_ns + cycle * cycle_ns
+            remaining_ns = deadline_ns - monotonic_ns()
+            # Woken up early by stop()
+            if remaining_ns > 0 and self._stopped.wait(remaining_ns / 1e9):
+                break
+            now_ns = monotonic_ns()
+            self.jitter_ms.add((now_ns - deadline_ns) / 1e6)
+
+            request = CaptureRequest(source="Continuous")
+            request.late = late
+            paced_ns = getattr(self.cam, "paced_ns", 0)
+            self._capture(request)
+            self.frames += 1
+            if self.cam.is_finished():
+                logging.info("Camera finished, continuous trigger stops.")
+                break
+            # The pacing of the camera is not late. A FramePipeline
+            #   paces in its own thread, so only the time this
+            #   capture waited for it counts.
+            start_ns += min(getattr(self.cam, "paced_ns", 0) - paced_ns, monotonic_ns() - now_ns)
+
+            # Continue with the next deadline. If it already passed,
+            #   take the image immediately for the last passed
+            #   deadline and skip the others to keep the phase.
+            now_ns = monotonic_ns()
+            passed = (now_ns - start_ns) // cycle_ns
+            late = passed > cycle
+            if late:
+                self.late += 1
+                self.missed += passed - cycle - 1
+                logging.debug("CYCLE_TIME too short, {} late, {} missed deadlines.".format(self.late, self.missed))
+                cycle = passed
             else:
-                # Sleep for difference of cycle time minus loop 
-                #   time to have a constant cycle time
-                delay = self.cycle_time - loop_time
-                logging.debug("Delay to reach constant cycle time.")
-                time.sleep(delay)
+                cycle += 1
+
+            if now_ns - report_ns >= self.report_interval * 1e9:
+                self.fps = (self.frames - report_frames) / ((now_ns - report_ns) / 1e9)
+                report_ns = now_ns
+                report_frames = self.frames
+                stats = self.stats()
+                logging.info("Continuous trigger: {:.2f} FPS, jitter p50 {:.2f} ms, p95 {:.2f} ms, p99 {:.2f} ms, "
+                             "{} late, {} missed deadlines.".format(stats['fps'], stats['jitter_ms_p50'],
+                                                                    stats['jitter_ms_p95'], stats['jitter_ms_p99'],
+                                                                    self.late, self.missed))
+
+        # Publish the last frame
+        if self._encoder is not None:
+            self._wait_for_pending()
+            self._encoder.shutdown(wait=True)
+        logging.debug("Continuous trigger stopped.")
+
+    def _capture(self, request) -> None:
+        # A failed image must not end the loop, e.g. a camera that
+        #   recovers with the next image
+        frame = None
+        try:
+            if self._encoder is None:
+                self.cam.get_image(request)
+                return
+            frame = self.cam.acquire_frame(request)
+        except Exception:
+            self.errors += 1
+            logging.exception("Acquisition of an image failed.")
+
+        # Wait for the previous frame, so at most one frame is
+        #   encoded while the next one is acquired
+        self._wait_for_pending()
+        if frame is not None:
+            self._pending = self._encoder.submit(self._encode_and_publish, frame)
+
+    def _wait_for_pending(self) -> None:
+        if self._pending is None:
+            return
+        try:
+            self._pending.result()
+        except Exception:
+            self.errors += 1
+            logging.exception("Encoding or publishing an image failed.")
+        self._pending = None
+
+    def _encode_and_publish(self, frame) -> None:
+        try:
+            self.cam.encode_frame(frame)
+            self.cam.publish_frame(frame)
+        finally:
+            # Gives the image back if the encoding failed
+            frame.release_image()